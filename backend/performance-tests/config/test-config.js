@@ -21,8 +21,9 @@ export const ENV = {
 
 // Get current environment
 export const currentEnv = __ENV.TEST_ENV || 'local';
-export const BASE_URL = ENV[currentEnv].baseUrl;
-export const WS_URL = ENV[currentEnv].wsUrl;
+// BASE_URL/WS_URL override the environment's URLs (rdvops.loadtest --base-url)
+export const BASE_URL = __ENV.BASE_URL || ENV[currentEnv].baseUrl;
+export const WS_URL = __ENV.WS_URL || (__ENV.BASE_URL ? __ENV.BASE_URL.replace(/^http/, 'ws') : ENV[currentEnv].wsUrl);
 
 // Default HTTP request options
 export const defaultOptions = {
@@ -0,0 +1,5 @@
+-- CreateIndex
+CREATE INDEX "ScraperLog_createdAt_id_idx" ON "ScraperLog"("createdAt", "id");
+
+-- CreateIndex
+CREATE INDEX "ConsulateScraperLog_createdAt_id_idx" ON "ConsulateScraperLog"("createdAt", "id");
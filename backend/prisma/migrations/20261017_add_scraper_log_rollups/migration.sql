@@ -0,0 +1,28 @@
+-- ScraperLog columns declared in schema.prisma that no earlier migration created
+ALTER TABLE "ScraperLog" ADD COLUMN IF NOT EXISTS "categoryCode" TEXT;
+ALTER TABLE "ScraperLog" ADD COLUMN IF NOT EXISTS "finalUrl" TEXT;
+ALTER TABLE "ScraperLog" ADD COLUMN IF NOT EXISTS "redirectCount" INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE "ScraperLog" ADD COLUMN IF NOT EXISTS "urlChanged" BOOLEAN NOT NULL DEFAULT false;
+
+-- CreateIndex
+CREATE INDEX IF NOT EXISTS "ScraperLog_prefectureId_categoryCode_createdAt_idx" ON "ScraperLog"("prefectureId", "categoryCode", "createdAt");
+
+-- CreateTable
+CREATE TABLE "ScraperLogRollup" (
+    "source" TEXT NOT NULL,
+    "targetId" TEXT NOT NULL,
+    "category" TEXT NOT NULL DEFAULT '',
+    "hour" TIMESTAMP(3) NOT NULL,
+    "runs" INTEGER NOT NULL,
+    "successes" INTEGER NOT NULL,
+    "successRate" DOUBLE PRECISION NOT NULL,
+    "avgResponseMs" DOUBLE PRECISION NOT NULL,
+    "p95ResponseMs" DOUBLE PRECISION NOT NULL,
+    "slotsFound" INTEGER NOT NULL,
+    "slotRuns" INTEGER NOT NULL,
+
+    CONSTRAINT "ScraperLogRollup_pkey" PRIMARY KEY ("source","targetId","category","hour")
+);
+
+-- CreateIndex
+CREATE INDEX "ScraperLogRollup_hour_idx" ON "ScraperLogRollup"("hour");
@@ -1,55 +1,44 @@
-import paramiko, sys
+import argparse, sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.config import get_host
+from rdvops.query import QueryAgent
+from rdvops.report import diff_reports, fetch_report, format_report, list_snapshots, load_snapshot, save_snapshot
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
 
-cmd = """cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e "
-const {PrismaClient}=require('@prisma/client');
-const p=new PrismaClient();
-async function report() {
-  // Prefecture stats
-  const total = await p.prefecture.count();
-  const active = await p.prefecture.count({where:{status:'ACTIVE'}});
-  const byTier = await p.prefecture.groupBy({by:['tier'],where:{status:'ACTIVE'},_count:true});
-  console.log('=== PREFECTURE STATUS ===');
-  console.log('Total:', total, '| Active:', active);
-  byTier.forEach(s => console.log('  Tier', s.tier, ':', s._count, 'active'));
+parser = argparse.ArgumentParser(description='Prefecture, scraper and detection report in one query.')
+parser.add_argument('--cached', action='store_true', help='show the last saved snapshot without querying')
+parser.add_argument('--diff', action='store_true', help='compare the last two saved snapshots without querying')
+parser.add_argument('--list', action='store_true', help='list saved snapshots')
+parser.add_argument('--hours', type=int, default=24, help='window for per-status counts (default 24)')
+args = parser.parse_args()
 
-  // Scraper stats
-  const logCount = await p.scraperLog.count();
-  const recent = await p.scraperLog.findMany({take:10,orderBy:{createdAt:'desc'},select:{prefectureId:true,status:true,createdAt:true}});
-  console.log('\\n=== SCRAPER STATUS ===');
-  console.log('Total logs:', logCount);
-  console.log('Recent scrapes:');
-  recent.forEach(r => console.log(' ', r.prefectureId, '-', r.status, '-', r.createdAt.toISOString().slice(0,19)));
+host = get_host().name
+snapshots = list_snapshots(host)
 
-  // URL tracking
-  const urlChanges = await p.scraperLog.count({where:{urlChanged:true}});
-  console.log('\\n=== URL TRACKING ===');
-  console.log('URL changes detected:', urlChanges);
+if args.list:
+    for path in snapshots:
+        print(path)
+    sys.exit(0)
 
-  // Detection stats
-  const detections = await p.detection.count();
-  console.log('\\n=== DETECTIONS ===');
-  console.log('Total slot detections:', detections);
+if args.cached or args.diff:
+    if len(snapshots) < (2 if args.diff else 1):
+        print('Not enough saved snapshots, run without --cached/--diff first.')
+        sys.exit(1)
+    if args.cached:
+        print(format_report(load_snapshot(snapshots[-1])))
+    else:
+        print(f'Changes from {snapshots[-2].stem} to {snapshots[-1].stem}:')
+        print('\n'.join(diff_reports(load_snapshot(snapshots[-2]), load_snapshot(snapshots[-1]))) or '  (none)')
+    sys.exit(0)
 
-  await p.\\$disconnect();
-}
-report().catch(e=>{console.error(e);process.exit(1)});
-" 2>&1"""
+with QueryAgent(get_session(), timeout=60) as db:
+    report = fetch_report(db, args.hours)
+path = save_snapshot(host, report)
+print(format_report(report))
 
-channel = ssh.get_transport().open_session()
-channel.exec_command(cmd)
-channel.settimeout(30)
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-    except:
-        break
-print(output.decode('utf-8', errors='replace'))
-ssh.close()
+if snapshots:
+    print(f'\n=== CHANGES SINCE {snapshots[-1].stem} ===')
+    print('\n'.join(diff_reports(load_snapshot(snapshots[-1]), report)) or '  (none)')
+print(f'\nSaved {path}')
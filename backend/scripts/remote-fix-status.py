@@ -1,52 +1,36 @@
-import paramiko, sys
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.query import QueryAgent
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
+ssh = get_session()
 
 # Reset all priority prefectures to ACTIVE and clear error counts
-cmd = """cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e "
-const {PrismaClient}=require('@prisma/client');
-const p=new PrismaClient();
+priority_ids = [
+    'paris_75', 'bobigny_93', 'creteil_94', 'nanterre_92',
+    'evry_91', 'cergy_95', 'melun_77', 'versailles_78',
+    'lyon_69', 'marseille_13', 'toulouse_31', 'lille_59',
+    'nantes_44', 'bordeaux_33', 'montpellier_34', 'strasbourg_67',
+    'nice_06', 'rouen_76', 'rennes_35', 'grenoble_38',
+]
 
-const priorityIds = [
-  'paris_75','bobigny_93','creteil_94','nanterre_92',
-  'evry_91','cergy_95','melun_77','versailles_78',
-  'lyon_69','marseille_13','toulouse_31','lille_59',
-  'nantes_44','bordeaux_33','montpellier_34','strasbourg_67',
-  'nice_06','rouen_76','rennes_35','grenoble_38'
-];
+fix = """
+const result = await prisma.prefecture.updateMany({
+  where: { id: { in: args.ids } },
+  data: { status: 'ACTIVE', consecutiveErrors: 0 }
+});
+log('Reset', result.count, 'prefectures to ACTIVE');
 
-async function fix() {
-  const result = await p.prefecture.updateMany({
-    where: { id: { in: priorityIds } },
-    data: { status: 'ACTIVE', consecutiveErrors: 0 }
-  });
-  console.log('Reset', result.count, 'prefectures to ACTIVE');
+const stats = await prisma.prefecture.groupBy({
+  by: ['tier','status'],
+  where: { id: { in: args.ids } },
+  _count: true
+});
+stats.forEach(s => log('Tier', s.tier, s.status, ':', s._count));
+"""
 
-  const stats = await p.prefecture.groupBy({
-    by: ['tier','status'],
-    where: { id: { in: priorityIds } },
-    _count: true
-  });
-  stats.forEach(s => console.log('Tier', s.tier, s.status, ':', s._count));
-  await p.\\$disconnect();
-}
-fix().catch(e => { console.error(e); process.exit(1); });
-" 2>&1"""
-
-channel = ssh.get_transport().open_session()
-channel.exec_command(cmd)
-channel.settimeout(30)
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-    except:
-        break
-print(output.decode('utf-8', errors='replace'))
-print('EXIT:', channel.recv_exit_status())
-ssh.close()
+with QueryAgent(ssh, timeout=30) as db:
+    result = db.script(fix, ids=priority_ids)
+print(result.text if result.ok else f'Error: {result.error}')
+print('EXIT:', 0 if result.ok else 1)
@@ -1,53 +1,24 @@
-import paramiko, sys
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.query import QueryAgent
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
+ssh = get_session()
 
 # Check Tier 1 prefectures and their status
-cmd = """cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e "
-const {PrismaClient}=require('@prisma/client');
-const p=new PrismaClient();
-p.prefecture.findMany({where:{tier:1},select:{id:true,name:true,tier:true,status:true}}).then(r=>{
-  console.log('Tier 1 prefectures:');
-  r.forEach(x=>console.log(x.id, '-', x.name, '-', x.status));
-  console.log('Total:', r.length);
-}).finally(()=>p.\\$disconnect());
-" 2>&1"""
-
-channel = ssh.get_transport().open_session()
-channel.exec_command(cmd)
-channel.settimeout(30)
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-    except:
-        break
-print(output.decode('utf-8', errors='replace'))
+tier1 = """
+const r = await prisma.prefecture.findMany({where:{tier:1},select:{id:true,name:true,tier:true,status:true}});
+log('Tier 1 prefectures:');
+r.forEach(x=>log(x.id, '-', x.name, '-', x.status));
+log('Total:', r.length);
+"""
 
 # Also check scraper log count
-cmd2 = """cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e "
-const {PrismaClient}=require('@prisma/client');
-const p=new PrismaClient();
-p.scraperLog.count().then(c=>console.log('Total scraper logs:', c)).finally(()=>p.\\$disconnect());
-" 2>&1"""
-
-channel2 = ssh.get_transport().open_session()
-channel2.exec_command(cmd2)
-channel2.settimeout(30)
-output2 = b''
-while True:
-    try:
-        chunk = channel2.recv(4096)
-        if not chunk:
-            break
-        output2 += chunk
-    except:
-        break
-print(output2.decode('utf-8', errors='replace'))
+log_count = """
+log('Total scraper logs:', await prisma.scraperLog.count());
+"""
 
-ssh.close()
+with QueryAgent(ssh, timeout=30) as db:
+    for result in db.batch([{'script': tier1}, {'script': log_count}]):
+        print(result.text if result.ok else f'Error: {result.error}')
@@ -1,23 +1,48 @@
-import paramiko, sys
+import argparse, sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.config import get_host
+from rdvops.logs import (DEFAULT_RING, DEFAULT_TAIL, LEVEL_ORDER, CursorStore, LogFetcher, RingBuffer,
+                         cursor_view)
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
 
-cmd = """cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml logs --tail=20 nginx 2>&1 | tail -25 && echo '===' && docker compose -f docker-compose.prod.yml logs --tail=20 boss-panel 2>&1 | tail -25 && echo '===' && docker compose -f docker-compose.prod.yml logs --tail=10 frontend 2>&1 | tail -15"""
+parser = argparse.ArgumentParser(description='Show new log lines from every compose service, merged by time.')
+parser.add_argument('services', nargs='*', help='services to read (default: all)')
+parser.add_argument('-f', '--follow', action='store_true', help='keep streaming new lines')
+parser.add_argument('-g', '--grep', help='only lines matching this extended regex (case-insensitive)')
+parser.add_argument('-l', '--level', choices=LEVEL_ORDER, help='only lines at this level or worse')
+parser.add_argument('--tail', type=int, default=DEFAULT_TAIL,
+                    help=f'lines per service when there is no cursor yet (default {DEFAULT_TAIL})')
+parser.add_argument('--reset', action='store_true', help='forget the cursors and start from --tail again')
+parser.add_argument('--replay', type=int, metavar='N', help='print the last N lines already fetched and stop')
+parser.add_argument('--ring', type=int, default=DEFAULT_RING, help=f'lines kept for --replay (default {DEFAULT_RING})')
+args = parser.parse_args()
 
-channel = ssh.get_transport().open_session()
-channel.exec_command(cmd)
-channel.settimeout(30)
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-    except:
-        break
-print(output.decode('utf-8', errors='replace'))
-print('EXIT:', channel.recv_exit_status())
-ssh.close()
+host = get_host().name
+ring = RingBuffer(host, args.ring)
+if args.replay is not None:
+    for line in list(ring.lines)[-args.replay:]:
+        print(line.format())
+    sys.exit(0)
+
+store = CursorStore(host, cursor_view(args.grep, args.level))
+if args.reset:
+    store.reset()
+fetcher = LogFetcher(get_session(), store, args.services, args.tail, args.grep, args.level)
+try:
+    if args.follow:
+        for line in fetcher.follow():
+            ring.lines.append(line)
+            print(line.format(), flush=True)
+    else:
+        lines = fetcher.fetch(compress=True)
+        ring.extend(lines)
+        for line in lines:
+            print(line.format())
+        print(f'-- {len(lines)} new lines, {fetcher.transfer.describe()}')
+except KeyboardInterrupt:
+    pass
+finally:
+    store.save()
+    ring.save()
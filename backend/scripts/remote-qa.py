@@ -1,8 +1,35 @@
-import paramiko, sys
+import argparse, dataclasses, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops import latency
+from rdvops.checks import DEFAULT_CONCURRENCY, format_summary, run_checks, run_query_checks
+from rdvops.config import select_hosts
+from rdvops.fanout import run_checks_on_hosts
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
+
+parser = argparse.ArgumentParser(description='Run production QA checks over one SSH connection.')
+parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                    help=f'checks in flight at once, 1 runs them sequentially (default {DEFAULT_CONCURRENCY})')
+parser.add_argument('--timeout', type=float, default=30, help='time limit per check in seconds (default 30)')
+parser.add_argument('--hosts', help="run the shell checks on these hosts or roles at once, e.g. 'all' or 'worker'"
+                                    ' (database checks stay on the default host)')
+parser.add_argument('--latency', type=int, metavar='N',
+                    help='instead of the checks, time N requests per API endpoint inside rdv_api and through nginx')
+parser.add_argument('--latency-concurrency', type=int, default=latency.DEFAULT_CONCURRENCY,
+                    help=f'sampled requests in flight at once (default {latency.DEFAULT_CONCURRENCY})')
+parser.add_argument('--latency-rate', type=float, default=latency.DEFAULT_RATE,
+                    help=f'sampled requests a second through nginx (default {latency.DEFAULT_RATE:g}, nginx allows 10)')
+args = parser.parse_args()
+
+ssh = get_session()
+
+if args.latency:
+    series = latency.sample_endpoints(ssh, samples=args.latency, concurrency=args.latency_concurrency,
+                                      rate=args.latency_rate)
+    print(latency.format_report(series))
+    sys.exit(1 if any(s.error or s.failures for s in series) else 0)
 
 tests = [
     ("API Health (external)", "curl -sk https://rdvpriority.fr/api/health/ready"),
@@ -16,38 +43,46 @@ tests = [
     ("Boss Connections (internal)", "docker exec rdv_api curl -s http://localhost:4000/api/boss/connections"),
     ("Admin URL Changes (internal)", "docker exec rdv_api curl -s http://localhost:4000/api/admin/url-changes"),
     ("VFS Centers (internal)", "docker exec rdv_api curl -s http://localhost:4000/api/vfs/centers | head -c 200"),
-    ("Prefecture DB Count", "cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e \"const {PrismaClient}=require('@prisma/client');const p=new PrismaClient();p.prefecture.count().then(c=>console.log('Prefectures:',c)).finally(()=>p.\\$disconnect())\""),
-    ("Active Prefectures by Tier", "cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e \"const {PrismaClient}=require('@prisma/client');const p=new PrismaClient();p.prefecture.groupBy({by:['tier'],where:{status:'ACTIVE'},_count:true}).then(r=>r.forEach(s=>console.log('Tier',s.tier,':',s._count))).finally(()=>p.\\$disconnect())\""),
-    ("Scraper Logs (recent)", "cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e \"const {PrismaClient}=require('@prisma/client');const p=new PrismaClient();p.scraperLog.findMany({take:5,orderBy:{createdAt:'desc'},select:{prefectureId:true,status:true,finalUrl:true,urlChanged:true,createdAt:true}}).then(r=>console.log(JSON.stringify(r,null,2))).finally(()=>p.\\$disconnect())\""),
-    ("Worker1 recent logs", "cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml logs --tail=3 worker1 2>&1 | tail -3"),
+    ("Worker1 recent logs", lambda host: host.compose('logs --tail=3 worker1') + ' 2>&1 | tail -3'),
     ("WebSocket test", "curl -sk -o /dev/null -w 'HTTP %{http_code}' 'https://rdvpriority.fr/socket.io/?EIO=4&transport=polling'"),
 ]
 
-for name, cmd in tests:
+# Database checks share one query helper (one Node process, one Prisma pool) in rdv_api.
+db_tests = [
+    ("Prefecture DB Count", "log('Prefectures:', await prisma.prefecture.count())"),
+    ("Active Prefectures by Tier", "(await prisma.prefecture.groupBy({by:['tier'],where:{status:'ACTIVE'},_count:true})).forEach(s=>log('Tier',s.tier,':',s._count))"),
+    ("Scraper Logs (recent)", "log(JSON.stringify(await prisma.scraperLog.findMany({take:5,orderBy:{createdAt:'desc'},select:{prefectureId:true,status:true,finalUrl:true,urlChanged:true,createdAt:true}}),null,2))"),
+]
+# The database checks are reported where they sat in the original list, before the worker logs.
+db_position = [name for name, _ in tests].index("Worker1 recent logs")
+
+
+def report(r):
     print(f"\n{'='*60}")
-    print(f"  {name}")
+    print(f"  {r.name}")
     print('='*60)
-    try:
-        channel = ssh.get_transport().open_session()
-        channel.exec_command(cmd)
-        channel.settimeout(30)
-        output = b''
-        while True:
-            try:
-                chunk = channel.recv(4096)
-                if not chunk:
-                    break
-                output += chunk
-            except:
-                break
-        result = output.decode('utf-8', errors='replace').strip()
-        exit_code = channel.recv_exit_status()
-        status = "PASS" if exit_code == 0 and result else "FAIL"
-        print(f"[{status}] {result[:400]}")
-    except Exception as e:
-        print(f"[ERROR] {e}")
-
-ssh.close()
+    print(f"[{r.status}] ({r.elapsed:.2f}s) {r.output[:400]}")
+    results.append(r)
+
+
+started = time.monotonic()
+results = []
+with ThreadPoolExecutor(max_workers=1) as pool:
+    db_results = pool.submit(run_query_checks, ssh, db_tests, args.timeout)
+    if args.hosts:
+        # The database checks run once, so they land in the first host's block.
+        by_host = run_checks_on_hosts(select_hosts(args.hosts), tests, args.concurrency, args.timeout)
+        shell_results = [dataclasses.replace(r, name=f'{host}: {r.name}')
+                         for host, host_results in by_host.items() for r in host_results]
+    else:
+        shell_results = run_checks(ssh, tests, concurrency=args.concurrency, timeout=args.timeout)
+    for i, r in enumerate(shell_results):
+        if i == db_position:
+            for db_result in db_results.result():
+                report(db_result)
+        report(r)
+
 print("\n" + "="*60)
 print("  QA TESTING COMPLETE")
 print("="*60)
+print(format_summary(results, time.monotonic() - started))
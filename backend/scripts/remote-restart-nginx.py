@@ -1,24 +1,14 @@
-import paramiko, sys
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
+ssh = get_session()
 
 # Restart nginx to pick up new container IPs
 cmd = """cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml restart nginx 2>&1 && sleep 5 && docker compose -f docker-compose.prod.yml ps 2>&1"""
 
-channel = ssh.get_transport().open_session()
-channel.exec_command(cmd)
-channel.settimeout(60)
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-    except:
-        break
-print(output.decode('utf-8', errors='replace'))
-print('EXIT:', channel.recv_exit_status())
-ssh.close()
+with ssh.stream(cmd, timeout=60) as output:
+    for line in output:
+        print(line.text)
+print('EXIT:', output.exit_status)
@@ -0,0 +1,51 @@
+import argparse, json, sys, time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.config import cache_dir, get_host
+from rdvops.query import QueryAgent
+from rdvops.scraperlogs import PAGE_SIZE, TABLES, analyze, export, format_table, load, parse_duration
+from rdvops.session import get_session
+sys.stdout.reconfigure(encoding='utf-8')
+
+parser = argparse.ArgumentParser(description='Export scraper logs to local columnar files and analyse them.')
+parser.add_argument('command', choices=('export', 'analyze'))
+parser.add_argument('--table', choices=(*TABLES, 'all'), default='scraper', help='log table (default scraper)')
+parser.add_argument('--dir', type=Path, help='export directory (default: the rdvops cache)')
+parser.add_argument('--page-size', type=int, default=PAGE_SIZE, help=f'rows per page (default {PAGE_SIZE})')
+parser.add_argument('--by', choices=('target', 'worker', 'status', 'category'), default='target',
+                    help='group by prefecture/consulate (target), worker, status or category')
+parser.add_argument('--window', help='also split by time window, e.g. 1h or 1d')
+parser.add_argument('--since', help='only the last period before the newest exported row, e.g. 24h or 7d')
+parser.add_argument('--json', action='store_true', help='print JSON rows instead of a table')
+args = parser.parse_args()
+
+host = get_host().name
+tables = list(TABLES) if args.table == 'all' else [args.table]
+
+if args.command == 'export':
+    with QueryAgent(get_session(), timeout=300, compress=True) as db:
+        for key in tables:
+            directory = (args.dir or cache_dir() / 'scraperlogs' / host) / key
+            started = time.monotonic()
+            added = export(db, TABLES[key], directory, args.page_size)
+            print(f'{TABLES[key].name}: {added} new rows in {time.monotonic() - started:.1f}s -> {directory}')
+        print(f'transfer: {db.transfer.describe()}')
+    sys.exit(0)
+
+for key in tables:
+    table = TABLES[key]
+    directory = (args.dir or cache_dir() / 'scraperlogs' / host) / key
+    started = time.monotonic()
+    columns = load(directory, table)
+    if not len(columns):
+        print(f'{table.name}: nothing exported yet, run "export" first')
+        continue
+    column = {'target': table.target, 'worker': 'workerId', 'status': 'status',
+              'category': table.strings[-1]}[args.by]
+    since = int(columns.time.max()) - parse_duration(args.since) if args.since else None
+    rows = analyze(columns, column, parse_duration(args.window) if args.window else None, since)
+    if args.json:
+        print(json.dumps({'table': table.name, 'by': column, 'rows': rows}, indent=2))
+    else:
+        print(f'\n=== {table.name} by {column} ({len(columns)} rows, {time.monotonic() - started:.2f}s) ===')
+        print(format_table(rows))
@@ -1,23 +1,18 @@
-import paramiko, sys
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.logs import CursorStore, LogFetcher
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
+ssh = get_session()
 
-cmd = r"""docker ps --format 'table {{.Names}}\t{{.Status}}' && echo '---' && cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml logs --tail=10 api 2>&1 | tail -15 && echo '---' && docker compose -f docker-compose.prod.yml logs --tail=5 worker1 2>&1 | tail -8"""
+print(ssh.run("docker ps --format 'table {{.Names}}\\t{{.Status}}'", timeout=30).stdout.rstrip())
+print('---')
 
-channel = ssh.get_transport().open_session()
-channel.exec_command(cmd)
-channel.settimeout(30)
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-    except:
-        break
-print(output.decode('utf-8', errors='replace'))
-print('EXIT:', channel.recv_exit_status())
-ssh.close()
+# Only lines logged since the last status check (first run: the last 10 per service)
+store = CursorStore(ssh.host.name, 'status')
+lines = LogFetcher(ssh, store, ['api', 'worker1'], tail=10).fetch()
+for line in lines:
+    print(line.format())
+print(f'-- {len(lines)} new lines from api, worker1')
+store.save()
@@ -1,62 +1,44 @@
-import paramiko, sys
+import argparse, sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from rdvops.intervals import IntervalError, load_intervals
+from rdvops.prefsync import DEFAULT_CHUNK, apply_changes, apply_overrides, diff_prefectures, format_diff, load_state
+from rdvops.query import QueryAgent
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
 
-# Use the compiled dist files - import ALL_PREFECTURES from compiled JS
-cmd = r"""cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml exec -T api node -e "
-const { ALL_PREFECTURES } = require('./dist/scraper/prefectures/index.js');
-const { PrismaClient } = require('@prisma/client');
-const prisma = new PrismaClient();
+parser = argparse.ArgumentParser(description='Sync the Prefecture table with the compiled configs in rdv_api.')
+parser.add_argument('--dry-run', action='store_true', help='print the diff and stop')
+parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK,
+                    help=f'rows per transaction (default {DEFAULT_CHUNK})')
+parser.add_argument('--intervals', type=Path,
+                    help='checkInterval values to use instead of the configs, from python -m rdvops.intervals')
+args = parser.parse_args()
 
-async function seed() {
-  console.log('Seeding ' + ALL_PREFECTURES.length + ' prefectures...');
-  for (const config of ALL_PREFECTURES) {
-    await prisma.prefecture.upsert({
-      where: { id: config.id },
-      update: {
-        name: config.name,
-        department: config.department,
-        region: config.region,
-        tier: config.tier,
-        bookingUrl: config.bookingUrl,
-        checkInterval: config.checkInterval,
-        selectors: config.selectors,
-      },
-      create: {
-        id: config.id,
-        name: config.name,
-        department: config.department,
-        region: config.region,
-        tier: config.tier,
-        bookingUrl: config.bookingUrl,
-        checkInterval: config.checkInterval,
-        selectors: config.selectors,
-        status: 'ACTIVE',
-      },
-    });
-  }
-  const stats = await prisma.prefecture.groupBy({ by: ['tier'], _count: true });
-  stats.forEach(s => console.log('Tier ' + s.tier + ': ' + s._count));
-  console.log('Done! Total: ' + ALL_PREFECTURES.length);
-  await prisma.\$disconnect();
-}
-seed().catch(e => { console.error(e); process.exit(1); });
-" 2>&1"""
-
-channel = ssh.get_transport().open_session()
-channel.exec_command(cmd)
-channel.settimeout(120)
-output = b''
-while True:
+overrides = {}
+if args.intervals:
     try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-    except:
-        break
-print(output.decode('utf-8', errors='replace'))
-print('EXIT:', channel.recv_exit_status())
-ssh.close()
+        intervals = load_intervals(args.intervals)
+        overrides = {pref_id: {'checkInterval': value} for pref_id, value in intervals.items()}
+    except IntervalError as exc:
+        sys.exit(f'error: {exc}')
+
+ssh = get_session()
+
+# Configs come from the compiled dist files, rows from one findMany
+with QueryAgent(ssh, timeout=120) as db:
+    configs, rows = load_state(db)
+    if overrides:
+        configs, unknown = apply_overrides(configs, overrides)
+        print(f'{len(overrides) - len(unknown)} check intervals from {args.intervals}'
+              + (f' ({len(unknown)} without a config skipped: {", ".join(unknown)})' if unknown else ''))
+    print(f'{len(configs)} configs, {len(rows)} rows in the database')
+    changes = diff_prefectures(configs, rows)
+    if not changes:
+        print('Already in sync.')
+        sys.exit(0)
+    print(format_diff(changes))
+    if args.dry_run:
+        sys.exit(0)
+    written = apply_changes(db, changes, args.chunk_size)
+    print(f'Done! Wrote {written} prefectures.')
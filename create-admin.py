@@ -1,11 +1,9 @@
-import paramiko
 import sys
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
 
 print('Connecting to server...')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20)
+ssh = get_session()
 
 print('Creating admin account...')
 
@@ -47,12 +45,9 @@ ENDOFJS
 docker cp /tmp/create-admin.js rdv_api:/app/create-admin.js && docker exec -w /app rdv_api node create-admin.js 2>&1
 '''
 
-stdin, stdout, stderr = ssh.exec_command(cmd, timeout=60)
-out = stdout.read().decode('utf-8', errors='replace')
-err = stderr.read().decode('utf-8', errors='replace')
-print('Output:', out)
-if err:
-    print('Stderr:', err)
+result = ssh.run(cmd, timeout=60)
+print('Output:', result.stdout)
+if result.stderr:
+    print('Stderr:', result.stderr)
 
-ssh.close()
 print('Done!')
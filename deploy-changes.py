@@ -1,75 +1,39 @@
-import paramiko, sys, os
+import argparse, sys
+from rdvops.build import deploy_services
+from rdvops.config import get_host
+from rdvops.deploy import sync
+from rdvops.session import get_session
+from rdvops.trace import DeployTrace
 sys.stdout.reconfigure(encoding='utf-8')
 
-LOCAL_BASE = r'c:\Users\SHAH HARSH\.gemini\antigravity\scratch\rdvpriority'
-REMOTE_BASE = '/opt/rdvpriority'
-
-# Files to upload (local relative path -> remote relative path)
-FILES = [
-    # Backend - Boss API fixes: slotsFound24h + categories in details
-    ('backend/src/routes/boss.routes.ts', 'backend/src/routes/boss.routes.ts'),
-    # Backend - Consulate scraper: check ALL services per category (not just first)
-    ('backend/src/scraper/consulate.scraper.ts', 'backend/src/scraper/consulate.scraper.ts'),
-]
-
-print('Connecting to server...')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
-sftp = ssh.open_sftp()
-
-print('Uploading files...')
-for local_rel, remote_rel in FILES:
-    local_path = os.path.join(LOCAL_BASE, local_rel)
-    remote_path = f'{REMOTE_BASE}/{remote_rel}'
-    print(f'  {local_rel} -> {remote_path}')
-    sftp.put(local_path, remote_path)
-
-sftp.close()
-print('All files uploaded.')
-
-# Rebuild api + all worker containers (workers need the updated scraper code)
-print('\nRebuilding api, worker1, worker2, worker3 containers...')
-cmd = 'cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml build --no-cache api worker1 worker2 worker3 2>&1'
-channel = ssh.get_transport().open_session()
-channel.settimeout(600)
-channel.exec_command(cmd)
-
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-        # Print progress
-        lines = chunk.decode('utf-8', errors='replace')
-        for line in lines.strip().split('\n'):
-            if line.strip():
-                print(f'  {line.strip()[:120]}')
-    except Exception as e:
-        print(f'  Read error: {e}')
-        break
-
-exit_code = channel.recv_exit_status()
-print(f'\nBuild exit code: {exit_code}')
-
-if exit_code == 0:
-    print('\nRestarting containers...')
-    stdin, stdout, stderr = ssh.exec_command(
-        'cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml up -d api worker1 worker2 worker3 2>&1',
-        timeout=120
-    )
-    result = stdout.read().decode('utf-8', errors='replace')
-    print(result)
+parser = argparse.ArgumentParser(description='Upload changed backend sources and rebuild.')
+parser.add_argument('--dry-run', action='store_true', help='show changed files and stop')
+parser.add_argument('--force', action='store_true', help='upload every file and rebuild')
+args = parser.parse_args()
+
+# Phase timings go to the deploy history (python -m rdvops.trace) and a Prometheus textfile.
+trace = DeployTrace('backend', get_host().name)
+ok = False
+try:
+    print('Connecting to server...')
+    with trace.span('connect'):
+        ssh = get_session()
+
+    print('Uploading changed files...')
+    plan = sync(ssh, ('backend/src', 'backend/prisma'), dry_run=args.dry_run, force=args.force, trace=trace)
+    if args.dry_run:
+        sys.exit(0)
+
+    # Build each Dockerfile once (api, then one worker image retagged for all three
+    # workers) and restart the affected containers one at a time.
+    ok = deploy_services(ssh, plan.changed + plan.deleted, restrict=('api', 'worker1', 'worker2', 'worker3'),
+                         force=args.force, trace=trace)
+finally:
+    if not args.dry_run:
+        trace.finish(ok)
+
+if ok:
     print('Deployment complete!')
 else:
     print('BUILD FAILED - check output above')
-    # Print last part of output for debugging
-    decoded = output.decode('utf-8', errors='replace')
-    lines = decoded.strip().split('\n')
-    print('\nLast 30 lines:')
-    for line in lines[-30:]:
-        print(f'  {line}')
-
-ssh.close()
+    sys.exit(1)
@@ -1,70 +1,37 @@
-import paramiko, sys, os
+import argparse, sys
+from rdvops.build import deploy_services
+from rdvops.config import get_host
+from rdvops.deploy import sync
+from rdvops.session import get_session
+from rdvops.trace import DeployTrace
 sys.stdout.reconfigure(encoding='utf-8')
 
-LOCAL_BASE = r'c:\Users\SHAH HARSH\.gemini\antigravity\scratch\rdvpriority'
-REMOTE_BASE = '/opt/rdvpriority'
-
-# Files to upload - just the frontend homepage change
-FILES = [
-    ('frontend/src/app/page.tsx', 'frontend/src/app/page.tsx'),
-]
-
-print('Connecting to server...')
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20, banner_timeout=20, auth_timeout=20)
-sftp = ssh.open_sftp()
-
-print('Uploading files...')
-for local_rel, remote_rel in FILES:
-    local_path = os.path.join(LOCAL_BASE, local_rel)
-    remote_path = f'{REMOTE_BASE}/{remote_rel}'
-    print(f'  {local_rel} -> {remote_path}')
-    sftp.put(local_path, remote_path)
-
-sftp.close()
-print('All files uploaded.')
-
-# Rebuild frontend container
-print('\nRebuilding frontend container...')
-cmd = 'cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml build --no-cache frontend 2>&1'
-channel = ssh.get_transport().open_session()
-channel.settimeout(600)
-channel.exec_command(cmd)
-
-output = b''
-while True:
-    try:
-        chunk = channel.recv(4096)
-        if not chunk:
-            break
-        output += chunk
-        lines = chunk.decode('utf-8', errors='replace')
-        for line in lines.strip().split('\n'):
-            if line.strip():
-                print(f'  {line.strip()[:120]}')
-    except Exception as e:
-        print(f'  Read error: {e}')
-        break
-
-exit_code = channel.recv_exit_status()
-print(f'\nBuild exit code: {exit_code}')
-
-if exit_code == 0:
-    print('\nRestarting frontend container...')
-    stdin, stdout, stderr = ssh.exec_command(
-        'cd /opt/rdvpriority && docker compose -f docker-compose.prod.yml up -d frontend 2>&1',
-        timeout=120
-    )
-    result = stdout.read().decode('utf-8', errors='replace')
-    print(result)
+parser = argparse.ArgumentParser(description='Upload changed frontend sources and rebuild.')
+parser.add_argument('--dry-run', action='store_true', help='show changed files and stop')
+parser.add_argument('--force', action='store_true', help='upload every file and rebuild')
+args = parser.parse_args()
+
+# Phase timings go to the deploy history (python -m rdvops.trace) and a Prometheus textfile.
+trace = DeployTrace('frontend', get_host().name)
+ok = False
+try:
+    print('Connecting to server...')
+    with trace.span('connect'):
+        ssh = get_session()
+
+    print('Uploading changed files...')
+    plan = sync(ssh, ('frontend/src',), dry_run=args.dry_run, force=args.force, trace=trace)
+    if args.dry_run:
+        sys.exit(0)
+
+    ok = deploy_services(ssh, plan.changed + plan.deleted, restrict=('frontend',),
+                         force=args.force, trace=trace)
+finally:
+    if not args.dry_run:
+        trace.finish(ok)
+
+if ok:
     print('Deployment complete!')
 else:
     print('BUILD FAILED - check output above')
-    decoded = output.decode('utf-8', errors='replace')
-    lines = decoded.strip().split('\n')
-    print('\nLast 30 lines:')
-    for line in lines[-30:]:
-        print(f'  {line}')
-
-ssh.close()
+    sys.exit(1)
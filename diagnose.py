@@ -1,26 +1,22 @@
-import paramiko
 import sys
+from rdvops.bullq import format_queues, inspect_queues
+from rdvops.resp import connect_redis
+from rdvops.session import get_session
 sys.stdout.reconfigure(encoding='utf-8')
 
-ssh = paramiko.SSHClient()
-ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-ssh.connect('46.225.228.141', port=22, username='root', password='Root@123456', timeout=20)
+ssh = get_session()
 
 print('=== Worker1 Status (last 50 lines) ===')
-stdin, stdout, stderr = ssh.exec_command('docker logs rdv_worker1 --tail 50 2>&1', timeout=30)
-print(stdout.read().decode('utf-8', errors='replace'))
+print(ssh.run('docker logs rdv_worker1 --tail 50 2>&1', timeout=30).stdout)
 
 print('\n=== Redis Queue Status ===')
-stdin, stdout, stderr = ssh.exec_command('docker exec rdv_redis redis-cli keys "bull:*" 2>&1', timeout=30)
-print(stdout.read().decode('utf-8', errors='replace'))
+with connect_redis(ssh) as redis:
+    print(format_queues(inspect_queues(redis)))
 
 print('\n=== Container Health ===')
-stdin, stdout, stderr = ssh.exec_command('docker ps --format "table {{.Names}}\t{{.Status}}" 2>&1', timeout=30)
-print(stdout.read().decode('utf-8', errors='replace'))
+print(ssh.run('docker ps --format "table {{.Names}}\t{{.Status}}" 2>&1', timeout=30).stdout)
 
 print('\n=== Environment Check (BOOTSTRAP_MODE) ===')
-stdin, stdout, stderr = ssh.exec_command('docker exec rdv_worker1 printenv | grep -E "BOOTSTRAP|TWOCAPTCHA|WEBSHARE" 2>&1', timeout=30)
-print(stdout.read().decode('utf-8', errors='replace'))
+print(ssh.run('docker exec rdv_worker1 printenv | grep -E "BOOTSTRAP|TWOCAPTCHA|WEBSHARE" 2>&1', timeout=30).stdout)
 
-ssh.close()
 print('Done!')
@@ -0,0 +1 @@
+"""Shared tooling for the RDVPriority ops scripts."""
@@ -0,0 +1,275 @@
+"""Benchmarks for the ops layer against a local SSH stand-in.
+
+``python -m rdvops.bench`` starts a :class:`~rdvops.sshstub.StubSSHServer`
+that serves SFTP and has a fake ``docker`` first on its PATH, then times the
+paths every ops script goes through: connecting, opening a channel, a
+command round trip, ``docker exec``, attaching to and running through the
+mux master, SFTP upload/download, and the remote-qa.py check set.  Each
+case is repeated and reported as p50/p95.  Results are written as JSON
+under ``cache_dir()/bench`` together with the git revision, and
+``--compare`` flags cases whose p50 or p95 got worse by more than
+``--max-regression`` percent, the same 10% the k6 baselines allow.
+"""
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator
+
+import paramiko
+
+from . import mux
+from .checks import DEFAULT_CONCURRENCY, run_checks
+from .config import HostConfig, cache_dir
+from .session import SSHSession
+from .sshstub import StubSSHServer
+
+CASES = ('connect', 'channel_open', 'round_trip', 'docker_exec', 'mux_attach', 'mux_round_trip',
+         'sftp_put', 'sftp_get', 'qa_checks')
+DEFAULT_ITERATIONS = 30
+DEFAULT_SFTP_MB = 4
+MAX_REGRESSION = 10.0
+DOCKER_EXEC = 'docker exec rdv_api curl -s http://localhost:4000/api/health/ready'
+
+FAKE_DOCKER = r'''#!/bin/sh
+# Canned answers for the docker commands the ops scripts send.
+case "$1" in
+  exec) echo '{"status":"ready","checks":{"database":"ok","redis":"ok"}}' ;;
+  ps) printf 'NAMES\tSTATUS\nrdv_api\tUp 2 hours\nrdv_worker1\tUp 2 hours\n' ;;
+  compose) printf 'worker1  | [INFO] scrape paris_75 no_slots\nworker1  | [INFO] scrape bobigny_93 no_slots\n' ;;
+  inspect) echo '172.18.0.2' ;;
+esac
+'''
+
+# The internal (docker exec / compose) checks from remote-qa.py; the external
+# curl checks depend on the network rather than the tooling and are left out.
+QA_CHECKS = [
+    ('API Health (internal)', 'docker exec rdv_api curl -s http://localhost:4000/api/health/ready'),
+    ('Boss Stats (internal)', 'docker exec rdv_api curl -s http://localhost:4000/api/boss/stats'),
+    ('Boss Prefectures (internal)', 'docker exec rdv_api curl -s http://localhost:4000/api/boss/prefectures | head -c 300'),
+    ('Boss Top Prefectures (internal)', 'docker exec rdv_api curl -s http://localhost:4000/api/boss/top-prefectures'),
+    ('Boss Connections (internal)', 'docker exec rdv_api curl -s http://localhost:4000/api/boss/connections'),
+    ('Admin URL Changes (internal)', 'docker exec rdv_api curl -s http://localhost:4000/api/admin/url-changes'),
+    ('VFS Centers (internal)', 'docker exec rdv_api curl -s http://localhost:4000/api/vfs/centers | head -c 200'),
+    ('Worker1 recent logs', lambda host: host.compose('logs --tail=3 worker1') + ' 2>&1 | tail -3'),
+]
+
+
+def percentile(samples: list[float], q: float) -> float:
+    """Linearly interpolated percentile of ``samples`` (``q`` in 0-100)."""
+    ordered = sorted(samples)
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(samples: list[float]) -> dict:
+    """Timings in seconds as rounded millisecond stats."""
+    ms = [s * 1000 for s in samples]
+    return {'n': len(ms), 'p50': round(percentile(ms, 50), 3), 'p95': round(percentile(ms, 95), 3),
+            'mean': round(sum(ms) / len(ms), 3), 'min': round(min(ms), 3), 'max': round(max(ms), 3)}
+
+
+def time_calls(fn: Callable[[], object], iterations: int, warmup: int = 1) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+@contextmanager
+def stand_in(workdir: Path) -> Iterator[HostConfig]:
+    """A local SSH server with SFTP and a fake ``docker``, and the host settings to reach it."""
+    bin_dir = workdir / 'bin'
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    docker = bin_dir / 'docker'
+    docker.write_text(FAKE_DOCKER)
+    docker.chmod(0o755)
+    (workdir / 'sftp').mkdir(exist_ok=True)
+    (workdir / 'remote').mkdir(exist_ok=True)
+    env = dict(os.environ, PATH=f'{bin_dir}{os.pathsep}{os.environ.get("PATH", "")}')
+    with StubSSHServer(env=env, sftp_root=workdir / 'sftp') as server:
+        yield HostConfig(name=f'bench-{os.getpid()}', hostname='127.0.0.1', port=server.port, username='ops',
+                         password='secret', control_persist=0, remote_dir=str(workdir / 'remote'))
+
+
+@contextmanager
+def _mux_master(host: HostConfig) -> Iterator[HostConfig]:
+    host = dataclasses.replace(host, control_persist=60)
+    master = mux.MuxMaster(host)
+    thread = threading.Thread(target=master.serve_forever, daemon=True)
+    thread.start()
+    try:
+        while not mux.master_ready(host.name):
+            time.sleep(0.01)
+        yield host
+    finally:
+        master.shutdown()
+        thread.join(5)
+
+
+def run_benchmarks(host: HostConfig, iterations: int = DEFAULT_ITERATIONS, sftp_mb: float = DEFAULT_SFTP_MB,
+                   cases: tuple[str, ...] = CASES, log=print) -> dict[str, dict]:
+    """Time each case in ``cases`` against ``host``; returns per-case stats in milliseconds."""
+    results: dict[str, dict] = {}
+
+    def record(name: str, fn: Callable[[], object], **extra) -> None:
+        if name not in cases:
+            return
+        stats = summarize(time_calls(fn, iterations))
+        for key, derive in extra.items():
+            stats[key] = derive(stats)
+        results[name] = stats
+        log(f"  {name:<15} p50 {stats['p50']:>9.2f}ms  p95 {stats['p95']:>9.2f}ms")
+
+    session = SSHSession.connect(host)
+    try:
+        record('connect', lambda: SSHSession.connect(host).close())
+        record('channel_open', lambda: session.open_session().close())
+        record('round_trip', lambda: session.run('true'))
+        record('docker_exec', lambda: session.run(DOCKER_EXEC))
+        if {'mux_attach', 'mux_round_trip'} & set(cases):
+            with _mux_master(host) as mux_host:
+                record('mux_attach', lambda: mux.attach(mux_host, spawn=False).close())
+                attached = mux.attach(mux_host, spawn=False)
+                record('mux_round_trip', lambda: attached.run('true'))
+        if {'sftp_put', 'sftp_get'} & set(cases):
+            payload = os.urandom(int(sftp_mb * 1024 * 1024))
+            mb_per_s = lambda stats: round(sftp_mb / (stats['p50'] / 1000), 2)
+            with session.open_sftp() as sftp:
+                record('sftp_put', lambda: sftp.putfo(io.BytesIO(payload), 'bench.bin', confirm=False),
+                       mb_per_s=mb_per_s)
+                if 'sftp_put' not in cases:
+                    sftp.putfo(io.BytesIO(payload), 'bench.bin', confirm=False)
+                record('sftp_get', lambda: sftp.getfo('bench.bin', io.BytesIO()), mb_per_s=mb_per_s)
+                sftp.remove('bench.bin')
+        record('qa_checks', lambda: list(run_checks(session, QA_CHECKS, DEFAULT_CONCURRENCY, timeout=30)),
+               per_check=lambda stats: round(stats['p50'] / len(QA_CHECKS), 3))
+    finally:
+        session.close()
+    return results
+
+
+def revision() -> str | None:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).resolve().parent,
+                             capture_output=True, text=True, timeout=5)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def results_dir() -> Path:
+    path = cache_dir() / 'bench'
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_results(report: dict, path: Path | None = None) -> Path:
+    if path is None:
+        stamp = report['created'].replace(':', '').replace('-', '')
+        path = results_dir() / f"{stamp}-{report['revision'] or 'unknown'}.json"
+    path.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    return path
+
+
+def latest_results(exclude: Path | None = None) -> Path | None:
+    paths = [p for p in sorted(results_dir().glob('*.json')) if p != exclude]
+    return paths[-1] if paths else None
+
+
+def compare(old: dict, new: dict, max_regression: float = MAX_REGRESSION) -> list[dict]:
+    """p50/p95 changes per case present in both reports; ``regressed`` when slower by more than the limit."""
+    rows = []
+    for case, stats in new['cases'].items():
+        before = old['cases'].get(case)
+        if before is None:
+            continue
+        for metric in ('p50', 'p95'):
+            change = (stats[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+            rows.append({'case': case, 'metric': metric, 'old': before[metric], 'new': stats[metric],
+                         'change': round(change, 1), 'regressed': change > max_regression})
+    return rows
+
+
+def format_comparison(rows: list[dict], old: dict, new: dict) -> str:
+    lines = [f"Compared with {old.get('revision') or '?'} ({old['created']}):"]
+    for key in ('iterations', 'sftp_mb', 'python', 'paramiko'):
+        if old.get(key) != new.get(key):
+            lines.append(f'  note: {key} differs ({old.get(key)} -> {new.get(key)})')
+    lines.append(f"{'Case':<15} {'':>3}  {'Before':>10}  {'After':>10}  {'Change':>8}")
+    for r in rows:
+        flag = '  REGRESSED' if r['regressed'] else ''
+        lines.append(f"{r['case']:<15} {r['metric']:>3}  {r['old']:>8.2f}ms  {r['new']:>8.2f}ms"
+                     f"  {r['change']:>+7.1f}%{flag}")
+    regressed = sorted({r['case'] for r in rows if r['regressed']})
+    lines.append(f"{len(regressed)} regressed: {', '.join(regressed)}" if regressed else 'No regressions.')
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the ops tooling against a local SSH stand-in.')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS,
+                        help=f'timed runs per case (default {DEFAULT_ITERATIONS})')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma-separated cases (default: all)')
+    parser.add_argument('--sftp-mb', type=float, default=DEFAULT_SFTP_MB,
+                        help=f'SFTP payload in MB (default {DEFAULT_SFTP_MB})')
+    parser.add_argument('--output', type=Path, help='write results here instead of the bench cache')
+    parser.add_argument('--compare', metavar='FILE|latest', help="compare with an earlier result ('latest' for the last run)")
+    parser.add_argument('--max-regression', type=float, default=MAX_REGRESSION,
+                        help=f'percent slowdown that counts as a regression (default {MAX_REGRESSION:g})')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args(argv)
+    cases = tuple(c.strip() for c in args.cases.split(','))
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f'unknown case(s) {", ".join(sorted(unknown))} (known: {", ".join(CASES)})')
+    baseline = latest_results() if args.compare == 'latest' else Path(args.compare) if args.compare else None
+
+    log = (lambda *a: print(*a, file=sys.stderr)) if args.json else print
+    log(f'Benchmarking {len(cases)} cases x {args.iterations} runs against a local SSH stand-in')
+    with tempfile.TemporaryDirectory(prefix='rdvops-bench-') as workdir, stand_in(Path(workdir)) as host:
+        cases_stats = run_benchmarks(host, args.iterations, args.sftp_mb, cases, log)
+    report = {
+        'created': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'revision': revision(),
+        'python': platform.python_version(),
+        'paramiko': paramiko.__version__,
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'sftp_mb': args.sftp_mb,
+        'cases': cases_stats,
+    }
+    path = save_results(report, args.output)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    log(f'Results written to {path}')
+    if baseline is None:
+        if args.compare:
+            log('No earlier results to compare with.')
+        return 0
+    old = json.loads(baseline.read_text(encoding='utf-8'))
+    rows = compare(old, report, args.max_regression)
+    log(format_comparison(rows, old, report))
+    return 1 if any(r['regressed'] for r in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
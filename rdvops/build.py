@@ -0,0 +1,194 @@
+"""Build-once image pipeline for the compose services.
+
+Changed paths are mapped to the services whose build context they fall in.
+Services that share a Dockerfile (worker1/2/3 all use
+``backend/Dockerfile.worker``) are built once, with the layer cache kept, and
+the image is retagged for the others.  Services are then restarted one after
+another.  Services whose build failed are remembered locally and retried on
+the next deploy even if nothing else changed.
+"""
+from __future__ import annotations
+
+import json
+import shlex
+import socket
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+from typing import Iterable
+
+from .config import cache_dir
+from .session import BaseSession, SessionError
+from .trace import DeployTrace, span
+
+
+@dataclass(frozen=True)
+class ServiceImage:
+    service: str
+    context: str
+    dockerfile: str
+    image: str
+
+    @property
+    def dockerfile_path(self) -> str:
+        return f'{self.context}/{self.dockerfile}' if self.context else self.dockerfile
+
+
+@dataclass
+class StageTiming:
+    service: str
+    build: float = 0.0
+    built_by: str | None = None
+    restart: float = 0.0
+    ok: bool = True
+
+
+def compose_services(session: BaseSession) -> dict[str, ServiceImage]:
+    """Read build settings for every buildable service from the server's compose file."""
+    result = session.compose('config --format json', timeout=60)
+    if not result.ok:
+        raise SessionError(f'docker compose config failed: {result.stderr.strip() or result.stdout.strip()}')
+    config = json.loads(result.stdout)
+    root = session.host.remote_dir.rstrip('/')
+    services = {}
+    for name, spec in config.get('services', {}).items():
+        build = spec.get('build')
+        if not build:
+            continue
+        context = build.get('context', '.')
+        if context == root or context.startswith(root + '/'):
+            context = context[len(root):].lstrip('/')
+        services[name] = ServiceImage(
+            service=name,
+            context=context,
+            dockerfile=build.get('dockerfile', 'Dockerfile'),
+            image=spec.get('image') or f'{config["name"]}-{name}',
+        )
+    return services
+
+
+def affected_services(paths: Iterable[str], services: dict[str, ServiceImage]) -> list[str]:
+    """Services whose image depends on any of ``paths`` (repo-relative)."""
+    hit = set()
+    for path in paths:
+        name = PurePosixPath(path).name
+        for svc in services.values():
+            if svc.context and not path.startswith(svc.context + '/'):
+                continue
+            # backend/Dockerfile only matters to api, Dockerfile.worker only to the workers.
+            if name.startswith('Dockerfile') and path != svc.dockerfile_path:
+                continue
+            hit.add(svc.service)
+    return [s for s in services if s in hit]
+
+
+def group_by_dockerfile(names: Iterable[str], services: dict[str, ServiceImage]) -> dict[str, list[str]]:
+    """Map each distinct Dockerfile to the services built from it, first service builds."""
+    groups: dict[str, list[str]] = {}
+    for name in names:
+        groups.setdefault(services[name].dockerfile_path, []).append(name)
+    return groups
+
+
+def _pending_path(session: BaseSession):
+    return cache_dir() / f'pending-build-{session.host.name}.json'
+
+
+def load_pending(session: BaseSession) -> set[str]:
+    try:
+        return set(json.loads(_pending_path(session).read_text(encoding='utf-8')))
+    except (OSError, ValueError):
+        return set()
+
+
+def save_pending(session: BaseSession, names: Iterable[str]) -> None:
+    names = sorted(set(names))
+    path = _pending_path(session)
+    if names:
+        path.write_text(json.dumps(names), encoding='utf-8')
+    elif path.exists():
+        path.unlink()
+
+
+def _stream(session: BaseSession, command: str, timeout: float, log) -> tuple[bool, str]:
+    with session.stream(command, timeout=timeout, tail=30) as reader:
+        try:
+            for line in reader:
+                if line.text.strip():
+                    log(f'  {line.text.strip()[:120]}')
+        except socket.timeout as e:
+            log(f'  Read error: {e}')
+    return reader.exit_status == 0, reader.tail_text()
+
+
+def build_and_restart(session: BaseSession, names: list[str], services: dict[str, ServiceImage],
+                      log=print, trace: DeployTrace | None = None) -> list[StageTiming]:
+    """Build each distinct Dockerfile once, retag, then restart services one by one."""
+    timings = {name: StageTiming(name) for name in names}
+    failed: set[str] = set()
+    for dockerfile, group in group_by_dockerfile(names, services).items():
+        builder = group[0]
+        log(f'\nBuilding {dockerfile} for {", ".join(group)}...')
+        with span(trace, 'build', builder, dockerfile=dockerfile) as building:
+            ok, tail = _stream(session, session.host.compose(f'build {builder} 2>&1'), 900, log)
+            building.ok = ok
+        timings[builder].build = building.duration
+        if not ok:
+            log(f'BUILD FAILED for {dockerfile}\n\nLast 30 lines:\n{tail}')
+            failed.update(group)
+            for name in group:
+                timings[name].ok = False
+            continue
+        source = services[builder].image
+        for name in group[1:]:
+            with span(trace, 'tag', name, source=builder) as tagging:
+                result = session.run(f'docker tag {shlex.quote(source)} {shlex.quote(services[name].image)}')
+                tagging.ok = result.ok
+            timings[name].build = tagging.duration
+            timings[name].built_by = builder
+            if not result.ok:
+                log(f'Tagging {services[name].image} failed: {result.stdout}{result.stderr}')
+                failed.add(name)
+                timings[name].ok = False
+    for name in names:
+        if name in failed:
+            continue
+        log(f'\nRestarting {name}...')
+        with span(trace, 'restart', name) as restarting:
+            result = session.compose(f'up -d --no-deps --no-build {name} 2>&1', timeout=180)
+            restarting.ok = result.ok
+        timings[name].restart = restarting.duration
+        if result.stdout.strip():
+            log(result.stdout.rstrip())
+        if not result.ok:
+            failed.add(name)
+            timings[name].ok = False
+    save_pending(session, failed)
+    return list(timings.values())
+
+
+def format_report(timings: list[StageTiming]) -> str:
+    width = max([len(t.service) for t in timings] + [7])
+    lines = [f"{'Service':<{width}}  {'Build':>8}  {'Restart':>8}  Note", '-' * (width + 26)]
+    for t in timings:
+        note = f'tag of {t.built_by}' if t.built_by else ''
+        if not t.ok:
+            note = 'FAILED'
+        lines.append(f'{t.service:<{width}}  {t.build:>7.1f}s  {t.restart:>7.1f}s  {note}')
+    lines.append(f"{'total':<{width}}  {sum(t.build for t in timings):>7.1f}s  {sum(t.restart for t in timings):>7.1f}s")
+    return '\n'.join(lines)
+
+
+def deploy_services(session: BaseSession, changed: Iterable[str], restrict: Iterable[str] | None = None,
+                    force: bool = False, log=print, trace: DeployTrace | None = None) -> bool:
+    """Rebuild and restart whatever ``changed`` (plus any earlier failures) affects."""
+    with span(trace, 'compose_config'):
+        services = compose_services(session)
+    allowed = [s for s in services if restrict is None or s in set(restrict)]
+    wanted = set(allowed) if force else set(affected_services(changed, services)) | load_pending(session)
+    names = [s for s in allowed if s in wanted]
+    if not names:
+        log('Nothing to rebuild.')
+        return True
+    timings = build_and_restart(session, names, services, log, trace)
+    log('\n' + format_report(timings))
+    return all(t.ok for t in timings)
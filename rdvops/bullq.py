@@ -0,0 +1,133 @@
+"""BullMQ queue inspector that never blocks Redis.
+
+Queues are discovered with ``SCAN`` (never ``KEYS``), then every count for
+every queue is read in one pipelined batch of ``LLEN``/``ZCARD``/``HGET``
+calls.  A second small batch fetches the enqueue time of the oldest waiting
+job in each queue so its age can be reported against the server clock.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+
+from .resp import RedisConnection, RedisError, connect_redis
+from .session import get_session
+
+DEFAULT_PREFIX = 'bull'
+# Keys that only exist for a queue (job hashes are <prefix>:<queue>:<id>).
+QUEUE_SUFFIXES = ('meta', 'id', 'wait', 'active', 'paused', 'prioritized', 'delayed', 'failed', 'completed', 'events')
+LISTS = ('wait', 'active', 'paused')
+SETS = ('prioritized', 'delayed', 'failed', 'completed')
+
+
+@dataclass
+class QueueStats:
+    name: str
+    wait: int = 0
+    active: int = 0
+    paused: int = 0
+    prioritized: int = 0
+    delayed: int = 0
+    failed: int = 0
+    completed: int = 0
+    is_paused: bool = False
+    oldest_wait_age: float | None = None
+    errors: list[str] = field(default_factory=list)
+
+
+def find_queues(redis: RedisConnection, prefix: str = DEFAULT_PREFIX, count: int = 1000) -> list[str]:
+    """Queue names under ``prefix``, found by SCAN."""
+    names = set()
+    start = len(prefix) + 1
+    # Job hashes end in a numeric id; leave them out server-side.
+    for key in redis.scan(f'{prefix}:*:[^0-9]*', count):
+        queue, _, suffix = key[start:].rpartition(':')
+        if queue and suffix in QUEUE_SUFFIXES:
+            names.add(queue)
+    return sorted(names)
+
+
+def _number(stats: QueueStats, what: str, reply) -> int:
+    if isinstance(reply, RedisError):
+        stats.errors.append(f'{what}: {reply}')
+        return 0
+    return reply or 0
+
+
+def inspect_queues(redis: RedisConnection, prefix: str = DEFAULT_PREFIX, queues: list[str] | None = None,
+                   count: int = 1000) -> list[QueueStats]:
+    names = queues if queues is not None else find_queues(redis, prefix, count)
+    commands: list[tuple] = [('TIME',)]
+    for name in names:
+        base = f'{prefix}:{name}'
+        commands += [('LLEN', f'{base}:{kind}') for kind in LISTS]
+        commands += [('ZCARD', f'{base}:{kind}') for kind in SETS]
+        commands += [('HGET', f'{base}:meta', 'paused'), ('LINDEX', f'{base}:wait', -1),
+                     ('LINDEX', f'{base}:paused', -1)]
+    replies = redis.pipeline(commands)
+    seconds, micros = replies[0]
+    now_ms = int(seconds) * 1000 + int(micros) // 1000
+    per_queue = len(LISTS) + len(SETS) + 3
+    stats = []
+    oldest: list[tuple[QueueStats, str]] = []
+    for i, name in enumerate(names):
+        chunk = replies[1 + i * per_queue:1 + (i + 1) * per_queue]
+        s = QueueStats(name)
+        for kind, reply in zip(LISTS + SETS, chunk):
+            setattr(s, kind, _number(s, kind, reply))
+        paused_flag, oldest_wait, oldest_paused = chunk[-3:]
+        s.is_paused = paused_flag not in (None, '0') and not isinstance(paused_flag, RedisError)
+        # Jobs are pushed on the left and taken from the right, so index -1 is the oldest.
+        job_id = next((j for j in (oldest_wait, oldest_paused) if isinstance(j, str)), None)
+        if job_id is not None:
+            oldest.append((s, job_id))
+        stats.append(s)
+    stamps = redis.pipeline(('HGET', f'{prefix}:{s.name}:{job_id}', 'timestamp') for s, job_id in oldest)
+    for (s, _), stamp in zip(oldest, stamps):
+        if isinstance(stamp, str) and stamp.isdigit():
+            s.oldest_wait_age = max(0.0, (now_ms - int(stamp)) / 1000)
+    return stats
+
+
+def format_age(seconds: float | None) -> str:
+    if seconds is None:
+        return '-'
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f'{seconds / size:.1f}{unit}'
+    return f'{seconds:.0f}s'
+
+
+def format_queues(stats: list[QueueStats]) -> str:
+    if not stats:
+        return '(no BullMQ queues found)'
+    width = max(max(len(s.name) for s in stats), 5)
+    head = (f"{'Queue':<{width}}  {'Wait':>6}  {'Prio':>5}  {'Active':>6}  {'Delayed':>7}"
+            f"  {'Failed':>7}  {'Completed':>9}  {'Oldest wait':>11}")
+    lines = [head, '-' * len(head)]
+    for s in stats:
+        name = s.name + (' (paused)' if s.is_paused else '')
+        lines.append(f'{name:<{width}}  {s.wait + s.paused:>6}  {s.prioritized:>5}  {s.active:>6}  {s.delayed:>7}'
+                     f'  {s.failed:>7}  {s.completed:>9}  {format_age(s.oldest_wait_age):>11}')
+        lines += [f'  ! {error}' for error in s.errors]
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Show BullMQ queue counts without blocking Redis.')
+    parser.add_argument('queues', nargs='*', help='queue names (default: every queue found by SCAN)')
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('--container', default='rdv_redis', help='Redis container (default rdv_redis)')
+    parser.add_argument('--prefix', default=DEFAULT_PREFIX, help=f'BullMQ key prefix (default {DEFAULT_PREFIX})')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args(argv)
+    with connect_redis(get_session(args.host), args.container) as redis:
+        stats = inspect_queues(redis, args.prefix, args.queues or None)
+    print(json.dumps([asdict(s) for s in stats], indent=2) if args.json else format_queues(stats))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Concurrent runner for ``(name, command)`` checks such as remote-qa.py's.
+
+Checks run in parallel over one session, each on its own channel, with a
+concurrency cap and a hard time limit per check.  Results are yielded in the
+order the checks were given, as soon as every earlier check has finished.
+"""
+from __future__ import annotations
+
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Union
+
+from .config import HostConfig
+from .session import BaseSession, SessionError
+
+# OpenSSH allows 10 sessions per connection by default (MaxSessions).
+DEFAULT_CONCURRENCY = 8
+
+Command = Union[str, Callable[[HostConfig], str]]
+
+
+@dataclass
+class CheckResult:
+    name: str
+    command: str
+    status: str
+    output: str
+    exit_status: int | None
+    elapsed: float
+
+
+def run_check(session: BaseSession, name: str, command: Command, timeout: float) -> CheckResult:
+    """Run one check; PASS means exit status 0 with some output.
+
+    ``command`` may be a function of the host's settings, for checks that
+    need its compose project (``lambda host: host.compose('ps')``).
+    """
+    if callable(command):
+        command = command(session.host)
+    try:
+        result = session.run(command, timeout=timeout, max_time=timeout)
+    except socket.timeout as e:
+        return CheckResult(name, command, 'TIMEOUT', str(e), None, timeout)
+    except (SessionError, OSError) as e:
+        return CheckResult(name, command, 'ERROR', str(e), None, 0.0)
+    output = result.stdout.strip() or result.stderr.strip()
+    status = 'PASS' if result.ok and result.stdout.strip() else 'FAIL'
+    return CheckResult(name, command, status, output, result.exit_status, result.elapsed)
+
+
+def run_checks(
+    session: BaseSession,
+    checks: Iterable[tuple[str, Command]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = 30.0,
+) -> Iterator[CheckResult]:
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(run_check, session, name, cmd, timeout) for name, cmd in checks]
+        for future in futures:
+            yield future.result()
+
+
+def run_query_checks(session: BaseSession, checks: Iterable[tuple[str, str]],
+                     timeout: float = 30.0) -> list[CheckResult]:
+    """Run ``(name, script body)`` checks as one batch through a :class:`QueryAgent`."""
+    from .query import QueryAgent, QueryError
+    checks = list(checks)
+    try:
+        with QueryAgent(session, timeout=timeout) as agent:
+            answers = agent.batch({'script': body} for _, body in checks)
+    except socket.timeout as e:
+        return [CheckResult(name, body, 'TIMEOUT', str(e), None, timeout) for name, body in checks]
+    except (QueryError, SessionError, OSError) as e:
+        return [CheckResult(name, body, 'ERROR', str(e), None, 0.0) for name, body in checks]
+    results = []
+    for (name, body), answer in zip(checks, answers):
+        output = answer.text if answer.ok else answer.error or ''
+        status = 'PASS' if answer.ok and output.strip() else 'FAIL'
+        results.append(CheckResult(name, body, status, output.strip(), 0 if answer.ok else 1, answer.elapsed))
+    return results
+
+
+def format_summary(results: list[CheckResult], wall: float, slowest: int = 5) -> str:
+    """Summary table of every check plus the slowest ones."""
+    width = max((len(r.name) for r in results), default=10)
+    lines = [f"{'Check':<{width}}  {'Status':<7}  {'Time':>7}"]
+    lines.append('-' * len(lines[0]))
+    for r in results:
+        lines.append(f'{r.name:<{width}}  {r.status:<7}  {r.elapsed:>6.2f}s')
+    counts = {}
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    total = sum(r.elapsed for r in results)
+    lines.append('')
+    lines.append(', '.join(f'{n} {status}' for status, n in sorted(counts.items())))
+    lines.append(f'Wall time {wall:.2f}s for {total:.2f}s of checks')
+    lines.append('')
+    lines.append(f'Slowest {min(slowest, len(results))}:')
+    for r in sorted(results, key=lambda r: r.elapsed, reverse=True)[:slowest]:
+        lines.append(f'  {r.elapsed:>6.2f}s  {r.name}')
+    return '\n'.join(lines)
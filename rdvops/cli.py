@@ -0,0 +1,325 @@
+"""One entry point for the ops scripts and tools: ``python -m rdvops <command> [args]``.
+
+The command table below is all this module needs to print help or complete
+a command line.  ``--help`` and tab completion therefore import neither
+paramiko nor its crypto backends, nor any other rdvops module.  The chosen
+command's script or module is loaded only once it is needed, in this
+process, and runs exactly as it does on its own.
+
+What would otherwise be worked out on every call is kept between calls:
+
+* ``cli-index.json`` in the rdvops cache holds each command's option names
+  and ``--help`` text, keyed on its source file's mtime.  The options are
+  read from the source; the help is captured from the first ``--help`` run.
+* ``cli.json`` next to the rdvops config holds the default host and the
+  default arguments per command (``python -m rdvops config``).
+
+``eval "$(python -m rdvops completion)"`` defines an ``rdvops`` shell
+function for this checkout, with bash completion.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+from .paths import cache_dir, config_path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# name -> (script relative to the repo or rdvops module, one-line summary)
+COMMANDS: dict[str, tuple[str, str]] = {
+    'status': ('backend/scripts/remote-status.py', 'container status and new api/worker1 log lines'),
+    'logs': ('backend/scripts/remote-logs.py', 'new log lines from every compose service, merged by time'),
+    'qa': ('backend/scripts/remote-qa.py', 'production QA checks (--latency N samples endpoint latency)'),
+    'report': ('backend/scripts/remote-final-report.py', 'prefecture, scraper and detection report'),
+    'deploy': ('deploy-changes.py', 'upload changed backend sources and rebuild'),
+    'deploy-frontend': ('deploy-frontend.py', 'upload changed frontend sources and rebuild'),
+    'sync': ('backend/scripts/remote-sync.py', 'sync the Prefecture table with the compiled configs'),
+    'diagnose': ('diagnose.py', 'worker1 logs, BullMQ queues, containers and worker environment'),
+    'scraper-stats': ('backend/scripts/remote-scraper-stats.py', 'export scraper logs locally and analyse them'),
+    'investigate': ('backend/scripts/remote-investigate.py', 'tier 1 prefectures and scraper log counts'),
+    'fix-status': ('backend/scripts/remote-fix-status.py', 'reset priority prefectures to ACTIVE'),
+    'restart-nginx': ('backend/scripts/remote-restart-nginx.py', 'restart nginx to pick up new container IPs'),
+    'check-prefs': ('check-prefs.py', 'prefecture status counts'),
+    'check-recent': ('check-recent.py', 'recent detections and scraper log summary'),
+    'check-urls': ('check-urls.py', 'sample of stored prefecture booking URLs'),
+    'create-admin': ('create-admin.py', 'create the admin account'),
+    'fanout': ('rdvops.fanout', 'run a command or local script on every matching host'),
+    'queues': ('rdvops.bullq', 'BullMQ queue counts'),
+    'keyspace': ('rdvops.keyspace', 'Redis memory and TTLs by key family'),
+    'upload': ('rdvops.deploy', 'upload changed source files without rebuilding'),
+    'trace': ('rdvops.trace', 'phase durations of recent deploys'),
+    'retention': ('rdvops.retention', 'roll up, archive and delete old scraper logs'),
+    'planaudit': ('rdvops.planaudit', 'EXPLAIN the hot Prisma queries and flag bad plans'),
+    'urlcheck': ('rdvops.urlcheck', 'check every stored booking URL'),
+    'latency': ('rdvops.latency', 'API endpoint latency inside rdv_api and through nginx'),
+    'intervals': ('rdvops.intervals', 'recommend prefecture checkInterval values'),
+    'users': ('rdvops.users', 'create or update user accounts from a CSV file'),
+    'screenshots': ('rdvops.screenshots', 'pull new scraper screenshots and index them'),
+    'loadtest': ('rdvops.loadtest', 'k6 scenarios against their baselines'),
+    'bench': ('rdvops.bench', 'benchmark the ops tooling'),
+}
+BUILTINS = {
+    'config': 'show or change the saved host and default arguments',
+    'completion': 'print the shell function and bash completion for rdvops',
+}
+HOST_OPTIONS = ('-H', '--host')
+INDEX_VERSION = 1
+
+_OPTION = re.compile(r"""add_argument\(\s*((?:['"]-[\w-]+['"]\s*,\s*)*['"]-[\w-]+['"])""")
+_STRING = re.compile(r"""['"](-[\w-]+)['"]""")
+_SUBCOMMAND = re.compile(r"""add_parser\(\s*['"]([\w-]+)['"]""")
+
+
+class CLIError(Exception):
+    """Bad command line or settings; printed without a traceback."""
+
+
+def source_of(name: str) -> Path:
+    target = COMMANDS[name][0]
+    if target.startswith('rdvops.'):
+        return REPO_ROOT / (target.replace('.', '/') + '.py')
+    return REPO_ROOT / target
+
+
+def settings_path() -> Path:
+    return config_path().parent / 'cli.json'
+
+
+def load_settings() -> dict:
+    try:
+        settings = json.loads(settings_path().read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        raise CLIError(f'{settings_path()}: invalid JSON ({e})') from e
+    return settings if isinstance(settings, dict) else {}
+
+
+def save_settings(settings: dict) -> None:
+    path = settings_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(settings, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+
+
+class Index:
+    """Option names and help text per command, refreshed when the source changes."""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or cache_dir() / 'cli-index.json'
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            data = {}
+        if data.get('version') != INDEX_VERSION:
+            data = {}
+        self.entries: dict[str, dict] = data.get('commands', {})
+        self.known_hosts: dict = data.get('hosts', {})
+        self.dirty = False
+
+    def entry(self, name: str) -> dict:
+        source = source_of(name)
+        mtime = source.stat().st_mtime
+        entry = self.entries.get(name)
+        if entry is None or entry.get('mtime') != mtime:
+            text = source.read_text(encoding='utf-8')
+            options = {o for group in _OPTION.findall(text) for o in _STRING.findall(group)}
+            options = sorted(options | {'-h', '--help'})
+            entry = {'mtime': mtime, 'argparse': 'ArgumentParser(' in text, 'options': options,
+                     'subcommands': _SUBCOMMAND.findall(text), 'help': None}
+            self.entries[name] = entry
+            self.dirty = True
+        return entry
+
+    def help(self, name: str) -> str:
+        entry = self.entry(name)
+        if entry['help'] is None:
+            summary = COMMANDS[name][1]
+            entry['help'] = _capture_help(name) if entry['argparse'] else (
+                f'usage: rdvops {name}\n\n{summary[0].upper()}{summary[1:]}. Takes no arguments.')
+            self.dirty = True
+        return entry['help']
+
+    def hosts(self) -> list[str]:
+        """Host names from the rdvops config, reread only when the config file changes."""
+        path = config_path()
+        mtime = path.stat().st_mtime if path.exists() else None
+        if 'names' not in self.known_hosts or self.known_hosts.get('mtime') != mtime:
+            from .config import _hosts, load_config
+            self.known_hosts = {'mtime': mtime, 'names': sorted(_hosts(load_config()))}
+            self.dirty = True
+        return self.known_hosts['names']
+
+    def save(self) -> None:
+        if self.dirty:
+            data = {'version': INDEX_VERSION, 'commands': self.entries, 'hosts': self.known_hosts}
+            self.path.write_text(json.dumps(data), encoding='utf-8')
+            self.dirty = False
+
+
+def _capture_help(name: str) -> str:
+    """Run the command's own ``--help`` once; its usage line is renamed to ``rdvops <name>``."""
+    import subprocess
+
+    target = COMMANDS[name][0]
+    command = ['-m', target] if target.startswith('rdvops.') else [str(source_of(name))]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get('PYTHONPATH')])))
+    done = subprocess.run([sys.executable, *command, '--help'], cwd=REPO_ROOT, env=env, capture_output=True,
+                          text=True, timeout=60)
+    if done.returncode != 0:
+        raise CLIError(f'{name} --help failed: {(done.stderr or done.stdout).strip()[-500:]}')
+    usage, _, rest = done.stdout.partition('\n\n')
+    prog = source_of(name).name
+    first, *wrapped = usage.replace(f'usage: {prog}', f'usage: rdvops {name}', 1).split('\n')
+    shift = len(f'rdvops {name}') - len(prog)
+    wrapped = [' ' * shift + line if shift > 0 else line[-shift:] for line in wrapped]
+    return '\n'.join([first, *wrapped, '', rest]).rstrip()
+
+
+def usage() -> str:
+    width = max(map(len, [*COMMANDS, *BUILTINS])) + 2
+    lines = ['usage: rdvops [-H HOST] <command> [args...]', '',
+             "Ops commands for RDVPriority; 'rdvops <command> --help' shows a command's options.", '',
+             'commands:']
+    lines += [f'  {name:<{width}}{summary}' for name, (_, summary) in COMMANDS.items()]
+    lines += ['', 'settings:']
+    lines += [f'  {name:<{width}}{summary}' for name, summary in BUILTINS.items()]
+    lines += ['', 'options:', f'  {"-H, --host HOST":<{width + 8}}host from the rdvops config for this run']
+    return '\n'.join(lines)
+
+
+def complete(cword: int, words: list[str]) -> list[str]:
+    """Candidates for ``words[cword]``; ``words`` is the command line after ``rdvops``."""
+    current = words[cword] if cword < len(words) else ''
+    previous = words[cword - 1] if 0 < cword <= len(words) else ''
+    index = Index()
+    if previous in HOST_OPTIONS:
+        hosts = index.hosts()
+        index.save()
+        return [h for h in hosts if h.startswith(current)]
+    i = 0
+    while i < cword and words[i] in HOST_OPTIONS:
+        i += 2
+    if i >= cword:
+        return [w for w in [*COMMANDS, *BUILTINS, *HOST_OPTIONS, '--help'] if w.startswith(current)]
+    name = words[i]
+    if name == 'config':
+        return [w for w in ('host', 'args') if w.startswith(current)] if cword == i + 1 else (
+            [c for c in COMMANDS if c.startswith(current)] if cword == i + 2 and words[i + 1] == 'args' else [])
+    if name not in COMMANDS:
+        return []
+    entry = index.entry(name)
+    index.save()
+    if current.startswith('-'):
+        return [o for o in entry['options'] if o.startswith(current)]
+    return [s for s in entry['subcommands'] if s.startswith(current)] if cword == i + 1 else []
+
+
+def completion_script() -> str:
+    python = sys.executable
+    return f'''rdvops() {{ PYTHONPATH="{REPO_ROOT}${{PYTHONPATH:+:$PYTHONPATH}}" "{python}" -m rdvops "$@"; }}
+_rdvops_complete() {{
+  local IFS=$'\\n'
+  COMPREPLY=($(rdvops __complete "$((COMP_CWORD - 1))" "${{COMP_WORDS[@]:1}}" 2>/dev/null))
+}}
+complete -o default -F _rdvops_complete rdvops
+'''
+
+
+def configure(args: list[str]) -> int:
+    settings = load_settings()
+    if not args:
+        print(f'{settings_path()}:')
+        print(f'  host: {settings.get("host") or "(rdvops config default)"}')
+        for name, extra in sorted(settings.get('args', {}).items()):
+            print(f'  {name}: {" ".join(extra)}')
+        return 0
+    what, rest = args[0], args[1:]
+    if what == 'host' and len(rest) <= 1:
+        if rest:
+            from .config import ConfigError, get_host
+            try:
+                get_host(rest[0])
+            except ConfigError as e:
+                raise CLIError(str(e)) from e
+            settings['host'] = rest[0]
+        else:
+            settings.pop('host', None)
+    elif what == 'args' and rest:
+        if rest[0] not in COMMANDS:
+            raise CLIError(f'unknown command {rest[0]!r}')
+        if rest[1:] and not Index().entry(rest[0])['argparse']:
+            raise CLIError(f'{rest[0]} takes no arguments')
+        defaults = settings.setdefault('args', {})
+        if rest[1:]:
+            defaults[rest[0]] = rest[1:]
+        else:
+            defaults.pop(rest[0], None)
+    else:
+        raise CLIError('usage: rdvops config [host [NAME] | args COMMAND [ARGS...]]')
+    save_settings(settings)
+    return 0
+
+
+def run(name: str, args: list[str]) -> int:
+    """Run a command in this process; returns its exit status."""
+    target = COMMANDS[name][0]
+    if str(REPO_ROOT) not in sys.path:
+        sys.path.insert(0, str(REPO_ROOT))
+    if target.startswith('rdvops.'):
+        import importlib
+        return importlib.import_module(target).main(args) or 0
+    import runpy
+    sys.argv = [str(source_of(name)), *args]
+    runpy.run_path(sys.argv[0], run_name='__main__')
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    try:
+        if argv[:1] == ['__complete']:
+            cword = int(argv[1]) if len(argv) > 1 else 0
+            print('\n'.join(complete(cword, argv[2:])))
+            return 0
+        host = None
+        while argv[:1] and argv[0] in HOST_OPTIONS:
+            if len(argv) < 2:
+                raise CLIError(f'{argv[0]} needs a host name')
+            host, argv = argv[1], argv[2:]
+        if not argv or argv[0] in ('-h', '--help'):
+            print(usage())
+            return 0 if argv else 2
+        name, args = argv[0], argv[1:]
+        if name == 'config':
+            return configure(args)
+        if name == 'completion':
+            print(completion_script(), end='')
+            return 0
+        if name not in COMMANDS:
+            import difflib
+            close = difflib.get_close_matches(name, [*COMMANDS, *BUILTINS], n=1)
+            raise CLIError(f'unknown command {name!r}' + (f" (did you mean '{close[0]}'?)" if close else '')
+                           + "; 'rdvops --help' lists them")
+        if args in (['-h'], ['--help']):
+            index = Index()
+            print(index.help(name))
+            index.save()
+            return 0
+        settings = load_settings()
+        defaults = settings.get('args', {}).get(name, [])
+        index = Index()
+        takes_args = index.entry(name)['argparse']
+        index.save()
+        if args and not takes_args:
+            raise CLIError(f'{name} takes no arguments')
+        host = host or os.environ.get('RDVOPS_HOST') or settings.get('host')
+        if host:
+            os.environ['RDVOPS_HOST'] = host
+        return run(name, [*defaults, *args])
+    except CLIError as e:
+        print(f'rdvops: {e}', file=sys.stderr)
+        return 2
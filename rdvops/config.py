@@ -0,0 +1,161 @@
+"""Connection settings for the ops tooling.
+
+Settings live in a JSON file (``$RDVOPS_CONFIG``, default
+``~/.config/rdvops/config.json``) and can be overridden per run with
+``RDVOPS_*`` environment variables, so no script carries its own host,
+password or timeouts.  The ``hosts`` section doubles as the inventory for
+fan-out runs: each host lists its ``roles`` and where its compose project
+lives, and :func:`select_hosts` picks hosts by name or role::
+
+    {
+      "default_host": "prod",
+      "defaults": {"command_timeout": 30},
+      "hosts": {
+        "prod": {"hostname": "46.225.228.141", "password": "...", "roles": ["api", "db", "worker"]},
+        "worker-2": {"hostname": "10.0.0.12", "roles": ["worker"],
+                     "compose_file": "docker-compose.worker.yml"}
+      }
+    }
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any
+
+from .paths import cache_dir, config_path
+
+DEFAULT_HOST = 'prod'
+
+# Built-in inventory; the config file can override or extend it.
+BUILTIN_HOSTS: dict[str, dict[str, Any]] = {
+    'prod': {'hostname': '46.225.228.141', 'roles': ['api', 'db', 'worker']},
+}
+
+# Environment overrides applied to the selected host.
+ENV_OVERRIDES = {
+    'RDVOPS_HOSTNAME': 'hostname',
+    'RDVOPS_PORT': 'port',
+    'RDVOPS_USER': 'username',
+    'RDVOPS_PASSWORD': 'password',
+    'RDVOPS_KEY_FILE': 'key_filename',
+    'RDVOPS_CONTROL_PERSIST': 'control_persist',
+}
+# Overrides that only make sense for a single host.
+SINGLE_HOST_OVERRIDES = ('RDVOPS_HOSTNAME', 'RDVOPS_PORT')
+
+
+class ConfigError(Exception):
+    """Raised when the ops configuration is missing or invalid."""
+
+
+@dataclass(frozen=True)
+class HostConfig:
+    name: str
+    hostname: str
+    port: int = 22
+    username: str = 'root'
+    password: str | None = None
+    key_filename: str | None = None
+    connect_timeout: float = 20.0
+    command_timeout: float = 30.0
+    keepalive: int = 30
+    # Seconds an idle mux master keeps the transport open; 0 disables it.
+    control_persist: int = 600
+    remote_dir: str = '/opt/rdvpriority'
+    compose_file: str = 'docker-compose.prod.yml'
+    roles: tuple[str, ...] = ()
+
+    def compose(self, args: str) -> str:
+        """Build a ``docker compose`` command run from the deploy directory."""
+        return f'cd {self.remote_dir} && docker compose -f {self.compose_file} {args}'
+
+
+_FIELD_TYPES = {f.name: f.type for f in fields(HostConfig)}
+
+
+def load_config(path: Path | None = None) -> dict[str, Any]:
+    path = path or config_path()
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+    except ValueError as e:
+        raise ConfigError(f'{path}: invalid JSON ({e})') from e
+    if not isinstance(data, dict):
+        raise ConfigError(f'{path}: expected a JSON object')
+    return data
+
+
+def _coerce(key: str, value: Any) -> Any:
+    kind = _FIELD_TYPES[key]
+    if value is None:
+        return None
+    if kind == 'int':
+        return int(value)
+    if kind == 'float':
+        return float(value)
+    if kind == 'tuple[str, ...]':
+        return tuple(v.strip() for v in value.split(',')) if isinstance(value, str) else tuple(map(str, value))
+    return str(value)
+
+
+def _build(name: str, values: dict[str, Any]) -> HostConfig:
+    unknown = set(values) - set(_FIELD_TYPES)
+    if unknown:
+        raise ConfigError(f'host {name!r}: unknown setting(s) {", ".join(sorted(unknown))}')
+    if not values.get('hostname'):
+        raise ConfigError(f'host {name!r}: hostname is required')
+    return HostConfig(**{k: _coerce(k, v) for k, v in values.items()})
+
+
+def _hosts(data: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    return {**BUILTIN_HOSTS, **data.get('hosts', {})}
+
+
+def _resolve(name: str, data: dict[str, Any], overrides=tuple(ENV_OVERRIDES)) -> HostConfig:
+    hosts = _hosts(data)
+    if name not in hosts:
+        raise ConfigError(f'unknown host {name!r} (known: {", ".join(sorted(hosts))})')
+    values = {**data.get('defaults', {}), **hosts[name], 'name': name}
+    for env in overrides:
+        if os.environ.get(env):
+            values[ENV_OVERRIDES[env]] = os.environ[env]
+    return _build(name, values)
+
+
+def get_host(name: str | None = None, path: Path | None = None) -> HostConfig:
+    """Resolve the settings for ``name`` (default: ``$RDVOPS_HOST`` or the configured default)."""
+    data = load_config(path)
+    name = name or os.environ.get('RDVOPS_HOST') or data.get('default_host') or DEFAULT_HOST
+    return _resolve(name, data)
+
+
+def select_hosts(selector: str | None = None, path: Path | None = None) -> list[HostConfig]:
+    """Hosts matching a comma-separated list of host names and roles (``all`` for every host).
+
+    With no selector this is just the default host.  When several hosts are
+    selected, ``RDVOPS_HOSTNAME``/``RDVOPS_PORT`` are ignored since they
+    cannot apply to all of them.
+    """
+    if not selector:
+        return [get_host(path=path)]
+    data = load_config(path)
+    hosts = _hosts(data)
+    configs = {name: _build(name, {**data.get('defaults', {}), **values, 'name': name})
+               for name, values in hosts.items()}
+    names: list[str] = []
+    for token in (t.strip() for t in selector.split(',')):
+        if token in hosts:
+            matched = [token]
+        else:
+            matched = [n for n, c in configs.items() if token == 'all' or token in c.roles]
+        if not matched:
+            roles = sorted({r for c in configs.values() for r in c.roles})
+            raise ConfigError(f'no host or role {token!r} (hosts: {", ".join(sorted(hosts))};'
+                              f' roles: {", ".join(roles)})')
+        names += [n for n in matched if n not in names]
+    overrides = [env for env in ENV_OVERRIDES if len(names) == 1 or env not in SINGLE_HOST_OVERRIDES]
+    return [_resolve(name, data, overrides) for name in names]
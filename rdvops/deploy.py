@@ -0,0 +1,225 @@
+"""Content-hashed incremental upload of the source trees.
+
+The local trees are hashed (SHA-256, with a stat cache so unchanged files are
+not re-read) and compared with the manifest left on the server by the last
+deploy.  Only changed files are sent, as one gzip'd tar streamed into
+``tar -x`` on a single channel; the tar also carries the new manifest and the
+list of files deleted locally since the last deploy, so the server never ends
+up with a manifest that does not match its tree.
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import gzip
+import hashlib
+import io
+import json
+import os
+import shlex
+import sys
+import tarfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .config import cache_dir
+from .session import BaseSession, SessionError, get_session
+from .stream import iter_chunks
+from .trace import DeployTrace, span
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_ROOTS = ('backend/src', 'frontend/src', 'boss-panel/src')
+MANIFEST = '.rdvops-manifest.json'
+DELETED = '.rdvops-deleted'
+EXCLUDE = ('__pycache__', '*.pyc', '.DS_Store', 'Thumbs.db', '*.swp')
+
+
+@dataclass
+class SyncPlan:
+    changed: list[str]
+    deleted: list[str]
+    unchanged: int
+    manifest: dict[str, str] = field(repr=False)
+    bytes_sent: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not self.changed and not self.deleted
+
+
+def _excluded(name: str) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in EXCLUDE)
+
+
+def _under(path: str, roots: tuple[str, ...]) -> bool:
+    return any(path == root or path.startswith(root + '/') for root in roots)
+
+
+def hash_tree(base: Path, roots: tuple[str, ...]) -> dict[str, str]:
+    """Map each file under ``roots`` (POSIX path relative to ``base``) to its SHA-256."""
+    cache_file = cache_dir() / 'deploy-hashes.json'
+    try:
+        cache = json.loads(cache_file.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        cache = {}
+    hashes: dict[str, str] = {}
+    fresh: dict[str, list] = {}
+    for root in roots:
+        top = base / root
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = sorted(d for d in dirnames if not _excluded(d))
+            for name in sorted(filenames):
+                if _excluded(name):
+                    continue
+                path = Path(dirpath) / name
+                rel = path.relative_to(base).as_posix()
+                st = path.stat()
+                key = f'{base}:{rel}'
+                hit = cache.get(key)
+                if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+                    digest = hit[2]
+                else:
+                    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+                hashes[rel] = digest
+                fresh[key] = [st.st_size, st.st_mtime_ns, digest]
+    # Keep cache entries for other bases/roots, replace the ones just walked.
+    prefixes = tuple(f'{base}:{root}/' for root in roots)
+    cache = {k: v for k, v in cache.items() if not k.startswith(prefixes)}
+    cache.update(fresh)
+    tmp = cache_file.with_suffix('.tmp')
+    tmp.write_text(json.dumps(cache), encoding='utf-8')
+    os.replace(tmp, cache_file)
+    return hashes
+
+
+def remote_manifest(session: BaseSession, roots: tuple[str, ...], verify: bool = False) -> dict[str, str]:
+    """Fetch the server's manifest; with ``verify``, rehash ``roots`` on the server instead of trusting it."""
+    remote_dir = shlex.quote(session.host.remote_dir)
+    result = session.run(f'cat {remote_dir}/{MANIFEST} 2>/dev/null || echo {{}}')
+    try:
+        manifest = json.loads(result.stdout or '{}')
+    except ValueError:
+        manifest = {}
+    if not verify:
+        return manifest
+    paths = ' '.join(shlex.quote(r) for r in roots)
+    result = session.run(
+        f'cd {remote_dir} && find {paths} -type f -print0 2>/dev/null | xargs -0 -r sha256sum',
+        timeout=120,
+    )
+    manifest = {p: d for p, d in manifest.items() if not _under(p, roots)}
+    for line in result.stdout.splitlines():
+        digest, _, path = line.partition('  ')
+        if path and not any(_excluded(part) for part in path.split('/')):
+            manifest[path] = digest
+    return manifest
+
+
+def plan_sync(local: dict[str, str], remote: dict[str, str], roots: tuple[str, ...],
+              force: bool = False) -> SyncPlan:
+    """Diff ``local`` against ``remote``; ``force`` treats every local file as changed."""
+    changed = sorted(p for p, digest in local.items() if force or remote.get(p) != digest)
+    deleted = sorted(p for p in remote if _under(p, roots) and p not in local)
+    # Entries outside the synced roots are carried over untouched.
+    manifest = {p: d for p, d in remote.items() if not _under(p, roots)}
+    manifest.update(local)
+    return SyncPlan(changed, deleted, len(local) - len(changed), manifest)
+
+
+class _ChannelWriter(io.RawIOBase):
+    """Write-only file object feeding a channel's stdin."""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.channel.sendall(bytes(data))
+        self.written += len(data)
+        return len(data)
+
+
+def _tar_member(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(data))
+
+
+def upload(session: BaseSession, base: Path, plan: SyncPlan, timeout: float = 300) -> None:
+    """Stream the changed files, deletions and new manifest in one tar."""
+    remote_dir = shlex.quote(session.host.remote_dir)
+    command = (
+        f'mkdir -p {remote_dir} && cd {remote_dir} && tar -xzf - --no-same-owner; s=$?'
+        f'; if [ $s -eq 0 ] && [ -s {DELETED} ]; then xargs -0 rm -f -- < {DELETED}; fi; rm -f {DELETED}; exit $s'
+    )
+    channel = session.open_session(timeout)
+    try:
+        channel.exec_command(command)
+        writer = _ChannelWriter(channel)
+        with gzip.GzipFile(fileobj=writer, mode='wb', compresslevel=6, mtime=0) as gz:
+            with tarfile.open(fileobj=gz, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+                for rel in plan.changed:
+                    tar.add(base / rel, arcname=rel, recursive=False)
+                _tar_member(tar, DELETED, b''.join(p.encode() + b'\0' for p in plan.deleted))
+                _tar_member(tar, MANIFEST, json.dumps(plan.manifest, sort_keys=True).encode())
+        channel.shutdown_write()
+        errors = b''.join(data for _, data in iter_chunks(channel, timeout))
+        status = channel.recv_exit_status()
+    finally:
+        channel.close()
+    plan.bytes_sent = writer.written
+    if status != 0:
+        raise SessionError(f'remote tar failed ({status}): {errors.decode("utf-8", errors="replace").strip()}')
+
+
+def sync(session: BaseSession, roots: tuple[str, ...] = DEFAULT_ROOTS, base: Path = REPO_ROOT,
+         dry_run: bool = False, verify: bool = False, force: bool = False, log=print,
+         trace: DeployTrace | None = None) -> SyncPlan:
+    """Bring the server's copy of ``roots`` in line with ``base``."""
+    started = time.monotonic()
+    missing = [r for r in roots if not (base / r).is_dir()]
+    if missing:
+        raise FileNotFoundError(f'not found under {base}: {", ".join(missing)}')
+    with span(trace, 'hash') as hashing:
+        local = hash_tree(base, roots)
+        hashing.attrs['files'] = len(local)
+    with span(trace, 'manifest'):
+        remote = remote_manifest(session, roots, verify)
+    plan = plan_sync(local, remote, roots, force)
+    log(f'{len(local)} files: {len(plan.changed)} changed, {len(plan.deleted)} deleted, {plan.unchanged} unchanged')
+    for rel in plan.changed:
+        log(f'  M {rel}')
+    for rel in plan.deleted:
+        log(f'  D {rel}')
+    if plan.empty or dry_run:
+        return plan
+    with span(trace, 'upload', files=len(plan.changed), deleted=len(plan.deleted)) as uploading:
+        upload(session, base, plan)
+        uploading.attrs['bytes'] = plan.bytes_sent
+    log(f'Uploaded {plan.bytes_sent / 1024:.1f} KiB in {time.monotonic() - started:.2f}s')
+    return plan
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Upload changed source files as one tar stream.')
+    parser.add_argument('roots', nargs='*', default=list(DEFAULT_ROOTS),
+                        help=f'trees to sync, relative to the repo (default: {" ".join(DEFAULT_ROOTS)})')
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('--base', type=Path, default=REPO_ROOT, help='local checkout to upload from')
+    parser.add_argument('--dry-run', action='store_true', help='show what would change and stop')
+    parser.add_argument('--verify', action='store_true', help='rehash the remote tree instead of trusting the manifest')
+    parser.add_argument('--force', action='store_true', help='upload every file')
+    args = parser.parse_args(argv)
+    sync(get_session(args.host), tuple(r.strip('/') for r in args.roots), args.base,
+         dry_run=args.dry_run, verify=args.verify, force=args.force)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
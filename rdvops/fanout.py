@@ -0,0 +1,181 @@
+"""Run commands and checks on many hosts at once.
+
+Hosts come from the inventory in the config file (see
+:func:`rdvops.config.select_hosts`) and are picked by name or role, e.g.
+``worker``, ``prod,worker-2`` or ``all``.  Every host gets its own pooled
+session and at most ``per_host`` channels in flight; the hosts themselves
+run concurrently on an asyncio loop that hands the blocking SSH calls to a
+thread pool, so a check takes about as long on N nodes as on the slowest one.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable
+
+from .checks import CheckResult, Command, run_check
+from .config import ConfigError, HostConfig, select_hosts
+from .session import BaseSession, SessionError, get_session
+
+# Channels per host; stays under OpenSSH's default MaxSessions of 10.
+DEFAULT_PER_HOST = 4
+# Exit status reported for hosts that could not be reached, as ssh(1) does.
+UNREACHABLE = 255
+
+
+@dataclass
+class HostResult:
+    host: str
+    command: str
+    exit_status: int
+    stdout: str
+    stderr: str
+    elapsed: float
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_status == 0
+
+
+def script_command(path: Path, interpreter: str = 'bash -s') -> tuple[str, bytes]:
+    """A local script as ``(command, stdin)``: the remote shell reads it from stdin."""
+    return interpreter, Path(path).read_bytes()
+
+
+def exit_code(results: Iterable[HostResult]) -> int:
+    """0 when every host succeeded, otherwise the highest exit status seen."""
+    return max((r.exit_status for r in results), default=0)
+
+
+class FanOut:
+    """Async executor over a set of hosts with a per-host concurrency limit."""
+
+    def __init__(self, hosts: list[HostConfig], per_host: int = DEFAULT_PER_HOST,
+                 connect: Callable[[HostConfig], BaseSession] = get_session):
+        self.hosts = hosts
+        self.per_host = max(1, per_host)
+        self._connect = connect
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._sessions: dict[str, asyncio.Future] = {}
+        self._pool: ThreadPoolExecutor | None = None
+
+    async def __aenter__(self) -> 'FanOut':
+        self._pool = ThreadPoolExecutor(max_workers=len(self.hosts) * self.per_host or 1,
+                                        thread_name_prefix='fanout')
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    async def session(self, host: HostConfig) -> BaseSession:
+        """Connect once per host, however many tasks ask for it."""
+        if host.name not in self._sessions:
+            self._sessions[host.name] = asyncio.ensure_future(self._call(self._connect, host))
+        return await self._sessions[host.name]
+
+    async def _on(self, host: HostConfig, fn, *args):
+        limit = self._limits.setdefault(host.name, asyncio.Semaphore(self.per_host))
+        async with limit:
+            session = await self.session(host)
+            return await self._call(fn, session, *args)
+
+    async def run_one(self, host: HostConfig, command: str, timeout: float | None = None,
+                      input: bytes | None = None) -> HostResult:
+        started = time.monotonic()
+        try:
+            result = await self._on(host, lambda s: s.run(command, timeout=timeout, input=input,
+                                                           max_time=timeout))
+        except socket.timeout as e:
+            return HostResult(host.name, command, UNREACHABLE, '', '', time.monotonic() - started,
+                              f'timed out: {e}')
+        except (SessionError, OSError) as e:
+            return HostResult(host.name, command, UNREACHABLE, '', '', time.monotonic() - started, str(e))
+        return HostResult(host.name, command, result.exit_status, result.stdout, result.stderr, result.elapsed)
+
+    async def run(self, command: str, timeout: float | None = None, input: bytes | None = None) -> list[HostResult]:
+        """``command`` on every host; results in inventory order."""
+        return list(await asyncio.gather(*(self.run_one(h, command, timeout, input) for h in self.hosts)))
+
+    async def checks(self, checks: list[tuple[str, Command]], timeout: float = 30.0) -> dict[str, list[CheckResult]]:
+        """``(name, command)`` checks on every host, ``per_host`` at a time per host."""
+        async def one(host: HostConfig, name: str, command: Command) -> CheckResult:
+            try:
+                return await self._on(host, run_check, name, command, timeout)
+            except (SessionError, OSError) as e:
+                shown = command(host) if callable(command) else command
+                return CheckResult(name, shown, 'ERROR', str(e), None, 0.0)
+
+        results = await asyncio.gather(*(one(h, name, cmd) for h in self.hosts for name, cmd in checks))
+        return {h.name: list(results[i * len(checks):(i + 1) * len(checks)]) for i, h in enumerate(self.hosts)}
+
+
+def run_on_hosts(hosts: list[HostConfig], command: str, per_host: int = DEFAULT_PER_HOST,
+                 timeout: float | None = None, input: bytes | None = None) -> list[HostResult]:
+    async def go():
+        async with FanOut(hosts, per_host) as fan:
+            return await fan.run(command, timeout, input)
+    return asyncio.run(go())
+
+
+def run_checks_on_hosts(hosts: list[HostConfig], checks: list[tuple[str, Command]], per_host: int = DEFAULT_PER_HOST,
+                        timeout: float = 30.0) -> dict[str, list[CheckResult]]:
+    async def go():
+        async with FanOut(hosts, per_host) as fan:
+            return await fan.checks(checks, timeout)
+    return asyncio.run(go())
+
+
+def format_results(results: list[HostResult]) -> str:
+    lines = []
+    for r in results:
+        lines.append(f'== {r.host} (exit {r.exit_status}, {r.elapsed:.2f}s) ==')
+        if r.error:
+            lines.append(f'! {r.error}')
+        lines += [text.rstrip('\n') for text in (r.stdout, r.stderr) if text.strip()]
+    failed = [r.host for r in results if not r.ok]
+    lines.append(f'{len(results)} hosts, {len(results) - len(failed)} ok'
+                 + (f', failed: {", ".join(failed)}' if failed else ''))
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Run a command or local script on every matching host.')
+    parser.add_argument('command', nargs='?', help='shell command to run remotely')
+    parser.add_argument('-H', '--hosts', help="host names and/or roles, comma-separated, or 'all' (default: default host)")
+    parser.add_argument('--script', type=Path, help='local script to run remotely with bash -s')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help=f'channels in flight per host (default {DEFAULT_PER_HOST})')
+    parser.add_argument('--timeout', type=float, help='time limit per host in seconds')
+    parser.add_argument('--list', action='store_true', help='show the matching hosts and exit')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of text')
+    args = parser.parse_args(argv)
+    try:
+        hosts = select_hosts(args.hosts)
+    except ConfigError as e:
+        parser.error(str(e))
+    if args.list:
+        for h in hosts:
+            print(f'{h.name:<16} {h.username}@{h.hostname}:{h.port}  roles={",".join(h.roles) or "-"}'
+                  f'  {h.remote_dir}/{h.compose_file}')
+        return 0
+    if bool(args.command) == bool(args.script):
+        parser.error('give either a command or --script')
+    command, stdin = script_command(args.script) if args.script else (args.command, None)
+    results = run_on_hosts(hosts, command, args.per_host, args.timeout, stdin)
+    print(json.dumps([asdict(r) for r in results], indent=2) if args.json else format_results(results))
+    return exit_code(results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
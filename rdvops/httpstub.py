@@ -0,0 +1,111 @@
+"""Local HTTP/1.1 server stand-in for the URL checker tests.
+
+Serves canned routes with keep-alive, and records every request with its
+``Host`` header, arrival time and client connection, which is what the
+tests need to prove per-host rate limits and connection reuse.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class Route:
+    status: int = 200
+    body: bytes = b'<html>rendez-vous</html>'
+    headers: dict[str, str] = field(default_factory=dict)
+    delay: float = 0.0
+    chunked: bool = False
+
+
+@dataclass(frozen=True)
+class Request:
+    host: str
+    path: str
+    at: float
+    connection: int
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: '_Server'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.record(Request(self.headers.get('Host', ''), self.path, time.monotonic(), self.client_address[1]))
+        route = stub.routes.get(self.path.split('?')[0].rstrip('/') or '/', Route(404, b'not found'))
+        if route.delay:
+            time.sleep(route.delay)
+        self.send_response(route.status)
+        for name, value in route.headers.items():
+            self.send_header(name, value)
+        if route.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i in range(0, len(route.body), 7):
+                piece = route.body[i:i + 7]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(route.body)))
+            self.end_headers()
+            self.wfile.write(route.body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    stub: 'StubHTTPServer'
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that is the test, not a server fault.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class StubHTTPServer:
+    """HTTP server on 127.0.0.1 serving ``routes`` by path (a trailing slash is ignored); unknown paths are 404.
+
+    Use as a context manager; ``port`` is assigned on entry and ``requests``
+    lists what was asked for, in arrival order.
+    """
+
+    def __init__(self, routes: dict[str, Route] | None = None):
+        self.routes = dict(routes or {})
+        self.requests: list[Request] = []
+        self._server: _Server | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def url(self, path: str, host: str = '127.0.0.1') -> str:
+        return f'http://{host}:{self.port}{path}'
+
+    def redirect(self, path: str, location: str, status: int = 302) -> None:
+        self.routes[path] = Route(status, b'', {'Location': location})
+
+    def record(self, request: Request) -> None:
+        with self._lock:
+            self.requests.append(request)
+
+    def connections(self, host: str | None = None) -> int:
+        """Distinct client connections seen, optionally for one ``Host`` name."""
+        return len({r.connection for r in self.requests if host is None or r.host.split(':')[0] == host})
+
+    def __enter__(self) -> 'StubHTTPServer':
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,414 @@
+"""Prefecture ``checkInterval`` recommendations from slot-detection history.
+
+Each ACTIVE prefecture is scraped every ``checkInterval`` seconds, and one
+job loads every category page it has.  The tier configs give all of them
+the same interval whether or not they ever release slots.  This module
+rebuilds the slot windows seen over the last ``days`` and spends a fixed
+scrape budget where it buys the most windows caught in time:
+
+* Observations per prefecture and category come from ``ScraperLog`` polls
+  (``slotsFound > 0`` or not) and from ``Detection.detectedAt``.  Detections
+  near a logged positive poll are the same event, because there is one row
+  per alert.  The others come from polls whose log rows the retention job
+  has already rolled up.
+* A window is a run of positive observations.  Its length is the observed
+  run plus half of the gap to the negative poll on each side.  Where there
+  is no neighbour, the current interval stands in for the gap.
+* A window of length ``D`` polled every ``T`` seconds from a random phase is
+  caught within ``target`` with probability ``min(1, min(D, target) / T)``.
+  A prefecture's loss at ``T`` is its windows per day times the share not
+  caught in time.
+* Every prefecture starts at ``max_interval``.  Then the step to the next
+  shorter interval with the most loss saved per added scrape is taken,
+  until the budget (by default today's scrapes per hour) runs out or
+  nothing is left to save.
+
+The scheduler never polls faster than ``minIntervalSeconds`` in
+``backend/src/config/bootstrap.config.ts`` (240s), so that is the default
+floor.  Windows shorter than the poll interval are often missed, so they
+are under-represented and the estimates lean optimistic for them.
+
+The recommendation is written as a JSON file of ``checkInterval`` values
+that ``remote-sync.py --intervals FILE`` applies on top of the tier configs.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .config import cache_dir
+from .prefsync import PrefectureChange, format_diff
+from .query import QueryAgent, QueryError
+from .session import get_session
+
+DEFAULT_DAYS = 14
+DEFAULT_TARGET = 600
+# minIntervalSeconds in backend/src/config/bootstrap.config.ts.
+SCHEDULER_FLOOR = 240
+DEFAULT_MAX_INTERVAL = 1800
+INTERVALS = (240, 300, 360, 480, 600, 900, 1200, 1800, 2700, 3600)
+# A Detection this close to a logged positive poll of the same prefecture is that poll.
+DEDUPE_SECONDS = 120
+# Positives further apart than this many intervals, with nothing between, are separate windows.
+MAX_GAP_INTERVALS = 3
+
+LOAD_SCRIPT = """
+const since = `(now() AT TIME ZONE 'UTC') - make_interval(days => $1::int)`;
+const prefectures = await prisma.prefecture.findMany({
+  where: { status: 'ACTIVE' }, select: { id: true, name: true, tier: true, checkInterval: true } });
+const logs = await prisma.$queryRawUnsafe(`
+  SELECT "prefectureId" AS p, coalesce("categoryCode", '') AS c, extract(epoch FROM "createdAt")::float8 AS t,
+         "slotsFound" > 0 AS s
+  FROM "ScraperLog" WHERE "createdAt" >= ${since} AND "status" IN ('no_slots', 'slots_found')
+  ORDER BY "createdAt"`, args.days);
+const detections = await prisma.$queryRawUnsafe(`
+  SELECT "prefectureId" AS p, coalesce("categoryCode", '') AS c, extract(epoch FROM "detectedAt")::float8 AS t
+  FROM "Detection" WHERE "prefectureId" IS NOT NULL AND "detectedAt" >= ${since}
+  ORDER BY "detectedAt"`, args.days);
+const rollups = await prisma.$queryRawUnsafe(`
+  SELECT "targetId" AS p, extract(epoch FROM min("hour"))::float8 AS t
+  FROM "ScraperLogRollup" WHERE "source" = 'prefecture' AND "runs" > 0 AND "hour" >= ${since}
+  GROUP BY 1`, args.days);
+return {
+  now: Date.now() / 1000,
+  prefectures,
+  logs: logs.map(r => [r.p, r.c, r.t, r.s ? 1 : 0]),
+  detections: detections.map(r => [r.p, r.c, r.t]),
+  firstRollup: Object.fromEntries(rollups.map(r => [r.p, r.t])),
+};
+"""
+
+
+class IntervalError(Exception):
+    """The history could not be loaded or the recommendation cannot be made."""
+
+
+@dataclass(frozen=True)
+class Window:
+    category: str
+    start: float
+    duration: float
+    polls: int
+
+
+@dataclass
+class PrefectureHistory:
+    id: str
+    name: str
+    tier: int
+    check_interval: int
+    categories: int
+    days: float
+    windows: list[Window] = field(default_factory=list)
+
+    @property
+    def per_day(self) -> float:
+        return len(self.windows) / self.days if self.days else 0.0
+
+    @property
+    def durations(self) -> list[float]:
+        return [w.duration for w in self.windows]
+
+
+@dataclass
+class Recommendation:
+    id: str
+    name: str
+    tier: int
+    categories: int
+    windows: int
+    per_day: float
+    median_window: float | None
+    current: int
+    recommended: int
+    on_time_before: float | None
+    on_time_after: float | None
+    scrapes_before: float
+    scrapes_after: float
+    curve: list[dict] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def effective(interval: float, floor: int = SCHEDULER_FLOOR) -> float:
+    return max(interval, floor)
+
+
+def on_time(durations: list[float], interval: float, target: float) -> float:
+    """Share of windows caught within ``target`` seconds when polling every ``interval``."""
+    if not durations:
+        return 1.0
+    return sum(min(1.0, min(d, target) / interval) for d in durations) / len(durations)
+
+
+def caught(durations: list[float], interval: float) -> float:
+    """Share of windows that see at least one poll."""
+    if not durations:
+        return 1.0
+    return sum(min(1.0, d / interval) for d in durations) / len(durations)
+
+
+def mean_delay(durations: list[float], interval: float) -> float | None:
+    """Average seconds from a window opening to its first poll, over the windows that get one."""
+    weights = [min(1.0, d / interval) for d in durations]
+    if not sum(weights):
+        return None
+    return sum(w * min(d, interval) / 2 for w, d in zip(weights, durations)) / sum(weights)
+
+
+def build_windows(observations: list[tuple[float, bool]], interval: float) -> list[tuple[float, float, int]]:
+    """``(start, duration, polls)`` of each run of positive observations in ``observations``.
+
+    Each edge of a run is taken halfway to the negative poll beyond it.
+    Without one, or when it is more than ``MAX_GAP_INTERVALS`` intervals
+    away, ``interval`` is used for the gap instead.  Positives further apart
+    than that split into separate windows.
+    """
+    max_gap = MAX_GAP_INTERVALS * interval
+    ordered = sorted(observations)
+    windows = []
+    i = 0
+    while i < len(ordered):
+        if not ordered[i][1]:
+            i += 1
+            continue
+        first = last = ordered[i][0]
+        polls = 1
+        j = i + 1
+        while j < len(ordered) and ordered[j][1] and ordered[j][0] - last <= max_gap:
+            last = ordered[j][0]
+            polls += 1
+            j += 1
+        before = first - ordered[i - 1][0] if i > 0 and not ordered[i - 1][1] else None
+        after = ordered[j][0] - last if j < len(ordered) and not ordered[j][1] else None
+        before = before if before is not None and before <= max_gap else interval
+        after = after if after is not None and after <= max_gap else interval
+        windows.append((first - before / 2, last - first + (before + after) / 2, polls))
+        i = j
+    return windows
+
+
+def build_histories(data: dict, days: int, floor: int = SCHEDULER_FLOOR) -> list[PrefectureHistory]:
+    """Windows per ACTIVE prefecture that was polled in the period, from ``LOAD_SCRIPT``'s answer."""
+    observations: dict[str, dict[str, list[tuple[float, bool]]]] = {}
+    first_seen: dict[str, float] = dict(data.get('firstRollup') or {})
+    logged: dict[str, list[float]] = {}
+    for p, c, t, slots in data['logs']:
+        observations.setdefault(p, {}).setdefault(c, []).append((t, bool(slots)))
+        first_seen[p] = min(first_seen.get(p, t), t)
+        if slots:
+            logged.setdefault(p, []).append(t)
+    for times in logged.values():
+        times.sort()
+    last_detection: dict[str, float] = {}
+    for p, c, t in sorted(data['detections'], key=lambda d: d[2]):
+        times = logged.get(p, [])
+        i = bisect.bisect_left(times, t - DEDUPE_SECONDS)
+        if i < len(times) and times[i] <= t + DEDUPE_SECONDS:
+            continue
+        # One row per alert: the later rows of the same detection.
+        if p in last_detection and t - last_detection[p] <= DEDUPE_SECONDS:
+            continue
+        last_detection[p] = t
+        observations.setdefault(p, {}).setdefault(c, []).append((t, True))
+        first_seen[p] = min(first_seen.get(p, t), t)
+
+    now = data.get('now') or time.time()
+    histories = []
+    for row in sorted(data['prefectures'], key=lambda r: r['id']):
+        by_category = observations.get(row['id'])
+        if not by_category:
+            continue
+        interval = effective(row['checkInterval'] or SCHEDULER_FLOOR, floor)
+        span = min(now - first_seen[row['id']], days * 86400)
+        history = PrefectureHistory(row['id'], row.get('name') or row['id'], row.get('tier') or 3,
+                                    row['checkInterval'], len(by_category), max(span, 3600) / 86400)
+        for category, seen in sorted(by_category.items()):
+            history.windows += [Window(category, start, duration, polls)
+                                for start, duration, polls in build_windows(seen, interval)]
+        histories.append(history)
+    return histories
+
+
+def scrapes_per_hour(history: PrefectureHistory, interval: float, floor: int = SCHEDULER_FLOOR) -> float:
+    return history.categories * 3600 / effective(interval, floor)
+
+
+def _loss(history: PrefectureHistory, interval: float, target: float, floor: int) -> float:
+    """Windows a day not caught within ``target``."""
+    return history.per_day * (1 - on_time(history.durations, effective(interval, floor), target))
+
+
+def allocate(histories: list[PrefectureHistory], budget: float, target: float = DEFAULT_TARGET,
+             min_interval: int = SCHEDULER_FLOOR, max_interval: int = DEFAULT_MAX_INTERVAL,
+             floor: int = SCHEDULER_FLOOR) -> dict[str, int]:
+    """Interval per prefecture that keeps the most windows on time within ``budget`` scrapes an hour."""
+    grid = sorted({i for i in INTERVALS if min_interval <= i <= max_interval} | {min_interval, max_interval},
+                  reverse=True)
+    level = {h.id: 0 for h in histories}
+    spent = sum(scrapes_per_hour(h, grid[0], floor) for h in histories)
+    if spent > budget:
+        raise IntervalError(f'{spent:.0f} scrapes/hour at --max-interval {max_interval}s is over the budget '
+                            f'of {budget:.0f}; raise --budget or --max-interval')
+    while True:
+        best = None
+        for h in histories:
+            i = level[h.id]
+            if i + 1 >= len(grid):
+                continue
+            cost = scrapes_per_hour(h, grid[i + 1], floor) - scrapes_per_hour(h, grid[i], floor)
+            saved = _loss(h, grid[i], target, floor) - _loss(h, grid[i + 1], target, floor)
+            if saved <= 1e-9 or spent + cost > budget + 1e-9:
+                continue
+            score = saved / cost if cost > 0 else float('inf')
+            if best is None or score > best[0]:
+                best = (score, h, cost)
+        if best is None:
+            break
+        _, h, cost = best
+        level[h.id] += 1
+        spent += cost
+    return {h.id: grid[level[h.id]] for h in histories}
+
+
+def recommend(histories: list[PrefectureHistory], budget: float | None = None, target: float = DEFAULT_TARGET,
+              min_interval: int = SCHEDULER_FLOOR, max_interval: int = DEFAULT_MAX_INTERVAL,
+              floor: int = SCHEDULER_FLOOR) -> tuple[list[Recommendation], float]:
+    """Recommendations and the budget used; ``budget`` defaults to today's scrapes per hour."""
+    if budget is None:
+        budget = sum(scrapes_per_hour(h, h.check_interval, floor) for h in histories)
+    chosen = allocate(histories, budget, target, min_interval, max_interval, floor)
+    recommendations = []
+    for h in histories:
+        durations = h.durations
+        before, after = effective(h.check_interval, floor), effective(chosen[h.id], floor)
+        curve = [{'interval': i, 'onTime': on_time(durations, effective(i, floor), target),
+                  'caught': caught(durations, effective(i, floor)),
+                  'meanDelay': mean_delay(durations, effective(i, floor))}
+                 for i in INTERVALS if min_interval <= i <= max_interval] if durations else []
+        recommendations.append(Recommendation(
+            h.id, h.name, h.tier, h.categories, len(h.windows), h.per_day,
+            statistics.median(durations) if durations else None, h.check_interval, chosen[h.id],
+            on_time(durations, before, target) if durations else None,
+            on_time(durations, after, target) if durations else None,
+            scrapes_per_hour(h, h.check_interval, floor), scrapes_per_hour(h, chosen[h.id], floor), curve))
+    return recommendations, budget
+
+
+def changes(recommendations: list[Recommendation]) -> list[PrefectureChange]:
+    """The ``checkInterval`` updates, in the form remote-sync.py prints and writes."""
+    return [PrefectureChange(r.id, 'update', {'checkInterval': (r.current, r.recommended)})
+            for r in recommendations if r.recommended != r.current]
+
+
+def save_intervals(path: Path, recommendations: list[Recommendation], meta: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = dict(meta, generated=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    checkInterval={r.id: r.recommended for r in recommendations})
+    path.write_text(json.dumps(document, indent=2) + '\n', encoding='utf-8')
+
+
+def load_intervals(path: Path) -> dict[str, int]:
+    """``{prefectureId: checkInterval}`` from a file written by :func:`save_intervals`."""
+    try:
+        document = json.loads(Path(path).read_text(encoding='utf-8'))
+        intervals = document['checkInterval']
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        raise IntervalError(f'cannot read intervals from {path}: {exc}') from exc
+    if not all(isinstance(v, int) and v > 0 for v in intervals.values()):
+        raise IntervalError(f'{path}: checkInterval values must be positive whole seconds')
+    return intervals
+
+
+def default_path() -> Path:
+    return cache_dir() / 'check-intervals.json'
+
+
+def load_history(agent: QueryAgent, days: int = DEFAULT_DAYS) -> dict:
+    answer = agent.script(LOAD_SCRIPT, days=days)
+    if not answer.ok:
+        raise QueryError(f'cannot load detection history: {answer.error}')
+    return answer.result
+
+
+def _pct(value: float | None) -> str:
+    return '-' if value is None else f'{value * 100:.0f}%'
+
+
+def _minutes(seconds: float | None) -> str:
+    return '-' if seconds is None else f'{seconds / 60:.1f}m'
+
+
+def format_report(recommendations: list[Recommendation], budget: float, target: float) -> str:
+    lines = [f'{"prefecture":<16} {"tier":>4} {"cats":>4} {"windows":>7} {"/day":>5} {"median":>7} '
+             f'{"interval":>13} {"on time":>11} {"scrapes/h":>13}']
+    for r in recommendations:
+        lines.append(f'{r.id:<16} {r.tier:>4} {r.categories:>4} {r.windows:>7} {r.per_day:>5.1f} '
+                     f'{_minutes(r.median_window):>7} {f"{r.current}s -> {r.recommended}s":>13} '
+                     f'{f"{_pct(r.on_time_before)} -> {_pct(r.on_time_after)}":>11} '
+                     f'{f"{r.scrapes_before:.0f} -> {r.scrapes_after:.0f}":>13}')
+    curves = [r for r in recommendations if r.curve]
+    if curves:
+        lines += ['', f'caught within {target / 60:g}m / mean delay, by interval:']
+        for r in curves:
+            points = '  '.join(f'{p["interval"]}s {_pct(p["onTime"])}/{_minutes(p["meanDelay"])}' for p in r.curve)
+            lines.append(f'  {r.id:<16} {points}')
+    late_before = sum(r.per_day * (1 - r.on_time_before) for r in recommendations if r.on_time_before is not None)
+    late_after = sum(r.per_day * (1 - r.on_time_after) for r in recommendations if r.on_time_after is not None)
+    before = sum(r.scrapes_before for r in recommendations)
+    after = sum(r.scrapes_after for r in recommendations)
+    lines += ['', f'scrapes/hour {before:.0f} -> {after:.0f} (budget {budget:.0f}); '
+                  f'windows a day missed or later than {target / 60:g}m: {late_before:.1f} -> {late_after:.1f}']
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Recommend prefecture checkInterval values from detection history.')
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('--days', type=int, default=DEFAULT_DAYS, help=f'history to use (default {DEFAULT_DAYS})')
+    parser.add_argument('--target', type=int, default=DEFAULT_TARGET,
+                        help=f'seconds from a window opening to its detection (default {DEFAULT_TARGET})')
+    parser.add_argument('--budget', type=float, help='scrapes per hour to spend (default: the current rate)')
+    parser.add_argument('--min-interval', type=int, default=SCHEDULER_FLOOR,
+                        help=f'shortest interval to propose (default {SCHEDULER_FLOOR}, the scheduler floor)')
+    parser.add_argument('--max-interval', type=int, default=DEFAULT_MAX_INTERVAL,
+                        help=f'longest interval to propose (default {DEFAULT_MAX_INTERVAL})')
+    parser.add_argument('--output', type=Path, help=f'where to write the intervals (default {default_path()})')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args(argv)
+    if args.min_interval > args.max_interval:
+        parser.error('--min-interval is above --max-interval')
+    try:
+        with QueryAgent(get_session(args.host), timeout=300, compress=True) as db:
+            histories = build_histories(load_history(db, args.days), args.days)
+        recommendations, budget = recommend(histories, args.budget, args.target, args.min_interval,
+                                            args.max_interval)
+    except (QueryError, IntervalError) as exc:
+        print(f'error: {exc}', file=sys.stderr)
+        return 2
+    if not recommendations:
+        print(f'no prefecture was polled in the last {args.days} days')
+        return 0
+    output = args.output or default_path()
+    save_intervals(output, recommendations, {'days': args.days, 'target': args.target, 'budget': budget})
+    if args.json:
+        print(json.dumps({'budget': budget, 'target': args.target,
+                          'prefectures': [r.to_dict() for r in recommendations]}, indent=2))
+        return 0
+    print(format_report(recommendations, budget, args.target))
+    diff = changes(recommendations)
+    print('\n' + (format_diff(diff) if diff else 'No interval changes.'))
+    print(f'\nWrote {output}; apply with: python backend/scripts/remote-sync.py --intervals {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
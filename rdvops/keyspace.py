@@ -0,0 +1,271 @@
+"""Sampling memory/TTL profiler for the Redis keyspace.
+
+Keys are walked with ``SCAN`` (never ``KEYS``) and each batch is sized with
+one pipeline of ``TYPE``, ``PTTL`` and ``MEMORY USAGE ... SAMPLES``, which
+are O(1) or bounded by the sample count, so the server is never blocked.
+Keys are grouped into families by replacing their id-like segments with
+``*`` (``cache:pref:paris_75`` -> ``cache:pref:*``), and per-family totals
+are scaled up by ``DBSIZE`` when only part of the keyspace was sampled.
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import json
+import re
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .resp import RedisConnection, RedisError, connect_redis
+from .session import get_session
+from .transport import format_bytes
+
+DEFAULT_LIMIT = 20_000
+DEFAULT_COUNT = 500
+MEMORY_SAMPLES = 5
+TTL_BUCKETS = ((60, '<=1m'), (300, '<=5m'), (900, '<=15m'), (3600, '<=1h'), (86400, '<=1d'))
+NO_TTL = 'no ttl'
+LONG_TTL = '>1d'
+SMALLEST_BUCKET = 64
+_HEX = re.compile(r'[0-9a-fA-F-]{16,}')
+
+
+def key_pattern(key: str, depth: int | None = None) -> str:
+    """``key`` with id-like segments (anything with a digit, long hex/tokens) replaced by ``*``."""
+    parts = key.split(':')
+    if depth is not None and len(parts) > depth:
+        parts = parts[:depth] + ['*']
+    return ':'.join('*' if any(c.isdigit() for c in p) or len(p) >= 32 or _HEX.fullmatch(p) else p
+                    for p in parts)
+
+
+def ttl_bucket(ttl: float | None) -> str:
+    if ttl is None:
+        return NO_TTL
+    for bound, label in TTL_BUCKETS:
+        if ttl <= bound:
+            return label
+    return LONG_TTL
+
+
+def size_bucket(size: int) -> int:
+    """Smallest power of two (at least 64) that holds ``size`` bytes."""
+    bucket = SMALLEST_BUCKET
+    while bucket < size:
+        bucket <<= 1
+    return bucket
+
+
+@dataclass
+class KeySample:
+    key: str
+    type: str
+    bytes: int
+    ttl: float | None
+
+
+@dataclass
+class KeyFamily:
+    pattern: str
+    keys: int = 0
+    bytes: int = 0
+    max_bytes: int = 0
+    max_key: str = ''
+    types: Counter = field(default_factory=Counter)
+    ttls: Counter = field(default_factory=Counter)
+
+    def add(self, sample: KeySample) -> None:
+        self.keys += 1
+        self.bytes += sample.bytes
+        if sample.bytes > self.max_bytes:
+            self.max_bytes, self.max_key = sample.bytes, sample.key
+        self.types[sample.type] += 1
+        self.ttls[ttl_bucket(sample.ttl)] += 1
+
+
+@dataclass
+class Profile:
+    dbsize: int
+    examined: int
+    families: list[KeyFamily]
+    sizes: Counter
+    ttls: Counter
+    complete: bool
+    info: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def sampled(self) -> int:
+        return sum(f.keys for f in self.families)
+
+    @property
+    def scale(self) -> float:
+        """Factor from sampled counts to whole-keyspace estimates."""
+        if self.complete or not self.examined:
+            return 1.0
+        return max(self.dbsize / self.examined, 1.0)
+
+    @property
+    def hit_rate(self) -> float | None:
+        hits, misses = int(self.info.get('keyspace_hits', 0)), int(self.info.get('keyspace_misses', 0))
+        return hits / (hits + misses) if hits + misses else None
+
+    def to_dict(self) -> dict:
+        scale = self.scale
+        return {
+            'dbsize': self.dbsize, 'examined': self.examined, 'sampled': self.sampled,
+            'complete': self.complete, 'scale': round(scale, 3), 'hit_rate': self.hit_rate,
+            'used_memory': int(self.info.get('used_memory', 0)), 'maxmemory': int(self.info.get('maxmemory', 0)),
+            'families': [{
+                'pattern': f.pattern, 'keys': f.keys, 'bytes': f.bytes,
+                'est_keys': round(f.keys * scale), 'est_bytes': round(f.bytes * scale),
+                'avg_bytes': round(f.bytes / f.keys), 'max_bytes': f.max_bytes, 'max_key': f.max_key,
+                'types': dict(f.types), 'ttls': dict(f.ttls),
+            } for f in self.families],
+            'sizes': {str(k): v for k, v in sorted(self.sizes.items())},
+            'ttls': dict(self.ttls),
+        }
+
+
+def parse_info(text: str) -> dict[str, str]:
+    info = {}
+    for line in text.splitlines():
+        name, sep, value = line.partition(':')
+        if sep and not name.startswith('#'):
+            info[name] = value.strip()
+    return info
+
+
+def sample_keys(redis: RedisConnection, match: str | None = None, limit: int = DEFAULT_LIMIT,
+                count: int = DEFAULT_COUNT, pause: float = 0.0):
+    """Yield ``(examined, sized, [KeySample, ...])`` per SCAN batch until ``limit`` keys were sized.
+
+    ``match`` is applied here rather than as ``SCAN MATCH`` so that
+    ``examined`` counts every key walked and the scale-up stays honest.
+    """
+    if limit < 1:
+        return
+    seen: set[str] = set()
+    sized = 0
+    for batch in _batches(redis.scan(count=count), count):
+        examined = len(batch)
+        keys = [k for k in batch if k not in seen and (match is None or fnmatch.fnmatchcase(k, match))]
+        seen.update(keys)
+        if len(keys) > limit - sized:
+            keys = keys[:limit - sized]
+            # The walk stops at the last key sized; the rest of the batch was never examined.
+            examined = batch.index(keys[-1]) + 1
+        commands = []
+        for key in keys:
+            commands += [('TYPE', key), ('PTTL', key), ('MEMORY', 'USAGE', key, 'SAMPLES', MEMORY_SAMPLES)]
+        replies = redis.pipeline(commands)
+        samples = []
+        for i, key in enumerate(keys):
+            kind, pttl, size = replies[3 * i:3 * i + 3]
+            if kind == 'none' or not isinstance(size, int) or isinstance(kind, RedisError):
+                continue  # expired between SCAN and the pipeline
+            ttl = pttl / 1000 if isinstance(pttl, int) and pttl >= 0 else None
+            samples.append(KeySample(key, kind, size, ttl))
+        sized += len(keys)
+        yield examined, len(keys), samples
+        if sized >= limit:
+            return
+        if pause:
+            time.sleep(pause)
+
+
+def _batches(keys, size: int):
+    batch = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def profile_keyspace(redis: RedisConnection, match: str | None = None, limit: int = DEFAULT_LIMIT,
+                     count: int = DEFAULT_COUNT, depth: int | None = None, pause: float = 0.0) -> Profile:
+    dbsize, memory, stats = redis.pipeline([('DBSIZE',), ('INFO', 'memory'), ('INFO', 'stats')])
+    info = {}
+    for text in (memory, stats):
+        if isinstance(text, str):
+            info.update(parse_info(text))
+    families: dict[str, KeyFamily] = {}
+    sizes: Counter = Counter()
+    ttls: Counter = Counter()
+    examined = sized = 0
+    for walked, batch, samples in sample_keys(redis, match, limit, count, pause):
+        examined += walked
+        sized += batch
+        for sample in samples:
+            pattern = key_pattern(sample.key, depth)
+            families.setdefault(pattern, KeyFamily(pattern)).add(sample)
+            sizes[size_bucket(sample.bytes)] += 1
+            ttls[ttl_bucket(sample.ttl)] += 1
+    complete = sized < limit
+    ordered = sorted(families.values(), key=lambda f: f.bytes, reverse=True)
+    return Profile(dbsize if isinstance(dbsize, int) else examined, examined, ordered, sizes, ttls, complete, info)
+
+
+def _histogram(counts: dict, labels: list, total: int) -> list[str]:
+    width = max((len(str(label)) for label in labels), default=0)
+    peak = max(counts.values(), default=0) or 1
+    return [f'  {label:>{width}}  {counts.get(key, 0):>7}  {counts.get(key, 0) / total * 100:>5.1f}%  '
+            + '#' * round(counts.get(key, 0) / peak * 30) for key, label in zip(counts.keys(), labels)]
+
+
+def format_profile(profile: Profile, top: int = 20) -> str:
+    data = profile.to_dict()
+    lines = [f"{data['dbsize']} keys, {data['sampled']} sampled"
+             + ('' if profile.complete else f" (estimates x{data['scale']:.1f})")
+             + f", used {format_bytes(data['used_memory'])}"
+             + (f" of {format_bytes(data['maxmemory'])}" if data['maxmemory'] else '')]
+    if profile.hit_rate is not None:
+        lines[0] += f', hit rate {profile.hit_rate * 100:.1f}%'
+    families = data['families'][:top]
+    if not families:
+        return lines[0] + '\n(no keys sampled)'
+    width = max(max(len(f['pattern']) for f in families), 7)
+    ttl_labels = [label for _, label in TTL_BUCKETS] + [LONG_TTL, NO_TTL]
+    head = f"{'Pattern':<{width}}  {'Type':<6}  {'Keys':>8}  {'Memory':>9}  {'Avg':>8}  {'Max':>8}  TTLs"
+    lines += ['', head, '-' * len(head)]
+    for f in families:
+        kind = max(f['types'], key=f['types'].get)
+        spread = ' '.join(f"{label}:{f['ttls'][label]}" for label in ttl_labels if label in f['ttls'])
+        lines.append(f"{f['pattern']:<{width}}  {kind:<6}  {f['est_keys']:>8}  {format_bytes(f['est_bytes']):>9}"
+                     f"  {format_bytes(f['avg_bytes']):>8}  {format_bytes(f['max_bytes']):>8}  {spread}")
+    total = profile.sampled
+    sizes = dict(sorted(profile.sizes.items()))
+    lines += ['', 'Key sizes:'] + _histogram(sizes, [f'<={format_bytes(s)}' for s in sizes], total)
+    ttls = {label: profile.ttls[label] for label in ttl_labels if label in profile.ttls}
+    lines += ['', 'TTLs:'] + _histogram(ttls, list(ttls), total)
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Profile Redis memory and TTLs by key family, without blocking it.')
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('--container', default='rdv_redis', help='Redis container (default rdv_redis)')
+    parser.add_argument('--match', help="only profile keys matching this glob (e.g. 'cache:*')")
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT,
+                        help=f'stop after sizing this many keys (default {DEFAULT_LIMIT})')
+    parser.add_argument('--count', type=int, default=DEFAULT_COUNT,
+                        help=f'SCAN COUNT and pipeline batch size (default {DEFAULT_COUNT})')
+    parser.add_argument('--depth', type=int, help='group keys by at most this many leading segments')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between batches')
+    parser.add_argument('--top', type=int, default=20, help='families to show (default 20)')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args(argv)
+    if args.limit < 1:
+        parser.error('--limit must be at least 1')
+    with connect_redis(get_session(args.host), args.container) as redis:
+        profile = profile_keyspace(redis, args.match, args.limit, args.count, args.depth, args.pause)
+    print(json.dumps(profile.to_dict(), indent=2) if args.json else format_profile(profile, args.top))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
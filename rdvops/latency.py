@@ -0,0 +1,299 @@
+"""Latency sampling for the API endpoints remote-qa.py checks.
+
+Each endpoint is requested ``samples`` times by ``concurrency`` parallel
+``curl`` loops, once inside rdv_api against localhost:4000 (``internal``)
+and once on the host through nginx at https://rdvpriority.fr
+(``external``).  Every request is a separate curl process on a new
+connection, so its ``-w`` timings cover the whole request: DNS, TCP
+connect, TLS handshake, time to first byte and total.  Comparing the two
+sides of an endpoint shows how much of its latency is the API and how much
+the proxy in front of it.
+
+nginx limits ``/api/`` to 10 requests a second per address (``api_limit``,
+burst 20) and answers 503 past that, so external loops are paced to
+``--rate`` requests a second overall; internal requests are not paced.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import shlex
+import socket
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+
+from .bench import percentile
+from .session import BaseSession, get_session
+
+ENDPOINTS = ('/api/health/ready', '/api/boss/stats', '/api/boss/heatmap', '/api/boss/top-prefectures',
+             '/api/vfs/centers')
+SIDES = ('internal', 'external')
+INTERNAL_BASE = 'http://localhost:4000'
+EXTERNAL_BASE = 'https://rdvpriority.fr'
+CONTAINER = 'rdv_api'
+DEFAULT_SAMPLES = 20
+DEFAULT_CONCURRENCY = 4
+# Requests a second through nginx; api_limit allows 10 with a burst of 20.
+DEFAULT_RATE = 8.0
+DEFAULT_TIMEOUT = 10.0
+PHASES = ('dns', 'connect', 'tls', 'wait', 'ttfb', 'total')
+QUANTILES = (50, 95, 99)
+# Upper bounds of the histogram buckets, in milliseconds.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BAR_WIDTH = 24
+
+WRITE_OUT = ('%{http_code} %{time_namelookup} %{time_connect} %{time_appconnect} %{time_pretransfer} '
+             '%{time_starttransfer} %{time_total} %{size_download}\\n')
+
+
+@dataclass(frozen=True)
+class Sample:
+    """One request; times are in milliseconds from the start of the request, except the phases."""
+    status: int
+    dns: float
+    connect: float
+    tls: float
+    wait: float
+    ttfb: float
+    total: float
+    size: int
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 400
+
+    @classmethod
+    def parse(cls, line: str) -> 'Sample':
+        """Read one ``WRITE_OUT`` line; curl's cumulative times become per-phase durations."""
+        code, lookup, connect, appconnect, pretransfer, starttransfer, total, size = line.split()
+        lookup, connect, appconnect, pretransfer, starttransfer, total = (
+            float(v) * 1000 for v in (lookup, connect, appconnect, pretransfer, starttransfer, total))
+        return cls(
+            status=int(code),
+            dns=lookup,
+            connect=max(connect - lookup, 0.0),
+            # appconnect stays 0 for plain http.
+            tls=max(appconnect - connect, 0.0) if appconnect else 0.0,
+            # From the request being sent to the first byte of the answer.
+            wait=max(starttransfer - pretransfer, 0.0) if starttransfer else 0.0,
+            ttfb=starttransfer,
+            total=total,
+            size=int(float(size)),
+        )
+
+
+@dataclass
+class Series:
+    """All samples of one endpoint from one side."""
+    endpoint: str
+    side: str
+    url: str
+    concurrency: int
+    rate: float
+    elapsed: float
+    samples: list[Sample] = field(default_factory=list)
+    error: str = ''
+
+    @property
+    def ok(self) -> list[Sample]:
+        return [s for s in self.samples if s.ok]
+
+    @property
+    def failures(self) -> dict[int, int]:
+        """Count of failed requests by HTTP status (0 when curl got no answer)."""
+        counts: dict[int, int] = {}
+        for s in self.samples:
+            if not s.ok:
+                counts[s.status] = counts.get(s.status, 0) + 1
+        return dict(sorted(counts.items()))
+
+    def stat(self, phase: str, q: float) -> float | None:
+        values = [getattr(s, phase) for s in self.ok]
+        return percentile(values, q) if values else None
+
+    def histogram(self, phase: str = 'total') -> list[int]:
+        """Successful requests per ``BUCKETS`` bound, plus one bucket for anything slower."""
+        counts = [0] * (len(BUCKETS) + 1)
+        for s in self.ok:
+            value = getattr(s, phase)
+            counts[next((i for i, bound in enumerate(BUCKETS) if value <= bound), len(BUCKETS))] += 1
+        return counts
+
+    def to_dict(self) -> dict:
+        return {
+            'endpoint': self.endpoint, 'side': self.side, 'url': self.url, 'concurrency': self.concurrency,
+            'rate': self.rate, 'elapsed': round(self.elapsed, 3), 'requests': len(self.samples),
+            'failures': self.failures, 'error': self.error,
+            'stats': {phase: {f'p{q}': self.stat(phase, q) for q in QUANTILES} for phase in PHASES},
+            'histogram': dict(zip([f'<={b}ms' for b in BUCKETS] + [f'>{BUCKETS[-1]}ms'], self.histogram())),
+            'samples': [asdict(s) for s in self.samples],
+        }
+
+
+def split_evenly(total: int, parts: int) -> list[int]:
+    parts = max(1, min(parts, total))
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def sampler_script(url: str, samples: int, concurrency: int, rate: float = 0.0, timeout: float = DEFAULT_TIMEOUT,
+                   insecure: bool = False) -> str:
+    """POSIX sh that prints one ``WRITE_OUT`` line per request.
+
+    ``concurrency`` loops run in the background, each pausing
+    ``concurrency / rate`` seconds after a request when ``rate`` is set.
+    The lines are short single writes, so the loops do not interleave
+    within a line.
+    """
+    counts = split_evenly(samples, concurrency)
+    pause = f'{len(counts) / rate:.3f}' if rate > 0 else ''
+    curl = (f'curl -s{"k" if insecure else ""} -o /dev/null --max-time {timeout:g} '
+            f'-w {shlex.quote(WRITE_OUT)} {shlex.quote(url)}')
+    loop = (f'sample() {{ i=0; while [ $i -lt $1 ]; do {curl}; '
+            f'{f"sleep {pause}; " if pause else ""}i=$((i+1)); done; }}')
+    workers = ' '.join(f'sample {n} &' for n in counts)
+    return f'{loop}; {workers} wait'
+
+
+def sample_command(endpoint: str, side: str, samples: int, concurrency: int, rate: float = 0.0,
+                   timeout: float = DEFAULT_TIMEOUT, base: str | None = None,
+                   container: str = CONTAINER) -> tuple[str, str]:
+    """``(url, command)`` sampling ``endpoint`` from ``side``."""
+    if side == 'internal':
+        url = (base or INTERNAL_BASE) + endpoint
+        script = sampler_script(url, samples, concurrency, 0.0, timeout)
+        return url, f'docker exec {container} sh -c {shlex.quote(script)}'
+    url = (base or EXTERNAL_BASE) + endpoint
+    return url, f'sh -c {shlex.quote(sampler_script(url, samples, concurrency, rate, timeout, insecure=True))}'
+
+
+def sample_endpoint(session: BaseSession, endpoint: str, side: str, samples: int = DEFAULT_SAMPLES,
+                    concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE,
+                    timeout: float = DEFAULT_TIMEOUT, base: str | None = None) -> Series:
+    rate = rate if side == 'external' else 0.0
+    url, command = sample_command(endpoint, side, samples, concurrency, rate, timeout, base)
+    started = time.monotonic()
+    series = Series(endpoint, side, url, min(concurrency, samples), rate, 0.0)
+    try:
+        # Every request ends within its --max-time, so output never stalls longer than that.
+        result = session.run(command, timeout=timeout + 10)
+    except socket.timeout:
+        series.error = 'no output from the sampler'
+        return series
+    finally:
+        series.elapsed = time.monotonic() - started
+    for line in result.stdout.splitlines():
+        try:
+            series.samples.append(Sample.parse(line))
+        except ValueError:
+            continue
+    if not series.samples:
+        series.error = (result.stderr.strip() or result.stdout.strip() or f'exit status {result.exit_status}')[:200]
+    return series
+
+
+def sample_endpoints(session: BaseSession, endpoints: tuple[str, ...] | list[str] = ENDPOINTS,
+                     sides: tuple[str, ...] = SIDES, samples: int = DEFAULT_SAMPLES,
+                     concurrency: int = DEFAULT_CONCURRENCY, rate: float = DEFAULT_RATE,
+                     timeout: float = DEFAULT_TIMEOUT, bases: dict[str, str] | None = None) -> list[Series]:
+    """Sample each endpoint from each side, one at a time so they do not slow each other down."""
+    bases = bases or {}
+    return [sample_endpoint(session, endpoint, side, samples, concurrency, rate, timeout, bases.get(side))
+            for endpoint in endpoints for side in sides]
+
+
+def _ms(value: float | None) -> str:
+    return '-' if value is None else f'{value:.1f}'
+
+
+def _overhead(internal: Series, external: Series) -> str | None:
+    """How much slower the median external request is, and in which phases."""
+    total = [s.stat('total', 50) for s in (internal, external)]
+    if None in total:
+        return None
+    parts = []
+    for phase in ('dns', 'connect', 'tls', 'wait'):
+        inside, outside = internal.stat(phase, 50), external.stat(phase, 50)
+        if abs(outside - inside) >= 0.1:
+            parts.append(f'{phase} {outside - inside:+.1f}ms')
+    return f'proxy adds {total[1] - total[0]:+.1f}ms at p50' + (f' ({", ".join(parts)})' if parts else '')
+
+
+def _histogram(series: list[Series]) -> list[str]:
+    counts = [s.histogram() for s in series]
+    used = [i for i in range(len(BUCKETS) + 1) if any(c[i] for c in counts)]
+    if not used:
+        return []
+    peak = max(max(c) for c in counts)
+    labels = [f'<={b}ms' for b in BUCKETS] + [f'>{BUCKETS[-1]}ms']
+    lines = ['  total    ' + ''.join(f'{s.side:<{BAR_WIDTH + 6}}' for s in series).rstrip()]
+    for i in range(used[0], used[-1] + 1):
+        bars = ''.join(f'{"#" * round(c[i] * BAR_WIDTH / peak):<{BAR_WIDTH}} {c[i]:>4} ' for c in counts)
+        lines.append(f'  {labels[i]:>8} {bars.rstrip()}')
+    return lines
+
+
+def format_report(series: list[Series]) -> str:
+    """Per endpoint: phase medians, TTFB and total percentiles, histograms and the proxy's share."""
+    lines = []
+    by_endpoint: dict[str, list[Series]] = {}
+    for s in series:
+        by_endpoint.setdefault(s.endpoint, []).append(s)
+    header = (f'  {"side":<9} {"n":>4} {"fail":>4} {"dns":>6} {"conn":>6} {"tls":>6} {"wait":>7} '
+              + ' '.join(f'{f"ttfb p{q}":>9}' for q in QUANTILES) + ' '
+              + ' '.join(f'{f"total p{q}":>9}' for q in QUANTILES))
+    for endpoint, group in by_endpoint.items():
+        lines += ['', endpoint, header]
+        for s in group:
+            if s.error:
+                lines.append(f'  {s.side:<9} error: {s.error}')
+                continue
+            lines.append(
+                f'  {s.side:<9} {len(s.samples):>4} {sum(s.failures.values()):>4} '
+                + ' '.join(f'{_ms(s.stat(p, 50)):>6}' for p in ('dns', 'connect', 'tls')) + f' {_ms(s.stat("wait", 50)):>7} '
+                + ' '.join(f'{_ms(s.stat("ttfb", q)):>9}' for q in QUANTILES) + ' '
+                + ' '.join(f'{_ms(s.stat("total", q)):>9}' for q in QUANTILES))
+        for s in group:
+            if s.failures:
+                failed = ', '.join(f'{code or "no answer"} x{n}' for code, n in s.failures.items())
+                hint = ' (nginx api_limit, lower --rate)' if s.side == 'external' and 503 in s.failures else ''
+                lines.append(f'  {s.side} failures: {failed}{hint}')
+        sides = {s.side: s for s in group if not s.error}
+        if 'internal' in sides and 'external' in sides and (overhead := _overhead(sides['internal'], sides['external'])):
+            lines.append(f'  {overhead}')
+        lines += _histogram([s for s in group if not s.error])
+    if series:
+        lines += ['', 'dns, conn, tls and wait are p50s in ms; wait runs from the request being sent to the first byte']
+    return '\n'.join(lines).lstrip('\n')
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Sample API endpoint latency inside rdv_api and through nginx.')
+    parser.add_argument('endpoints', nargs='*', default=list(ENDPOINTS),
+                        help='paths to sample (default: the remote-qa.py boss and health endpoints)')
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('-n', '--samples', type=int, default=DEFAULT_SAMPLES,
+                        help=f'requests per endpoint and side (default {DEFAULT_SAMPLES})')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'requests in flight at once (default {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'external requests a second, 0 for no limit (default {DEFAULT_RATE:g};'
+                             ' nginx allows 10 plus a burst of 20)')
+    parser.add_argument('--side', choices=SIDES, help='sample only inside rdv_api or only through nginx')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'time limit per request in seconds (default {DEFAULT_TIMEOUT:g})')
+    parser.add_argument('--json', action='store_true', help='print JSON with every sample instead of a table')
+    args = parser.parse_args(argv)
+    if args.samples < 1 or args.concurrency < 1:
+        parser.error('--samples and --concurrency must be at least 1')
+    sides = (args.side,) if args.side else SIDES
+    series = sample_endpoints(get_session(args.host), args.endpoints, sides, args.samples, args.concurrency,
+                              args.rate, args.timeout)
+    print(json.dumps([s.to_dict() for s in series], indent=2) if args.json else format_report(series))
+    if any(s.error for s in series):
+        return 2
+    return 1 if any(s.failures for s in series) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
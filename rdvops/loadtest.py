@@ -0,0 +1,395 @@
+"""Run the k6 scenarios and catch regressions between runs.
+
+``python -m rdvops.loadtest run`` runs the chosen scenarios from
+``backend/performance-tests`` with ``--summary-export``, checks each summary
+against ``thresholds.json`` and appends it to a history in the rdvops
+cache.  Each tracked value (every threshold in ``thresholds.json``) is then
+compared with the same scenario's last ``--baseline-runs`` runs against the
+same target.  A run counts as regressed only when the value is worse by more
+than ``maxRegressionPercent`` *and* falls outside the baseline's 95%
+one-sided prediction interval, so ordinary run-to-run noise does not fail a
+build; until there are :data:`MIN_BASELINE` earlier runs, changes are only
+reported.  ``report`` prints the history per scenario with the trend of
+each value.  ``--local`` starts postgres and redis with docker compose and
+the API from ``backend`` before the runs, and stops the API afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+from .bench import revision
+from .config import cache_dir
+
+ROOT = Path(__file__).resolve().parents[1]
+BACKEND = ROOT / 'backend'
+PERF_DIR = BACKEND / 'performance-tests'
+# Scenario -> duration used unless --full, as in scripts/run-baseline.sh.
+SCENARIOS = {
+    'auth-load': '3m',
+    'alerts-crud': '3m',
+    'prefecture-cache': '2m',
+    'admin-dashboard': '2m',
+    'websocket-load': '2m',
+    'stress-db-pool': '5m',
+}
+DEFAULT_SCENARIOS = ('auth-load', 'alerts-crud', 'prefecture-cache', 'admin-dashboard')
+TREND_STATS = 'avg,min,med,max,p(90),p(95),p(99)'
+BASELINE_RUNS = 5
+MIN_BASELINE = 3
+MAX_REGRESSION = 10.0
+LOCAL_URL = 'http://localhost:4000'
+HEALTH_PATH = '/api/health/ready'
+# thresholds.json stat -> k6 summary key
+STAT_KEYS = {'p90': 'p(90)', 'p95': 'p(95)', 'p99': 'p(99)', 'avg': 'avg', 'med': 'med', 'max': 'max',
+             'rate': 'value', 'min': 'value'}
+# Metrics the scenarios do not emit but thresholds.json names: (hits counter, misses counter).
+DERIVED = {'cache_hit_rate': ('cache_hits', 'cache_misses')}
+# Changes smaller than this are noise whatever the statistics say: 1ms, or 0.1 points of a rate.
+NOISE_FLOOR = {'ms': 1.0, 'rate': 0.001}
+# One-sided 95% Student t quantiles by degrees of freedom.
+_T95 = {1: 6.314, 2: 2.920, 3: 2.353, 4: 2.132, 5: 2.015, 6: 1.943, 7: 1.895, 8: 1.860, 9: 1.833,
+        10: 1.812, 15: 1.753, 20: 1.725, 30: 1.697}
+
+
+class LoadTestError(Exception):
+    pass
+
+
+@dataclass
+class ThresholdResult:
+    metric: str
+    stat: str
+    limit: float
+    value: float | None
+
+    @property
+    def ok(self) -> bool | None:
+        """``None`` when the summary has no such value."""
+        if self.value is None:
+            return None
+        return self.value >= self.limit if self.stat == 'min' else self.value <= self.limit
+
+
+@dataclass
+class Run:
+    scenario: str
+    started: str
+    target: str
+    revision: str | None
+    duration: str | None
+    exit_status: int
+    seconds: float
+    metrics: dict[str, dict[str, float]]
+    thresholds: list[ThresholdResult] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return all(t.ok is not False for t in self.thresholds)
+
+    def value(self, metric: str, stat: str) -> float | None:
+        return self.metrics.get(metric, {}).get(STAT_KEYS.get(stat, stat))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Run':
+        return cls(**{**data, 'thresholds': [ThresholdResult(**t) for t in data.get('thresholds', [])]})
+
+
+def load_thresholds(path: Path | None = None) -> tuple[dict[str, dict], float]:
+    """``(scenario -> {metric: {stat: limit}}, maxRegressionPercent)`` from thresholds.json."""
+    data = json.loads((path or PERF_DIR / 'thresholds.json').read_text(encoding='utf-8'))
+    scenarios = {name: spec.get('thresholds', {}) for name, spec in data.get('scenarios', {}).items()}
+    return scenarios, float(data.get('global', {}).get('maxRegressionPercent', MAX_REGRESSION))
+
+
+def read_summary(path: Path) -> dict[str, dict[str, float]]:
+    """``{metric: {stat: value}}`` from a ``--summary-export`` file or a ``handleSummary`` data dump."""
+    try:
+        data = json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError) as e:
+        raise LoadTestError(f'unreadable k6 summary {path}: {e}') from None
+    metrics = {}
+    for name, metric in data.get('metrics', {}).items():
+        values = metric.get('values', metric)
+        metrics[name] = {k: float(v) for k, v in values.items()
+                         if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    for name, (hits, misses) in DERIVED.items():
+        if name not in metrics and hits in metrics and misses in metrics:
+            total = metrics[hits].get('count', 0) + metrics[misses].get('count', 0)
+            if total:
+                metrics[name] = {'value': metrics[hits].get('count', 0) / total}
+    return metrics
+
+
+def check_thresholds(metrics: dict[str, dict[str, float]], spec: dict[str, dict]) -> list[ThresholdResult]:
+    results = []
+    for metric, limits in spec.items():
+        for stat, limit in limits.items():
+            results.append(ThresholdResult(metric, stat, float(limit),
+                                           metrics.get(metric, {}).get(STAT_KEYS.get(stat, stat))))
+    return results
+
+
+def history_path() -> Path:
+    return cache_dir() / 'loadtest' / 'history.jsonl'
+
+
+def load_history(path: Path | None = None) -> list[Run]:
+    try:
+        lines = (path or history_path()).read_text(encoding='utf-8').splitlines()
+    except OSError:
+        return []
+    return [Run.from_dict(json.loads(line)) for line in lines if line.strip()]
+
+
+def append_history(run: Run, path: Path | None = None) -> None:
+    path = path or history_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run.to_dict()) + '\n')
+
+
+def _t95(df: int) -> float:
+    if df > 30:
+        return 1.645
+    return _T95[max(k for k in _T95 if k <= df)]
+
+
+def compare_to_baseline(run: Run, history: list[Run], max_regression: float = MAX_REGRESSION,
+                        runs: int = BASELINE_RUNS) -> list[dict]:
+    """Every tracked value of ``run`` against the last ``runs`` runs of its scenario and target in ``history``.
+
+    ``history`` holds the runs before this one, oldest first.
+    """
+    previous = [r for r in history if r.scenario == run.scenario and r.target == run.target][-runs:]
+    rows = []
+    for t in run.thresholds:
+        current = run.value(t.metric, t.stat)
+        values = [v for v in (r.value(t.metric, t.stat) for r in previous) if v is not None]
+        if current is None or not values:
+            continue
+        n = len(values)
+        mean = statistics.fmean(values)
+        spread = statistics.stdev(values) if n > 1 else 0.0
+        worse = mean - current if t.stat == 'min' else current - mean
+        change = worse / mean * 100 if mean else (math.inf if worse > 0 else 0.0)
+        bound = _t95(n - 1) * spread * math.sqrt(1 + 1 / n) if n > 1 else 0.0
+        floor = NOISE_FLOOR['rate' if t.stat in ('rate', 'min') else 'ms']
+        significant = n >= MIN_BASELINE and worse > max(bound, floor)
+        rows.append({'scenario': run.scenario, 'metric': t.metric, 'stat': t.stat, 'baseline': mean,
+                     'spread': spread, 'runs': n, 'value': current, 'change': change, 'significant': significant,
+                     'regressed': significant and change > max_regression})
+    return rows
+
+
+def trend(values: list[float]) -> float:
+    """Least-squares slope as percent of the mean per run."""
+    n = len(values)
+    if n < 2 or not statistics.fmean(values):
+        return 0.0
+    xs = range(n)
+    x_mean, y_mean = (n - 1) / 2, statistics.fmean(values)
+    slope = sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, values)) / sum((x - x_mean) ** 2 for x in xs)
+    return slope / y_mean * 100
+
+
+def _format_value(stat: str, value: float | None) -> str:
+    if value is None:
+        return '-'
+    return f'{value:.2%}' if stat in ('rate', 'min') else f'{value:.0f}ms'
+
+
+def format_run(run: Run, rows: list[dict]) -> str:
+    lines = [f'== {run.scenario} ({run.target}, {run.seconds:.0f}s, k6 exit {run.exit_status}) ==']
+    by_key = {(r['metric'], r['stat']): r for r in rows}
+    for t in run.thresholds:
+        state = {True: 'ok', False: 'FAIL', None: 'no data'}[t.ok]
+        limit = f"{'>=' if t.stat == 'min' else '<='} {_format_value(t.stat, t.limit)}"
+        line = f'  {t.metric} {t.stat}: {_format_value(t.stat, t.value)} ({limit}) {state}'
+        row = by_key.get((t.metric, t.stat))
+        if row:
+            change = f"{row['change']:.1f}% worse" if row['change'] >= 0 else f"{-row['change']:.1f}% better"
+            line += f"; baseline {_format_value(t.stat, row['baseline'])} over {row['runs']} runs, {change}"
+            if row['regressed']:
+                line += ' REGRESSED'
+            elif row['runs'] < MIN_BASELINE:
+                line += ' (baseline still building)'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def format_report(history: list[Run], scenarios: list[str] | None = None, last: int = 10) -> str:
+    lines = []
+    for scenario in scenarios or sorted({r.scenario for r in history}):
+        for target in sorted({r.target for r in history if r.scenario == scenario}):
+            runs = [r for r in history if r.scenario == scenario and r.target == target]
+            keys = [(t.metric, t.stat) for t in runs[-1].thresholds]
+            lines.append(f'== {scenario} on {target}: {len(runs)} runs ==')
+            lines.append('  ' + '  '.join([f"{'started':<19}", f"{'revision':<9}",
+                                           *(f'{m} {s}'[-24:].rjust(24) for m, s in keys), 'result']))
+            for r in runs[-last:]:
+                values = [_format_value(s, r.value(m, s)).rjust(24) for m, s in keys]
+                lines.append('  ' + '  '.join([r.started[:19], f"{r.revision or '?':<9}", *values,
+                                               'pass' if r.passed else 'FAIL']))
+            for m, s in keys:
+                values = [v for v in (r.value(m, s) for r in runs[-last:]) if v is not None]
+                slope = trend(values)
+                if len(values) >= 2 and round(slope, 1):
+                    direction = 'better' if (slope < 0) != (s == 'min') else 'worse'
+                    lines.append(f'  trend {m} {s}: {slope:+.1f}%/run ({direction})')
+    return '\n'.join(lines) if lines else 'No load test runs recorded yet.'
+
+
+def k6_command(scenario: str, summary: Path, env: str = 'local', base_url: str | None = None,
+               duration: str | None = None, vus: int | None = None) -> list[str]:
+    command = [os.environ.get('K6', 'k6'), 'run', '--env', f'TEST_ENV={env}', '--summary-export', str(summary),
+               '--summary-trend-stats', TREND_STATS]
+    if base_url:
+        command += ['--env', f'BASE_URL={base_url}']
+    if duration:
+        command += ['--duration', duration]
+    if vus:
+        command += ['--vus', str(vus)]
+    return command + [f'scenarios/{scenario}.js']
+
+
+def run_scenario(scenario: str, spec: dict, env: str = 'local', base_url: str | None = None,
+                 duration: str | None = None, vus: int | None = None) -> Run:
+    """Run one scenario with k6; its output goes to a log next to the summary."""
+    if shutil.which(os.environ.get('K6', 'k6')) is None:
+        raise LoadTestError('k6 is not installed (brew install k6, choco install k6 or https://k6.io)')
+    started = datetime.now(timezone.utc)
+    out_dir = cache_dir() / 'loadtest' / started.strftime('%Y%m%dT%H%M%SZ')
+    out_dir.mkdir(parents=True, exist_ok=True)
+    summary, log = out_dir / f'{scenario}.json', out_dir / f'{scenario}.log'
+    summary.unlink(missing_ok=True)
+    clock = time.monotonic()
+    with open(log, 'wb') as f:
+        status = subprocess.run(k6_command(scenario, summary, env, base_url, duration, vus), cwd=PERF_DIR,
+                                stdout=f, stderr=subprocess.STDOUT).returncode
+    # k6 exits with 99 when the script's own thresholds fail; the summary is still written.
+    if not summary.exists():
+        raise LoadTestError(f'{scenario}: k6 exited {status} without a summary; see {log}')
+    metrics = read_summary(summary)
+    return Run(scenario, started.isoformat(timespec='seconds'), base_url or env, revision(), duration, status,
+               time.monotonic() - clock, metrics, check_thresholds(metrics, spec))
+
+
+def _healthy(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+@contextmanager
+def local_stack(base_url: str = LOCAL_URL, timeout: float = 120.0) -> Iterator[str]:
+    """Postgres and redis from docker-compose.yml plus the API from ``backend``, until the block ends.
+
+    An API already answering on ``base_url`` is used as it is.
+    """
+    health = base_url.rstrip('/') + HEALTH_PATH
+    if _healthy(health):
+        yield base_url
+        return
+    if not (BACKEND / '.env').exists():
+        raise LoadTestError('backend/.env is missing; copy backend/.env.example and adjust it')
+    try:
+        subprocess.run(['docker', 'compose', 'up', '-d', '--wait', 'postgres', 'redis'], cwd=ROOT, check=True)
+        subprocess.run(['npx', 'prisma', 'migrate', 'deploy'], cwd=BACKEND, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise LoadTestError(f'could not start the local stack: {e}') from None
+    log_path = cache_dir() / 'loadtest' / 'api.log'
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'wb') as log:
+        api = subprocess.Popen(['npx', 'tsx', 'src/index.ts'], cwd=BACKEND, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + timeout
+        while not _healthy(health):
+            if api.poll() is not None or time.monotonic() > deadline:
+                raise LoadTestError(f'the API did not become ready on {health}; see {log_path}')
+            time.sleep(1)
+        yield base_url
+    finally:
+        api.terminate()
+        try:
+            api.wait(10)
+        except subprocess.TimeoutExpired:
+            api.kill()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Run the k6 scenarios and compare them with earlier runs.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help='run scenarios, check thresholds and the baseline')
+    run.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                     help=f"default: {' '.join(DEFAULT_SCENARIOS)}; any of {', '.join(SCENARIOS)}")
+    run.add_argument('--env', default='local', help='TEST_ENV for config/test-config.js (default local)')
+    run.add_argument('--base-url', help='API to load instead of the one TEST_ENV names')
+    run.add_argument('--local', action='store_true', help='start postgres, redis and the API locally first')
+    run.add_argument('--duration', help='override every scenario duration, e.g. 30s')
+    run.add_argument('--full', action='store_true', help="use each script's own stages instead of a fixed duration")
+    run.add_argument('--vus', type=int, help='override the number of virtual users')
+    run.add_argument('--baseline-runs', type=int, default=BASELINE_RUNS,
+                     help=f'earlier runs the baseline is built from (default {BASELINE_RUNS})')
+    run.add_argument('--max-regression', type=float,
+                     help='percent that counts as a regression (default: maxRegressionPercent in thresholds.json)')
+    run.add_argument('--json', action='store_true', help='print JSON instead of text')
+    report = sub.add_parser('report', help='show the recorded runs and their trends')
+    report.add_argument('scenarios', nargs='*', help='default: every scenario with runs')
+    report.add_argument('--last', type=int, default=10, help='runs shown per scenario (default 10)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'report':
+        print(format_report(load_history(), args.scenarios or None, args.last))
+        return 0
+
+    specs, max_regression = load_thresholds()
+    if args.max_regression is not None:
+        max_regression = args.max_regression
+    scenarios = args.scenarios or list(DEFAULT_SCENARIOS)
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+    failed = False
+    results = []
+    try:
+        with local_stack(args.base_url or LOCAL_URL) if args.local else nullcontext(args.base_url) as base_url:
+            for scenario in scenarios:
+                duration = None if args.full else args.duration or SCENARIOS[scenario]
+                history = load_history()
+                result = run_scenario(scenario, specs.get(scenario, {}), args.env, base_url, duration, args.vus)
+                rows = compare_to_baseline(result, history, max_regression, args.baseline_runs)
+                append_history(result)
+                failed |= not result.passed or any(r['regressed'] for r in rows)
+                results.append({'run': result.to_dict(), 'baseline': rows})
+                if not args.json:
+                    print(format_run(result, rows), flush=True)
+    except LoadTestError as e:
+        print(f'loadtest: {e}', file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""Incremental log fetching for every compose service over one channel.
+
+One shell command runs ``docker compose logs --timestamps`` for all services
+at once, each with its own ``--since`` cursor (or ``--tail`` the first
+time), and filters the lines with ``grep`` on the server so only matches
+cross the wire.  Lines come back tagged with their service and are merged in
+timestamp order.  Cursors and a bounded ring of recently shown lines are kept
+in the rdvops cache, so repeat runs fetch only new lines and ``--replay``
+needs no server at all.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shlex
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Iterable, Iterator
+
+from .config import cache_dir
+from .session import BaseSession
+from .transport import Transfer, TransferLog
+
+LEVELS = {
+    'error': r'error|fatal|panic|exception|unhandled|\berr\b|✗|❌',
+    'warn': r'warn|⚠',
+    'info': r'info',
+}
+LEVEL_ORDER = ('error', 'warn', 'info')
+DEFAULT_TAIL = 50
+DEFAULT_RING = 2000
+FOLLOW_IDLE = 24 * 3600  # a quiet stack is not an error while following
+
+_SERVICE = '@service'
+_NOW = '@now'
+
+
+@dataclass(frozen=True)
+class LogLine:
+    timestamp: str
+    service: str
+    text: str
+
+    def format(self) -> str:
+        return f'{self.timestamp[11:23]} {self.service:<10} {self.text}'
+
+
+def normalize_timestamp(value: str) -> str:
+    """Pad Docker's RFC 3339 nano timestamps so they sort as strings."""
+    value = value.rstrip('Z')
+    seconds, _, fraction = value.partition('.')
+    return f'{seconds}.{fraction[:9]:0<9}Z'
+
+
+def level_pattern(level: str) -> str:
+    """Pattern matching ``level`` and everything more severe."""
+    if level not in LEVELS:
+        raise ValueError(f'unknown level {level!r}, expected one of {", ".join(LEVEL_ORDER)}')
+    return '|'.join(LEVELS[name] for name in LEVEL_ORDER[:LEVEL_ORDER.index(level) + 1])
+
+
+def build_command(compose: str, services: Iterable[str] | None, cursors: dict[str, str],
+                  tail: int = DEFAULT_TAIL, pattern: str | None = None, level: str | None = None,
+                  follow: bool = False) -> str:
+    """Shell command printing ``<service> <timestamp> <text>`` lines for every service.
+
+    ``compose`` is the ``cd ... && docker compose -f ...`` prefix; the loop
+    runs one ``logs`` per service in the background so ``follow`` works
+    across all of them.
+    """
+    listing = ' '.join(shlex.quote(s) for s in services) if services else f'$({compose} ps --services)'
+    cases = ''.join(f'{shlex.quote(s)}) opt="--since {shlex.quote(ts)}";; ' for s, ts in sorted(cursors.items()))
+    filters = ''
+    for regex in (pattern, level_pattern(level) if level else None):
+        if regex:
+            filters += f' | grep -E -i --line-buffered -e {shlex.quote(regex)}'
+    return (
+        f'echo "{_NOW} $(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"; '
+        f'for s in {listing}; do '
+        f'echo "{_SERVICE} $s"; '
+        f'case "$s" in {cases}*) opt="--tail {int(tail)}";; esac; '
+        f'( {compose} logs --no-color --no-log-prefix --timestamps {"--follow " if follow else ""}$opt "$s" 2>&1'
+        f'{filters} | awk -v s="$s" \'{{print s" "$0; fflush()}}\' ) & '
+        f'done; wait'
+    )
+
+
+def cursor_view(pattern: str | None = None, level: str | None = None) -> str:
+    """The :class:`CursorStore` name for a filter.
+
+    A filtered run moves its cursors past lines the filter dropped, so it
+    keeps its own; sharing them would hide those lines from plain runs.
+    """
+    if not pattern and not level:
+        return 'logs'
+    key = json.dumps([pattern or '', level or ''])
+    return 'logs-' + hashlib.sha256(key.encode()).hexdigest()[:12]
+
+
+class CursorStore:
+    """Last timestamp seen per service, saved per host and view."""
+
+    def __init__(self, host: str, name: str = 'logs'):
+        self.path = cache_dir() / f'log-cursors-{name}-{host}.json'
+        try:
+            self.cursors: dict[str, str] = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.cursors = {}
+
+    def advance(self, service: str, timestamp: str) -> None:
+        if timestamp > self.cursors.get(service, ''):
+            self.cursors[service] = timestamp
+
+    def reset(self) -> None:
+        self.cursors = {}
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.cursors, indent=1, sort_keys=True), encoding='utf-8')
+        os.replace(tmp, self.path)
+
+
+class RingBuffer:
+    """The last ``size`` lines shown, kept on disk as JSON lines."""
+
+    def __init__(self, host: str, size: int = DEFAULT_RING):
+        self.path = cache_dir() / f'log-ring-{host}.jsonl'
+        self.lines: deque[LogLine] = deque(maxlen=size)
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for raw in f:
+                    self.lines.append(LogLine(**json.loads(raw)))
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def extend(self, lines: Iterable[LogLine]) -> None:
+        self.lines.extend(lines)
+
+    def save(self) -> None:
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for line in self.lines:
+                f.write(json.dumps(asdict(line), ensure_ascii=False) + '\n')
+        os.replace(tmp, self.path)
+
+
+class LogFetcher:
+    """Fetch or follow new log lines for a host, advancing ``store``."""
+
+    def __init__(self, session: BaseSession, store: CursorStore, services: Iterable[str] | None = None,
+                 tail: int = DEFAULT_TAIL, pattern: str | None = None, level: str | None = None):
+        self.session = session
+        self.store = store
+        self.services = list(services) if services else None
+        self.tail = tail
+        self.pattern = pattern
+        self.level = level
+        self.transfer: Transfer | None = None
+
+    def _parse(self, text: str, seen: dict[str, str]) -> LogLine | None:
+        service, _, rest = text.partition(' ')
+        if service == _NOW:
+            self.now = normalize_timestamp(rest.strip())
+            return None
+        if service == _SERVICE:
+            seen.setdefault(rest.strip(), '')
+            return None
+        stamp, _, message = rest.partition(' ')
+        if not stamp[:4].isdigit():
+            return None  # compose errors such as "no such service"
+        stamp = normalize_timestamp(stamp)
+        cursor = self.store.cursors.get(service, '')
+        # --since is inclusive, so the line at the cursor comes back again.
+        if stamp <= cursor:
+            return None
+        seen[service] = max(seen.get(service, ''), stamp)
+        return LogLine(stamp, service, message)
+
+    def _lines(self, follow: bool, timeout: float, compress: bool = False,
+               size_hint: int | None = None) -> Iterator[tuple[LogLine | None, dict]]:
+        command = build_command(self.session.host.compose('').rstrip(), self.services, self.store.cursors,
+                                self.tail, self.pattern, self.level, follow)
+        self.now = ''
+        seen: dict[str, str] = {}
+        with self.session.stream(command, timeout=timeout, tail=1, compress=compress, size_hint=size_hint) as reader:
+            for raw in reader:
+                yield self._parse(raw.text, seen), seen
+            self.transfer = reader.transfer
+
+    def _advance(self, seen: dict[str, str]) -> None:
+        # Unmatched lines up to the server clock need not be fetched again.
+        for service, stamp in seen.items():
+            self.store.advance(service, max(stamp, self.now))
+
+    def fetch(self, timeout: float = 60, compress: bool = False) -> list[LogLine]:
+        """New lines for every service, oldest first.
+
+        With ``compress`` the logs come gzipped, at a level picked from the
+        size of the previous fetch for this host; :attr:`transfer` has the
+        numbers afterwards.
+        """
+        transfers = TransferLog() if compress else None
+        key = f'logs-{self.session.host.name}'
+        lines = []
+        seen: dict[str, str] = {}
+        for line, seen in self._lines(False, timeout, compress, transfers and transfers.expected(key)):
+            if line is not None:
+                lines.append(line)
+        self._advance(seen)
+        if transfers:
+            transfers.record(key, self.transfer)
+        lines.sort(key=lambda line: line.timestamp)
+        return lines
+
+    def follow(self) -> Iterator[LogLine]:
+        """Yield lines as they arrive until interrupted; cursors advance as lines are seen."""
+        seen: dict[str, str] = {}
+        try:
+            for line, seen in self._lines(True, FOLLOW_IDLE):
+                if line is not None:
+                    self.store.advance(line.service, line.timestamp)
+                    yield line
+        finally:
+            for service, stamp in seen.items():
+                self.store.advance(service, stamp)
@@ -0,0 +1,510 @@
+"""Control-socket multiplexing for SSH sessions across script runs.
+
+The first script to need a host spawns ``python -m rdvops.mux <host>`` in the
+background.  That master performs the handshake once and listens on a local
+control socket (a Unix socket where available, loopback TCP otherwise).  Each
+channel a client opens becomes one connection to the socket; the master opens
+the real channel on its transport and relays data both ways.  The master exits
+after ``control_persist`` seconds without clients.
+
+Wire format, both directions: one type byte, a 4-byte big-endian length and
+the payload.  The client opens with an ``R`` frame carrying a JSON request
+whose ``op`` is ``exec``, ``subsystem`` or ``tcp`` (a ``direct-tcpip``
+tunnel, which has no exit status).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import secrets
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import paramiko
+from paramiko import pipe
+from paramiko.buffered_pipe import BufferedPipe, PipeTimeout
+
+from .config import HostConfig, cache_dir, get_host
+from .session import BaseSession, SessionError, SSHSession
+
+REQUEST = b'R'
+OK = b'K'
+ERROR = b'E'
+STDIN = b'i'
+SHUTDOWN_WRITE = b'w'
+STDOUT = b'o'
+STDERR = b'e'
+EXIT = b'x'
+
+_HEADER = struct.Struct('>cI')
+_CHUNK = 32768
+
+
+def _send_frame(sock: socket.socket, kind: bytes, payload: bytes = b'') -> None:
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise EOFError
+        buf += chunk
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> tuple[bytes, bytes]:
+    kind, length = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return kind, _recv_exact(sock, length) if length else b''
+
+
+def state_path(name: str) -> Path:
+    return cache_dir() / f'mux-{name}.json'
+
+
+def _read_state(name: str) -> dict | None:
+    try:
+        return json.loads(state_path(name).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def master_ready(name: str) -> bool:
+    """Whether a mux master for ``name`` has published its control socket."""
+    state = _read_state(name)
+    return state is not None and not state.get('error')
+
+
+def _connect_socket(state: dict, timeout: float) -> socket.socket:
+    if state['family'] == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = state['address']
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = tuple(state['address'])
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    sock.settimeout(None)
+    return sock
+
+
+# ── Client side ─────────────────────────────────
+
+
+class MuxChannel:
+    """Channel look-alike relayed through the mux master.
+
+    Implements the subset of ``paramiko.Channel`` the ops tooling uses,
+    including ``fileno()`` for ``select`` and enough for ``SFTPClient``.
+    """
+
+    def __init__(self, session: 'MuxSession', timeout: float | None):
+        self._session = session
+        self._sock: socket.socket | None = None
+        self.timeout = timeout
+        self.in_buffer = BufferedPipe()
+        self.in_stderr_buffer = BufferedPipe()
+        self._pipe = None
+        self._send_lock = threading.Lock()
+        self._status_event = threading.Event()
+        self.exit_status = -1
+        self.eof_received = False
+        self.closed = False
+
+    def get_name(self) -> str:
+        return f'mux:{self._session.host.name}'
+
+    def settimeout(self, timeout: float | None) -> None:
+        self.timeout = timeout
+
+    def _open(self, request: dict) -> None:
+        if self._sock is not None:
+            raise SessionError('channel already in use')
+        sock = self._session._connect()
+        try:
+            _send_frame(sock, REQUEST, json.dumps({**request, 'token': self._session.token}).encode())
+            kind, payload = _recv_frame(sock)
+        except (OSError, EOFError) as e:
+            sock.close()
+            raise SessionError(f'mux master dropped the request ({e})') from e
+        if kind != OK:
+            sock.close()
+            raise SessionError(payload.decode('utf-8', errors='replace') or 'mux request refused')
+        self._sock = sock
+        threading.Thread(target=self._reader, name=f'{self.get_name()}-reader', daemon=True).start()
+
+    def exec_command(self, command: str) -> None:
+        self._open({'op': 'exec', 'command': command})
+
+    def invoke_subsystem(self, subsystem: str) -> None:
+        self._open({'op': 'subsystem', 'name': subsystem})
+
+    def open_tunnel(self, host: str, port: int) -> None:
+        self._open({'op': 'tcp', 'host': host, 'port': port})
+
+    def _reader(self) -> None:
+        try:
+            while True:
+                kind, payload = _recv_frame(self._sock)
+                if kind == STDOUT:
+                    self.in_buffer.feed(payload)
+                elif kind == STDERR:
+                    self.in_stderr_buffer.feed(payload)
+                elif kind == EXIT:
+                    self.exit_status = struct.unpack('>i', payload)[0]
+                    self._status_event.set()
+        except (OSError, EOFError, struct.error):
+            pass
+        finally:
+            self.eof_received = True
+            self.in_buffer.close()
+            self.in_stderr_buffer.close()
+            self._status_event.set()
+
+    def fileno(self) -> int:
+        if self._pipe is None:
+            self._pipe = pipe.make_pipe()
+            p1, p2 = pipe.make_or_pipe(self._pipe)
+            self.in_buffer.set_event(p1)
+            self.in_stderr_buffer.set_event(p2)
+        return self._pipe.fileno()
+
+    def recv_ready(self) -> bool:
+        return self.in_buffer.read_ready()
+
+    def recv_stderr_ready(self) -> bool:
+        return self.in_stderr_buffer.read_ready()
+
+    def recv(self, nbytes: int) -> bytes:
+        try:
+            return self.in_buffer.read(nbytes, self.timeout)
+        except PipeTimeout:
+            raise socket.timeout()
+
+    def recv_stderr(self, nbytes: int) -> bytes:
+        try:
+            return self.in_stderr_buffer.read(nbytes, self.timeout)
+        except PipeTimeout:
+            raise socket.timeout()
+
+    def exit_status_ready(self) -> bool:
+        return self._status_event.is_set()
+
+    def recv_exit_status(self) -> int:
+        self._status_event.wait()
+        return self.exit_status
+
+    def send(self, data: bytes) -> int:
+        if self.closed or self._sock is None:
+            raise OSError('channel is closed')
+        with self._send_lock:
+            _send_frame(self._sock, STDIN, bytes(data))
+        return len(data)
+
+    def sendall(self, data: bytes) -> None:
+        view = memoryview(data)
+        for i in range(0, len(view), _CHUNK):
+            self.send(view[i:i + _CHUNK])
+
+    def shutdown_write(self) -> None:
+        if self._sock is not None and not self.closed:
+            with self._send_lock:
+                _send_frame(self._sock, SHUTDOWN_WRITE)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+        if self._pipe is not None:
+            self._pipe.close()
+
+
+class MuxSession(BaseSession):
+    """Session whose channels are relayed by a running mux master."""
+
+    def __init__(self, host: HostConfig, state: dict):
+        self.host = host
+        self.state = state
+        self.token = state['token']
+        self._closed = False
+
+    def _connect(self) -> socket.socket:
+        try:
+            return _connect_socket(self.state, self.host.connect_timeout)
+        except OSError as e:
+            raise SessionError(f'{self.host.name}: mux master unreachable ({e})') from e
+
+    def open_session(self, timeout: float | None = None) -> MuxChannel:
+        return MuxChannel(self, timeout or self.host.command_timeout)
+
+    def open_sftp(self) -> paramiko.SFTPClient:
+        channel = self.open_session(None)
+        channel.invoke_subsystem('sftp')
+        return paramiko.SFTPClient(channel)
+
+    def open_tunnel(self, host: str, port: int, timeout: float | None = None) -> MuxChannel:
+        channel = self.open_session(timeout)
+        channel.open_tunnel(host, port)
+        return channel
+
+    def ping(self) -> bool:
+        try:
+            return self.run('true', timeout=self.host.connect_timeout).ok
+        except (SessionError, OSError):
+            return False
+
+    @property
+    def active(self) -> bool:
+        return not self._closed
+
+    def close(self) -> None:
+        # The master owns the transport; closing only detaches this process.
+        self._closed = True
+
+
+def _spawn_master(host: HostConfig) -> None:
+    log = open(cache_dir() / f'mux-{host.name}.log', 'ab')
+    env = dict(os.environ)
+    root = str(Path(__file__).resolve().parent.parent)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [root, env.get('PYTHONPATH')]))
+    kwargs: dict = {}
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    subprocess.Popen(
+        [sys.executable, '-m', 'rdvops.mux', host.name],
+        stdin=subprocess.DEVNULL, stdout=log, stderr=log, env=env, close_fds=True, **kwargs,
+    )
+    log.close()
+
+
+def attach(host: HostConfig, spawn: bool = True) -> MuxSession:
+    """Attach to the host's mux master, starting one if none is running."""
+    state = _read_state(host.name)
+    if state is not None:
+        session = MuxSession(host, state)
+        if session.ping():
+            return session
+    if not spawn:
+        raise SessionError(f'{host.name}: no mux master running')
+    previous = state and state.get('token')
+    _spawn_master(host)
+    deadline = time.monotonic() + host.connect_timeout + 5
+    while time.monotonic() < deadline:
+        state = _read_state(host.name)
+        if state is not None and state.get('token') != previous:
+            if state.get('error'):
+                raise SessionError(f'{host.name}: mux master failed to start ({state["error"]})')
+            session = MuxSession(host, state)
+            if session.ping():
+                return session
+        time.sleep(0.1)
+    raise SessionError(f'{host.name}: mux master did not come up')
+
+
+# ── Master side ─────────────────────────────────
+
+
+class MuxMaster:
+    """Holds one transport and relays client channels over a control socket."""
+
+    def __init__(self, host: HostConfig, session: SSHSession | None = None, state_file: Path | None = None):
+        self.host = host
+        self.session = session
+        self.state_file = state_file or state_path(host.name)
+        self.token = secrets.token_hex(16)
+        self._clients = 0
+        self._lock = threading.Lock()
+        self._last_activity = time.monotonic()
+        self._stop = threading.Event()
+        self.listener = self._listen()
+
+    def _listen(self) -> socket.socket:
+        if hasattr(socket, 'AF_UNIX'):
+            path = self.state_file.with_suffix('.sock')
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            old_umask = os.umask(0o177)
+            try:
+                sock.bind(str(path))
+            finally:
+                os.umask(old_umask)
+            self.state = {'family': 'unix', 'address': str(path)}
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            self.state = {'family': 'inet', 'address': list(sock.getsockname())}
+        sock.listen(64)
+        sock.settimeout(1.0)
+        self.state.update(token=self.token, pid=os.getpid(), host=self.host.name)
+        return sock
+
+    def _write_state(self, **extra) -> None:
+        tmp = self.state_file.with_suffix('.tmp')
+        tmp.write_text(json.dumps({**self.state, **extra}), encoding='utf-8')
+        if hasattr(os, 'chmod'):
+            os.chmod(tmp, 0o600)
+        os.replace(tmp, self.state_file)
+
+    def _transport_session(self) -> SSHSession:
+        with self._lock:
+            if self.session is None or not self.session.active:
+                self.session = SSHSession.connect(self.host)
+            return self.session
+
+    def serve_forever(self) -> None:
+        self._transport_session()
+        self._write_state()
+        try:
+            while not self._stop.is_set():
+                try:
+                    client, _ = self.listener.accept()
+                except socket.timeout:
+                    with self._lock:
+                        idle = self._clients == 0 and time.monotonic() - self._last_activity > self.host.control_persist
+                    if idle:
+                        break
+                    continue
+                except OSError:
+                    if self._stop.is_set():
+                        break
+                    raise
+                with self._lock:
+                    self._clients += 1
+                threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self.listener.close()
+        state = _read_state(self.host.name) if self.state_file == state_path(self.host.name) else None
+        if state is None or state.get('token') == self.token:
+            for path in (self.state_file, self.state_file.with_suffix('.sock')):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        if self.session is not None:
+            self.session.close()
+
+    def _handle(self, client: socket.socket) -> None:
+        channel = None
+        try:
+            kind, payload = _recv_frame(client)
+            request = json.loads(payload) if kind == REQUEST else {}
+            if not secrets.compare_digest(str(request.get('token', '')), self.token):
+                _send_frame(client, ERROR, b'bad token')
+                return
+            op = request.get('op')
+            try:
+                if op == 'tcp':
+                    channel = self._transport_session().open_tunnel(request['host'], int(request['port']))
+                    channel.settimeout(None)
+                else:
+                    channel = self._transport_session().open_session(None)
+                    if op == 'subsystem':
+                        channel.invoke_subsystem(request['name'])
+                    else:
+                        channel.exec_command(request['command'])
+            except (SessionError, paramiko.SSHException, KeyError, ValueError) as e:
+                _send_frame(client, ERROR, str(e).encode())
+                return
+            _send_frame(client, OK)
+            threading.Thread(target=self._pump_input, args=(client, channel), daemon=True).start()
+            self._pump_output(client, channel, op == 'exec')
+        except (OSError, EOFError, ValueError):
+            pass
+        finally:
+            if channel is not None:
+                channel.close()
+            try:
+                # Wakes the input pump and gives the client its EOF.
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+            with self._lock:
+                self._clients -= 1
+                self._last_activity = time.monotonic()
+
+    @staticmethod
+    def _pump_input(client: socket.socket, channel: paramiko.Channel) -> None:
+        try:
+            while True:
+                kind, payload = _recv_frame(client)
+                if kind == STDIN:
+                    channel.sendall(payload)
+                elif kind == SHUTDOWN_WRITE:
+                    channel.shutdown_write()
+        except (OSError, EOFError, struct.error):
+            # The client went away: tear the channel down so the output pump exits.
+            try:
+                channel.close()
+            except (OSError, EOFError):
+                pass  # the transport is already gone
+
+    @staticmethod
+    def _pump_output(client: socket.socket, channel: paramiko.Channel, has_status: bool) -> None:
+        fd = channel.fileno()
+        while True:
+            select.select([fd], [], [], 1.0)
+            moved = False
+            while channel.recv_stderr_ready():
+                _send_frame(client, STDERR, channel.recv_stderr(_CHUNK))
+                moved = True
+            if channel.recv_ready():
+                data = channel.recv(_CHUNK)
+                if data:
+                    _send_frame(client, STDOUT, data)
+                    moved = True
+            if not moved and (channel.closed or channel.eof_received) \
+                    and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+        if has_status:
+            _send_frame(client, EXIT, struct.pack('>i', channel.recv_exit_status()))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Run an SSH mux master for an ops host.')
+    parser.add_argument('host', nargs='?', help='host name from the rdvops config')
+    args = parser.parse_args(argv)
+    host = get_host(args.host)
+    master = MuxMaster(host)
+    try:
+        master.serve_forever()
+    except SessionError as e:
+        # Leave the error where the waiting client can see it, then clean up.
+        master._write_state(error=str(e))
+        time.sleep(5)
+        master.shutdown()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+"""Where the ops tooling keeps its config and local state.
+
+Kept apart from :mod:`rdvops.config` so the CLI can find its files without
+importing anything but the standard library's path handling.
+"""
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+
+def config_path() -> Path:
+    env = os.environ.get('RDVOPS_CONFIG')
+    if env:
+        return Path(env).expanduser()
+    return Path.home() / '.config' / 'rdvops' / 'config.json'
+
+
+def cache_dir() -> Path:
+    """Directory for control sockets, manifests and other local state."""
+    env = os.environ.get('RDVOPS_CACHE_DIR')
+    if env:
+        path = Path(env).expanduser()
+    elif sys.platform == 'win32':
+        path = Path(os.environ.get('LOCALAPPDATA', Path.home())) / 'rdvops'
+    else:
+        path = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'rdvops'
+    path.mkdir(parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,499 @@
+"""EXPLAIN (ANALYZE, BUFFERS) audit of the hot Prisma queries.
+
+:data:`CATALOG` holds the SQL the app runs for its busiest reads (the admin
+scraper-log list, the detection stream and history, the prefecture groupBys
+and the queries behind ``/api/boss/stats`` and ``/api/boss/heatmap``).  The
+auditor loads ``backend/prisma/migrations`` into a scratch Postgres, seeds it
+with synthetic rows of production shape, runs every query through
+``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` in one ``psql`` session and flags
+sequential scans of large tables, sorts and hashes that spill to disk, and
+indexes that no query in the catalog uses.  Each audit is saved under the
+schema version (the last migration applied), so the plans of two versions
+can be compared offline::
+
+    python -m rdvops.planaudit --dsn postgresql://postgres@localhost/audit --load --seed
+    python -m rdvops.planaudit --diff 20260302_add_consulate_scraper_log 20261017_add_scraper_log_created_at_index
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import json
+import os
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from .config import cache_dir
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'prisma' / 'migrations'
+MARKER_TABLE = '_rdvops_planaudit'
+# Sequential scans reading fewer rows than this are cheaper than any index.
+SEQ_SCAN_ROWS = 1000
+FINDING_KINDS = ('seq_scan', 'sort_spill', 'hash_spill', 'unused_index')
+# Unused indexes are advisory: worth a look, but not a failed run.
+FAIL_ON = ('seq_scan', 'sort_spill', 'hash_spill')
+
+
+class PlanAuditError(Exception):
+    """Raised when psql fails or the target database is not safe to load."""
+
+
+@dataclass(frozen=True)
+class AuditQuery:
+    name: str
+    source: str
+    sql: str
+    # SQL expressions bound to $1, $2, ... through PREPARE/EXECUTE, as Prisma binds them.
+    params: tuple[str, ...] = ()
+
+
+CATALOG = [
+    AuditQuery('scraper_logs_recent', 'admin.routes GET /admin/scraper-logs',
+               'SELECT "id", "prefectureId", "workerId", "status", "slotsFound", "responseTimeMs", "createdAt"\n'
+               'FROM "ScraperLog" ORDER BY "createdAt" DESC LIMIT $1 OFFSET $2', ('50', '0')),
+    AuditQuery('scraper_logs_by_prefecture', 'admin.routes GET /admin/scraper-logs?prefectureId=',
+               'SELECT "id", "prefectureId", "workerId", "status", "slotsFound", "responseTimeMs", "createdAt"\n'
+               'FROM "ScraperLog" WHERE "prefectureId" = $1 ORDER BY "createdAt" DESC LIMIT $2', ("'pref_1'", '50')),
+    AuditQuery('detections_stream', 'analytics.service getSlotStream',
+               'SELECT "id", "prefectureId", "slotDate", "slotTime", "detectedAt"\n'
+               'FROM "Detection" ORDER BY "detectedAt" DESC LIMIT $1', ('50',)),
+    AuditQuery('detections_prefecture_history', 'analytics.service predictNextSlot',
+               'SELECT "id", "slotsAvailable", "detectedAt" FROM "Detection"\n'
+               'WHERE "prefectureId" = $1 AND "detectedAt" >= $2 ORDER BY "detectedAt" ASC',
+               ("'pref_1'", "now() - interval '30 days'")),
+    AuditQuery('prefectures_by_tier_status', 'prefecture.groupBy tier/status',
+               'SELECT "tier", "status", COUNT(*) FROM "Prefecture" GROUP BY "tier", "status"'),
+    AuditQuery('boss_stats_active_prefectures', 'analytics.service getStats (/api/boss/stats)',
+               'SELECT COUNT(*) FROM "Prefecture" WHERE "status" = $1', ("'ACTIVE'",)),
+    AuditQuery('boss_stats_detections_24h', 'analytics.service getStats (/api/boss/stats)',
+               'SELECT COUNT(*) FROM "Detection" WHERE "detectedAt" >= $1', ("now() - interval '24 hours'",)),
+    AuditQuery('boss_stats_detections_7d', 'analytics.service getStats (/api/boss/stats)',
+               'SELECT COUNT(*) FROM "Detection" WHERE "detectedAt" >= $1', ("now() - interval '7 days'",)),
+    AuditQuery('boss_stats_top_prefectures', 'analytics.service getStats (/api/boss/stats)',
+               'SELECT "prefectureId", COUNT("id") FROM "Detection" WHERE "detectedAt" >= $1\n'
+               'GROUP BY "prefectureId" ORDER BY COUNT("id") DESC LIMIT $2', ("now() - interval '7 days'", '5')),
+    AuditQuery('boss_heatmap_prefectures', 'analytics.service getHeatMapData (/api/boss/heatmap)',
+               'SELECT "id", "name", "department", "region", "lastSlotFoundAt" FROM "Prefecture" WHERE "status" = $1',
+               ("'ACTIVE'",)),
+    AuditQuery('boss_heatmap_counts', 'analytics.service getHeatMapData (/api/boss/heatmap)',
+               'SELECT "prefectureId", COUNT("id") FROM "Detection" WHERE "detectedAt" >= $1 GROUP BY "prefectureId"',
+               ("now() - interval '24 hours'",)),
+]
+
+
+class Psql:
+    """``psql`` as a subprocess, against a DSN or inside a local container."""
+
+    def __init__(self, dsn: str | None = None, container: str | None = None, user: str = 'postgres',
+                 database: str = 'rdvpriority', timeout: float = 600.0):
+        if container:
+            self.command = ['docker', 'exec', '-i', container, 'psql', '-U', user, '-d', database]
+        else:
+            self.command = ['psql'] + ([dsn] if dsn else [])
+        self.timeout = timeout
+
+    def run(self, script: str) -> str:
+        """Run ``script`` on stdin in one session and return the unaligned output."""
+        try:
+            proc = subprocess.run([*self.command, '-X', '-q', '-A', '-t', '-v', 'ON_ERROR_STOP=1'],
+                                  input=script, capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise PlanAuditError(f'cannot run psql: {e}') from None
+        if proc.returncode:
+            raise PlanAuditError(proc.stderr.strip() or f'psql exited with status {proc.returncode}')
+        return proc.stdout
+
+    def value(self, sql: str) -> str:
+        return self.run(sql).strip()
+
+
+def migrations(directory: Path = MIGRATIONS_DIR, upto: str | None = None) -> list[Path]:
+    """Migration directories in apply order, stopping after the one named ``upto``."""
+    found = sorted(p for p in Path(directory).iterdir() if (p / 'migration.sql').is_file())
+    if upto is None:
+        return found
+    for i, path in enumerate(found):
+        if path.name == upto or path.name.startswith(upto + '_'):
+            return found[:i + 1]
+    raise PlanAuditError(f'no migration named {upto!r} in {directory}')
+
+
+def load_schema(psql: Psql, applied: list[Path]) -> str:
+    """Recreate the public schema from ``applied`` migrations; returns the schema version.
+
+    Refuses to touch a database that has tables but was not loaded by this tool.
+    """
+    state = psql.value(f"SELECT to_regclass('{MARKER_TABLE}') IS NOT NULL, "
+                       "(SELECT count(*) FROM pg_tables WHERE schemaname = 'public')")
+    marked, tables = state.split('|')
+    if marked != 't' and int(tables):
+        raise PlanAuditError(f'the database has {tables} tables and was not loaded by planaudit; '
+                             'point --dsn at an empty scratch database')
+    version = applied[-1].name
+    script = ['BEGIN;', 'DROP SCHEMA IF EXISTS public CASCADE;', 'CREATE SCHEMA public;']
+    script += [(p / 'migration.sql').read_text(encoding='utf-8') for p in applied]
+    script += [f'CREATE TABLE "{MARKER_TABLE}" (migration TEXT NOT NULL, loaded_at TIMESTAMPTZ DEFAULT now());',
+               f"INSERT INTO \"{MARKER_TABLE}\" (migration) VALUES ('{version}');", 'COMMIT;']
+    psql.run('\n'.join(script))
+    return version
+
+
+def schema_version(psql: Psql) -> str:
+    """The last migration applied: from the loader's marker, or Prisma's own table."""
+    return psql.value(f"""
+DO $$ BEGIN
+  IF to_regclass('{MARKER_TABLE}') IS NOT NULL THEN
+    PERFORM set_config('rdvops.schema', (SELECT migration FROM "{MARKER_TABLE}" LIMIT 1), false);
+  ELSIF to_regclass('_prisma_migrations') IS NOT NULL THEN
+    PERFORM set_config('rdvops.schema', (SELECT migration_name FROM _prisma_migrations
+                                         WHERE finished_at IS NOT NULL ORDER BY migration_name DESC LIMIT 1), false);
+  END IF;
+END $$;
+SELECT coalesce(current_setting('rdvops.schema', true), 'unknown');""") or 'unknown'
+
+
+def seed_sql(prefectures: int = 100, logs: int = 200_000, detections: int = 50_000, days: int = 30) -> str:
+    """Synthetic rows with production's shape: logs spread over ``days``, detections skewed to few prefectures.
+
+    Foreign keys are not checked while seeding (``session_replication_role``),
+    so no users, alerts or workers are needed; that takes a superuser, which
+    a scratch database has.
+    """
+    return f"""
+BEGIN;
+SET LOCAL session_replication_role = replica;
+INSERT INTO "Prefecture" ("id", "name", "department", "region", "tier", "bookingUrl", "selectors", "status", "updatedAt")
+SELECT 'pref_' || i, 'Prefecture ' || i, lpad(i::text, 2, '0'), 'Region ' || (i % 13), 1 + i % 3,
+       'https://example.invalid/' || i, '{{}}'::jsonb,
+       (CASE WHEN i % 3 = 0 THEN 'ACTIVE' ELSE 'PAUSED' END)::"PrefectureStatus", now()
+FROM generate_series(1, {prefectures}) i;
+INSERT INTO "ScraperLog" ("id", "prefectureId", "workerId", "status", "slotsFound", "responseTimeMs", "createdAt")
+SELECT 'log_' || i, 'pref_' || (1 + i % {prefectures}), 'worker-' || (1 + i % 3),
+       (ARRAY['no_slots', 'no_slots', 'no_slots', 'no_slots', 'error', 'captcha', 'slots_found'])[1 + i % 7],
+       CASE WHEN i % 7 = 6 THEN 1 + i % 4 ELSE 0 END, 300 + (i * 7919) % 9000,
+       now() - make_interval(secs => i::double precision * {days * 86400} / {max(logs, 1)})
+FROM generate_series(1, {logs}) i;
+INSERT INTO "Detection" ("id", "alertId", "prefectureId", "slotsAvailable", "bookingUrl", "detectedAt")
+SELECT 'det_' || i, 'alert_' || (i % 500), 'pref_' || (1 + (i::bigint * i) % greatest({prefectures} / 10, 1)),
+       1 + i % 5, 'https://example.invalid/book', now() - make_interval(secs => i::double precision * {days * 2 * 86400} / {max(detections, 1)})
+FROM generate_series(1, {detections}) i;
+COMMIT;
+ANALYZE;
+"""
+
+
+def seed(psql: Psql, **sizes) -> None:
+    psql.run(seed_sql(**sizes))
+
+
+PLAN_MARK = '@@plan '
+
+INDEX_SQL = """
+SELECT coalesce(json_agg(json_build_object(
+  'table', t.relname, 'index', i.relname, 'bytes', pg_relation_size(i.oid),
+  'constraint', x.indisprimary OR x.indisunique) ORDER BY t.relname, i.relname), '[]')
+FROM pg_index x
+JOIN pg_class i ON i.oid = x.indexrelid
+JOIN pg_class t ON t.oid = x.indrelid
+JOIN pg_namespace n ON n.oid = t.relnamespace
+WHERE n.nspname = current_schema();
+"""
+
+
+def explain_script(queries: list[AuditQuery], runs: int = 2, work_mem: str | None = None) -> str:
+    """One psql script that EXPLAINs every query ``runs`` times; the last run is kept, warm."""
+    lines = [f"SET work_mem = '{work_mem}';"] if work_mem else []
+    for i, q in enumerate(queries):
+        lines.append(f'PREPARE audit_{i} AS {q.sql};')
+        args = f'({", ".join(q.params)})' if q.params else ''
+        for _ in range(runs):
+            lines.append(f'\\echo {PLAN_MARK}{q.name}')
+            lines.append(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) EXECUTE audit_{i}{args};')
+        lines.append(f'DEALLOCATE audit_{i};')
+    lines.append(f'\\echo {PLAN_MARK}__indexes__')
+    lines.append(INDEX_SQL)
+    return '\n'.join(lines) + '\n'
+
+
+def parse_output(output: str) -> dict[str, object]:
+    """Split psql output on the markers; later runs of a query replace earlier ones."""
+    parsed: dict[str, object] = {}
+    name, chunk = None, []
+    for line in output.splitlines() + [PLAN_MARK]:
+        if line.startswith(PLAN_MARK):
+            if name is not None:
+                parsed[name] = json.loads('\n'.join(chunk))
+            name, chunk = line[len(PLAN_MARK):].strip(), []
+        else:
+            chunk.append(line)
+    return parsed
+
+
+def walk(node: dict) -> Iterator[dict]:
+    yield node
+    for child in node.get('Plans', ()):
+        yield from walk(child)
+
+
+def describe(node: dict) -> str:
+    """A plan node without costs or timings, e.g. ``Index Scan Backward using idx on ScraperLog``."""
+    text = node['Node Type']
+    if node['Node Type'] == 'Aggregate' and node.get('Strategy', 'Plain') != 'Plain':
+        text = f"{node['Strategy']} {text}"
+    if node.get('Scan Direction') == 'Backward':
+        text += ' Backward'
+    if node.get('Index Name'):
+        text += f" using {node['Index Name']}"
+    if node.get('Relation Name'):
+        text += f" on {node['Relation Name']}"
+    return text
+
+
+def shape(plan: dict, depth: int = 0) -> list[str]:
+    """The plan tree as indented node descriptions, which is what a diff compares."""
+    lines = ['  ' * depth + describe(plan)]
+    for child in plan.get('Plans', ()):
+        lines += shape(child, depth + 1)
+    return lines
+
+
+@dataclass
+class Finding:
+    query: str
+    kind: str  # seq_scan, sort_spill, hash_spill or unused_index
+    detail: str
+
+
+@dataclass
+class PlanResult:
+    name: str
+    execution_ms: float
+    planning_ms: float
+    rows: int
+    shared_hit: int
+    shared_read: int
+    temp_written: int
+    shape: list[str]
+    indexes: list[str]
+    findings: list[Finding] = field(default_factory=list)
+
+
+def _rows_read(node: dict) -> int:
+    loops = node.get('Actual Loops', 1) or 1
+    return int((node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0)) * loops)
+
+
+def analyse(name: str, explain: list | dict, seq_scan_rows: int = SEQ_SCAN_ROWS) -> PlanResult:
+    """Findings and totals for one ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` result."""
+    top = explain[0] if isinstance(explain, list) else explain
+    plan = top['Plan']
+    findings = []
+    indexes = []
+    for node in walk(plan):
+        kind = node['Node Type']
+        if kind == 'Seq Scan' and _rows_read(node) >= seq_scan_rows:
+            kept = int(node.get('Actual Rows', 0) * (node.get('Actual Loops', 1) or 1))
+            findings.append(Finding(name, 'seq_scan', f"Seq Scan on {node.get('Relation Name')} read "
+                                    f"{_rows_read(node)} rows to keep {kept}"
+                                    + (f" (filter: {node['Filter']})" if node.get('Filter') else '')))
+        if kind in ('Sort', 'Incremental Sort') and node.get('Sort Space Type') == 'Disk':
+            findings.append(Finding(name, 'sort_spill', f"{node.get('Sort Method', 'sort')} on "
+                                    f"{', '.join(node.get('Sort Key', []))} used {node.get('Sort Space Used')}kB of disk"))
+        if kind == 'Hash' and node.get('Hash Batches', 1) > 1:
+            findings.append(Finding(name, 'hash_spill', f"Hash split into {node['Hash Batches']} batches "
+                                    f"(planned {node.get('Original Hash Batches', 1)})"))
+        if kind == 'Aggregate' and node.get('Disk Usage', 0) > 0:
+            findings.append(Finding(name, 'hash_spill', f"HashAggregate used {node['Disk Usage']}kB of disk "
+                                    f"in {node.get('HashAgg Batches', '?')} batches"))
+        if node.get('Index Name') and node['Index Name'] not in indexes:
+            indexes.append(node['Index Name'])
+    return PlanResult(
+        name=name,
+        execution_ms=round(top.get('Execution Time', 0.0), 3),
+        planning_ms=round(top.get('Planning Time', 0.0), 3),
+        rows=int(plan.get('Actual Rows', 0)),
+        shared_hit=plan.get('Shared Hit Blocks', 0),
+        shared_read=plan.get('Shared Read Blocks', 0),
+        temp_written=plan.get('Temp Written Blocks', 0),
+        shape=shape(plan),
+        indexes=indexes,
+        findings=findings,
+    )
+
+
+def unused_indexes(results: list[PlanResult], inventory: list[dict]) -> list[dict]:
+    """Indexes on the tables the catalog reads that none of its plans use.
+
+    Primary keys and unique indexes are left out: they enforce constraints
+    whether or not anything reads through them.
+    """
+    tables = {line.rsplit(' on ', 1)[1] for r in results for line in r.shape if ' on ' in line}
+    used = {name for r in results for name in r.indexes}
+    return [ix for ix in inventory if ix['table'] in tables and not ix['constraint'] and ix['index'] not in used]
+
+
+@dataclass
+class Audit:
+    schema: str
+    created: float
+    results: list[PlanResult]
+    unused: list[dict]
+
+    @property
+    def findings(self) -> list[Finding]:
+        found = [f for r in self.results for f in r.findings]
+        return found + [Finding('-', 'unused_index', f"{ix['index']} on {ix['table']} ({ix['bytes'] // 1024}kB)")
+                        for ix in self.unused]
+
+    def to_dict(self) -> dict:
+        return {'schema': self.schema, 'created': self.created, 'results': [asdict(r) for r in self.results],
+                'unused': self.unused}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Audit':
+        results = [PlanResult(**{**r, 'findings': [Finding(**f) for f in r['findings']]}) for r in data['results']]
+        return cls(data['schema'], data['created'], results, data['unused'])
+
+
+def run_audit(psql: Psql, queries: list[AuditQuery] = CATALOG, runs: int = 2, work_mem: str | None = None,
+              seq_scan_rows: int = SEQ_SCAN_ROWS) -> Audit:
+    version = schema_version(psql)
+    parsed = parse_output(psql.run(explain_script(queries, runs, work_mem)))
+    results = [analyse(q.name, parsed[q.name], seq_scan_rows) for q in queries]
+    return Audit(version, time.time(), results, unused_indexes(results, parsed.get('__indexes__') or []))
+
+
+def snapshots_dir() -> Path:
+    path = cache_dir() / 'plans'
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_audit(audit: Audit) -> Path:
+    """One snapshot per schema version; auditing a version again replaces it."""
+    path = snapshots_dir() / f'{audit.schema}.json'
+    path.write_text(json.dumps(audit.to_dict(), indent=2), encoding='utf-8')
+    return path
+
+
+def load_audit(version: str) -> Audit:
+    """The snapshot of ``version``, which may be a path or a unique prefix of a migration name."""
+    path = Path(version)
+    if not path.is_file():
+        matches = sorted(snapshots_dir().glob(f'{version}*.json'))
+        if len(matches) != 1:
+            known = ', '.join(p.stem for p in sorted(snapshots_dir().glob('*.json'))) or 'none'
+            raise PlanAuditError(f'{"no" if not matches else "more than one"} snapshot matches {version!r} '
+                                 f'(saved: {known})')
+        path = matches[0]
+    return Audit.from_dict(json.loads(path.read_text(encoding='utf-8')))
+
+
+def diff_audits(old: Audit, new: Audit) -> list[str]:
+    """Plan shape changes, timing swings and findings that appeared or went away."""
+    lines = []
+    before = {r.name: r for r in old.results}
+    for r in new.results:
+        was = before.pop(r.name, None)
+        if was is None:
+            lines.append(f'{r.name}: new in {new.schema}')
+            continue
+        changes = []
+        if was.shape != r.shape:
+            changes += ['    ' + line for line in difflib.unified_diff(was.shape, r.shape, lineterm='', n=0)
+                        if not line.startswith(('---', '+++', '@@'))]
+        old_f = {(f.kind, f.detail.split(' read ')[0]) for f in was.findings}
+        new_f = {(f.kind, f.detail.split(' read ')[0]) for f in r.findings}
+        changes += [f'    fixed: {kind}: {detail}' for kind, detail in sorted(old_f - new_f)]
+        changes += [f'    new:   {kind}: {detail}' for kind, detail in sorted(new_f - old_f)]
+        if changes or abs(r.execution_ms - was.execution_ms) > max(1.0, was.execution_ms * 0.5):
+            lines.append(f'{r.name}: {was.execution_ms:.2f}ms -> {r.execution_ms:.2f}ms')
+            lines += changes
+    lines += [f'{name}: not in {new.schema}' for name in before]
+    old_unused = {ix['index'] for ix in old.unused}
+    new_unused = {ix['index'] for ix in new.unused}
+    lines += [f'index now used: {name}' for name in sorted(old_unused - new_unused)]
+    lines += [f'index now unused: {name}' for name in sorted(new_unused - old_unused)]
+    return lines
+
+
+def format_audit(audit: Audit, verbose: bool = False) -> str:
+    lines = [f'Schema {audit.schema}', '',
+             f"{'Query':<32} {'Exec ms':>9} {'Rows':>7} {'Hit':>7} {'Read':>7}  Plan"]
+    for r in audit.results:
+        lines.append(f'{r.name:<32} {r.execution_ms:>9.2f} {r.rows:>7} {r.shared_hit:>7} {r.shared_read:>7}  '
+                     f'{r.shape[0] if verbose else " > ".join(line.strip() for line in r.shape)}')
+        if verbose:
+            lines += [' ' * 68 + line for line in r.shape[1:]]
+    findings = audit.findings
+    lines += ['', f'{len(findings)} finding(s)' + (':' if findings else '')]
+    lines += [f'  [{f.kind}] {f.query}: {f.detail}' for f in findings]
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='EXPLAIN the hot Prisma queries and flag bad plans.')
+    parser.add_argument('--dsn', default=os.environ.get('RDVOPS_PLANAUDIT_DSN'),
+                        help='scratch database to audit (default $RDVOPS_PLANAUDIT_DSN)')
+    parser.add_argument('--container', help='run psql in this local docker container instead')
+    parser.add_argument('--user', default='postgres', help='database user with --container (default postgres)')
+    parser.add_argument('--database', default='rdvpriority', help='database with --container (default rdvpriority)')
+    parser.add_argument('--load', action='store_true', help='recreate the schema from backend/prisma/migrations')
+    parser.add_argument('--upto', help='with --load, stop after this migration')
+    parser.add_argument('--seed', action='store_true', help='fill the tables with synthetic rows')
+    parser.add_argument('--logs', type=int, default=200_000, help='ScraperLog rows to seed (default 200000)')
+    parser.add_argument('--detections', type=int, default=50_000, help='Detection rows to seed (default 50000)')
+    parser.add_argument('--work-mem', help="work_mem for the audit session, e.g. '4MB' (default: server's)")
+    parser.add_argument('--only', help='comma-separated query names from the catalog')
+    parser.add_argument('--seq-scan-rows', type=int, default=SEQ_SCAN_ROWS,
+                        help=f'flag sequential scans reading at least this many rows (default {SEQ_SCAN_ROWS})')
+    parser.add_argument('--fail-on', default=','.join(FAIL_ON),
+                        help=f'comma-separated finding kinds that exit 1 (default {",".join(FAIL_ON)})')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved schema versions and exit')
+    parser.add_argument('--list', action='store_true', help='show the query catalog and exit')
+    parser.add_argument('--no-save', action='store_true', help='do not save the audit as a snapshot')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show whole plan trees')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args(argv)
+    fail_on = set(filter(None, args.fail_on.split(',')))
+    if unknown := fail_on - set(FINDING_KINDS):
+        parser.error(f'unknown finding kinds: {", ".join(sorted(unknown))} (one of {", ".join(FINDING_KINDS)})')
+
+    if args.list:
+        for q in CATALOG:
+            print(f'{q.name:<32} {q.source}')
+        return 0
+    try:
+        if args.diff:
+            old, new = (load_audit(v) for v in args.diff)
+            lines = diff_audits(old, new)
+            print(f'{old.schema} -> {new.schema}')
+            print('\n'.join(lines) if lines else '(no plan changes)')
+            return 0
+        queries = CATALOG
+        if args.only:
+            wanted = set(args.only.split(','))
+            queries = [q for q in CATALOG if q.name in wanted]
+            if unknown := wanted - {q.name for q in queries}:
+                parser.error(f'unknown queries: {", ".join(sorted(unknown))} (see --list)')
+        psql = Psql(args.dsn, args.container, args.user, args.database)
+        if args.load:
+            print(f'Loaded schema {load_schema(psql, migrations(upto=args.upto))}', file=sys.stderr)
+        if args.seed:
+            seed(psql, logs=args.logs, detections=args.detections)
+        audit = run_audit(psql, queries, work_mem=args.work_mem, seq_scan_rows=args.seq_scan_rows)
+    except PlanAuditError as e:
+        print(f'planaudit: {e}', file=sys.stderr)
+        return 2
+    if not args.no_save:
+        save_audit(audit)
+    print(json.dumps(audit.to_dict(), indent=2) if args.json else format_audit(audit, args.verbose))
+    return 1 if any(f.kind in fail_on for f in audit.findings) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
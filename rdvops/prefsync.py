@@ -0,0 +1,126 @@
+"""Diff-based sync of the ``Prefecture`` table against the compiled configs.
+
+One helper request reads the configs from ``dist`` and the current rows in a
+single ``findMany``; the field-level diff is computed here and only the rows
+that differ are written, in chunked ``$transaction`` batches.  A sync with
+nothing to change costs that one read.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Any
+
+from .query import QueryAgent, QueryError
+
+SYNC_FIELDS = ('name', 'department', 'region', 'tier', 'bookingUrl', 'checkInterval', 'selectors')
+CONFIG_MODULE = './dist/scraper/prefectures/index.js'
+DEFAULT_CHUNK = 50
+
+LOAD_SCRIPT = """
+const { ALL_PREFECTURES } = require(args.module);
+const select = { id: true };
+args.fields.forEach(f => { select[f] = true; });
+const rows = await prisma.prefecture.findMany({ select });
+const configs = ALL_PREFECTURES.map(c => {
+  const picked = { id: c.id };
+  args.fields.forEach(f => { picked[f] = c[f] === undefined ? null : c[f]; });
+  return picked;
+});
+return { configs, rows };
+"""
+
+APPLY_SCRIPT = """
+const ops = args.changes.map(c => c.action === 'create'
+  ? prisma.prefecture.create({ data: { id: c.id, ...c.data, status: 'ACTIVE' } })
+  : prisma.prefecture.update({ where: { id: c.id }, data: c.data }));
+const done = await prisma.$transaction(ops);
+return done.length;
+"""
+
+
+@dataclass
+class PrefectureChange:
+    id: str
+    action: str  # 'create' or 'update'
+    fields: dict[str, tuple[Any, Any]] = field(default_factory=dict)
+
+    @property
+    def data(self) -> dict[str, Any]:
+        return {name: new for name, (_, new) in self.fields.items()}
+
+
+def _same(a: Any, b: Any) -> bool:
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+def diff_prefectures(configs: list[dict], rows: list[dict],
+                     fields: tuple[str, ...] = SYNC_FIELDS) -> list[PrefectureChange]:
+    """Changes needed to make ``rows`` match ``configs``; rows without a config are left alone."""
+    current = {row['id']: row for row in rows}
+    changes = []
+    for config in configs:
+        row = current.get(config['id'])
+        if row is None:
+            changes.append(PrefectureChange(config['id'], 'create',
+                                            {f: (None, config.get(f)) for f in fields}))
+            continue
+        differing = {f: (row.get(f), config.get(f)) for f in fields if not _same(row.get(f), config.get(f))}
+        if differing:
+            changes.append(PrefectureChange(config['id'], 'update', differing))
+    return changes
+
+
+def apply_overrides(configs: list[dict], overrides: dict[str, dict[str, Any]]) -> tuple[list[dict], list[str]]:
+    """``configs`` with ``overrides[id]`` fields laid over them, and the override ids that have no config."""
+    known = {c['id'] for c in configs}
+    merged = [dict(c, **overrides[c['id']]) if c['id'] in overrides else c for c in configs]
+    return merged, sorted(set(overrides) - known)
+
+
+def _short(value: Any, limit: int = 60) -> str:
+    text = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def format_diff(changes: list[PrefectureChange]) -> str:
+    lines = []
+    for change in changes:
+        if change.action == 'create':
+            lines.append(f'+ {change.id}  (new, {change.fields.get("name", (None, ""))[1]})')
+            continue
+        lines.append(f'~ {change.id}')
+        for name, (old, new) in change.fields.items():
+            lines.append(f'    {name}: {_short(old)} -> {_short(new)}')
+    created = sum(c.action == 'create' for c in changes)
+    lines.append(f'{created} to create, {len(changes) - created} to update')
+    return '\n'.join(lines)
+
+
+def load_state(agent: QueryAgent, fields: tuple[str, ...] = SYNC_FIELDS,
+               module: str = CONFIG_MODULE) -> tuple[list[dict], list[dict]]:
+    """Compiled configs and current rows, fetched in one request."""
+    answer = agent.script(LOAD_SCRIPT, fields=list(fields), module=module)
+    if not answer.ok:
+        raise QueryError(f'cannot load prefectures: {answer.error}')
+    return answer.result['configs'], answer.result['rows']
+
+
+def apply_changes(agent: QueryAgent, changes: list[PrefectureChange], chunk_size: int = DEFAULT_CHUNK) -> int:
+    """Write ``changes`` as one transaction per chunk; returns the rows written."""
+    requests = [
+        {'script': APPLY_SCRIPT,
+         'args': {'changes': [{'id': c.id, 'action': c.action, 'data': c.data}
+                              for c in changes[i:i + chunk_size]]}}
+        for i in range(0, len(changes), chunk_size)
+    ]
+    written = 0
+    errors = []
+    for answer in agent.batch(requests):
+        if answer.ok:
+            written += answer.result
+        else:
+            errors.append(answer.error)
+    if errors:
+        raise QueryError(f'{len(errors)} of {len(requests)} chunks failed ({written} rows written): {errors[0]}')
+    return written
@@ -0,0 +1,177 @@
+"""Batched Prisma queries through one long-lived helper in the api container.
+
+``QueryAgent`` starts ``query_agent.js`` once with ``docker exec -i`` and
+streams requests to it over stdin, so a whole batch of checks costs one Node
+start and one Prisma connection pool instead of one of each per query.
+Requests are either script bodies (an async function of ``prisma``, ``args``,
+``log`` and ``require``) or the names of queries defined in the helper.
+With ``compress=True`` the helper gzips its answers, each at a level chosen
+from its size (:data:`rdvops.transport.LEVELS`), which pays off for large
+exports.
+"""
+from __future__ import annotations
+
+import json
+import shlex
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable
+
+from .session import BaseSession, SessionError
+from .stream import STDERR, STDOUT, ChannelReader
+from .transport import LEVELS, Transfer
+
+AGENT_SOURCE = Path(__file__).with_name('query_agent.js')
+DEFAULT_CONTAINER = 'rdv_api'
+# Each answer is one JSON line, so the reader must not split long ones.
+MAX_ANSWER = 512 * 1024 * 1024
+
+
+class QueryError(Exception):
+    """Raised when the helper cannot be started or stops answering."""
+
+
+@dataclass
+class QueryResult:
+    id: int
+    ok: bool
+    result: Any = None
+    output: list[str] = field(default_factory=list)
+    error: str | None = None
+    elapsed: float = 0.0
+
+    @property
+    def text(self) -> str:
+        """The lines the script logged, or its result as JSON."""
+        if self.output:
+            return '\n'.join(self.output)
+        return '' if self.result is None else json.dumps(self.result, indent=2, ensure_ascii=False)
+
+
+def agent_command(container: str = DEFAULT_CONTAINER, workdir: str = '/app', compress: bool = False) -> str:
+    source = AGENT_SOURCE.read_text(encoding='utf-8')
+    env = f'-e RDVOPS_AGENT_GZIP={shlex.quote(json.dumps(LEVELS))} ' if compress else ''
+    return (f'docker exec -i {env}-w {shlex.quote(workdir)} {shlex.quote(container)} '
+            f'node -e {shlex.quote(source)}')
+
+
+class QueryAgent:
+    """One running helper; use as a context manager.
+
+    >>> with QueryAgent(get_session()) as db:
+    ...     db.query('prefectureCount').result
+    """
+
+    def __init__(self, session: BaseSession, container: str = DEFAULT_CONTAINER, timeout: float = 60.0,
+                 compress: bool = False):
+        self.session = session
+        self.container = container
+        self.timeout = timeout
+        self.compress = compress
+        self.pid: int | None = None
+        self._reader: ChannelReader | None = None
+        self._transfer: Transfer | None = None
+        self._lines = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> 'QueryAgent':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start(self) -> None:
+        channel = self.session.open_session(self.timeout)
+        try:
+            channel.exec_command(agent_command(self.container, compress=self.compress))
+        except BaseException:
+            channel.close()
+            raise
+        self._reader = ChannelReader(channel, self.timeout, tail=20, max_line=MAX_ANSWER,
+                                     encoding='gzip-adaptive' if self.compress else 'identity')
+        self._lines = (line.text for line in self._reader if line.stream == STDOUT)
+        hello = self._receive()
+        if not hello.get('ready'):
+            self.close()
+            raise QueryError(f'query helper failed to start: {hello.get("error") or self._stderr()}')
+        self.pid = hello.get('pid')
+
+    @property
+    def transfer(self) -> Transfer | None:
+        """Answer bytes on the wire against bytes decoded, for the helper's whole life."""
+        return self._reader.transfer if self._reader else self._transfer
+
+    def _stderr(self) -> str:
+        return self._reader.tail_text(STDERR) if self._reader else ''
+
+    def _receive(self) -> dict:
+        for text in self._lines:
+            if not text.strip():
+                continue
+            try:
+                return json.loads(text)
+            except ValueError:
+                raise QueryError(f'unexpected output from query helper: {text[:200]}') from None
+        raise QueryError(f'query helper exited (status {self._reader.exit_status}): {self._stderr()}')
+
+    def batch(self, requests: Iterable[dict]) -> list[QueryResult]:
+        """Send every request at once and return the answers in request order."""
+        if self._reader is None:
+            raise QueryError('query helper is not running')
+        with self._lock:
+            ids = []
+            payload = []
+            for request in requests:
+                self._next_id += 1
+                ids.append(self._next_id)
+                payload.append(json.dumps(dict(request, id=self._next_id)) + '\n')
+            # Write from a thread so a large batch cannot deadlock against unread answers.
+            errors: list[BaseException] = []
+
+            def write():
+                try:
+                    self._reader.channel.sendall(''.join(payload).encode('utf-8'))
+                except BaseException as e:
+                    errors.append(e)
+
+            writer = threading.Thread(target=write, daemon=True)
+            writer.start()
+            answers: dict[int, QueryResult] = {}
+            while len(answers) < len(ids):
+                message = self._receive()
+                answers[message.get('id')] = QueryResult(
+                    id=message.get('id'),
+                    ok=bool(message.get('ok')),
+                    result=message.get('result'),
+                    output=message.get('output') or [],
+                    error=message.get('error'),
+                    elapsed=(message.get('ms') or 0) / 1000,
+                )
+            writer.join()
+            if errors:
+                raise SessionError(f'cannot send to query helper: {errors[0]}')
+        return [answers[i] for i in ids]
+
+    def script(self, body: str, **args) -> QueryResult:
+        return self.batch([{'script': body, 'args': args}])[0]
+
+    def query(self, name: str, **args) -> QueryResult:
+        return self.batch([{'query': name, 'args': args}])[0]
+
+    def close(self) -> None:
+        """Close stdin so the helper disconnects Prisma and exits."""
+        if self._reader is None:
+            return
+        reader, self._reader = self._reader, None
+        try:
+            reader.channel.shutdown_write()
+            for _ in self._lines:
+                pass
+        except (OSError, SessionError, QueryError):
+            pass
+        finally:
+            self._transfer = reader.transfer
+            reader.channel.close()
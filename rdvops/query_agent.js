@@ -0,0 +1,115 @@
+// Long-lived Prisma query helper started by rdvops/query.py inside rdv_api.
+//
+// Reads one JSON request per line on stdin:
+//   {"id": 1, "query": "prefectureCount", "args": {}}
+//   {"id": 2, "script": "return prisma.detection.count()", "args": {}}
+// and answers each with one JSON line on stdout:
+//   {"id": 1, "ok": true, "result": 101, "output": [], "ms": 3}
+// Requests run concurrently on a single PrismaClient; stdin EOF disconnects
+// and exits once the in-flight requests have answered.
+//
+// With RDVOPS_AGENT_GZIP set (a JSON list of [max bytes, level] pairs, the
+// last with a null limit), every answer is written as its own gzip member,
+// at the level for its size; the members concatenate into one gzip stream.
+'use strict';
+
+const readline = require('readline');
+const zlib = require('zlib');
+const { PrismaClient } = require(process.env.RDVOPS_PRISMA_MODULE || '@prisma/client');
+
+const prisma = new PrismaClient();
+const AsyncFunction = Object.getPrototypeOf(async function () {}).constructor;
+
+// Anything a script prints with console.log must not corrupt the protocol.
+console.log = (...parts) => process.stderr.write(parts.join(' ') + '\n');
+
+const NAMED = {
+  prefectureCount: () => prisma.prefecture.count(),
+  prefecturesByTier: ({ status = 'ACTIVE' }) =>
+    prisma.prefecture.groupBy({ by: ['tier'], where: { status }, _count: true }),
+  scraperLogCount: ({ where = {} }) => prisma.scraperLog.count({ where }),
+  recentScraperLogs: ({ take = 5 }) =>
+    prisma.scraperLog.findMany({
+      take,
+      orderBy: { createdAt: 'desc' },
+      select: { prefectureId: true, status: true, finalUrl: true, urlChanged: true, createdAt: true },
+    }),
+};
+
+function replacer(key, value) {
+  return typeof value === 'bigint' ? value.toString() : value;
+}
+
+const levels = process.env.RDVOPS_AGENT_GZIP ? JSON.parse(process.env.RDVOPS_AGENT_GZIP) : null;
+let sending = Promise.resolve();
+
+function levelFor(size) {
+  return levels.find(([limit]) => limit === null || size <= limit)[1];
+}
+
+function send(message) {
+  const text = JSON.stringify(message, replacer) + '\n';
+  if (!levels) {
+    process.stdout.write(text);
+    return sending;
+  }
+  // Compressed off the event loop, written in order so answers never interleave.
+  const member = new Promise((resolve, reject) => {
+    zlib.gzip(text, { level: levelFor(Buffer.byteLength(text)) }, (e, data) => (e ? reject(e) : resolve(data)));
+  });
+  sending = sending.then(() => member).then((data) => new Promise((resolve) => process.stdout.write(data, resolve)));
+  return sending;
+}
+
+function finish() {
+  return sending;
+}
+
+async function handle(request) {
+  const started = Date.now();
+  const output = [];
+  const log = (...parts) =>
+    output.push(parts.map((p) => (typeof p === 'string' ? p : JSON.stringify(p, replacer))).join(' '));
+  try {
+    let result;
+    if (request.query) {
+      const fn = NAMED[request.query];
+      if (!fn) throw new Error('unknown query: ' + request.query);
+      result = await fn(request.args || {});
+    } else {
+      const body = new AsyncFunction('prisma', 'args', 'log', 'require', request.script);
+      result = await body(prisma, request.args || {}, log, require);
+    }
+    send({ id: request.id, ok: true, result: result === undefined ? null : result, output, ms: Date.now() - started });
+  } catch (e) {
+    send({ id: request.id, ok: false, error: String((e && e.message) || e), output, ms: Date.now() - started });
+  }
+}
+
+const inFlight = new Set();
+const input = readline.createInterface({ input: process.stdin });
+input.on('line', (line) => {
+  if (!line.trim()) return;
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (e) {
+    send({ id: null, ok: false, error: 'bad request: ' + e.message, output: [], ms: 0 });
+    return;
+  }
+  const pending = handle(request).finally(() => inFlight.delete(pending));
+  inFlight.add(pending);
+});
+input.on('close', async () => {
+  await Promise.allSettled([...inFlight]);
+  await prisma.$disconnect();
+  await finish();
+});
+
+prisma.$connect().then(
+  () => send({ ready: true, pid: process.pid }),
+  (e) => {
+    send({ ready: false, error: String((e && e.message) || e) });
+    finish().then(() => process.exit(1));
+  },
+);
@@ -0,0 +1,165 @@
+"""Aggregated ops report in one SQL round trip, with local snapshots.
+
+Every section of the report comes from a single statement run through the
+query helper.  The ScraperLog sections walk the ``(status, createdAt)``
+index one status at a time (a loose index scan), so neither the per-status
+window counts nor the "recent scrapes" list read the whole table, and the
+totals of the large tables come from ``pg_class.reltuples`` once they pass
+``EXACT_BELOW`` rows.  Each report is saved as a timestamped JSON snapshot
+so it can be shown again, or compared with the previous one, offline.
+"""
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any
+
+from .config import cache_dir
+from .query import QueryAgent, QueryError
+
+EXACT_BELOW = 100_000
+
+REPORT_SQL = """
+WITH RECURSIVE statuses AS (
+  (SELECT status FROM "ScraperLog" ORDER BY status LIMIT 1)
+  UNION ALL
+  SELECT (SELECT l.status FROM "ScraperLog" l WHERE l.status > s.status ORDER BY l.status LIMIT 1)
+  FROM statuses s WHERE s.status IS NOT NULL
+),
+window_logs AS (
+  SELECT s.status, w.n, w.url_changed
+  FROM statuses s
+  CROSS JOIN LATERAL (
+    SELECT count(*) AS n, count(*) FILTER (WHERE l."urlChanged") AS url_changed
+    FROM "ScraperLog" l
+    WHERE l.status = s.status AND l."createdAt" > now() - make_interval(hours => $1::int)
+  ) w
+  WHERE s.status IS NOT NULL
+),
+recent AS (
+  SELECT r.*
+  FROM statuses s
+  CROSS JOIN LATERAL (
+    SELECT l."prefectureId", l.status, l."createdAt"
+    FROM "ScraperLog" l
+    WHERE l.status = s.status
+    ORDER BY l."createdAt" DESC
+    LIMIT 10
+  ) r
+  WHERE s.status IS NOT NULL
+  ORDER BY r."createdAt" DESC
+  LIMIT 10
+),
+sizes AS (
+  SELECT c.relname, c.reltuples::bigint AS estimate
+  FROM pg_class c
+  WHERE c.oid IN ('"ScraperLog"'::regclass, '"Detection"'::regclass)
+)
+SELECT json_build_object(
+  'generatedAt', now(),
+  'windowHours', $1::int,
+  'prefectures', json_build_object(
+    'total', (SELECT count(*) FROM "Prefecture"),
+    'byStatus', (SELECT COALESCE(json_object_agg(status, n), '{}')
+                 FROM (SELECT status::text AS status, count(*) AS n FROM "Prefecture" GROUP BY 1) x),
+    'activeByTier', (SELECT COALESCE(json_object_agg(tier, n), '{}')
+                     FROM (SELECT tier, count(*) AS n FROM "Prefecture" WHERE status = 'ACTIVE' GROUP BY 1) x)
+  ),
+  'scraperLogs', json_build_object(
+    'total', (SELECT CASE WHEN estimate < $2::bigint THEN (SELECT count(*) FROM "ScraperLog") ELSE estimate END
+              FROM sizes WHERE relname = 'ScraperLog'),
+    'estimated', (SELECT estimate >= $2::bigint FROM sizes WHERE relname = 'ScraperLog'),
+    'window', (SELECT COALESCE(json_object_agg(status, n), '{}') FROM window_logs),
+    'urlChanged', (SELECT COALESCE(sum(url_changed), 0) FROM window_logs),
+    'recent', (SELECT COALESCE(json_agg(recent ORDER BY "createdAt" DESC), '[]') FROM recent)
+  ),
+  'detections', json_build_object(
+    'total', (SELECT CASE WHEN estimate < $2::bigint THEN (SELECT count(*) FROM "Detection") ELSE estimate END
+              FROM sizes WHERE relname = 'Detection'),
+    'estimated', (SELECT estimate >= $2::bigint FROM sizes WHERE relname = 'Detection')
+  )
+) AS report
+"""
+
+FETCH_SCRIPT = """
+const [row] = await prisma.$queryRawUnsafe(args.sql, args.hours, args.exactBelow);
+return row.report;
+"""
+
+
+def fetch_report(agent: QueryAgent, window_hours: int = 24, exact_below: int = EXACT_BELOW) -> dict:
+    answer = agent.script(FETCH_SCRIPT, sql=REPORT_SQL, hours=window_hours, exactBelow=exact_below)
+    if not answer.ok:
+        raise QueryError(f'report query failed: {answer.error}')
+    return answer.result
+
+
+def snapshot_dir(host: str) -> Path:
+    path = cache_dir() / 'reports' / host
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_snapshot(host: str, report: dict) -> Path:
+    path = snapshot_dir(host) / time.strftime('%Y%m%dT%H%M%SZ.json', time.gmtime())
+    path.write_text(json.dumps(report, indent=2, sort_keys=True), encoding='utf-8')
+    return path
+
+
+def list_snapshots(host: str) -> list[Path]:
+    """Saved snapshots for ``host``, oldest first."""
+    return sorted(snapshot_dir(host).glob('*.json'))
+
+
+def load_snapshot(path: Path) -> dict:
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def _count(section: dict) -> str:
+    return f'~{section["total"]}' if section.get('estimated') else str(section['total'])
+
+
+def format_report(report: dict) -> str:
+    prefectures = report['prefectures']
+    logs = report['scraperLogs']
+    hours = report['windowHours']
+    active = prefectures['byStatus'].get('ACTIVE', 0)
+    lines = ['=== PREFECTURE STATUS ===', f'Total: {prefectures["total"]} | Active: {active}']
+    for tier, n in sorted(prefectures['activeByTier'].items()):
+        lines.append(f'  Tier {tier} : {n} active')
+    lines.append('  ' + ', '.join(f'{status} {n}' for status, n in sorted(prefectures['byStatus'].items())))
+    lines += ['', '=== SCRAPER STATUS ===', f'Total logs: {_count(logs)}', f'Last {hours}h by status:']
+    for status, n in sorted(logs['window'].items(), key=lambda kv: -kv[1]):
+        lines.append(f'  {status}: {n}')
+    lines.append('Recent scrapes:')
+    for r in logs['recent']:
+        lines.append(f'  {r["prefectureId"]} - {r["status"]} - {r["createdAt"][:19]}')
+    lines += ['', '=== URL TRACKING ===', f'URL changes detected (last {hours}h): {logs["urlChanged"]}']
+    lines += ['', '=== DETECTIONS ===', f'Total slot detections: {_count(report["detections"])}']
+    lines += ['', f'Generated {report["generatedAt"][:19]}']
+    return '\n'.join(lines)
+
+
+def _flatten(value: Any, prefix: str = '') -> dict[str, float]:
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten(item, f'{prefix}{key}.'))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix.rstrip('.'): value}
+    return {}
+
+
+def diff_reports(old: dict, new: dict) -> list[str]:
+    """One line per count that differs between two reports."""
+    before, after = _flatten(old), _flatten(new)
+    before.pop('windowHours', None)
+    after.pop('windowHours', None)
+    lines = []
+    for key in sorted(before.keys() | after.keys()):
+        a, b = before.get(key, 0), after.get(key, 0)
+        if a != b:
+            lines.append(f'  {key}: {a} -> {b} ({b - a:+})')
+    return lines
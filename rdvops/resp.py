@@ -0,0 +1,128 @@
+"""Minimal pipelining Redis (RESP2) client.
+
+Works over anything with ``sendall``/``recv``: a socket for a local
+``redis-server`` or an SSH ``direct-tcpip`` channel to the ``rdv_redis``
+container (see :func:`connect_redis`).  ``pipeline`` writes a whole batch
+and then reads the replies, so N commands cost one round trip.
+"""
+from __future__ import annotations
+
+import shlex
+import socket
+from typing import Any, Iterable, Iterator
+
+from .session import BaseSession, SessionError
+
+DEFAULT_CONTAINER = 'rdv_redis'
+DEFAULT_PORT = 6379
+
+
+class RedisError(Exception):
+    """An error reply; returned in place of a result inside pipelines."""
+
+
+def encode(*args) -> bytes:
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        out.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(out)
+
+
+class RedisConnection:
+    def __init__(self, stream, close=None):
+        self.stream = stream
+        self._close = close or stream.close
+        self._buffer = bytearray()
+
+    @classmethod
+    def connect(cls, host: str = '127.0.0.1', port: int = DEFAULT_PORT, timeout: float = 10.0) -> 'RedisConnection':
+        return cls(socket.create_connection((host, port), timeout=timeout))
+
+    def __enter__(self) -> 'RedisConnection':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._close()
+
+    def _fill(self) -> None:
+        data = self.stream.recv(65536)
+        if not data:
+            raise ConnectionError('redis closed the connection')
+        self._buffer += data
+
+    def _line(self) -> bytes:
+        while True:
+            end = self._buffer.find(b'\r\n')
+            if end >= 0:
+                line = bytes(self._buffer[:end])
+                del self._buffer[:end + 2]
+                return line
+            self._fill()
+
+    def _exact(self, n: int) -> bytes:
+        while len(self._buffer) < n + 2:
+            self._fill()
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n + 2]
+        return data
+
+    def _reply(self) -> Any:
+        line = self._line()
+        kind, rest = line[:1], line[1:]
+        if kind == b'+':
+            return rest.decode('utf-8', errors='replace')
+        if kind == b'-':
+            return RedisError(rest.decode('utf-8', errors='replace'))
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            n = int(rest)
+            return None if n < 0 else self._exact(n).decode('utf-8', errors='replace')
+        if kind == b'*':
+            n = int(rest)
+            return None if n < 0 else [self._reply() for _ in range(n)]
+        raise ConnectionError(f'unexpected reply from redis: {line[:80]!r}')
+
+    def pipeline(self, commands: Iterable[tuple]) -> list[Any]:
+        """Send every command, then read every reply; error replies come back as :class:`RedisError`."""
+        commands = list(commands)
+        if not commands:
+            return []
+        self.stream.sendall(b''.join(encode(*command) for command in commands))
+        return [self._reply() for _ in commands]
+
+    def execute(self, *args) -> Any:
+        [reply] = self.pipeline([args])
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def scan(self, match: str | None = None, count: int = 1000, type: str | None = None) -> Iterator[str]:
+        """Iterate keys with SCAN; each call touches at most about ``count`` slots, so it never blocks."""
+        cursor = '0'
+        while True:
+            args = ['SCAN', cursor]
+            if match:
+                args += ['MATCH', match]
+            args += ['COUNT', count]
+            if type:
+                args += ['TYPE', type]
+            cursor, keys = self.execute(*args)
+            yield from keys
+            if cursor == '0':
+                return
+
+
+def connect_redis(session: BaseSession, container: str = DEFAULT_CONTAINER, port: int = DEFAULT_PORT) -> RedisConnection:
+    """Tunnel to ``container``'s Redis port over the session, without exposing it on the host."""
+    result = session.run(
+        "docker inspect -f '{{range .NetworkSettings.Networks}}{{.IPAddress}} {{end}}' " + shlex.quote(container))
+    addresses = result.stdout.split()
+    if not result.ok or not addresses:
+        raise SessionError(f'cannot find the address of {container}: {result.stderr.strip() or result.stdout.strip()}')
+    channel = session.open_tunnel(addresses[0], port)
+    return RedisConnection(channel)
@@ -0,0 +1,254 @@
+"""Retention for the scraper log tables: hourly rollups, local archives, bounded deletes.
+
+``archive`` walks ``ScraperLog`` or ``ConsulateScraperLog`` from the oldest
+row up to the retention cutoff (rounded down to the hour) in batches of
+whole hours holding about ``batch_size`` rows, keyed on ``createdAt`` so
+every step is served by the ``[createdAt, id]`` index.  Each batch is first
+written locally as gzipped JSON lines; then, in one transaction, its hours
+are rolled up into ``ScraperLogRollup`` (runs, success rate, average and
+p95 ``responseTimeMs`` and slots found per target, category and hour) and
+the rows are deleted.  The transaction is rolled back if the table no
+longer holds exactly the archived rows.  ``restore`` loads an archive
+file back into its table.
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .config import cache_dir, get_host
+from .query import QueryAgent, QueryError
+from .scraperlogs import SUCCESS, TABLES, parse_duration
+from .session import get_session
+
+BATCH_SIZE = 20_000
+# The maintenance worker deletes ScraperLog rows after seven days without
+# rolling them up, so the default stays well inside that.
+DEFAULT_RETENTION = '3d'
+RESTORE_CHUNK = 1_000
+
+# Rollup source name and category expression per table in scraperlogs.TABLES.
+ROLLUPS = {
+    'scraper': ('prefecture', '"categoryCode"'),
+    'consulate': ('consulate', '"categoryId"::text'),
+}
+
+ROLLUP_COLUMNS = ('"runs" = EXCLUDED."runs", "successes" = EXCLUDED."successes", '
+                  '"successRate" = EXCLUDED."successRate", "avgResponseMs" = EXCLUDED."avgResponseMs", '
+                  '"p95ResponseMs" = EXCLUDED."p95ResponseMs", "slotsFound" = EXCLUDED."slotsFound", '
+                  '"slotRuns" = EXCLUDED."slotRuns"')
+
+
+def rollup_sql(key: str) -> str:
+    """INSERT of the hourly rollups of ``[$1, $2)``; a re-run replaces an hour's row."""
+    table = TABLES[key]
+    source, category = ROLLUPS[key]
+    ok = ', '.join(f"'{s}'" for s in SUCCESS)
+    return f"""
+INSERT INTO "ScraperLogRollup" ("source", "targetId", "category", "hour", "runs", "successes", "successRate",
+                                "avgResponseMs", "p95ResponseMs", "slotsFound", "slotRuns")
+SELECT '{source}', "{table.target}", coalesce({category}, ''), date_trunc('hour', "createdAt"),
+       count(*), count(*) FILTER (WHERE "status" IN ({ok})),
+       round(count(*) FILTER (WHERE "status" IN ({ok}))::numeric / count(*), 4),
+       round(avg("responseTimeMs"), 1),
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY "responseTimeMs"),
+       sum("slotsFound"), count(*) FILTER (WHERE "slotsFound" > 0)
+FROM "{table.name}"
+WHERE "createdAt" >= $1::timestamp AND "createdAt" < $2::timestamp
+GROUP BY 2, 3, 4
+ON CONFLICT ("source", "targetId", "category", "hour") DO UPDATE SET {ROLLUP_COLUMNS}"""
+
+
+# Timestamps travel as text in UTC, the way Prisma stores them, so no Date
+# conversion can shift an hour boundary.
+CUTOFF_SQL = """date_trunc('hour', (now() AT TIME ZONE 'UTC') - make_interval(secs => $1::int))"""
+TEXT_TIME = """'YYYY-MM-DD"T"HH24:MI:SS'"""
+
+BATCH_SCRIPT = f"""
+const table = '"' + args.table + '"';
+const [{{ cutoff, start }}] = await prisma.$queryRawUnsafe(`
+  WITH c AS (SELECT {CUTOFF_SQL} AS cutoff)
+  SELECT to_char(c.cutoff, {TEXT_TIME}) AS cutoff,
+         (SELECT to_char(date_trunc('hour', min("createdAt")), {TEXT_TIME})
+          FROM ${{table}} WHERE "createdAt" < c.cutoff) AS start
+  FROM c`, args.retentionSeconds);
+if (!start) return {{ cutoff, start: null, end: null, rows: [] }};
+// Whole hours only, so every rollup sees all of its hour's rows.
+const [{{ end }}] = await prisma.$queryRawUnsafe(`
+  SELECT to_char(greatest(date_trunc('hour', coalesce(
+           (SELECT "createdAt" FROM ${{table}} WHERE "createdAt" >= $1::timestamp AND "createdAt" < $2::timestamp
+            ORDER BY "createdAt" OFFSET $3 LIMIT 1), $2::timestamp)),
+         $1::timestamp + interval '1 hour'), {TEXT_TIME}) AS end`, start, cutoff, args.batchSize);
+const rows = await prisma.$queryRawUnsafe(`
+  SELECT row_to_json(l)::text AS row FROM ${{table}} l
+  WHERE "createdAt" >= $1::timestamp AND "createdAt" < $2::timestamp
+  ORDER BY "createdAt", id`, start, end);
+return {{ cutoff, start, end, rows: rows.map(r => r.row) }};
+"""
+
+COMMIT_SCRIPT = """
+return prisma.$transaction(async (tx) => {
+  const rollups = await tx.$executeRawUnsafe(args.sql, args.start, args.end);
+  const deleted = await tx.$executeRawUnsafe(
+    `DELETE FROM "${args.table}" WHERE "createdAt" >= $1::timestamp AND "createdAt" < $2::timestamp`,
+    args.start, args.end);
+  if (deleted !== args.expected) {
+    throw new Error(`${args.table} holds ${deleted} rows in ${args.start}..${args.end} but ${args.expected} `
+                    + 'were archived; rolled back');
+  }
+  return { rollups, deleted };
+}, { timeout: 120000 });
+"""
+
+STATUS_SCRIPT = f"""
+const [row] = await prisma.$queryRawUnsafe(`
+  WITH c AS (SELECT {CUTOFF_SQL} AS cutoff)
+  SELECT to_char(c.cutoff, {TEXT_TIME}) AS cutoff, count(l.id)::int AS rows,
+         to_char(min(l."createdAt"), {TEXT_TIME}) AS oldest
+  FROM c LEFT JOIN "${{args.table}}" l ON l."createdAt" < c.cutoff
+  GROUP BY c.cutoff`, args.retentionSeconds);
+return row;
+"""
+
+RESTORE_SCRIPT = """
+return prisma.$executeRawUnsafe(
+  `INSERT INTO "${args.table}" SELECT * FROM json_populate_recordset(NULL::"${args.table}", $1::json)
+   ON CONFLICT (id) DO NOTHING`, JSON.stringify(args.rows));
+"""
+
+
+@dataclass
+class Batch:
+    table: str
+    start: str
+    end: str
+    rows: int
+    rollups: int
+    path: Path
+
+
+def _call(agent: QueryAgent, body: str, what: str, **args):
+    answer = agent.script(body, **args)
+    if not answer.ok:
+        raise QueryError(f'{what} failed: {answer.error}')
+    return answer.result
+
+
+def archive_path(directory: Path, table: str, start: str, end: str) -> Path:
+    def stamp(text: str) -> str:
+        return text[:13].replace('-', '').replace(':', '')
+    return directory / start[:7] / f'{table}-{stamp(start)}-{stamp(end)}.jsonl.gz'
+
+
+def write_archive(path: Path, rows: list[str]) -> None:
+    """Gzipped JSON lines, synced to disk before the rows may be deleted."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as gz:
+            gz.write(''.join(row + '\n' for row in rows).encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+
+
+def read_archive(path: Path) -> list[dict]:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def archive(agent: QueryAgent, key: str, directory: Path, retention_ms: int, batch_size: int = BATCH_SIZE,
+            max_batches: int | None = None, pause: float = 0.0, log=print) -> list[Batch]:
+    """Archive, roll up and delete ``key``'s rows older than the retention cutoff, oldest first."""
+    table = TABLES[key]
+    sql = rollup_sql(key)
+    batches: list[Batch] = []
+    while max_batches is None or len(batches) < max_batches:
+        found = _call(agent, BATCH_SCRIPT, f'{table.name} batch', table=table.name,
+                      retentionSeconds=retention_ms // 1000, batchSize=batch_size)
+        if not found['start']:
+            break
+        path = archive_path(directory, table.name, found['start'], found['end'])
+        write_archive(path, found['rows'])
+        try:
+            done = _call(agent, COMMIT_SCRIPT, f'{table.name} rollup and delete', table=table.name, sql=sql,
+                         start=found['start'], end=found['end'], expected=len(found['rows']))
+        except BaseException:
+            path.unlink()  # the rows are still in the table; the next run archives them again
+            raise
+        batch = Batch(table.name, found['start'], found['end'], done['deleted'], done['rollups'], path)
+        batches.append(batch)
+        log(f'  {batch.start} .. {batch.end}  {batch.rows:>7} rows  {batch.rollups:>5} rollups  -> {path.name}')
+        if pause:
+            time.sleep(pause)
+    return batches
+
+
+def pending(agent: QueryAgent, key: str, retention_ms: int) -> dict:
+    """``{'cutoff', 'rows', 'oldest'}``: what an archive run would move."""
+    return _call(agent, STATUS_SCRIPT, f'{TABLES[key].name} status', table=TABLES[key].name,
+                 retentionSeconds=retention_ms // 1000)
+
+
+def restore(agent: QueryAgent, key: str, path: Path, chunk: int = RESTORE_CHUNK) -> int:
+    """Insert an archive file's rows back; rows already present are skipped."""
+    rows = read_archive(path)
+    restored = 0
+    for i in range(0, len(rows), chunk):
+        restored += _call(agent, RESTORE_SCRIPT, f'restore {path.name}', table=TABLES[key].name,
+                          rows=rows[i:i + chunk])
+    return restored
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Roll up, archive and delete old scraper logs.')
+    parser.add_argument('--table', choices=(*TABLES, 'all'), default='all', help='log table (default all)')
+    parser.add_argument('--retention', default=DEFAULT_RETENTION,
+                        help=f'keep raw rows this long, e.g. 48h or 3d (default {DEFAULT_RETENTION})')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'about this many rows per batch, in whole hours (default {BATCH_SIZE})')
+    parser.add_argument('--max-batches', type=int, help='stop after this many batches per table')
+    parser.add_argument('--pause', type=float, default=0.2, help='seconds between batches (default 0.2)')
+    parser.add_argument('--dir', type=Path, help='archive directory (default: the rdvops cache)')
+    parser.add_argument('--dry-run', action='store_true', help='show how many rows would be archived and stop')
+    parser.add_argument('--restore', type=Path, nargs='+', metavar='FILE', help='load archive files back')
+    args = parser.parse_args(argv)
+    try:
+        retention_ms = parse_duration(args.retention)
+    except ValueError as e:
+        parser.error(str(e))
+    host = get_host().name
+    keys = list(TABLES) if args.table == 'all' else [args.table]
+
+    with QueryAgent(get_session(), timeout=300, compress=True) as db:
+        if args.restore:
+            for path in args.restore:
+                key = next((k for k in TABLES if path.name.startswith(TABLES[k].name + '-')), None)
+                if key is None:
+                    parser.error(f'{path.name} is not a scraper log archive')
+                print(f'{path.name}: {restore(db, key, path)} rows restored')
+            return 0
+        for key in keys:
+            table = TABLES[key]
+            if args.dry_run:
+                state = pending(db, key, retention_ms)
+                print(f'{table.name}: {state["rows"]} rows before {state["cutoff"]}'
+                      + (f' (oldest {state["oldest"]})' if state['oldest'] else ''))
+                continue
+            directory = (args.dir or cache_dir() / 'archive' / host) / key
+            print(f'{table.name}:')
+            started = time.monotonic()
+            batches = archive(db, key, directory, retention_ms, args.batch_size, args.max_batches, args.pause)
+            print(f'{table.name}: {sum(b.rows for b in batches)} rows archived in {len(batches)} batches, '
+                  f'{sum(b.rollups for b in batches)} rollup rows, {time.monotonic() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""Columnar export of the scraper log tables and vectorised health stats.
+
+``export`` pages through ``ScraperLog`` or ``ConsulateScraperLog`` in
+``(createdAt, id)`` order with keyset pagination (served by the
+``[createdAt, id]`` index) and appends the new rows locally as a compressed
+``.npz`` segment: timestamps as int64 milliseconds, numbers as int32, and
+strings dictionary-encoded.  ``load`` stitches the segments back into
+columns and ``analyze`` computes percentiles and rates per prefecture or
+worker, optionally per time window, with NumPy group operations only.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from .query import QueryAgent, QueryError
+
+PAGE_SIZE = 20_000
+SEGMENT_ROWS = 500_000
+PERCENTILES = (50, 95, 99)
+SUCCESS = ('no_slots', 'slots_found')
+
+
+@dataclass(frozen=True)
+class LogTable:
+    name: str
+    target: str
+    strings: tuple[str, ...]
+    ints: tuple[str, ...]
+    bools: tuple[str, ...] = ()
+
+
+TABLES = {
+    'scraper': LogTable('ScraperLog', 'prefectureId',
+                        ('prefectureId', 'workerId', 'status', 'categoryCode'),
+                        ('responseTimeMs', 'slotsFound', 'redirectCount'),
+                        ('urlChanged',)),
+    'consulate': LogTable('ConsulateScraperLog', 'consulateId',
+                          ('consulateId', 'workerId', 'status', 'categoryName'),
+                          ('responseTimeMs', 'slotsFound', 'categoryId')),
+}
+
+PAGE_SCRIPT = """
+const columns = [...args.strings, ...args.ints, ...args.bools];
+const select = ['id', '"createdAt"', ...columns.map(c => '"' + c + '"')].join(', ');
+const rows = args.after
+  ? await prisma.$queryRawUnsafe(
+      `SELECT ${select} FROM "${args.table}" WHERE ("createdAt", id) > ($1::timestamp, $2)
+       ORDER BY "createdAt", id LIMIT $3`, args.after[0], args.after[1], args.limit)
+  : await prisma.$queryRawUnsafe(
+      `SELECT ${select} FROM "${args.table}" ORDER BY "createdAt", id LIMIT $1`, args.limit);
+const out = { id: [], createdAt: [] };
+columns.forEach(c => { out[c] = []; });
+for (const row of rows) {
+  out.id.push(row.id);
+  out.createdAt.push(row.createdAt.getTime());
+  columns.forEach(c => { out[c].push(row[c]); });
+}
+return out;
+"""
+
+
+def _iso(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def parse_duration(text: str) -> int:
+    """``'90s'``, ``'15m'``, ``'6h'`` or ``'7d'`` in milliseconds."""
+    match = re.fullmatch(r'(\d+)([smhd])', text.strip())
+    if not match:
+        raise ValueError(f'bad duration {text!r}, expected e.g. 15m, 6h or 7d')
+    return int(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)] * 1000
+
+
+def _state_path(directory: Path) -> Path:
+    return directory / 'state.json'
+
+
+def load_state(directory: Path) -> dict:
+    try:
+        return json.loads(_state_path(directory).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {'after': None, 'rows': 0, 'segments': []}
+
+
+def _write_segment(directory: Path, table: LogTable, pages: list[dict], state: dict) -> None:
+    columns = {'createdAt': np.concatenate([np.asarray(p['createdAt'], dtype=np.int64) for p in pages])}
+    for name in table.strings:
+        values = np.array([v or '' for p in pages for v in p[name]], dtype=str)
+        vocab, codes = np.unique(values, return_inverse=True)
+        columns[name] = codes.astype(np.int32)
+        columns[f'{name}__vocab'] = vocab
+    for name in table.ints:
+        columns[name] = np.array([v or 0 for p in pages for v in p[name]], dtype=np.int32)
+    for name in table.bools:
+        columns[name] = np.array([bool(v) for p in pages for v in p[name]], dtype=bool)
+    segment = f'seg-{len(state["segments"]) + 1:06d}.npz'
+    np.savez_compressed(directory / segment, **columns)
+    state['segments'].append(segment)
+    state['rows'] += len(columns['createdAt'])
+    last = pages[-1]
+    state['after'] = [_iso(last['createdAt'][-1]), last['id'][-1]]
+    tmp = _state_path(directory).with_suffix('.tmp')
+    tmp.write_text(json.dumps(state, indent=1), encoding='utf-8')
+    os.replace(tmp, _state_path(directory))
+
+
+def export(agent: QueryAgent, table: LogTable, directory: Path, page_size: int = PAGE_SIZE,
+           segment_rows: int = SEGMENT_ROWS, log=print) -> int:
+    """Append rows newer than the saved cursor; returns how many were added."""
+    directory.mkdir(parents=True, exist_ok=True)
+    state = load_state(directory)
+    after = state['after']
+    pages: list[dict] = []
+    buffered = added = 0
+    while True:
+        answer = agent.script(PAGE_SCRIPT, table=table.name, strings=list(table.strings), ints=list(table.ints),
+                              bools=list(table.bools), after=after, limit=page_size)
+        if not answer.ok:
+            raise QueryError(f'{table.name} page failed: {answer.error}')
+        page = answer.result
+        if not page['id']:
+            break
+        pages.append(page)
+        buffered += len(page['id'])
+        after = [_iso(page['createdAt'][-1]), page['id'][-1]]
+        if buffered >= segment_rows:
+            _write_segment(directory, table, pages, state)
+            added += buffered
+            log(f'  {state["rows"]} rows exported')
+            pages, buffered = [], 0
+        if len(page['id']) < page_size:
+            break
+    if pages:
+        _write_segment(directory, table, pages, state)
+        added += buffered
+    return added
+
+
+@dataclass
+class Columns:
+    time: np.ndarray
+    codes: dict[str, np.ndarray] = field(default_factory=dict)
+    vocab: dict[str, np.ndarray] = field(default_factory=dict)
+    values: dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+
+def load(directory: Path, table: LogTable) -> Columns:
+    """All exported segments as one set of columns, strings re-encoded against a shared vocabulary."""
+    state = load_state(directory)
+    segments = [np.load(directory / name) for name in state['segments']]
+    if not segments:
+        empty = Columns(np.zeros(0, dtype=np.int64))
+        for name in table.strings:
+            empty.codes[name] = np.zeros(0, dtype=np.int32)
+            empty.vocab[name] = np.zeros(0, dtype=str)
+        for name in table.ints + table.bools:
+            empty.values[name] = np.zeros(0, dtype=np.int32 if name in table.ints else bool)
+        return empty
+    columns = Columns(np.concatenate([s['createdAt'] for s in segments]))
+    for name in table.strings:
+        vocabs = [s[f'{name}__vocab'] for s in segments]
+        vocab, remap = np.unique(np.concatenate(vocabs), return_inverse=True)
+        offsets = np.cumsum([0] + [len(v) for v in vocabs])
+        columns.codes[name] = np.concatenate(
+            [remap[offsets[i]:offsets[i + 1]][s[name]] for i, s in enumerate(segments)]).astype(np.int32)
+        columns.vocab[name] = vocab
+    for name in table.ints + table.bools:
+        columns.values[name] = np.concatenate([s[name] for s in segments])
+    return columns
+
+
+def analyze(columns: Columns, by: str, window_ms: int | None = None, since_ms: int | None = None) -> list[dict]:
+    """Per-group run count, ``responseTimeMs`` percentiles and success/slots/URL-change rates."""
+    mask = columns.time >= since_ms if since_ms is not None else np.ones(len(columns), dtype=bool)
+    keys = columns.codes[by][mask]
+    vocab = columns.vocab[by]
+    times = columns.time[mask]
+    response = np.clip(columns.values['responseTimeMs'][mask], 0, None).astype(np.int64)
+    if not len(keys):
+        return []
+    if window_ms:
+        buckets = times // window_ms
+        group = buckets * len(vocab) + keys
+    else:
+        group = keys.astype(np.int64)
+    groups, inverse = np.unique(group, return_inverse=True)
+    counts = np.bincount(inverse)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    # One int64 sort on (group << 32 | responseTimeMs) orders every group's times at once.
+    ordered = (np.sort((inverse.astype(np.int64) << 32) | response) & 0xFFFFFFFF).astype(np.float64)
+    stats = {}
+    for q in PERCENTILES:
+        pos = starts + (counts - 1) * (q / 100)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, starts + counts - 1)
+        stats[f'p{q}'] = ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+    status_vocab = columns.vocab['status']
+    ok_codes = np.flatnonzero(np.isin(status_vocab, SUCCESS))
+    stats['success'] = np.bincount(inverse, weights=np.isin(columns.codes['status'][mask], ok_codes)) / counts
+    stats['slots'] = np.bincount(inverse, weights=columns.values['slotsFound'][mask] > 0) / counts
+    if 'urlChanged' in columns.values:
+        stats['urlChanged'] = np.bincount(inverse, weights=columns.values['urlChanged'][mask]) / counts
+    rows = []
+    for i, g in enumerate(groups.tolist()):
+        row = {'key': str(vocab[g % len(vocab)] if window_ms else vocab[g]), 'runs': int(counts[i])}
+        if window_ms:
+            row['window'] = _iso((g // len(vocab)) * window_ms)[:16]
+        row.update({name: round(float(values[i]), 4) for name, values in stats.items()})
+        rows.append(row)
+    return rows
+
+
+def format_table(rows: list[dict]) -> str:
+    if not rows:
+        return '(no rows)'
+    width = max(len(r['key']) for r in rows)
+    windowed = 'window' in rows[0]
+    has_url = 'urlChanged' in rows[0]
+    head = (f"{'Window':<17} " if windowed else '') + f"{'Key':<{width}}  {'Runs':>7}  {'p50':>7}  {'p95':>7}  {'p99':>7}  {'OK%':>6}  {'Slots%':>6}"
+    lines = [head + ('  URL%' if has_url else ''), '-' * (len(head) + (6 if has_url else 0))]
+    for r in rows:
+        line = (f"{r['window']:<17} " if windowed else '') + (
+            f"{r['key']:<{width}}  {r['runs']:>7}  {r['p50']:>7.0f}  {r['p95']:>7.0f}  {r['p99']:>7.0f}"
+            f"  {r['success'] * 100:>6.1f}  {r['slots'] * 100:>6.1f}")
+        if has_url:
+            line += f"  {r['urlChanged'] * 100:>5.1f}"
+        lines.append(line)
+    return '\n'.join(lines)
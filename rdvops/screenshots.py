@@ -0,0 +1,326 @@
+"""Incremental pull of scraper screenshots into a local index.
+
+The scrapers save a full-page PNG for each blocked, captcha, navigation
+failure and detection result into the ``screenshots`` volume
+(``SCRAPER_CONFIG.screenshotDir``), named ``<kind>_<prefectureId>_<ms>.png``,
+and record the path on the ``ScraperLog`` row.  A pull lists the volume once
+(name, size and mtime of every file, from ``find`` in a single command) and
+downloads only what is missing locally, several files at a time, each on its
+own SFTP channel with its reads pipelined.  Files are written to ``.part``
+first, so an interrupted pull carries on from where it stopped.  The result
+lands under ``cache_dir()/screenshots/<prefectureId>/`` with an
+``index.json`` that ties every file to its ``ScraperLog`` id::
+
+    python -m rdvops.screenshots --since 6 --kind blocked
+    python -m rdvops.screenshots --list --prefecture paris_75
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import shlex
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from queue import Empty, Queue
+
+import paramiko
+
+from .config import cache_dir
+from .query import QueryAgent, QueryError
+from .session import BaseSession, SessionError, get_session
+
+CONTAINER = 'rdv_api'
+MOUNT = '/app/public/screenshots'
+# path.join('./public/screenshots', name) in backend/src/utils/screenshot.util.ts.
+STORED_PREFIX = 'public/screenshots/'
+KINDS = ('detection', 'error', 'captcha', 'blocked', 'nav_failure')
+NAME = re.compile(r'^(?P<kind>' + '|'.join(KINDS) + r')_(?P<prefecture>.+)_(?P<ms>\d+)\.png$')
+DEFAULT_PARALLEL = 4
+# Bytes per readv range: the reads inside a range are pipelined, and each
+# range is written out as it completes.
+READ_RANGE = 1024 * 1024
+
+LOGS_SCRIPT = '''
+const logs = await prisma.scraperLog.findMany({
+  where: { screenshotPath: { in: args.paths } },
+  select: { id: true, status: true, errorMessage: true, screenshotPath: true },
+});
+return logs.map((l) => [l.screenshotPath, l.id, l.status, l.errorMessage]);
+'''
+
+
+class ScreenshotError(Exception):
+    """Raised when the screenshot volume cannot be found or listed."""
+
+
+@dataclass
+class RemoteFile:
+    name: str
+    size: int
+    mtime: float
+
+    @property
+    def prefecture(self) -> str:
+        match = NAME.match(self.name)
+        return match['prefecture'] if match else 'unknown'
+
+    @property
+    def kind(self) -> str | None:
+        match = NAME.match(self.name)
+        return match['kind'] if match else None
+
+
+@dataclass
+class PullResult:
+    listed: int = 0
+    selected: int = 0
+    downloaded: list[str] = field(default_factory=list)
+    resumed: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    bytes: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def skipped(self) -> int:
+        return self.selected - len(self.downloaded) - len(self.failed)
+
+    def to_dict(self) -> dict:
+        return dict(asdict(self), skipped=self.skipped)
+
+
+def default_dest() -> Path:
+    return cache_dir() / 'screenshots'
+
+
+def list_command(remote_dir: str | None = None, container: str = CONTAINER) -> str:
+    """One command that prints the volume's host path, then ``name<TAB>size<TAB>mtime`` per file."""
+    if remote_dir:
+        locate = f'dir={shlex.quote(remote_dir)}'
+    else:
+        template = '{{range .Mounts}}{{if eq .Destination "%s"}}{{.Source}}{{end}}{{end}}' % MOUNT
+        locate = f'dir=$(docker inspect -f {shlex.quote(template)} {shlex.quote(container)})'
+    return (f'{locate} && test -n "$dir" && cd "$dir" && pwd && '
+            "find . -maxdepth 1 -type f -name '*.png' -printf '%f\\t%s\\t%T@\\n'")
+
+
+def list_remote(session: BaseSession, remote_dir: str | None = None) -> tuple[str, list[RemoteFile]]:
+    result = session.run(list_command(remote_dir), timeout=120, compress=True)
+    if not result.ok:
+        where = remote_dir or f'the {MOUNT} mount of {CONTAINER}'
+        raise ScreenshotError(f'cannot list {where}: {result.stderr.strip() or f"exit {result.exit_status}"}')
+    lines = result.stdout.splitlines()
+    files = []
+    for line in lines[1:]:
+        name, size, mtime = line.rsplit('\t', 2)
+        files.append(RemoteFile(name, int(size), float(mtime)))
+    return lines[0].strip(), files
+
+
+def local_path(dest: Path, remote: RemoteFile) -> Path:
+    return dest / remote.prefecture / remote.name
+
+
+def needs_download(dest: Path, remote: RemoteFile) -> bool:
+    path = local_path(dest, remote)
+    return not (path.exists() and path.stat().st_size == remote.size)
+
+
+def download(sftp, remote_dir: str, dest: Path, remote: RemoteFile) -> tuple[int, bool]:
+    """Fetch one file through ``<name>.part``; returns the bytes read and whether it resumed."""
+    path = local_path(dest, remote)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    part = path.with_name(path.name + '.part')
+    offset = part.stat().st_size if part.exists() else 0
+    if offset > remote.size:
+        offset = 0
+    ranges = [(start, min(READ_RANGE, remote.size - start)) for start in range(offset, remote.size, READ_RANGE)]
+    with open(part, 'ab' if offset else 'wb') as out, sftp.open(f'{remote_dir}/{remote.name}', 'rb') as source:
+        for data in source.readv(ranges):
+            out.write(data)
+    os.replace(part, path)
+    os.utime(path, (remote.mtime, remote.mtime))
+    return remote.size - offset, offset > 0
+
+
+def fetch_all(session: BaseSession, remote_dir: str, dest: Path, files: list[RemoteFile],
+              parallel: int = DEFAULT_PARALLEL, result: PullResult | None = None) -> PullResult:
+    """Download ``files`` on ``parallel`` SFTP channels of the one SSH connection."""
+    result = result or PullResult()
+    todo: Queue[RemoteFile] = Queue()
+    for remote in sorted(files, key=lambda f: f.mtime, reverse=True):  # newest first
+        todo.put(remote)
+    lock = threading.Lock()
+
+    def worker():
+        sftp = None
+        try:
+            while True:
+                try:
+                    remote = todo.get_nowait()
+                except Empty:
+                    return
+                try:
+                    sftp = sftp or session.open_sftp()
+                    done, resumed = download(sftp, remote_dir, dest, remote)
+                except (OSError, SessionError, paramiko.SSHException) as e:
+                    with lock:
+                        result.failed[remote.name] = str(e) or type(e).__name__
+                    continue
+                with lock:
+                    result.downloaded.append(remote.name)
+                    result.bytes += done
+                    if resumed:
+                        result.resumed.append(remote.name)
+        finally:
+            if sftp is not None:
+                sftp.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, min(parallel, len(files))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return result
+
+
+def load_index(dest: Path) -> dict[str, dict]:
+    try:
+        return json.loads((dest / 'index.json').read_text(encoding='utf-8'))['files']
+    except (FileNotFoundError, ValueError, KeyError):
+        return {}
+
+
+def save_index(dest: Path, index: dict[str, dict]) -> None:
+    dest.mkdir(parents=True, exist_ok=True)
+    tmp = dest / 'index.json.tmp'
+    tmp.write_text(json.dumps({'files': dict(sorted(index.items()))}, indent=1), encoding='utf-8')
+    os.replace(tmp, dest / 'index.json')
+
+
+def index_entry(dest: Path, remote: RemoteFile) -> dict:
+    match = NAME.match(remote.name)
+    return {
+        'path': str(local_path(dest, remote).relative_to(dest)),
+        'prefecture': remote.prefecture,
+        'kind': remote.kind,
+        'takenAt': int(match['ms']) / 1000 if match else remote.mtime,
+        'size': remote.size,
+        'mtime': remote.mtime,
+        'logId': None,
+    }
+
+
+def attach_logs(agent: QueryAgent, index: dict[str, dict], names: list[str]) -> int:
+    """Fill in ``logId``, ``status`` and ``error`` from the ScraperLog rows that point at ``names``."""
+    if not names:
+        return 0
+    answer = agent.script(LOGS_SCRIPT, paths=[STORED_PREFIX + name for name in names])
+    if not answer.ok:
+        raise QueryError(f'cannot look up scraper logs: {answer.error}')
+    for path, log_id, status, error in answer.result:
+        entry = index.get(path.rsplit('/', 1)[-1])
+        if entry is not None:
+            entry.update(logId=log_id, status=status, error=error)
+    return len(answer.result)
+
+
+def select(files, prefectures=(), kinds=(), since: float | None = None, now: float | None = None):
+    """Files (remote or index entries) matching the filters; ``since`` is in hours."""
+    cutoff = (now or time.time()) - since * 3600 if since else None
+    chosen = []
+    for f in files:
+        prefecture, kind, mtime = ((f['prefecture'], f['kind'], f['mtime']) if isinstance(f, dict)
+                                   else (f.prefecture, f.kind, f.mtime))
+        if prefectures and prefecture not in prefectures:
+            continue
+        if kinds and kind not in kinds:
+            continue
+        if cutoff is not None and mtime < cutoff:
+            continue
+        chosen.append(f)
+    return chosen
+
+
+def pull(session: BaseSession, dest: Path, prefectures=(), kinds=(), since: float | None = None,
+         parallel: int = DEFAULT_PARALLEL, remote_dir: str | None = None,
+         agent: QueryAgent | None = None) -> PullResult:
+    started = time.monotonic()
+    remote_dir, files = list_remote(session, remote_dir)
+    chosen = select(files, prefectures, kinds, since)
+    result = PullResult(listed=len(files), selected=len(chosen))
+    fetch_all(session, remote_dir, dest, [f for f in chosen if needs_download(dest, f)], parallel, result)
+    index = load_index(dest)
+    for remote in chosen:
+        if remote.name not in result.failed:
+            index[remote.name] = dict(index_entry(dest, remote), **{
+                k: v for k, v in index.get(remote.name, {}).items() if k in ('logId', 'status', 'error')})
+    if agent is not None:
+        attach_logs(agent, index, [r.name for r in chosen if r.name in index and index[r.name]['logId'] is None])
+    save_index(dest, index)
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def format_entries(dest: Path, entries: list[dict]) -> str:
+    lines = []
+    for e in sorted(entries, key=lambda e: e['takenAt']):
+        taken = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(e['takenAt']))
+        log = f'log {e["logId"]}' if e.get('logId') else 'no log'
+        detail = f'  {e["status"]}: {e["error"]}' if e.get('error') else ''
+        lines.append(f'{taken}  {e["prefecture"]:<20} {e["kind"] or "?":<12} {log:<42} '
+                     f'{dest / e["path"]}{detail}')
+    return '\n'.join(lines) or 'no screenshots'
+
+
+def format_report(result: PullResult) -> str:
+    lines = [f'{result.listed} remote files, {result.selected} selected: {len(result.downloaded)} downloaded '
+             f'({len(result.resumed)} resumed, {result.bytes / 1048576:.1f} MiB), {result.skipped} already local, '
+             f'{len(result.failed)} failed in {result.elapsed:.1f}s']
+    for name, error in sorted(result.failed.items()):
+        lines.append(f'  FAILED {name}: {error}')
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Pull new scraper screenshots and index them by prefecture '
+                                                 'and ScraperLog id.')
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('--prefecture', action='append', default=[], help='only this prefecture (repeatable)')
+    parser.add_argument('--kind', action='append', default=[], choices=KINDS, help='only this kind (repeatable)')
+    parser.add_argument('--since', type=float, help='only files from the last N hours')
+    parser.add_argument('--parallel', type=int, default=DEFAULT_PARALLEL,
+                        help=f'files downloaded at once (default {DEFAULT_PARALLEL})')
+    parser.add_argument('--remote-dir', help=f'screenshot directory on the host (default: the {MOUNT} mount of '
+                                             f'{CONTAINER})')
+    parser.add_argument('--dest', type=Path, help=f'local directory (default {default_dest()})')
+    parser.add_argument('--no-logs', action='store_true', help='do not look up the ScraperLog rows')
+    parser.add_argument('--list', action='store_true', help='list the local index without connecting')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of text')
+    args = parser.parse_args(argv)
+    dest = args.dest or default_dest()
+    if args.list:
+        entries = select(load_index(dest).values(), args.prefecture, args.kind, args.since)
+        print(json.dumps(entries, indent=2) if args.json else format_entries(dest, entries))
+        return 0
+    try:
+        session = get_session(args.host)
+        if args.no_logs:
+            result = pull(session, dest, args.prefecture, args.kind, args.since, args.parallel, args.remote_dir)
+        else:
+            with QueryAgent(session) as db:
+                result = pull(session, dest, args.prefecture, args.kind, args.since, args.parallel,
+                              args.remote_dir, db)
+    except (ScreenshotError, QueryError, SessionError) as exc:
+        print(f'error: {exc}', file=sys.stderr)
+        return 2
+    print(json.dumps(result.to_dict(), indent=2) if args.json else format_report(result))
+    return 1 if result.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
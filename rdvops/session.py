@@ -0,0 +1,246 @@
+"""Pooled SSH sessions shared by the ops scripts.
+
+``get_session()`` keeps one authenticated transport per host for the life of
+the process and hands out channels from it.  When the host has
+``control_persist`` enabled, the transport lives in a background mux master
+(see :mod:`rdvops.mux`) instead, so consecutive script runs share a single
+handshake the way OpenSSH ``ControlMaster`` does.
+"""
+from __future__ import annotations
+
+import atexit
+import sys
+from abc import ABC, abstractmethod
+import threading
+import time
+from dataclasses import dataclass
+
+import paramiko
+
+from .config import HostConfig, get_host
+from .stream import STDERR, ChannelReader, Inflater, iter_chunks
+from .transport import Transfer, choose_level, gzip_command
+
+
+class SessionError(Exception):
+    """Raised when a session or channel cannot be established."""
+
+
+@dataclass
+class CommandResult:
+    command: str
+    exit_status: int
+    stdout: str
+    stderr: str
+    elapsed: float
+    transfer: Transfer | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_status == 0
+
+
+class BaseSession(ABC):
+    """Operations shared by direct and multiplexed sessions."""
+
+    host: HostConfig
+
+    @abstractmethod
+    def open_session(self, timeout: float | None = None):
+        """A channel ready for ``exec_command`` or ``invoke_subsystem``."""
+
+    @abstractmethod
+    def open_sftp(self) -> paramiko.SFTPClient:
+        """An SFTP client on a channel of this session."""
+
+    @abstractmethod
+    def open_tunnel(self, host: str, port: int, timeout: float | None = None):
+        """A ``direct-tcpip`` channel to ``host:port`` as seen from the server."""
+
+    @property
+    @abstractmethod
+    def active(self) -> bool:
+        """Whether new channels can still be opened."""
+
+    @abstractmethod
+    def close(self) -> None:
+        """Release the session."""
+
+    def run(self, command: str, timeout: float | None = None, input: bytes | None = None,
+            max_time: float | None = None, compress: bool = False, size_hint: int | None = None) -> CommandResult:
+        """Run ``command`` on a fresh channel and collect its output.
+
+        ``timeout`` bounds the time spent waiting for output, like
+        ``channel.settimeout`` in the original scripts; ``max_time`` bounds
+        the whole command.  Either raises ``socket.timeout`` and closes the
+        channel.  With ``compress``, stdout is gzipped on the server at a
+        level chosen from ``size_hint`` (see :func:`rdvops.transport.choose_level`).
+        """
+        timeout = timeout or self.host.command_timeout
+        started = time.monotonic()
+        wrapped, encoding = self._encode(command, compress, size_hint)
+        channel = self._exec(wrapped, timeout, input)
+        inflater = Inflater() if encoding != 'identity' else None
+        out: list[bytes] = []
+        err: list[bytes] = []
+        wire = 0
+        try:
+            for stream, data in iter_chunks(channel, timeout, started + max_time if max_time else None):
+                if stream == STDERR:
+                    err.append(data)
+                    continue
+                wire += len(data)
+                out.append(inflater.decode(data) if inflater else data)
+            status = channel.recv_exit_status()
+        finally:
+            channel.close()
+        stdout = b''.join(out)
+        elapsed = time.monotonic() - started
+        return CommandResult(
+            command=command,
+            exit_status=status,
+            stdout=stdout.decode('utf-8', errors='replace'),
+            stderr=b''.join(err).decode('utf-8', errors='replace'),
+            elapsed=elapsed,
+            transfer=Transfer(wire, len(stdout), encoding, elapsed),
+        )
+
+    def stream(self, command: str, timeout: float | None = None, input: bytes | None = None,
+               max_time: float | None = None, tail: int = 50, compress: bool = False,
+               size_hint: int | None = None) -> ChannelReader:
+        """Start ``command`` and return a line reader over its output.
+
+        Unlike :meth:`run`, nothing but the last ``tail`` lines is kept, so
+        this is the one to use for build logs and large dumps.  ``compress``
+        and ``size_hint`` are as for :meth:`run`; gzip holds output back
+        until it has a block to send, so leave it off for live output.
+        """
+        timeout = timeout or self.host.command_timeout
+        wrapped, encoding = self._encode(command, compress, size_hint)
+        return ChannelReader(self._exec(wrapped, timeout, input), timeout, max_time, tail, encoding=encoding)
+
+    @staticmethod
+    def _encode(command: str, compress: bool, size_hint: int | None) -> tuple[str, str]:
+        level = choose_level(size_hint) if compress else 0
+        return (gzip_command(command, level), f'gzip-{level}') if level else (command, 'identity')
+
+    def _exec(self, command: str, timeout: float, input: bytes | None):
+        channel = self.open_session(timeout)
+        try:
+            channel.exec_command(command)
+            if input:
+                channel.sendall(input)
+            channel.shutdown_write()
+        except BaseException:
+            channel.close()
+            raise
+        return channel
+
+    def compose(self, args: str, timeout: float | None = None) -> CommandResult:
+        return self.run(self.host.compose(args), timeout=timeout)
+
+
+class SSHSession(BaseSession):
+    """A session that owns its paramiko transport."""
+
+    def __init__(self, host: HostConfig, client: paramiko.SSHClient):
+        self.host = host
+        self._client = client
+        self.transport: paramiko.Transport = client.get_transport()
+
+    @classmethod
+    def connect(cls, host: HostConfig) -> 'SSHSession':
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            client.connect(
+                host.hostname,
+                port=host.port,
+                username=host.username,
+                password=host.password,
+                key_filename=host.key_filename,
+                timeout=host.connect_timeout,
+                banner_timeout=host.connect_timeout,
+                auth_timeout=host.connect_timeout,
+                look_for_keys=host.password is None,
+                allow_agent=host.password is None,
+            )
+        except (paramiko.SSHException, OSError) as e:
+            client.close()
+            raise SessionError(f'{host.name}: cannot connect to {host.hostname}:{host.port} ({e})') from e
+        client.get_transport().set_keepalive(host.keepalive)
+        return cls(host, client)
+
+    def open_session(self, timeout: float | None = None) -> paramiko.Channel:
+        try:
+            channel = self.transport.open_session(timeout=self.host.connect_timeout)
+        except (paramiko.SSHException, OSError) as e:
+            raise SessionError(f'{self.host.name}: cannot open channel ({e})') from e
+        channel.settimeout(timeout or self.host.command_timeout)
+        return channel
+
+    def open_sftp(self) -> paramiko.SFTPClient:
+        return paramiko.SFTPClient.from_transport(self.transport)
+
+    def open_tunnel(self, host: str, port: int, timeout: float | None = None) -> paramiko.Channel:
+        try:
+            channel = self.transport.open_channel('direct-tcpip', (host, port), ('127.0.0.1', 0),
+                                                  timeout=self.host.connect_timeout)
+        except (paramiko.SSHException, OSError) as e:
+            raise SessionError(f'{self.host.name}: cannot open tunnel to {host}:{port} ({e})') from e
+        channel.settimeout(timeout or self.host.command_timeout)
+        return channel
+
+    @property
+    def active(self) -> bool:
+        return self.transport is not None and self.transport.is_active()
+
+    def close(self) -> None:
+        self._client.close()
+
+
+_POOL: dict[str, BaseSession] = {}
+_POOL_LOCK = threading.Lock()
+_HOST_LOCKS: dict[str, threading.Lock] = {}
+
+
+def get_session(name: str | HostConfig | None = None, *, multiplex: bool | None = None) -> BaseSession:
+    """Return the pooled session for a host, connecting on first use.
+
+    ``multiplex`` forces the mux master on or off; by default it follows the
+    host's ``control_persist`` setting.  If the master cannot be reached the
+    session falls back to a direct connection.
+    """
+    host = name if isinstance(name, HostConfig) else get_host(name)
+    # One lock per host, so fan-out runs connect to every host at once.
+    with _POOL_LOCK:
+        lock = _HOST_LOCKS.setdefault(host.name, threading.Lock())
+    with lock:
+        session = _POOL.get(host.name)
+        if session is not None and session.active:
+            return session
+        session = None
+        if host.control_persist > 0 if multiplex is None else multiplex:
+            from . import mux
+            try:
+                session = mux.attach(host)
+            except SessionError as e:
+                print(f'[rdvops] mux unavailable, connecting directly: {e}', file=sys.stderr)
+        if session is None:
+            session = SSHSession.connect(host)
+        with _POOL_LOCK:
+            _POOL[host.name] = session
+        return session
+
+
+def close_all() -> None:
+    with _POOL_LOCK:
+        for session in _POOL.values():
+            try:
+                session.close()
+            except Exception:
+                pass
+        _POOL.clear()
+
+
+atexit.register(close_all)
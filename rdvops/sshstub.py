@@ -0,0 +1,280 @@
+"""Local SSH server stand-in built on ``paramiko.ServerInterface``.
+
+Accepts password auth, runs exec requests through the local shell and counts
+handshakes, which is what the session tests need to prove connection reuse.
+With ``sftp_root`` set it also serves SFTP out of that local directory.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+
+# Resets from clients that hang up are expected; keep them out of stderr.
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+_HOST_KEY: paramiko.RSAKey | None = None
+
+
+def _host_key() -> paramiko.RSAKey:
+    global _HOST_KEY
+    if _HOST_KEY is None:
+        _HOST_KEY = paramiko.RSAKey.generate(2048)
+    return _HOST_KEY
+
+
+class _StubInterface(paramiko.ServerInterface):
+    def __init__(self, server: 'StubSSHServer'):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.server.username, self.server.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        self.server.tunnels[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        self.server.commands.append(command.decode('utf-8', errors='replace'))
+        threading.Thread(target=self.server.run_command, args=(channel, command), daemon=True).start()
+        return True
+
+
+class _StubSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class _StubSFTPInterface(paramiko.SFTPServerInterface):
+    """Plain filesystem SFTP rooted at ``root``; paths are not sandboxed beyond that prefix."""
+
+    def __init__(self, server, root: str):
+        super().__init__(server)
+        self.root = root
+
+    def canonicalize(self, path):
+        # Relative paths start at the root, which clients see as ``/``.
+        return os.path.normpath('/' + path).replace(os.sep, '/').replace('//', '/')
+
+    def _path(self, path: str) -> str:
+        return os.path.join(self.root, self.canonicalize(path).lstrip('/'))
+
+    def _call(self, fn, *args):
+        try:
+            return fn(*args)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def list_folder(self, path):
+        def listing(real):
+            return [paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(real, name)), name)
+                    for name in os.listdir(real)]
+        return self._call(listing, self._path(path))
+
+    def stat(self, path):
+        return self._call(lambda p: paramiko.SFTPAttributes.from_stat(os.stat(p)), self._path(path))
+
+    def lstat(self, path):
+        return self._call(lambda p: paramiko.SFTPAttributes.from_stat(os.lstat(p)), self._path(path))
+
+    def open(self, path, flags, attr):
+        def opened(real):
+            fd = os.open(real, flags, getattr(attr, 'st_mode', None) or 0o644)
+            mode = ('ab' if flags & os.O_APPEND else 'r+b' if flags & os.O_RDWR else
+                    'wb' if flags & os.O_WRONLY else 'rb')
+            handle = _StubSFTPHandle(flags)
+            handle.filename = real
+            handle.readfile = handle.writefile = os.fdopen(fd, mode)
+            return handle
+        return self._call(opened, self._path(path))
+
+    def remove(self, path):
+        return self._call(lambda p: os.remove(p) or paramiko.SFTP_OK, self._path(path))
+
+    def rename(self, oldpath, newpath):
+        return self._call(lambda a, b: os.replace(a, b) or paramiko.SFTP_OK, self._path(oldpath), self._path(newpath))
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+        return self._call(lambda p: os.mkdir(p) or paramiko.SFTP_OK, self._path(path))
+
+    def rmdir(self, path):
+        return self._call(lambda p: os.rmdir(p) or paramiko.SFTP_OK, self._path(path))
+
+    def chattr(self, path, attr):
+        def apply(real):
+            if attr.st_mode is not None:
+                os.chmod(real, attr.st_mode)
+            if attr.st_atime is not None and attr.st_mtime is not None:
+                os.utime(real, (attr.st_atime, attr.st_mtime))
+            return paramiko.SFTP_OK
+        return self._call(apply, self._path(path))
+
+
+class StubSSHServer:
+    """SSH server on 127.0.0.1 that runs commands with ``subprocess``.
+
+    Use as a context manager; ``port`` is assigned on entry and
+    ``handshakes`` counts completed transports.
+    """
+
+    def __init__(self, username: str = 'ops', password: str = 'secret', env: dict | None = None,
+                 sftp_root: str | os.PathLike | None = None):
+        self.username = username
+        self.password = password
+        self.env = env
+        self.sftp_root = os.fspath(sftp_root) if sftp_root is not None else None
+        self.handshakes = 0
+        self.commands: list[str] = []
+        self.tunnels: dict[int, tuple[str, int]] = {}
+        self._sock: socket.socket | None = None
+        self._transports: list[paramiko.Transport] = []
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self._sock.getsockname()[1]
+
+    def __enter__(self) -> 'StubSSHServer':
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.listen(16)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._sock.close()
+        for transport in self._transports:
+            transport.close()
+
+    def _accept_loop(self) -> None:
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            # Without this, Nagle on the server side adds ~40ms to every round
+            # trip and hides the client-side costs the tests and benchmarks measure.
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(conn)
+            transport.set_log_channel(f'{__name__}.transport')
+            transport.add_server_key(_host_key())
+            self.configure(transport)
+            try:
+                transport.start_server(server=_StubInterface(self))
+            except paramiko.SSHException:
+                continue
+            with self._lock:
+                self.handshakes += 1
+                self._transports.append(transport)
+            threading.Thread(target=self._drain_accepts, args=(transport,), daemon=True).start()
+
+    def configure(self, transport: paramiko.Transport) -> None:
+        """Hook for subclasses to register subsystems on a new transport."""
+        if self.sftp_root is not None:
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _StubSFTPInterface, self.sftp_root)
+
+    def _drain_accepts(self, transport: paramiko.Transport) -> None:
+        # Exec channels are driven from check_channel_exec_request.  Accepting
+        # them keeps the queue short; holding the references stops paramiko
+        # from closing them on garbage collection.  Tunnels are relayed here.
+        channels = []
+        while transport.is_active():
+            channel = transport.accept(1.0)
+            if channel is not None:
+                channels = [c for c in channels if not c.closed] + [channel]
+                destination = self.tunnels.pop(channel.get_id(), None)
+                if destination is not None:
+                    threading.Thread(target=self._relay, args=(channel, destination), daemon=True).start()
+
+    @staticmethod
+    def _relay(channel: paramiko.Channel, destination: tuple[str, int]) -> None:
+        try:
+            upstream = socket.create_connection(destination, timeout=10)
+        except OSError:
+            channel.close()
+            return
+        upstream.settimeout(None)
+
+        def pump(recv, send, done):
+            try:
+                for chunk in iter(lambda: recv(32768), b''):
+                    send(chunk)
+            except OSError:
+                pass
+            finally:
+                try:
+                    done()
+                except (OSError, EOFError):
+                    pass  # the transport is already gone
+
+        threading.Thread(target=pump, args=(channel.recv, upstream.sendall,
+                                            lambda: upstream.shutdown(socket.SHUT_WR)), daemon=True).start()
+        pump(upstream.recv, channel.sendall, channel.close)
+        upstream.close()
+
+    def run_command(self, channel: paramiko.Channel, command: bytes) -> None:
+        proc = subprocess.Popen(
+            command.decode('utf-8', errors='replace'), shell=True, env=self.env,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+
+        def feed_stdin():
+            try:
+                while True:
+                    data = channel.recv(32768)
+                    if not data:
+                        break
+                    proc.stdin.write(data)
+                    proc.stdin.flush()
+            except (OSError, socket.timeout):
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except OSError:
+                    pass
+
+        def copy(stream, send):
+            try:
+                for chunk in iter(lambda: stream.read1(32768), b''):
+                    send(chunk)
+            except (OSError, EOFError):
+                pass  # the client closed the channel early
+
+        pumps = [
+            threading.Thread(target=feed_stdin, daemon=True),
+            threading.Thread(target=copy, args=(proc.stdout, channel.sendall), daemon=True),
+            threading.Thread(target=copy, args=(proc.stderr, channel.sendall_stderr), daemon=True),
+        ]
+        for t in pumps:
+            t.start()
+        pumps[1].join()
+        pumps[2].join()
+        # Exit status and EOF only: closing here could overtake the reply to
+        # the exec request, so the client closes the channel instead.
+        status = proc.wait()
+        try:
+            channel.send_exit_status(status)
+            channel.shutdown_write()
+        except (OSError, EOFError):
+            pass  # the client disconnected before the command finished
@@ -0,0 +1,161 @@
+"""Incremental readers for SSH channel output.
+
+``iter_chunks`` is the one place that pulls bytes off a channel: it waits on
+``channel.fileno()`` so stdout and stderr are drained as they arrive and
+neither can stall the other.  ``ChannelReader`` turns those chunks into
+decoded lines and keeps only a bounded tail, so memory stays flat however
+much a ``docker compose build`` or a JSON dump prints.  Output gzipped on
+the server (see :mod:`rdvops.transport`) is inflated chunk by chunk on the
+way in.
+"""
+from __future__ import annotations
+
+import codecs
+import select
+import socket
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterator
+
+from .transport import Transfer
+
+STDOUT = 'stdout'
+STDERR = 'stderr'
+
+CHUNK_SIZE = 32768
+
+
+def iter_chunks(channel, timeout: float | None = None, deadline: float | None = None,
+                chunk_size: int = CHUNK_SIZE) -> Iterator[tuple[str, bytes]]:
+    """Yield ``(stream, data)`` pairs until the remote side sends EOF.
+
+    ``timeout`` is the longest wait for new output and ``deadline`` an
+    absolute ``time.monotonic()`` limit; either raises ``socket.timeout``.
+    """
+    fd = channel.fileno()
+    while True:
+        wait = timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout('command exceeded its time limit')
+            wait = remaining if wait is None else min(wait, remaining)
+        ready, _, _ = select.select([fd], [], [], wait)
+        if not ready:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise socket.timeout('command exceeded its time limit')
+            raise socket.timeout(f'no output for {timeout}s')
+        got = False
+        while channel.recv_stderr_ready():
+            yield STDERR, channel.recv_stderr(chunk_size)
+            got = True
+        if channel.recv_ready():
+            yield STDOUT, channel.recv(chunk_size)
+            got = True
+        if not got and (channel.eof_received or channel.closed) \
+                and not channel.recv_ready() and not channel.recv_stderr_ready():
+            return
+
+
+class Inflater:
+    """Incremental gzip decoder; concatenated gzip members are decoded in turn."""
+
+    def __init__(self):
+        self._z = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+    def decode(self, data: bytes) -> bytes:
+        out = []
+        while data:
+            try:
+                out.append(self._z.decompress(data))
+            except zlib.error as e:
+                raise OSError(f'corrupt compressed output: {e}') from None
+            if not self._z.eof:
+                break
+            data = self._z.unused_data
+            self._z = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        return b''.join(out)
+
+
+@dataclass(frozen=True)
+class Line:
+    stream: str
+    text: str
+
+
+class ChannelReader:
+    """Iterate a running command's output as decoded :class:`Line` objects.
+
+    Only the last ``tail`` lines are retained (for "last N lines on
+    failure"); lines longer than ``max_line`` characters are split.  The exit
+    status is available once iteration finishes.  Use as a context manager
+    so the channel is closed even if the loop stops early.  ``encoding``
+    names how stdout was sent: ``identity``, or ``gzip-<level>`` (or
+    ``gzip-adaptive``) to inflate it.
+    """
+
+    def __init__(self, channel, timeout: float | None = None, max_time: float | None = None,
+                 tail: int = 50, max_line: int = 65536, encoding: str = 'identity'):
+        self.channel = channel
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.deadline = self.started + max_time if max_time else None
+        self.tail: deque[Line] = deque(maxlen=tail)
+        self.max_line = max_line
+        self.bytes_read = {STDOUT: 0, STDERR: 0}
+        self.bytes_decoded = {STDOUT: 0, STDERR: 0}
+        self.encoding = encoding
+        self.lines_read = 0
+        self.exit_status: int | None = None
+
+    def __enter__(self) -> 'ChannelReader':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.channel.close()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def transfer(self) -> Transfer:
+        """Stdout bytes on the wire against bytes decoded so far."""
+        return Transfer(self.bytes_read[STDOUT], self.bytes_decoded[STDOUT], self.encoding, self.elapsed)
+
+    def tail_text(self, stream: str | None = None) -> str:
+        return '\n'.join(line.text for line in self.tail if stream is None or line.stream == stream)
+
+    def _emit(self, stream: str, text: str) -> Line:
+        line = Line(stream, text[:-1] if text.endswith('\r') else text)
+        self.tail.append(line)
+        self.lines_read += 1
+        return line
+
+    def _split(self, stream: str, text: str) -> Iterator[Line]:
+        for i in range(0, max(len(text), 1), self.max_line):
+            yield self._emit(stream, text[i:i + self.max_line])
+
+    def __iter__(self) -> Iterator[Line]:
+        decoders = {s: codecs.getincrementaldecoder('utf-8')(errors='replace') for s in (STDOUT, STDERR)}
+        pending = {STDOUT: '', STDERR: ''}
+        inflater = Inflater() if self.encoding.startswith('gzip') else None
+        for stream, data in iter_chunks(self.channel, self.timeout, self.deadline):
+            self.bytes_read[stream] += len(data)
+            if inflater is not None and stream == STDOUT:
+                data = inflater.decode(data)
+            self.bytes_decoded[stream] += len(data)
+            *lines, rest = (pending[stream] + decoders[stream].decode(data)).split('\n')
+            for text in lines:
+                yield from self._split(stream, text)
+            while len(rest) > self.max_line:
+                yield self._emit(stream, rest[:self.max_line])
+                rest = rest[self.max_line:]
+            pending[stream] = rest
+        for stream, decoder in decoders.items():
+            rest = pending[stream] + decoder.decode(b'', final=True)
+            if rest:
+                yield from self._split(stream, rest)
+        self.exit_status = self.channel.recv_exit_status()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import socket
+import subprocess
+import time
+from contextlib import ExitStack
+
+import pytest
+
+from rdvops.resp import RedisConnection
+
+# Stands in for docker on the stub's PATH.  `docker exec [-i] [-e NAME=VALUE]...
+# [-w DIR] CONTAINER COMMAND...` runs COMMAND locally with the variables set and
+# `docker inspect ...` prints $DOCKER_INSPECT; with $DOCKER_LOG set, each call
+# appends "<verb> [container]" to it.
+FAKE_DOCKER = '''#!/bin/sh
+verb=$1
+shift
+if [ "$verb" = inspect ]; then
+  [ -n "$DOCKER_LOG" ] && echo inspect >> "$DOCKER_LOG"
+  echo "$DOCKER_INSPECT"
+  exit 0
+fi
+while :; do
+  case "$1" in
+    -i) shift ;;
+    -e) export "$2"; shift 2 ;;
+    -w) shift 2 ;;
+    *) break ;;
+  esac
+done
+container=$1
+shift
+[ -n "$DOCKER_LOG" ] && echo "$verb $container" >> "$DOCKER_LOG"
+exec "$@"
+'''
+
+
+@pytest.fixture
+def redis(tmp_path):
+    """A throwaway local redis-server; skips the test when it is not installed."""
+    if shutil.which('redis-server') is None:
+        pytest.skip('redis-server is not installed')
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    proc = subprocess.Popen(['redis-server', '--port', str(port), '--bind', '127.0.0.1', '--save', '',
+                             '--appendonly', 'no', '--dir', str(tmp_path)], stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            conn = RedisConnection.connect('127.0.0.1', port)
+            break
+        except OSError:
+            time.sleep(0.05)
+    else:
+        proc.kill()
+        pytest.fail('redis-server did not start')
+    yield conn
+    conn.close()
+    proc.kill()
+    proc.wait()
+
+
+@pytest.fixture
+def postgres_dsn(tmp_path):
+    """``$RDVOPS_TEST_PG_DSN`` (an empty scratch database), or a throwaway local cluster.
+
+    Skips the test when neither is available; initdb refuses to run as root.
+    """
+    if shutil.which('psql') is None:
+        pytest.skip('psql is not installed')
+    dsn = os.environ.get('RDVOPS_TEST_PG_DSN')
+    if dsn:
+        yield dsn
+        return
+    if shutil.which('initdb') is None or shutil.which('pg_ctl') is None or os.geteuid() == 0:
+        pytest.skip('no RDVOPS_TEST_PG_DSN and no local initdb to start a cluster with')
+    data = tmp_path / 'pgdata'
+    subprocess.run(['initdb', '-D', str(data), '-U', 'postgres', '-A', 'trust'], check=True,
+                   stdout=subprocess.DEVNULL)
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    subprocess.run(['pg_ctl', '-D', str(data), '-w', '-l', str(tmp_path / 'pg.log'),
+                    '-o', f'-p {port} -k {tmp_path} -c listen_addresses=', 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f'host={tmp_path} port={port} user=postgres dbname=postgres'
+    finally:
+        subprocess.run(['pg_ctl', '-D', str(data), '-m', 'immediate', 'stop'], stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def stub_session(tmp_path):
+    """Factory for sessions on a :class:`~rdvops.sshstub.StubSSHServer` with a fake docker on its PATH.
+
+    ``stub_session(prisma=SOURCE, docker=SCRIPT, env={...}, sftp_root=..., **host_fields)``:
+    ``prisma`` is written to ``prisma.js`` and used as ``@prisma/client`` by
+    the query helper, ``docker`` replaces :data:`FAKE_DOCKER`, ``env`` is
+    added to the server's environment (a ``PATH`` there replaces the inherited
+    one, still behind the fake docker) and the remaining keywords override
+    :class:`~rdvops.config.HostConfig` fields.  The last server started is
+    ``stub_session.server``, for its ``commands``.
+    """
+    from rdvops.config import HostConfig
+    from rdvops.session import SSHSession
+    from rdvops.sshstub import StubSSHServer
+
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir(exist_ok=True)
+    with ExitStack() as stack:
+        def start(prisma: str | None = None, docker: str = FAKE_DOCKER, env: dict | None = None, sftp_root=None,
+                  **fields):
+            (bin_dir / 'docker').write_text(docker)
+            (bin_dir / 'docker').chmod(0o755)
+            server_env = {**os.environ, **(env or {})}
+            server_env['PATH'] = f'{bin_dir}:{server_env["PATH"]}'
+            if prisma is not None:
+                (tmp_path / 'prisma.js').write_text(prisma)
+                server_env['RDVOPS_PRISMA_MODULE'] = str(tmp_path / 'prisma.js')
+            server = start.server = stack.enter_context(StubSSHServer(env=server_env, sftp_root=sftp_root))
+            host = HostConfig(**{'name': 'stub', 'hostname': '127.0.0.1', 'port': server.port, 'username': 'ops',
+                                 'password': 'secret', 'control_persist': 0, **fields})
+            session = SSHSession.connect(host)
+            stack.callback(session.close)
+            return session
+        yield start
+
+
+@pytest.fixture
+def session(stub_session):
+    """A direct session on a fresh stub server."""
+    return stub_session()
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.bench import CASES, compare, main, percentile, run_benchmarks, stand_in
+
+
+def test_percentile_interpolates():
+    assert percentile([4, 1, 3, 2], 50) == 2.5
+    assert percentile([1, 2, 3, 4, 5], 95) == pytest.approx(4.8)
+    assert percentile([7], 95) == 7
+
+
+def test_every_case_runs_against_the_stand_in(tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    with stand_in(tmp_path / 'stub') as host:
+        results = run_benchmarks(host, iterations=3, sftp_mb=0.25, log=lambda *a: None)
+    assert tuple(results) == CASES
+    assert all(r['n'] == 3 and 0 < r['min'] <= r['p50'] <= r['p95'] <= r['max'] for r in results.values())
+    assert results['sftp_get']['mb_per_s'] > 0 and results['qa_checks']['per_check'] > 0
+
+
+def test_compare_flags_regressions_and_main_exits_nonzero(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    old = {'created': '2026-01-01T00:00:00Z', 'cases': {'round_trip': {'p50': 10.0, 'p95': 20.0},
+                                                       'connect': {'p50': 50.0, 'p95': 60.0}}}
+    new = {'created': '2026-01-02T00:00:00Z', 'cases': {'round_trip': {'p50': 10.5, 'p95': 30.0},
+                                                       'connect': {'p50': 40.0, 'p95': 50.0}}}
+    rows = {(r['case'], r['metric']): r for r in compare(old, new)}
+    assert not rows['round_trip', 'p50']['regressed'] and rows['round_trip', 'p95']['regressed']
+    assert rows['connect', 'p50']['change'] == -20.0
+
+    out = tmp_path / 'now.json'
+    baseline = tmp_path / 'fast.json'
+    baseline.write_text(json.dumps({'created': '2026-01-01T00:00:00Z', 'revision': 'abc1234',
+                                    'cases': {'round_trip': {'p50': 0.0001, 'p95': 0.0001}}}))
+    assert main(['--iterations', '2', '--cases', 'round_trip', '--output', str(out),
+                 '--compare', str(baseline)]) == 1
+    report = json.loads(out.read_text())
+    assert set(report['cases']) == {'round_trip'} and report['iterations'] == 2
+    assert '1 regressed: round_trip' in capsys.readouterr().out
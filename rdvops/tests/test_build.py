@@ -0,0 +1,88 @@
+import json
+import sys
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.build import affected_services, deploy_services, load_pending
+from rdvops.trace import DeployTrace
+
+FAKE_DOCKER = '''#!{python}
+import json, os, sys
+args = sys.argv[1:]
+with open(os.environ['DOCKER_LOG'], 'a') as log:
+    log.write(' '.join(args) + '\\n')
+if 'config' in args:
+    root = os.getcwd()
+    print(json.dumps({{'name': 'rdvpriority', 'services': {{
+        'postgres': {{'image': 'postgres:15-alpine'}},
+        'api': {{'build': {{'context': root + '/backend', 'dockerfile': 'Dockerfile'}}}},
+        'worker1': {{'build': {{'context': root + '/backend', 'dockerfile': 'Dockerfile.worker'}}}},
+        'worker2': {{'build': {{'context': root + '/backend', 'dockerfile': 'Dockerfile.worker'}}}},
+        'worker3': {{'build': {{'context': root + '/backend', 'dockerfile': 'Dockerfile.worker'}}}},
+        'frontend': {{'build': {{'context': root + '/frontend', 'dockerfile': 'Dockerfile'}}}},
+    }}}}))
+elif 'build' in args and os.path.exists(os.environ['DOCKER_FAIL']):
+    print('step 3/7 failed')
+    sys.exit(1)
+'''
+
+
+@pytest.fixture
+def env(stub_session, tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    remote = tmp_path / 'remote'
+    remote.mkdir()
+    log = tmp_path / 'docker.log'
+    session = stub_session(docker=FAKE_DOCKER.format(python=sys.executable), remote_dir=str(remote),
+                           env={'DOCKER_LOG': str(log), 'DOCKER_FAIL': str(tmp_path / 'fail')})
+    return session, log, tmp_path / 'fail'
+
+
+def _calls(log):
+    return [line for line in log.read_text().splitlines() if 'config' not in line]
+
+
+def test_affected_services_follow_build_context():
+    from rdvops.build import ServiceImage
+    services = {
+        'api': ServiceImage('api', 'backend', 'Dockerfile', 'p-api'),
+        'worker1': ServiceImage('worker1', 'backend', 'Dockerfile.worker', 'p-worker1'),
+        'frontend': ServiceImage('frontend', 'frontend', 'Dockerfile', 'p-frontend'),
+    }
+    assert affected_services(['backend/src/a.ts'], services) == ['api', 'worker1']
+    assert affected_services(['backend/Dockerfile.worker'], services) == ['worker1']
+    assert affected_services(['frontend/src/page.tsx', 'README.md'], services) == ['frontend']
+
+
+def test_workers_build_once_and_restart_in_turn(env):
+    session, log, _ = env
+    out = []
+    assert deploy_services(session, ['backend/src/scraper/run.ts'], log=out.append)
+    calls = _calls(log)
+    builds = [c for c in calls if ' build ' in c]
+    assert [c.split()[-1] for c in builds] == ['api', 'worker1']
+    assert 'tag rdvpriority-worker1 rdvpriority-worker2' in calls
+    assert 'tag rdvpriority-worker1 rdvpriority-worker3' in calls
+    ups = [c.split()[-1] for c in calls if ' up ' in c]
+    assert ups == ['api', 'worker1', 'worker2', 'worker3']
+    assert all('--no-deps --no-build' in c for c in calls if ' up ' in c)
+    assert 'tag of worker1' in out[-1]
+
+
+def test_failed_build_is_retried_next_time(env):
+    session, log, fail = env
+    fail.touch()
+    trace = DeployTrace('backend', 'stub')
+    assert not deploy_services(session, ['backend/Dockerfile.worker'], log=lambda _: None, trace=trace)
+    assert [(s.name, s.service, s.ok) for s in trace.spans] == [('compose_config', None, True),
+                                                                ('build', 'worker1', False)]
+    assert load_pending(session) == {'worker1', 'worker2', 'worker3'}
+    assert not [c for c in _calls(log) if ' up ' in c]
+
+    fail.unlink()
+    log.write_text('')
+    assert deploy_services(session, [], log=lambda _: None)
+    assert [c.split()[-1] for c in _calls(log) if ' up ' in c] == ['worker1', 'worker2', 'worker3']
+    assert load_pending(session) == set()
@@ -0,0 +1,28 @@
+import time
+
+from rdvops.bullq import find_queues, format_queues, inspect_queues
+
+
+def test_counts_and_oldest_wait(redis):
+    now_ms = int(time.time() * 1000)
+    redis.pipeline([
+        ('HSET', 'bull:scraper:meta', 'opts.maxLenEvents', 10000),
+        ('SET', 'bull:scraper:id', 12),
+        ('LPUSH', 'bull:scraper:wait', 10), ('LPUSH', 'bull:scraper:wait', 11), ('LPUSH', 'bull:scraper:wait', 12),
+        ('HSET', 'bull:scraper:10', 'timestamp', now_ms - 90_000, 'name', 'scrape'),
+        ('HSET', 'bull:scraper:11', 'timestamp', now_ms - 5_000),
+        ('LPUSH', 'bull:scraper:active', 9),
+        ('ZADD', 'bull:scraper:failed', 1, 7, 2, 8),
+        ('ZADD', 'bull:scraper:completed', 1, 1, 2, 2, 3, 3),
+        ('ZADD', 'bull:notifications:delayed', now_ms + 60_000, 4),
+        ('HSET', 'bull:notifications:meta', 'paused', 1),
+        ('SET', 'unrelated', 'x'),
+    ])
+    for i in range(5000):  # enough job hashes that SCAN needs several calls
+        redis.execute('HSET', f'bull:scraper:{1000 + i}', 'timestamp', now_ms)
+    assert find_queues(redis, count=100) == ['notifications', 'scraper']
+    notifications, scraper = inspect_queues(redis)
+    assert (scraper.wait, scraper.active, scraper.failed, scraper.completed) == (3, 1, 2, 3)
+    assert 85 <= scraper.oldest_wait_age <= 120
+    assert notifications.delayed == 1 and notifications.is_paused and notifications.oldest_wait_age is None
+    assert 'notifications (paused)' in format_queues([notifications, scraper])
@@ -0,0 +1,27 @@
+import time
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.checks import format_summary, run_checks
+
+
+def test_checks_run_in_parallel_and_keep_order(session):
+    checks = [(f'check-{i}', f'sleep {0.4 - i * 0.1:.1f}; echo {i}') for i in range(4)]
+    started = time.monotonic()
+    results = list(run_checks(session, checks, concurrency=4, timeout=5))
+    wall = time.monotonic() - started
+    assert [r.name for r in results] == [name for name, _ in checks]
+    assert [r.output for r in results] == ['0', '1', '2', '3']
+    assert all(r.status == 'PASS' for r in results)
+    assert wall < sum(r.elapsed for r in results)
+
+
+def test_check_statuses_and_summary(session):
+    checks = [('empty', 'true'), ('fails', 'echo no; exit 2'), ('slow', 'sleep 5; echo late')]
+    results = list(run_checks(session, checks, concurrency=2, timeout=0.5))
+    assert [r.status for r in results] == ['FAIL', 'FAIL', 'TIMEOUT']
+    summary = format_summary(results, 0.6, slowest=1)
+    assert '2 FAIL, 1 TIMEOUT' in summary
+    assert summary.rstrip().endswith('slow')
@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+
+from rdvops import cli
+from rdvops.cli import REPO_ROOT, complete, main
+
+LIGHT_CHECK = '''
+import sys
+from rdvops.cli import main
+main(['--help'])
+main(['__complete', '1', 'qa', '--lat'])
+main(['__complete', '0', 'sy'])
+print(sorted(m for m in ('paramiko', 'cryptography', 'rdvops.session', 'rdvops.config', 'argparse')
+             if m in sys.modules))
+'''
+
+
+def _env(tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('RDVOPS_CONFIG', str(tmp_path / 'config' / 'config.json'))
+    monkeypatch.delenv('RDVOPS_HOST', raising=False)
+
+
+def test_help_and_completion_import_nothing_heavy(tmp_path, monkeypatch):
+    _env(tmp_path, monkeypatch)
+    done = subprocess.run([sys.executable, '-c', LIGHT_CHECK], cwd=REPO_ROOT, capture_output=True, text=True,
+                          env=dict(os.environ, PYTHONPATH=str(REPO_ROOT)))
+    assert done.returncode == 0, done.stderr
+    out = done.stdout.splitlines()
+    assert out[0] == 'usage: rdvops [-H HOST] <command> [args...]'
+    assert '--latency' in out and '--latency-rate' in out and 'sync' in out
+    assert out[-1] == '[]'
+
+    assert complete(2, ['-H', 'prod', 'lo']) == ['logs', 'loadtest']
+    assert complete(1, ['loadtest', '']) == ['run', 'report']
+    assert complete(1, ['-H', 'p']) == ['prod']
+    assert complete(2, ['config', 'args', 'dep']) == ['deploy', 'deploy-frontend']
+    assert '--dry-run' in complete(1, ['deploy', '--'])
+
+
+def test_cached_help_settings_and_dispatch(tmp_path, monkeypatch, capsys):
+    _env(tmp_path, monkeypatch)
+    assert main(['sync', '--help']) == 0
+    first = capsys.readouterr().out
+    assert first.startswith('usage: rdvops sync [-h] [--dry-run]') and '--intervals INTERVALS' in first
+    index = json.loads((tmp_path / 'cache' / 'cli-index.json').read_text())
+    assert index['commands']['sync']['help'] == first.rstrip()
+
+    # Later calls read the index instead of running the script.
+    def fail(name):
+        raise AssertionError(f'{name} --help ran again')
+    monkeypatch.setattr(cli, '_capture_help', fail)
+    assert main(['sync', '--help']) == 0 and capsys.readouterr().out == first
+    assert main(['status', '-h']) == 0
+    assert capsys.readouterr().out.startswith('usage: rdvops status\n\nContainer status')
+
+    assert main(['config', 'args', 'trace', '-n', '3', '--kind', 'frontend']) == 0
+    assert main(['config', 'host', 'prod']) == 0
+    assert main(['config', 'host', 'nowhere']) == 2
+    assert json.loads((tmp_path / 'config' / 'cli.json').read_text()) == {
+        'args': {'trace': ['-n', '3', '--kind', 'frontend']}, 'host': 'prod'}
+    capsys.readouterr()
+    assert main(['trace', '--json']) == 0
+    assert json.loads(capsys.readouterr().out) == [] and os.environ['RDVOPS_HOST'] == 'prod'
+
+    assert main(['stats']) == 2
+    assert "unknown command 'stats' (did you mean 'status'?)" in capsys.readouterr().err
+    assert main(['status', '--tail', '5']) == 2
+    assert main(['config', 'args', 'status', '-v']) == 2
+    assert main([]) == 2
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.deploy import MANIFEST, sync
+from rdvops.session import SessionError
+
+
+@pytest.fixture
+def env(stub_session, tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    local = tmp_path / 'local'
+    for rel, text in {'backend/src/a.ts': 'a', 'backend/src/lib/b.ts': 'b', 'frontend/src/page.tsx': 'p'}.items():
+        (local / rel).parent.mkdir(parents=True, exist_ok=True)
+        (local / rel).write_text(text)
+    remote = tmp_path / 'remote'
+    session = stub_session(remote_dir=str(remote))
+    return session, stub_session.server, local, remote
+
+
+def test_only_changes_cross_the_wire(env):
+    session, server, local, remote = env
+    roots = ('backend/src', 'frontend/src')
+    first = sync(session, roots, local, log=lambda _: None)
+    assert first.changed == ['backend/src/a.ts', 'backend/src/lib/b.ts', 'frontend/src/page.tsx']
+    assert (remote / 'backend/src/lib/b.ts').read_text() == 'b'
+
+    uploads = len(server.commands)
+    assert sync(session, roots, local, log=lambda _: None).empty
+    assert len(server.commands) == uploads + 1  # just the manifest read
+
+    (local / 'backend/src/a.ts').write_text('a2')
+    (local / 'backend/src/lib/b.ts').unlink()
+    plan = sync(session, ('backend/src',), local, log=lambda _: None)
+    assert (plan.changed, plan.deleted) == (['backend/src/a.ts'], ['backend/src/lib/b.ts'])
+    assert (remote / 'backend/src/a.ts').read_text() == 'a2'
+    assert not (remote / 'backend/src/lib/b.ts').exists()
+    manifest = json.loads((remote / MANIFEST).read_text())
+    assert sorted(manifest) == ['backend/src/a.ts', 'frontend/src/page.tsx']
+
+
+def test_verify_catches_remote_drift(env):
+    session, _, local, remote = env
+    sync(session, ('backend/src',), local, log=lambda _: None)
+    (remote / 'backend/src/a.ts').write_text('edited on the server')
+    assert sync(session, ('backend/src',), local, log=lambda _: None).empty
+    plan = sync(session, ('backend/src',), local, verify=True, log=lambda _: None)
+    assert plan.changed == ['backend/src/a.ts']
+    assert (remote / 'backend/src/a.ts').read_text() == 'a'
+
+
+def test_force_uploads_everything_but_keeps_the_manifest(env):
+    session, _, local, remote = env
+    sync(session, ('backend/src', 'frontend/src'), local, log=lambda _: None)
+    (local / 'backend/src/lib/b.ts').unlink()
+    plan = sync(session, ('backend/src',), local, force=True, log=lambda _: None)
+    assert (plan.changed, plan.deleted) == (['backend/src/a.ts'], ['backend/src/lib/b.ts'])
+    assert not (remote / 'backend/src/lib/b.ts').exists()
+    # The frontend entries survive a forced backend deploy.
+    assert sorted(json.loads((remote / MANIFEST).read_text())) == ['backend/src/a.ts', 'frontend/src/page.tsx']
+
+
+def test_failed_extract_fails_the_deploy(stub_session, tmp_path, env):
+    _, _, local, remote = env
+    tar = tmp_path / 'broken' / 'tar'
+    tar.parent.mkdir()
+    tar.write_text('#!/bin/sh\ncat > /dev/null\necho "tar: write error: No space left on device" >&2\nexit 2\n')
+    tar.chmod(0o755)
+    session = stub_session(env={'PATH': f'{tar.parent}:{os.environ["PATH"]}'}, remote_dir=str(remote))
+    with pytest.raises(SessionError, match='No space left'):
+        sync(session, ('backend/src',), local, log=lambda _: None)
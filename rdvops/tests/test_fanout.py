@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops import session as session_mod
+from rdvops.config import ConfigError, select_hosts
+from rdvops.fanout import exit_code, format_results, main, run_checks_on_hosts, run_on_hosts
+from rdvops.sshstub import StubSSHServer
+
+
+@pytest.fixture
+def inventory(tmp_path, monkeypatch):
+    with StubSSHServer(env={**os.environ, 'NODE': 'a'}) as a, StubSSHServer(env={**os.environ, 'NODE': 'b'}) as b:
+        config = tmp_path / 'config.json'
+        config.write_text(json.dumps({
+            'default_host': 'node-a',
+            'defaults': {'hostname': '127.0.0.1', 'username': 'ops', 'password': 'secret',
+                         'control_persist': 0, 'command_timeout': 10},
+            'hosts': {
+                'prod': {'hostname': '192.0.2.1', 'roles': []},
+                'node-a': {'port': a.port, 'roles': ['api', 'worker']},
+                'node-b': {'port': b.port, 'roles': 'worker', 'remote_dir': '/srv/rdv',
+                           'compose_file': 'docker-compose.worker.yml'},
+            },
+        }))
+        monkeypatch.setenv('RDVOPS_CONFIG', str(config))
+        monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+        for var in ('RDVOPS_HOST', 'RDVOPS_HOSTNAME', 'RDVOPS_PORT', 'RDVOPS_PASSWORD'):
+            monkeypatch.delenv(var, raising=False)
+        yield a, b
+        session_mod.close_all()
+
+
+def test_select_hosts_by_name_and_role(inventory):
+    assert [h.name for h in select_hosts()] == ['node-a']
+    assert [h.name for h in select_hosts('worker')] == ['node-a', 'node-b']
+    assert [h.name for h in select_hosts('node-b,api')] == ['node-b', 'node-a']
+    node_b = select_hosts('node-b')[0]
+    assert node_b.roles == ('worker',)
+    assert node_b.compose('ps') == 'cd /srv/rdv && docker compose -f docker-compose.worker.yml ps'
+    assert 'prod' in [h.name for h in select_hosts('all')]
+    with pytest.raises(ConfigError, match='roles: api, worker'):
+        select_hosts('gpu')
+
+
+def test_command_runs_on_all_hosts_concurrently(inventory):
+    hosts = select_hosts('worker')
+    started = time.monotonic()
+    results = run_on_hosts(hosts, 'sleep 0.5; echo node=$NODE; [ $NODE = a ] || exit 3')
+    wall = time.monotonic() - started
+    assert [(r.host, r.stdout.strip(), r.exit_status) for r in results] == [
+        ('node-a', 'node=a', 0), ('node-b', 'node=b', 3)]
+    assert wall < 1.0
+    assert exit_code(results) == 3
+    assert format_results(results).endswith('2 hosts, 1 ok, failed: node-b')
+
+
+def test_checks_fan_out_with_per_host_limit(inventory):
+    checks = [(f'check-{i}', f'sleep 0.3; echo $NODE-{i}') for i in range(4)]
+    checks.append(('compose', lambda host: f'echo {host.remote_dir}'))
+    started = time.monotonic()
+    by_host = run_checks_on_hosts(select_hosts('worker'), checks, per_host=2, timeout=5)
+    wall = time.monotonic() - started
+    assert [r.output for r in by_host['node-b']] == ['b-0', 'b-1', 'b-2', 'b-3', '/srv/rdv']
+    assert all(r.status == 'PASS' for results in by_host.values() for r in results)
+    # Five checks, two at a time per host: three rounds, the same on two hosts as on one.
+    assert 0.6 <= wall < 1.4
+
+
+def test_unreachable_host_and_script(inventory, tmp_path, capsys):
+    a, _ = inventory
+    a.password = 'changed'
+    script = tmp_path / 'check.sh'
+    script.write_text('echo "from script on $NODE"\n')
+    assert main(['--hosts', 'worker', '--script', str(script)]) == 255
+    out = capsys.readouterr().out
+    assert '== node-a (exit 255' in out and 'from script on b' in out
@@ -0,0 +1,91 @@
+import pytest
+
+from rdvops.intervals import (IntervalError, build_histories, build_windows, caught, changes, format_report,
+                              load_intervals, mean_delay, on_time, recommend, save_intervals)
+from rdvops.prefsync import apply_overrides, diff_prefectures, format_diff
+
+NOW = 10 * 86400.0
+START = NOW - 2 * 86400
+
+
+def _polls(prefecture, category, open_at=(), length=0, every=240):
+    """Two days of polls every ``every`` seconds, positive inside ``[t, t + length)`` for each ``t`` in ``open_at``."""
+    rows = []
+    t = START
+    while t < NOW:
+        slots = any(start <= t < start + length for start in open_at)
+        rows.append([prefecture, category, t, int(slots)])
+        t += every
+    return rows
+
+
+def _history_data():
+    logs = (_polls('paris_75', '16040', [START + h * 3600 for h in range(3, 48, 6)], 1200)
+            + _polls('paris_75', '1922')
+            + _polls('lyon_69', '')
+            + _polls('moulins_03', '', [START + 20 * 3600], 7200)
+            + _polls('old_01', '', [START], 7200))
+    detections = [['paris_75', '16040', START + 3 * 3600 + 30],  # same event as the logged poll
+                  ['moulins_03', '', NOW - 3 * 86400]]  # its log rows are already rolled up
+    return {
+        'now': NOW,
+        'prefectures': [{'id': i, 'name': i, 'tier': t, 'checkInterval': 180}
+                        for i, t in (('paris_75', 1), ('lyon_69', 2), ('moulins_03', 2), ('nice_06', 3))],
+        'logs': sorted(logs, key=lambda r: r[2]),
+        'detections': detections,
+        'firstRollup': {'moulins_03': NOW - 4 * 86400},
+    }
+
+
+def test_windows_and_detection_model():
+    # Positive at 240 and 480, negatives either side: the edges are taken halfway out.
+    assert build_windows([(0, False), (240, True), (480, True), (720, False)], 240) == [(120, 480, 2)]
+    # A lone positive with no neighbours, and two positives too far apart to be one window.
+    assert build_windows([(1000, True), (5000, True)], 240) == [(880, 240, 1), (4880, 240, 1)]
+    assert on_time([600, 120], 240, target=300) == pytest.approx((1 + 0.5) / 2)
+    assert caught([600, 120], 480) == pytest.approx((1 + 0.25) / 2)
+    assert mean_delay([600], 240) == 120 and mean_delay([], 240) is None
+
+    histories = {h.id: h for h in build_histories(_history_data(), days=14)}
+    assert sorted(histories) == ['lyon_69', 'moulins_03', 'paris_75']  # old_01 is not ACTIVE, nice_06 not polled
+    paris, lyon, moulins = histories['paris_75'], histories['lyon_69'], histories['moulins_03']
+    assert (paris.categories, len(paris.windows), round(paris.days, 2)) == (2, 8, 2.0)
+    assert {w.category for w in paris.windows} == {'16040'}
+    assert all(1200 <= w.duration <= 1440 and w.polls == 5 for w in paris.windows)
+    assert lyon.windows == []
+    # The rolled-up detection adds a window and stretches the observed span back four days.
+    assert (len(moulins.windows), moulins.days) == (2, 4.0)
+
+
+def test_recommendation_fits_the_budget_and_feeds_remote_sync(tmp_path):
+    histories = build_histories(_history_data(), days=14)
+    recommendations, budget = recommend(histories, target=300)
+    by_id = {r.id: r for r in recommendations}
+    assert budget == pytest.approx(4 * 3600 / 240)  # four category pages every 240s today
+    # 20-minute windows are all caught within 5 minutes at 300s; never-open Lyon drops to the slowest.
+    assert [by_id[i].recommended for i in ('paris_75', 'moulins_03', 'lyon_69')] == [300, 240, 1800]
+    assert by_id['paris_75'].on_time_after == 1.0 and by_id['paris_75'].curve[2]['onTime'] < 1
+    assert sum(r.scrapes_after for r in recommendations) == pytest.approx(24 + 15 + 2)
+    # With half the budget, the frequent Paris windows keep their interval and Moulins gives way.
+    squeezed, _ = recommend(histories, budget=budget / 2, target=300)
+    assert [r.recommended for r in squeezed] == [1800, 900, 300]
+    assert sum(r.scrapes_after for r in squeezed) <= budget / 2
+    with pytest.raises(IntervalError, match='over the budget'):
+        recommend(histories, budget=1)
+
+    report = format_report(recommendations, budget, 300)
+    assert '180s -> 1800s' in report and 'scrapes/hour 60 -> 41 (budget 60)' in report
+    assert 'paris_75         240s 100%/2.0m  300s 100%/2.5m  360s 83%/3.0m' in report
+
+    path = tmp_path / 'intervals.json'
+    save_intervals(path, recommendations, {'days': 14, 'target': 300, 'budget': budget})
+    intervals = load_intervals(path)
+    assert intervals['lyon_69'] == 1800
+    configs = [{'id': i, 'checkInterval': 180} for i in ('lyon_69', 'moulins_03', 'paris_75')]
+    merged, unknown = apply_overrides(configs, {i: {'checkInterval': v} for i, v in intervals.items()})
+    assert unknown == []
+    sync = diff_prefectures(merged, configs, ('checkInterval',))
+    assert format_diff(sync) == format_diff(changes(recommendations))
+    path.write_text('{"checkInterval": {"paris_75": "fast"}}')
+    with pytest.raises(IntervalError):
+        load_intervals(path)
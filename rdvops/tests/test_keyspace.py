@@ -0,0 +1,76 @@
+from rdvops.keyspace import format_profile, key_pattern, profile_keyspace, size_bucket, ttl_bucket
+
+
+class FakeRedis:
+    """Just enough of RedisConnection for the profiler: SCAN plus the sizing commands."""
+
+    def __init__(self, keys):
+        self.keys = keys  # name -> (type, bytes, pttl)
+        self.commands = []
+
+    def scan(self, match=None, count=1000, type=None):
+        self.commands.append(('SCAN', count))
+        yield from self.keys
+
+    def pipeline(self, commands):
+        replies = []
+        for name, *args in commands:
+            self.commands.append((name, *args))
+            if name == 'DBSIZE':
+                replies.append(len(self.keys))
+            elif name == 'INFO':
+                replies.append('# Memory\r\nused_memory:1048576\r\nmaxmemory:268435456\r\n'
+                               if args == ['memory'] else '# Stats\r\nkeyspace_hits:90\r\nkeyspace_misses:10\r\n')
+            else:
+                kind, size, pttl = self.keys[args[-1] if name != 'MEMORY' else args[1]]
+                replies.append({'TYPE': kind, 'PTTL': pttl, 'MEMORY': size}[name])
+        return replies
+
+
+def test_key_pattern_and_buckets():
+    assert key_pattern('cache:pref:paris_75') == 'cache:pref:*'
+    assert key_pattern('cache:pref:list') == 'cache:pref:list'
+    assert key_pattern('ratelimit:user:3f0c9a2e-8d4b-4b6e-9a51-2f1d0c7e6b5a:/api/alerts') == \
+        'ratelimit:user:*:/api/alerts'
+    assert key_pattern('dedup:paris_75:abcdefabcdefabcdef') == 'dedup:*:*'
+    assert key_pattern('bull:scraper:wait', depth=2) == 'bull:scraper:*'
+    assert [ttl_bucket(t) for t in (None, 30, 300, 301, 90000)] == ['no ttl', '<=1m', '<=5m', '<=15m', '>1d']
+    assert [size_bucket(n) for n in (1, 64, 65, 5000)] == [64, 64, 128, 8192]
+
+
+def test_profile_groups_families_and_scales_partial_samples():
+    keys = {f'cache:pref:pref_{i}': ('string', 2000, 250_000) for i in range(40)}
+    keys.update({f'cache:user:{i}': ('string', 300, 50_000) for i in range(60)})
+    keys.update({'cache:pref:list': ('string', 40_000, 590_000), 'bull:scraper:meta': ('hash', 200, -1)})
+    redis = FakeRedis(keys)
+
+    full = profile_keyspace(redis, count=25)
+    assert full.complete and full.scale == 1.0 and full.sampled == 102
+    pref, listed = full.families[0], full.families[1]
+    assert (pref.pattern, pref.keys, pref.bytes, pref.ttls['<=5m']) == ('cache:pref:*', 40, 80_000, 40)
+    assert (listed.pattern, listed.max_bytes) == ('cache:pref:list', 40_000)
+    assert full.ttls == {'<=5m': 40, '<=1m': 60, '<=15m': 1, 'no ttl': 1}
+    assert full.hit_rate == 0.9
+    # Every sizing call is bounded; nothing walks the keyspace in one go.
+    assert {c[0] for c in redis.commands} <= {'SCAN', 'DBSIZE', 'INFO', 'TYPE', 'PTTL', 'MEMORY'}
+    assert all(c[-2:] == ('SAMPLES', 5) for c in redis.commands if c[0] == 'MEMORY')
+
+    partial = profile_keyspace(FakeRedis(keys), match='cache:*', limit=50, count=25)
+    assert not partial.complete and partial.examined == 50 and partial.scale == 102 / 50
+    assert partial.to_dict()['families'][0]['est_keys'] == round(40 * 102 / 50)
+    # The last batch is only examined up to the key that hit the limit.
+    assert profile_keyspace(FakeRedis(keys), limit=40, count=25).examined == 40
+    assert profile_keyspace(FakeRedis(keys), limit=0).sampled == 0
+    report = format_profile(partial)
+    assert 'cache:pref:*' in report and 'estimates x2.0' in report and 'hit rate 90.0%' in report
+
+
+def test_profile_against_redis(redis):
+    redis.pipeline([('SET', f'cache:pref:pref_{i}', 'x' * 500, 'EX', 300) for i in range(300)]
+                   + [('SET', 'cache:pref:list', 'y' * 20_000, 'EX', 600), ('HSET', 'bull:scraper:meta', 'a', 1)])
+    profile = profile_keyspace(redis, count=50)
+    assert profile.complete and profile.dbsize == 302 and profile.sampled == 302
+    families = {f.pattern: f for f in profile.families}
+    assert families['cache:pref:*'].keys == 300 and families['cache:pref:*'].ttls['<=5m'] == 300
+    assert families['cache:pref:list'].max_bytes > 20_000
+    assert families['bull:scraper:meta'].types == {'hash': 1}
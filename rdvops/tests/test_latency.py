@@ -0,0 +1,45 @@
+import shutil
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.httpstub import Route, StubHTTPServer
+from rdvops.latency import Sample, format_report, sample_command, sample_endpoints
+
+pytestmark = pytest.mark.skipif(not shutil.which('curl'), reason='needs curl')
+
+
+def test_curl_timings_become_phases():
+    sample = Sample.parse('200 0.001200 0.001500 0.020500 0.020600 0.085600 0.090000 5120')
+    assert (sample.status, sample.size) == (200, 5120)
+    assert [round(getattr(sample, p), 1) for p in ('dns', 'connect', 'tls', 'wait', 'ttfb', 'total')] == [
+        1.2, 0.3, 19.0, 65.0, 85.6, 90.0]
+    assert Sample.parse('000 0.000000 0.000000 0.000000 0.000000 0.000000 2.001000 0').ok is False
+    url, command = sample_command('/api/boss/stats', 'internal', 20, 4)
+    assert url == 'http://localhost:4000/api/boss/stats' and command.startswith('docker exec rdv_api sh -c ')
+    url, command = sample_command('/api/boss/stats', 'external', 20, 4, rate=8)
+    assert url == 'https://rdvpriority.fr/api/boss/stats' and 'curl -sk ' in command and 'sleep 0.500' in command
+
+
+def test_samples_both_sides(session):
+    with StubHTTPServer({'/api/boss/stats': Route(delay=0.05), '/api/health/ready': Route()}) as stub:
+        stub.routes['/api/boss/limited'] = Route(503, b'rate limited')
+        bases = {'internal': stub.url(''), 'external': stub.url('', host='localhost')}
+        series = sample_endpoints(session, ['/api/boss/stats', '/api/boss/limited'], samples=6, concurrency=3,
+                                  rate=20, bases=bases)
+        assert len(stub.requests) == 24 and stub.connections() == 24
+
+    stats, stats_out, limited, limited_out = series
+    assert [(s.side, len(s.samples), len(s.ok)) for s in series] == [
+        ('internal', 6, 6), ('external', 6, 6), ('internal', 6, 0), ('external', 6, 0)]
+    assert stats.stat('wait', 50) >= 50 and stats.stat('total', 99) >= stats.stat('ttfb', 99) >= 50
+    assert sum(stats.histogram()) == 6 and stats.histogram()[6] == 6  # all between 50 and 100ms
+    # Three paced loops at 20 a second overall: two rounds take at least 0.15s.
+    assert stats_out.rate == 20 and stats_out.elapsed >= 0.15 and stats.rate == 0
+    assert limited_out.failures == {503: 6}
+
+    report = format_report(series)
+    assert '/api/boss/stats' in report and 'proxy adds' in report
+    assert 'external failures: 503 x6 (nginx api_limit, lower --rate)' in report
+    assert '<=100ms' in report
@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.loadtest import (Run, check_thresholds, compare_to_baseline, format_report, format_run, k6_command,
+                             load_history, load_thresholds, main, read_summary)
+
+# Writes a --summary-export file in k6's format from $FAKE_K6_RESULTS[scenario];
+# exits 99 like k6 when the script's own thresholds fail.
+FAKE_K6 = '''#!{python}
+import json, os, sys
+args = sys.argv[1:]
+scenario = os.path.basename(args[-1])[:-3]
+with open(os.environ['FAKE_K6_LOG'], 'a') as f:
+    f.write(' '.join(args) + '\\n')
+runs = json.load(open(os.environ['FAKE_K6_RESULTS']))
+p95, failed = runs[scenario].pop(0)
+json.dump(runs, open(os.environ['FAKE_K6_RESULTS'], 'w'))
+summary = {{'metrics': {{
+    'http_req_duration': {{'avg': p95 / 2, 'p(95)': p95, 'p(99)': p95 * 1.5,
+                          'thresholds': {{'p(95)<500': False}}}},
+    'http_req_failed': {{'passes': 3, 'fails': 997, 'value': failed}},
+    'cache_hits': {{'count': 95, 'rate': 1.5}},
+    'cache_misses': {{'count': 5, 'rate': 0.1}},
+}}}}
+json.dump(summary, open(args[args.index('--summary-export') + 1], 'w'))
+sys.exit(99 if p95 > 500 else 0)
+'''
+
+SPEC = {'http_req_duration': {'p95': 500, 'p99': 1000}, 'http_req_failed': {'rate': 0.01},
+        'cache_hit_rate': {'min': 0.9}}
+
+
+def _run(p95, started, failed=0.001):
+    metrics = {'http_req_duration': {'p(95)': p95, 'p(99)': p95 * 1.5}, 'http_req_failed': {'value': failed},
+               'cache_hit_rate': {'value': 0.95}}
+    return Run('auth-load', started, 'local', 'abc1234', '3m', 0, 180.0, metrics, check_thresholds(metrics, SPEC))
+
+
+def test_summaries_and_thresholds(tmp_path):
+    specs, max_regression = load_thresholds()
+    assert max_regression == 10 and specs['prefecture-cache']['cache_hit_rate'] == {'min': 0.9}
+    export = tmp_path / 'export.json'
+    export.write_text(json.dumps({'metrics': {
+        'http_req_duration': {'p(95)': 620.0, 'p(99)': 900.0, 'thresholds': {'p(95)<500': True}},
+        'http_req_failed': {'passes': 2, 'fails': 98, 'value': 0.02},
+        'cache_hits': {'count': 80}, 'cache_misses': {'count': 20}}}))
+    metrics = read_summary(export)
+    results = {(r.metric, r.stat): r.ok for r in check_thresholds(metrics, specs['prefecture-cache'])}
+    assert results == {('http_req_duration', 'p95'): False, ('http_req_duration', 'p99'): False,
+                       ('http_req_failed', 'rate'): False, ('cache_hit_rate', 'min'): False}
+    # handleSummary() dumps nest the numbers under "values".
+    export.write_text(json.dumps({'metrics': {'ws_msg_latency': {'type': 'trend', 'values': {'p(95)': 80}}}}))
+    results = check_thresholds(read_summary(export), specs['websocket-load'])
+    assert [(r.metric, r.stat, r.ok) for r in results] == [
+        ('ws_connect_duration', 'p95', None), ('ws_connect_duration', 'p99', None),
+        ('ws_msg_latency', 'p95', True), ('ws_msg_latency', 'p99', None)]
+    command = k6_command('auth-load', tmp_path / 's.json', base_url='http://localhost:4100', duration='30s')
+    assert command[-1] == 'scenarios/auth-load.js' and 'BASE_URL=http://localhost:4100' in command
+    assert command[command.index('--summary-trend-stats') + 1] == 'avg,min,med,max,p(90),p(95),p(99)'
+
+
+def test_regressions_need_significance_and_size():
+    history = [_run(p95, f'2026-10-1{i}T10:00:00') for i, p95 in enumerate((100, 104, 98, 102, 101))]
+    rows = {(r['metric'], r['stat']): r for r in compare_to_baseline(_run(130, '2026-10-16T10:00:00'), history)}
+    p95 = rows[('http_req_duration', 'p95')]
+    assert (p95['runs'], round(p95['baseline'], 1), round(p95['change'], 1)) == (5, 101.0, 28.7)
+    assert p95['significant'] and p95['regressed']
+    assert not rows[('http_req_failed', 'rate')]['regressed']
+    # 6% slower is outside the noise but inside the 10% allowance.
+    slower = compare_to_baseline(_run(107, '2026-10-16T10:00:00'), history)
+    assert slower[0]['significant'] and not slower[0]['regressed']
+    # A noisy baseline does not flag a jump it could have produced itself.
+    noisy = [_run(p95, f'2026-10-1{i}T10:00:00') for i, p95 in enumerate((80, 140, 95, 130, 105))]
+    assert not compare_to_baseline(_run(130, '2026-10-16T10:00:00'), noisy)[0]['regressed']
+    # Two earlier runs are not a baseline yet.
+    early = compare_to_baseline(_run(200, '2026-10-16T10:00:00'), history[:2])
+    assert early[0]['change'] > 90 and not early[0]['regressed']
+    assert 'baseline still building' in format_run(_run(200, '2026-10-16T10:00:00'), early)
+
+    report = format_report(history + [_run(130, '2026-10-16T10:00:00')])
+    assert '== auth-load on local: 6 runs ==' in report
+    assert 'trend http_req_duration p95: +3.9%/run (worse)' in report
+
+
+def test_run_against_fake_k6(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'k6').write_text(FAKE_K6.format(python=sys.executable))
+    (bin_dir / 'k6').chmod(0o755)
+    results = tmp_path / 'results.json'
+    results.write_text(json.dumps({'auth-load': [[100, 0.001], [103, 0.001], [99, 0.002], [101, 0.001], [300, 0.001],
+                                                 [160, 0.001]],
+                                   'alerts-crud': [[250, 0.001]]}))
+    monkeypatch.setenv('PATH', f'{bin_dir}:{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_K6_RESULTS', str(results))
+    monkeypatch.setenv('FAKE_K6_LOG', str(tmp_path / 'k6.log'))
+
+    for _ in range(4):
+        assert main(['run', 'auth-load', '--duration', '10s']) == 0
+    assert main(['run', 'auth-load', 'alerts-crud', '--base-url', 'http://localhost:4100']) == 0
+    assert main(['run', 'auth-load', '--duration', '10s']) == 1
+    out = capsys.readouterr().out
+    assert 'http_req_duration p95: 160ms (<= 500ms) ok; baseline 101ms over 4 runs, 58.8% worse REGRESSED' in out
+    assert 'cache_hit_rate' not in out  # not tracked for auth-load
+
+    history = load_history()
+    assert [(r.scenario, r.target) for r in history][-3:] == [
+        ('auth-load', 'http://localhost:4100'), ('alerts-crud', 'http://localhost:4100'), ('auth-load', 'local')]
+    calls = (tmp_path / 'k6.log').read_text().splitlines()
+    assert '--duration 10s' in calls[0] and '--duration 3m' in calls[4]
+    with pytest.raises(SystemExit):
+        main(['run', 'nope'])
+    # The fake k6 has no results left and fails without a summary.
+    assert main(['run', 'auth-load']) == 2
+    assert main(['report', 'auth-load']) == 0
+    assert '== auth-load on local: 5 runs ==' in capsys.readouterr().out
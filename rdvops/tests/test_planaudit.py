@@ -0,0 +1,112 @@
+import pytest
+
+from rdvops.planaudit import (CATALOG, Audit, PlanAuditError, Psql, analyse, diff_audits, explain_script,
+                              format_audit, load_audit, load_schema, migrations, parse_output, run_audit, save_audit,
+                              main, seed, unused_indexes)
+
+
+def seq_scan_sort(rows=50, read=200_000, spill=False):
+    sort = {'Node Type': 'Sort', 'Sort Key': ['"createdAt" DESC'], 'Actual Rows': rows, 'Actual Loops': 1,
+            'Plans': [{'Node Type': 'Seq Scan', 'Relation Name': 'ScraperLog', 'Actual Rows': read // 2,
+                       'Actual Loops': 2}]}
+    if spill:
+        sort.update({'Sort Method': 'external merge', 'Sort Space Type': 'Disk', 'Sort Space Used': 9000})
+    else:
+        sort.update({'Sort Method': 'top-N heapsort', 'Sort Space Type': 'Memory', 'Sort Space Used': 40})
+    return [{'Plan': {'Node Type': 'Limit', 'Actual Rows': rows, 'Shared Hit Blocks': 2300,
+                      'Shared Read Blocks': 12, 'Plans': [sort]},
+             'Planning Time': 0.2, 'Execution Time': 96.5}]
+
+
+INDEX_SCAN = [{'Plan': {'Node Type': 'Limit', 'Actual Rows': 50, 'Shared Hit Blocks': 6, 'Plans': [
+    {'Node Type': 'Index Scan', 'Scan Direction': 'Backward', 'Index Name': 'ScraperLog_createdAt_id_idx',
+     'Relation Name': 'ScraperLog', 'Actual Rows': 50, 'Actual Loops': 1}]},
+    'Planning Time': 0.1, 'Execution Time': 0.04}]
+
+SMALL_TABLE = [{'Plan': {'Node Type': 'Aggregate', 'Strategy': 'Hashed', 'Actual Rows': 3, 'Plans': [
+    {'Node Type': 'Seq Scan', 'Relation Name': 'Prefecture', 'Actual Rows': 100, 'Actual Loops': 1}]},
+    'Execution Time': 0.05}]
+
+INVENTORY = [
+    {'table': 'ScraperLog', 'index': 'ScraperLog_pkey', 'bytes': 8192, 'constraint': True},
+    {'table': 'ScraperLog', 'index': 'ScraperLog_createdAt_id_idx', 'bytes': 8192, 'constraint': False},
+    {'table': 'ScraperLog', 'index': 'ScraperLog_status_createdAt_idx', 'bytes': 16384, 'constraint': False},
+    {'table': 'User', 'index': 'User_role_idx', 'bytes': 8192, 'constraint': False},
+]
+
+
+def test_analyse_flags_large_seq_scans_and_spills():
+    slow = analyse('scraper_logs_recent', seq_scan_sort(spill=True))
+    assert slow.shape == ['Limit', '  Sort', '    Seq Scan on ScraperLog']
+    assert (slow.execution_ms, slow.rows, slow.shared_hit, slow.shared_read) == (96.5, 50, 2300, 12)
+    assert [(f.kind, f.detail) for f in slow.findings] == [
+        ('sort_spill', 'external merge on "createdAt" DESC used 9000kB of disk'),
+        ('seq_scan', 'Seq Scan on ScraperLog read 200000 rows to keep 200000'),
+    ]
+    assert [f.kind for f in analyse('q', seq_scan_sort()).findings] == ['seq_scan']
+    # A seq scan of a hundred prefectures is the right plan.
+    small = analyse('prefectures_by_tier_status', SMALL_TABLE)
+    assert small.findings == [] and small.shape[0] == 'Hashed Aggregate'
+
+    fast = analyse('scraper_logs_recent', INDEX_SCAN)
+    assert fast.findings == [] and fast.indexes == ['ScraperLog_createdAt_id_idx']
+    assert fast.shape[1] == '  Index Scan Backward using ScraperLog_createdAt_id_idx on ScraperLog'
+    assert [ix['index'] for ix in unused_indexes([fast], INVENTORY)] == ['ScraperLog_status_createdAt_idx']
+
+
+def test_script_and_output_parsing():
+    script = explain_script(CATALOG[:2], runs=2, work_mem='4MB')
+    assert script.startswith("SET work_mem = '4MB';")
+    assert 'PREPARE audit_1 AS SELECT' in script and "EXECUTE audit_1('pref_1', 50);" in script
+    assert script.count('@@plan scraper_logs_recent') == 2
+    output = '@@plan a\n[{"Plan": {"Node Type": "Result"}, "Execution Time": 9}]\n' \
+             '@@plan a\n[{"Plan": {"Node Type": "Result"},\n "Execution Time": 1}]\n@@plan __indexes__\n[]\n'
+    assert parse_output(output) == {'a': [{'Plan': {'Node Type': 'Result'}, 'Execution Time': 1}], '__indexes__': []}
+    names = [p.name for p in migrations()]
+    assert names[0].endswith('_init') and names == sorted(names)
+    assert migrations(upto='20260225_add_consulate_support')[-1].name == '20260225_add_consulate_support'
+
+
+def test_snapshots_diff_between_schema_versions(tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path))
+    before = Audit('20260302_add_consulate_scraper_log', 1.0, [analyse('scraper_logs_recent', seq_scan_sort())],
+                   [INVENTORY[1]])
+    after = Audit('20261017_add_scraper_log_created_at_index', 2.0, [analyse('scraper_logs_recent', INDEX_SCAN)],
+                  [INVENTORY[2]])
+    save_audit(before)
+    save_audit(after)
+    old, new = load_audit('20260302'), load_audit('20261017')
+    assert old.results[0].findings[0].kind == 'seq_scan'
+    assert diff_audits(old, new) == [
+        'scraper_logs_recent: 96.50ms -> 0.04ms',
+        '    -  Sort',
+        '    -    Seq Scan on ScraperLog',
+        '    +  Index Scan Backward using ScraperLog_createdAt_id_idx on ScraperLog',
+        '    fixed: seq_scan: Seq Scan on ScraperLog',
+        'index now used: ScraperLog_createdAt_id_idx',
+        'index now unused: ScraperLog_status_createdAt_idx',
+    ]
+    assert diff_audits(new, new) == []
+    report = format_audit(new)
+    assert 'Limit > Index Scan Backward' in report and '[unused_index] -: ScraperLog_status_createdAt_idx' in report
+
+    # An unused index alone is advisory; plan findings, or --fail-on, fail the run.
+    for audit, argv, status in ((new, [], 0), (new, ['--fail-on', 'unused_index'], 1), (before, [], 1)):
+        monkeypatch.setattr('rdvops.planaudit.run_audit', lambda *a, audit=audit, **kw: audit)
+        assert main(['--no-save', *argv]) == status
+
+
+def test_audit_against_postgres(postgres_dsn, tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path))
+    psql = Psql(postgres_dsn)
+    assert load_schema(psql, migrations()) == migrations()[-1].name
+    seed(psql, logs=20_000, detections=5_000)
+    audit = run_audit(psql, runs=1)
+    plans = {r.name: r for r in audit.results}
+    assert 'ScraperLog_createdAt_id_idx' in plans['scraper_logs_recent'].indexes
+    assert any(f.kind == 'seq_scan' for f in plans['boss_stats_detections_24h'].findings)
+    assert plans['detections_prefecture_history'].rows > 0
+    # Reloading a database this tool created is fine; anything else is refused.
+    psql.run('DROP TABLE "_rdvops_planaudit";')
+    with pytest.raises(PlanAuditError, match='not loaded by planaudit'):
+        load_schema(psql, migrations())
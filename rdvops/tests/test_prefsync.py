@@ -0,0 +1,43 @@
+from rdvops.prefsync import apply_changes, diff_prefectures, format_diff
+from rdvops.query import QueryResult
+
+CONFIGS = [
+    {'id': 'paris_75', 'name': 'Paris', 'tier': 1, 'checkInterval': 30, 'selectors': {'a': 1, 'b': [2]}},
+    {'id': 'lyon_69', 'name': 'Lyon', 'tier': 2, 'checkInterval': 60, 'selectors': None},
+    {'id': 'moulins_03', 'name': 'Moulins', 'tier': 3, 'checkInterval': 120, 'selectors': None},
+]
+FIELDS = ('name', 'tier', 'checkInterval', 'selectors')
+
+
+def test_diff_is_field_level():
+    rows = [
+        {'id': 'paris_75', 'name': 'Paris', 'tier': 1, 'checkInterval': 30, 'selectors': {'b': [2], 'a': 1}},
+        {'id': 'lyon_69', 'name': 'Lyon', 'tier': 2, 'checkInterval': 90, 'selectors': None},
+        {'id': 'old_01', 'name': 'Old', 'tier': 3, 'checkInterval': 60, 'selectors': None},
+    ]
+    changes = diff_prefectures(CONFIGS, rows, FIELDS)
+    assert [(c.id, c.action) for c in changes] == [('lyon_69', 'update'), ('moulins_03', 'create')]
+    assert changes[0].fields == {'checkInterval': (90, 60)}
+    assert changes[0].data == {'checkInterval': 60}
+    text = format_diff(changes)
+    assert '    checkInterval: 90 -> 60' in text
+    assert text.endswith('1 to create, 1 to update')
+    assert diff_prefectures(CONFIGS, [dict(c) for c in CONFIGS], FIELDS) == []
+
+
+class RecordingAgent:
+    def __init__(self):
+        self.batches = []
+
+    def batch(self, requests):
+        self.batches.append(requests)
+        return [QueryResult(i, True, len(r['args']['changes'])) for i, r in enumerate(requests)]
+
+
+def test_changes_are_written_in_chunks():
+    changes = diff_prefectures(CONFIGS, [], FIELDS)
+    agent = RecordingAgent()
+    assert apply_changes(agent, changes, chunk_size=2) == 3
+    [requests] = agent.batches
+    assert [len(r['args']['changes']) for r in requests] == [2, 1]
+    assert requests[1]['args']['changes'][0]['data']['name'] == 'Moulins'
@@ -0,0 +1,66 @@
+import shutil
+
+import pytest
+
+pytest.importorskip('paramiko')
+if shutil.which('node') is None:
+    pytest.skip('node is not installed', allow_module_level=True)
+
+from rdvops.checks import run_query_checks
+from rdvops.query import QueryAgent, QueryError
+
+# Stands in for @prisma/client: counts clients and answers a few model calls.
+FAKE_PRISMA = '''
+let clients = 0;
+class PrismaClient {
+  constructor() {
+    clients += 1;
+    this.prefecture = {
+      count: async () => 101,
+      groupBy: async () => [{ tier: 1, _count: 8 }, { tier: 2, _count: 20 }],
+    };
+    this.scraperLog = { count: async () => 5n };
+  }
+  async $connect() {}
+  async $disconnect() {}
+}
+module.exports = { PrismaClient, clients: () => clients };
+'''
+
+
+@pytest.fixture
+def env(stub_session, tmp_path):
+    log = tmp_path / 'docker.log'
+    return stub_session(prisma=FAKE_PRISMA, env={'DOCKER_LOG': str(log)}), log, str(tmp_path / 'prisma.js')
+
+
+def test_one_helper_answers_a_batch(env):
+    session, log, module = env
+    with QueryAgent(session) as agent:
+        assert agent.query('prefectureCount').result == 101
+        results = agent.batch([
+            {'script': "log('Prefectures:', await prisma.prefecture.count())"},
+            {'query': 'prefecturesByTier'},
+            {'script': 'return prisma.scraperLog.count()'},
+            {'script': "throw new Error('boom')"},
+            {'script': 'return require(args.module).clients()', 'args': {'module': module}},
+        ])
+    assert results[0].text == 'Prefectures: 101'
+    assert results[1].result == [{'tier': 1, '_count': 8}, {'tier': 2, '_count': 20}]
+    assert results[2].result == '5'
+    assert (results[3].ok, results[3].error) == (False, 'boom')
+    assert results[4].result == 1
+    assert log.read_text().splitlines() == ['exec rdv_api']
+
+
+def test_query_checks_and_start_failure(env, monkeypatch):
+    session, log, _ = env
+    results = run_query_checks(session, [
+        ('count', "log('Prefectures:', await prisma.prefecture.count())"),
+        ('nothing', 'return null'),
+    ])
+    assert [(r.status, r.output) for r in results] == [('PASS', 'Prefectures: 101'), ('FAIL', '')]
+
+    monkeypatch.setattr('rdvops.query.agent_command', lambda container, **_: 'echo not json; exit 3')
+    with pytest.raises(QueryError):
+        QueryAgent(session).start()
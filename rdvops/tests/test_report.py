@@ -0,0 +1,38 @@
+from rdvops.report import diff_reports, format_report, list_snapshots, load_snapshot, save_snapshot
+
+REPORT = {
+    'generatedAt': '2026-10-17T08:00:00.000+00:00',
+    'windowHours': 24,
+    'prefectures': {'total': 101, 'byStatus': {'ACTIVE': 10, 'PAUSED': 91}, 'activeByTier': {'1': 8, '2': 2}},
+    'scraperLogs': {
+        'total': 2400000, 'estimated': True, 'urlChanged': 3,
+        'window': {'no_slots': 900, 'error': 12},
+        'recent': [{'prefectureId': 'paris_75', 'status': 'no_slots', 'createdAt': '2026-10-17T07:59:58.120'}],
+    },
+    'detections': {'total': 42, 'estimated': False},
+}
+
+
+def test_format_marks_estimates():
+    text = format_report(REPORT)
+    assert 'Total: 101 | Active: 10' in text
+    assert 'Total logs: ~2400000' in text
+    assert 'Total slot detections: 42' in text
+    assert '  paris_75 - no_slots - 2026-10-17T07:59:58' in text
+    assert 'URL changes detected (last 24h): 3' in text
+
+
+def test_snapshots_and_diff(tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path))
+    first = save_snapshot('prod', REPORT)
+    assert list_snapshots('prod') == [first]
+    later = load_snapshot(first)
+    later['scraperLogs']['window'] = {'no_slots': 950, 'captcha': 4}
+    later['detections']['total'] = 43
+    assert diff_reports(REPORT, later) == [
+        '  detections.total: 42 -> 43 (+1)',
+        '  scraperLogs.window.captcha: 0 -> 4 (+4)',
+        '  scraperLogs.window.error: 12 -> 0 (-12)',
+        '  scraperLogs.window.no_slots: 900 -> 950 (+50)',
+    ]
+    assert diff_reports(REPORT, REPORT) == []
@@ -0,0 +1,45 @@
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.resp import RedisConnection, RedisError, encode
+
+
+def test_encode_and_parse_replies():
+    assert encode('LLEN', 'bull:q:wait') == b'*2\r\n$4\r\nLLEN\r\n$11\r\nbull:q:wait\r\n'
+    ours, theirs = socket.socketpair()
+    redis = RedisConnection(ours)
+    replies = b'+OK\r\n:42\r\n$-1\r\n-WRONGTYPE bad\r\n*2\r\n$1\r\n0\r\n*1\r\n$3\r\nabc\r\n'
+
+    def server():
+        theirs.recv(65536)
+        for i in range(0, len(replies), 3):  # dribble the bytes to exercise buffering
+            theirs.sendall(replies[i:i + 3])
+
+    threading.Thread(target=server, daemon=True).start()
+    ok, number, missing, error, scan = redis.pipeline([('SET', 'a', 1), ('INCR', 'b'), ('GET', 'c'),
+                                                      ('LLEN', 'd'), ('SCAN', 0)])
+    assert (ok, number, missing, scan) == ('OK', 42, None, ['0', ['abc']])
+    assert isinstance(error, RedisError) and str(error) == 'WRONGTYPE bad'
+    redis.close()
+    theirs.close()
+
+
+def test_tunnel_through_session(session):
+    upstream = socket.create_server(('127.0.0.1', 0))
+
+    def echo():
+        conn, _ = upstream.accept()
+        with conn:
+            for chunk in iter(lambda: conn.recv(1024), b''):
+                conn.sendall(chunk.upper())
+
+    threading.Thread(target=echo, daemon=True).start()
+    channel = session.open_tunnel('127.0.0.1', upstream.getsockname()[1])
+    channel.sendall(b'ping')
+    assert channel.recv(1024) == b'PING'
+    channel.close()
+    upstream.close()
@@ -0,0 +1,115 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from rdvops.query import QueryError, QueryResult
+from rdvops.retention import (BATCH_SCRIPT, COMMIT_SCRIPT, RESTORE_SCRIPT, STATUS_SCRIPT, archive, pending,
+                              read_archive, restore, rollup_sql)
+
+NOW = datetime(2026, 10, 17, 12, 30)
+
+
+def _text(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class TableAgent:
+    """Answers the retention scripts from an in-memory ScraperLog, the way the SQL does."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.rollups = {}
+        self.calls = []
+        self.late_row = None
+
+    def _between(self, start, end):
+        return [r for r in self.rows if start <= r['createdAt'] < end]
+
+    def script(self, body, **args):
+        self.calls.append(body)
+        cutoff = _hour(NOW - timedelta(seconds=args.get('retentionSeconds', 0)))
+        if body is BATCH_SCRIPT:
+            old = sorted((r for r in self.rows if r['createdAt'] < cutoff), key=lambda r: (r['createdAt'], r['id']))
+            if not old:
+                return QueryResult(1, True, {'cutoff': _text(cutoff), 'start': None, 'end': None, 'rows': []})
+            start = _hour(old[0]['createdAt'])
+            edge = old[args['batchSize']]['createdAt'] if len(old) > args['batchSize'] else cutoff
+            end = max(_hour(edge), start + timedelta(hours=1))
+            rows = [json.dumps({**r, 'createdAt': r['createdAt'].isoformat()}) for r in old if r['createdAt'] < end]
+            return QueryResult(1, True, {'cutoff': _text(cutoff), 'start': _text(start), 'end': _text(end),
+                                         'rows': rows})
+        if body is COMMIT_SCRIPT:
+            if self.late_row:
+                self.rows.append(self.late_row)
+                self.late_row = None
+            start, end = (datetime.fromisoformat(args[k]) for k in ('start', 'end'))
+            batch = self._between(start, end)
+            if len(batch) != args['expected']:
+                return QueryResult(2, False, error='rolled back')
+            for r in batch:
+                key = (r['prefectureId'], r['categoryCode'] or '', _hour(r['createdAt']))
+                self.rollups[key] = self.rollups.get(key, 0) + 1
+            self.rows = [r for r in self.rows if r not in batch]
+            return QueryResult(2, True, {'rollups': len({(r['prefectureId'], r['categoryCode'], _hour(r['createdAt']))
+                                                          for r in batch}), 'deleted': len(batch)})
+        if body is STATUS_SCRIPT:
+            old = [r['createdAt'] for r in self.rows if r['createdAt'] < cutoff]
+            return QueryResult(3, True, {'cutoff': _text(cutoff), 'rows': len(old),
+                                         'oldest': _text(min(old)) if old else None})
+        if body is RESTORE_SCRIPT:
+            ids = {r['id'] for r in self.rows}
+            new = [r for r in args['rows'] if r['id'] not in ids]
+            self.rows += [{**r, 'createdAt': datetime.fromisoformat(r['createdAt'])} for r in new]
+            return QueryResult(4, True, len(new))
+        raise AssertionError('unexpected script')
+
+
+def _rows(hours=30, per_hour=4):
+    return [{'id': f'log_{h:03d}_{i}', 'prefectureId': f'pref_{i % 2}', 'categoryCode': '16040' if i % 2 else None,
+             'status': 'no_slots', 'responseTimeMs': 100 * i, 'slotsFound': 0,
+             'createdAt': NOW - timedelta(hours=h, minutes=10 * i)}
+            for h in range(hours) for i in range(per_hour)]
+
+
+def test_archive_moves_whole_hours_in_bounded_batches(tmp_path):
+    agent = TableAgent(_rows())
+    assert pending(agent, 'scraper', 24 * 3600 * 1000)['rows'] == 20
+    batches = archive(agent, 'scraper', tmp_path, retention_ms=24 * 3600 * 1000, batch_size=10, log=lambda _: None)
+    # 20 rows older than the cutoff (12:00 yesterday), in batches of whole hours cut before the tenth row.
+    assert [b.rows for b in batches] == [8, 8, 4]
+    assert all(b.start.endswith(':00:00') and b.end.endswith(':00:00') for b in batches)
+    assert batches[-1].end == '2026-10-16T12:00:00'
+    assert min(r['createdAt'] for r in agent.rows) >= datetime(2026, 10, 16, 12)
+    archived = [row for b in batches for row in read_archive(b.path)]
+    assert len(archived) == 20 and len({r['id'] for r in archived}) == 20
+    assert batches[0].path.name == 'ScraperLog-20261016T07-20261016T09.jsonl.gz'
+    assert sum(agent.rollups.values()) == 20
+    assert archive(agent, 'scraper', tmp_path, 24 * 3600 * 1000, log=lambda _: None) == []
+
+    assert restore(agent, 'scraper', batches[0].path) == 8
+    assert restore(agent, 'scraper', batches[0].path) == 0
+
+
+def test_rows_arriving_mid_batch_roll_back_and_drop_the_archive(tmp_path):
+    agent = TableAgent(_rows(hours=30, per_hour=1))
+    agent.late_row = {**agent.rows[-1], 'id': 'late'}
+    with pytest.raises(QueryError, match='rolled back'):
+        archive(agent, 'scraper', tmp_path, 24 * 3600 * 1000, batch_size=100, log=lambda _: None)
+    assert list(tmp_path.rglob('*.jsonl.gz')) == []
+    assert len(agent.rows) == 31
+
+
+def test_rollup_sql_per_table():
+    scraper = rollup_sql('scraper')
+    assert 'FROM "ScraperLog"' in scraper and 'coalesce("categoryCode", \'\')' in scraper
+    assert "'prefecture', \"prefectureId\"" in scraper
+    consulate = rollup_sql('consulate')
+    assert "'consulate', \"consulateId\", coalesce(\"categoryId\"::text, '')" in consulate
+    assert 'percentile_cont(0.95)' in consulate and 'ON CONFLICT' in consulate
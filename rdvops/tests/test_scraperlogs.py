@@ -0,0 +1,75 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from rdvops.query import QueryResult
+from rdvops.scraperlogs import TABLES, Columns, analyze, export, format_table, load, parse_duration
+
+TABLE = TABLES['scraper']
+
+
+class PagingAgent:
+    """Serves PAGE_SCRIPT requests from an in-memory table in (createdAt, id) order."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def script(self, body, **args):
+        self.calls += 1
+        rows = sorted(self.rows, key=lambda r: (r['createdAt'], r['id']))
+        if args['after']:
+            stamp, last_id = args['after']
+            ms = int(np.datetime64(stamp.rstrip('Z'), 'ms').astype(np.int64))
+            rows = [r for r in rows if (r['createdAt'], r['id']) > (ms, last_id)]
+        page = rows[:args['limit']]
+        columns = ['id', 'createdAt', *args['strings'], *args['ints'], *args['bools']]
+        return QueryResult(self.calls, True, {c: [r.get(c) for r in page] for c in columns})
+
+
+def _row(i, prefecture, status='no_slots', ms=100):
+    return {'id': f'{i:05d}', 'createdAt': 1_790_000_000_000 + i * 1000, 'prefectureId': prefecture,
+            'workerId': f'worker{i % 3 + 1}', 'status': status, 'categoryCode': None,
+            'responseTimeMs': ms, 'slotsFound': int(status == 'slots_found'), 'redirectCount': 0,
+            'urlChanged': i % 10 == 0}
+
+
+def test_export_appends_segments_and_resumes(tmp_path):
+    rows = [_row(i, 'paris_75' if i % 2 else 'lyon_69', ms=i) for i in range(25)]
+    agent = PagingAgent(rows)
+    assert export(agent, TABLE, tmp_path, page_size=10, segment_rows=20, log=lambda _: None) == 25
+    assert agent.calls == 3
+    agent.rows += [_row(i, 'nice_06', status='error') for i in range(25, 30)]
+    assert export(agent, TABLE, tmp_path, page_size=10, log=lambda _: None) == 5
+    assert export(agent, TABLE, tmp_path, page_size=10, log=lambda _: None) == 0
+    columns = load(tmp_path, TABLE)
+    assert len(columns) == 30
+    assert (np.diff(columns.time) > 0).all()
+    prefectures = columns.vocab['prefectureId'][columns.codes['prefectureId']]
+    assert list(prefectures[:2]) == ['lyon_69', 'paris_75'] and set(prefectures[25:]) == {'nice_06'}
+
+
+def test_group_stats_match_numpy_percentile():
+    rng = np.random.default_rng(7)
+    n = 200_000
+    vocab = np.array(['lyon_69', 'paris_75', 'nice_06'])
+    statuses = np.array(['error', 'no_slots', 'slots_found'])
+    columns = Columns(
+        time=np.sort(rng.integers(0, 3 * 86_400_000, n)),
+        codes={'prefectureId': rng.integers(0, 3, n).astype(np.int32),
+               'status': rng.integers(0, 3, n).astype(np.int32)},
+        vocab={'prefectureId': vocab, 'status': statuses},
+        values={'responseTimeMs': rng.integers(50, 5000, n).astype(np.int32),
+                'slotsFound': rng.integers(0, 2, n).astype(np.int32),
+                'urlChanged': rng.random(n) < 0.01},
+    )
+    rows = analyze(columns, 'prefectureId')
+    for row in rows:
+        mine = columns.codes['prefectureId'] == list(vocab).index(row['key'])
+        rt = columns.values['responseTimeMs'][mine]
+        assert row['runs'] == mine.sum()
+        assert row['p95'] == pytest.approx(np.percentile(rt, 95), abs=1e-3)
+        assert row['success'] == pytest.approx((columns.codes['status'][mine] > 0).mean(), abs=1e-4)
+    windowed = analyze(columns, 'prefectureId', window_ms=parse_duration('1d'))
+    assert len(windowed) == 9 and sum(r['runs'] for r in windowed) == n
+    assert 'URL%' in format_table(windowed)
@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip('paramiko')
+if shutil.which('node') is None:
+    pytest.skip('node is not installed', allow_module_level=True)
+
+from rdvops.query import QueryAgent
+from rdvops.screenshots import READ_RANGE, format_entries, load_index, main, pull
+
+FAKE_PRISMA = '''
+const logs = [
+  { id: 'log-1', status: 'blocked', errorMessage: 'Bot detected: cloudflare',
+    screenshotPath: 'public/screenshots/blocked_paris_75_1760000000000.png' },
+  { id: 'log-2', status: 'error', errorMessage: null,
+    screenshotPath: 'public/screenshots/captcha_lyon_69_1760000100000.png' },
+];
+class PrismaClient {
+  constructor() {
+    this.scraperLog = {
+      findMany: async ({ where }) => logs.filter((l) => where.screenshotPath.in.includes(l.screenshotPath)),
+    };
+  }
+  async $connect() {}
+  async $disconnect() {}
+}
+module.exports = { PrismaClient };
+'''
+
+NAMES = ('blocked_paris_75_1760000000000.png', 'captcha_lyon_69_1760000100000.png',
+         'detection_paris_75_1760000200000.png')
+
+
+@pytest.fixture
+def remote(stub_session, tmp_path):
+    shots = tmp_path / 'volume'
+    shots.mkdir()
+    for i, name in enumerate(NAMES):
+        (shots / name).write_bytes(os.urandom(READ_RANGE * 2 + 1000 if i == 0 else 5000 + i))
+        os.utime(shots / name, (1760000000 + i * 100, 1760000000 + i * 100))
+    (shots / 'notes.txt').write_text('not a screenshot')
+    # SFTP served from / so the path found over exec is the one read over SFTP.
+    return stub_session(prisma=FAKE_PRISMA, env={'DOCKER_INSPECT': str(shots)}, sftp_root='/'), shots
+
+
+def test_pull_resumes_indexes_and_skips_local_files(remote, tmp_path, monkeypatch, capsys):
+    session, shots = remote
+    dest = tmp_path / 'local'
+    blocked = (shots / NAMES[0]).read_bytes()
+    (dest / 'paris_75').mkdir(parents=True)
+    (dest / 'paris_75' / (NAMES[0] + '.part')).write_bytes(blocked[:READ_RANGE + 10])
+
+    with QueryAgent(session) as db:
+        result = pull(session, dest, parallel=3, agent=db)
+    assert (result.listed, result.selected, result.skipped, result.failed) == (3, 3, 0, {})
+    assert sorted(result.downloaded) == sorted(NAMES) and result.resumed == [NAMES[0]]
+    assert result.bytes == len(blocked) - READ_RANGE - 10 + 5001 + 5002
+    assert (dest / 'paris_75' / NAMES[0]).read_bytes() == blocked
+    assert (dest / 'lyon_69' / NAMES[1]).stat().st_mtime == 1760000100
+    assert not list(dest.rglob('*.part'))
+
+    index = load_index(dest)
+    assert index[NAMES[0]]['logId'] == 'log-1' and index[NAMES[0]]['error'] == 'Bot detected: cloudflare'
+    assert (index[NAMES[1]]['prefecture'], index[NAMES[1]]['kind'], index[NAMES[1]]['logId']) == (
+        'lyon_69', 'captcha', 'log-2')
+    assert index[NAMES[2]]['logId'] is None and index[NAMES[2]]['takenAt'] == 1760000200
+
+    # Nothing new: a second pull only lists, and keeps the log ids it found before.
+    again = pull(session, dest, kinds=('blocked', 'detection'))
+    assert (again.selected, again.downloaded, again.skipped) == (2, [], 2)
+    assert load_index(dest)[NAMES[0]]['logId'] == 'log-1'
+    assert 'blocked      log log-1' in format_entries(dest, list(load_index(dest).values()))
+
+    assert main(['--list', '--dest', str(dest), '--prefecture', 'paris_75', '--json']) == 0
+    assert [e['path'] for e in json.loads(capsys.readouterr().out)] == [
+        f'paris_75/{NAMES[0]}', f'paris_75/{NAMES[2]}']
+    monkeypatch.setattr('rdvops.screenshots.get_session', lambda host: session)
+    assert main(['--no-logs', '--dest', str(dest), '--remote-dir', str(tmp_path / 'missing')]) == 2
+    assert 'cannot list' in capsys.readouterr().err
@@ -0,0 +1,109 @@
+import dataclasses
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+paramiko = pytest.importorskip('paramiko')
+
+from rdvops import mux, session as session_mod
+from rdvops.config import ConfigError, get_host
+from rdvops.sshstub import StubSSHServer
+
+
+@pytest.fixture
+def stub():
+    with StubSSHServer() as server:
+        yield server
+
+
+@pytest.fixture
+def host(stub, tmp_path, monkeypatch):
+    config = tmp_path / 'config.json'
+    config.write_text(json.dumps({
+        'default_host': 'stub',
+        'defaults': {'command_timeout': 10, 'connect_timeout': 5},
+        'hosts': {'stub': {
+            'hostname': '127.0.0.1', 'port': stub.port,
+            'username': 'ops', 'password': 'secret', 'control_persist': 0,
+        }},
+    }))
+    monkeypatch.setenv('RDVOPS_CONFIG', str(config))
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    for var in ('RDVOPS_HOST', 'RDVOPS_PASSWORD', 'RDVOPS_USER', 'RDVOPS_PORT'):
+        monkeypatch.delenv(var, raising=False)
+    yield get_host()
+    session_mod.close_all()
+
+
+def test_host_settings_come_from_config_and_env(host, monkeypatch):
+    assert (host.name, host.hostname, host.command_timeout) == ('stub', '127.0.0.1', 10.0)
+    monkeypatch.setenv('RDVOPS_PASSWORD', 'other')
+    assert get_host('stub').password == 'other'
+    with pytest.raises(ConfigError):
+        get_host('missing')
+
+
+def test_pool_reuses_one_transport(stub, host):
+    first = session_mod.get_session()
+    results = [first.run(f'echo run-{i}') for i in range(5)]
+    assert session_mod.get_session() is first
+    assert [r.stdout.strip() for r in results] == [f'run-{i}' for i in range(5)]
+    assert stub.handshakes == 1
+
+
+def test_run_separates_streams_and_reports_status(host):
+    result = session_mod.get_session().run('echo out; echo err >&2; exit 3')
+    assert (result.stdout, result.stderr, result.exit_status) == ('out\n', 'err\n', 3)
+    assert not result.ok
+    assert session_mod.get_session().run('cat', input=b'piped').stdout == 'piped'
+
+
+def test_bad_credentials_raise_session_error(host, monkeypatch):
+    monkeypatch.setenv('RDVOPS_PASSWORD', 'wrong')
+    with pytest.raises(session_mod.SessionError):
+        session_mod.get_session(multiplex=False)
+
+
+def test_incomplete_session_class_cannot_be_created():
+    class NoTunnel(session_mod.BaseSession):
+        open_session = open_sftp = close = lambda self, *args: None
+        active = True
+
+    with pytest.raises(TypeError, match='open_tunnel'):
+        NoTunnel()
+
+
+def test_mux_master_shares_transport_across_clients(stub, host):
+    host = dataclasses.replace(host, control_persist=60)
+    master = mux.MuxMaster(host)
+    thread = threading.Thread(target=master.serve_forever, daemon=True)
+    thread.start()
+    try:
+        while not mux.master_ready(host.name):
+            time.sleep(0.01)
+        # Each attach stands in for a separate script run.
+        clients = [mux.attach(host, spawn=False) for _ in range(3)]
+        outputs = [c.run(f'echo client-{i}; echo warn >&2; exit {i}') for i, c in enumerate(clients)]
+        assert [(o.stdout, o.stderr, o.exit_status) for o in outputs] == [
+            (f'client-{i}\n', 'warn\n', i) for i in range(3)
+        ]
+        assert clients[0].run('wc -c', input=b'x' * 100000).stdout.strip() == '100000'
+        with socket.create_server(('127.0.0.1', 0)) as upstream:
+            tunnel = clients[1].open_tunnel('127.0.0.1', upstream.getsockname()[1])
+            tunnel.sendall(b'hello')
+            conn, _ = upstream.accept()
+            with conn:
+                assert conn.recv(5) == b'hello'
+                conn.sendall(b'world')
+                assert tunnel.recv(5) == b'world'
+            tunnel.close()
+        assert stub.handshakes == 1
+    finally:
+        master.shutdown()
+        thread.join(5)
+    assert not mux.master_ready(host.name)
+    with pytest.raises(session_mod.SessionError):
+        mux.attach(host, spawn=False)
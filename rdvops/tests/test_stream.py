@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.stream import STDERR, STDOUT
+
+
+def test_large_output_keeps_only_the_tail(session):
+    with session.stream('seq 1 200000; echo done >&2; exit 4', tail=3) as reader:
+        counts = {STDOUT: 0, STDERR: 0}
+        for line in reader:
+            counts[line.stream] += 1
+    assert counts == {STDOUT: 200000, STDERR: 1}
+    assert reader.exit_status == 4
+    assert len(reader.tail) == 3
+    assert [l.text for l in reader.tail if l.stream == STDOUT][-1] == '200000'
+    assert reader.bytes_read == {STDOUT: sum(len(f'{i}\n') for i in range(1, 200001)), STDERR: 5}
+
+
+def test_lines_are_decoded_and_split(session):
+    # A multi-byte character split across writes, CRLF endings, an overlong
+    # line and a final line without a newline.
+    command = r"printf '\303'; sleep 0.1; printf '\251t\303\251\r\n'; printf 'xxxxxxxxxx\nend'"
+    with session.stream(command) as reader:
+        reader.max_line = 4
+        lines = [line.text for line in reader]
+    assert lines == ['été', 'xxxx', 'xxxx', 'xx', 'end']
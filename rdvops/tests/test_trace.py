@@ -0,0 +1,63 @@
+import json
+import time
+
+import pytest
+
+from rdvops.trace import DeployTrace, format_history, load_history, span
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.delenv('RDVOPS_TEXTFILE_DIR', raising=False)
+    return tmp_path / 'cache'
+
+
+def test_span_times_blocks_and_marks_failures():
+    with span(None, 'untraced') as s:
+        time.sleep(0.01)
+    assert s.duration >= 0.01 and s.ok
+    trace = DeployTrace('backend', 'prod')
+    with pytest.raises(RuntimeError):
+        with trace.span('upload', files=3):
+            raise RuntimeError('boom')
+    with trace.span('restart', 'api') as restarting:
+        restarting.ok = False
+    assert [(s.name, s.service, s.ok, s.attrs) for s in trace.spans] == [
+        ('upload', None, False, {'files': 3}), ('restart', 'api', False, {})]
+
+
+def test_finish_writes_history_and_textfile(cache, tmp_path, monkeypatch):
+    for i, kind in enumerate(['backend', 'frontend', 'backend']):
+        trace = DeployTrace(kind, 'prod')
+        with trace.span('connect'):
+            pass
+        for service in ('api', 'worker1'):
+            with trace.span('build', service):
+                time.sleep(0.01)
+        trace.finish(ok=i != 2)
+    deploys = load_history('prod', kind='backend')
+    assert [d['ok'] for d in deploys] == [True, False]
+    assert deploys[0]['phases']['build'] >= 0.02
+    assert [s['service'] for s in deploys[0]['spans']] == [None, 'api', 'worker1']
+    assert len(load_history('prod', last=2)) == 2
+
+    table = format_history(load_history('prod'), detail=True)
+    assert 'FAILED' in table and 'build worker1' in table and table.splitlines()[-1].startswith('mean')
+
+    prom = (cache / 'deploys' / 'rdvops_deploy_prod_backend.prom').read_text()
+    assert '# TYPE rdvops_deploy_phase_duration_seconds gauge' in prom
+    assert 'rdvops_deploy_success{host="prod",kind="backend"} 0' in prom
+    assert 'rdvops_deploy_phase_duration_seconds{host="prod",kind="backend",phase="build",service="api"}' in prom
+    assert 'phase="connect"}' in prom
+    # The frontend deploy has its own file, so neither kind's series replaces the other's.
+    assert 'kind="frontend"' in (cache / 'deploys' / 'rdvops_deploy_prod_frontend.prom').read_text()
+
+    monkeypatch.setenv('RDVOPS_TEXTFILE_DIR', str(tmp_path / 'textfiles'))
+    DeployTrace('frontend', 'prod').finish(ok=True)
+    assert (tmp_path / 'textfiles' / 'rdvops_deploy_prod_frontend.prom').exists()
+    # A truncated line from an interrupted deploy is skipped.
+    with open(cache / 'deploys' / 'prod.jsonl', 'a') as f:
+        f.write('{"type": "span", "id"')
+    assert len(load_history('prod', last=0)) == 4
+    assert json.loads((cache / 'deploys' / 'prod.jsonl').read_text().splitlines()[0])['type'] == 'span'
@@ -0,0 +1,74 @@
+import gzip
+import shutil
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from rdvops.query import QueryAgent
+from rdvops.stream import STDERR, STDOUT, Inflater
+from rdvops.transport import Transfer, TransferLog, choose_level, gzip_command
+
+FAKE_PRISMA = '''
+class PrismaClient {
+  async $connect() {}
+  async $disconnect() {}
+}
+module.exports = { PrismaClient };
+'''
+
+
+@pytest.fixture
+def session(stub_session, tmp_path, monkeypatch):
+    monkeypatch.setenv('RDVOPS_CACHE_DIR', str(tmp_path / 'cache'))
+    return stub_session(prisma=FAKE_PRISMA)
+
+
+def test_levels_follow_payload_size(tmp_path):
+    assert [choose_level(n) for n in (None, 200, 100_000, 10 * 2 ** 20, 2 ** 30)] == [6, 0, 6, 4, 1]
+    assert '| gzip -c -4 >&3' in gzip_command('true', 4)
+    transfer = Transfer(wire=1024, decoded=10 * 1024 * 1024, encoding='gzip-4', elapsed=1.25)
+    assert transfer.describe() == '10.0MB decoded from 1.0KB on the wire (10240.0x, gzip-4) in 1.2s'
+
+    log = TransferLog(tmp_path / 'transfers.json')
+    assert log.expected('logs-stub') is None
+    log.record('logs-stub', transfer)
+    assert TransferLog(tmp_path / 'transfers.json').expected('logs-stub') == 10 * 1024 * 1024
+
+
+def test_inflater_handles_split_and_concatenated_members():
+    data = gzip.compress(b'first\n') + gzip.compress(b'second\n')
+    inflater = Inflater()
+    assert b''.join(inflater.decode(data[i:i + 5]) for i in range(0, len(data), 5)) == b'first\nsecond\n'
+    with pytest.raises(OSError, match='corrupt'):
+        Inflater().decode(b'not gzip at all')
+
+
+def test_compressed_run_keeps_stderr_and_exit_status(session):
+    plain = session.run('seq 1 200000; echo oops >&2; exit 3')
+    packed = session.run('seq 1 200000; echo oops >&2; exit 3', compress=True, size_hint=2 ** 20)
+    assert (packed.stdout, packed.stderr, packed.exit_status) == (plain.stdout, 'oops\n', 3)
+    assert packed.command == plain.command and plain.transfer.encoding == 'identity'
+    assert packed.transfer.encoding == 'gzip-6'
+    assert packed.transfer.decoded == len(plain.stdout) and packed.transfer.wire < packed.transfer.decoded // 3
+    # Small outputs are not worth compressing at all.
+    small = session.run('echo hi', compress=True, size_hint=10)
+    assert (small.stdout, small.transfer.encoding) == ('hi\n', 'identity')
+
+    with session.stream('seq 1 50000', compress=True) as reader:
+        lines = [line.text for line in reader if line.stream == STDOUT]
+    assert lines[-1] == '50000' and len(lines) == 50000
+    assert reader.exit_status == 0 and reader.transfer.wire < reader.bytes_decoded[STDOUT]
+    assert reader.bytes_decoded[STDERR] == 0
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_query_helper_answers_gzipped(session):
+    rows = "return Array.from({ length: 20000 }, (_, i) => ({ id: i, status: 'no_slots' }))"
+    with QueryAgent(session, compress=True) as agent:
+        assert agent.script('return 1 + 1').result == 2
+        big = agent.script(rows)
+        assert len(big.result) == 20000 and big.result[-1] == {'id': 19999, 'status': 'no_slots'}
+        assert agent.script("log('after')").text == 'after'
+    transfer = agent.transfer
+    assert transfer.encoding == 'gzip-adaptive' and transfer.wire * 5 < transfer.decoded
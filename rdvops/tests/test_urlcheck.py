@@ -0,0 +1,66 @@
+import asyncio
+
+from rdvops.httpstub import Route, StubHTTPServer
+from rdvops.urlcheck import HostPool, Target, check_urls, diff_history, format_report, normalize_url
+
+
+def test_redirects_failures_and_history_diff():
+    with StubHTTPServer({'/ok': Route(), '/new': Route(chunked=True), '/gone': Route(404),
+                         '/slow': Route(delay=1.0)}) as stub:
+        stub.redirect('/old', '/mid', 301)
+        stub.redirect('/mid', stub.url('/new', host='localhost'))
+        stub.redirect('/loop', '/loop')
+        stub.redirect('/moved', '/new/')
+        targets = [
+            Target('prefecture', 'paris', 'Paris', stub.url('/old'), history_url=stub.url('/new', host='localhost'),
+                   history_status='PENDING', history_at='2026-10-01'),
+            Target('prefecture', 'lyon', 'Lyon', stub.url('/moved')),
+            Target('consulate', 'dz', 'Alger', stub.url('/ok/')),
+            Target('vfs', 'del', 'New Delhi', stub.url('/gone')),
+            Target('category', 'c1', 'Paris / Salarié', stub.url('/slow')),
+            Target('category', 'c2', 'Lyon / Étudiant', stub.url('/loop')),
+            Target('vfs', 'bom', 'Mumbai', 'ftp://example.invalid/'),
+        ]
+        checks = check_urls(targets, rate=0, timeout=0.3)
+
+    paris, lyon, alger, delhi, slow, loop, ftp = checks
+    assert (paris.state, paris.redirects, paris.final_url) == ('redirected', 2, stub.url('/new', host='localhost'))
+    assert [hop.status for hop in paris.hops] == [301, 302, 200] and paris.ms > 0
+    assert (lyon.state, lyon.final_url) == ('redirected', stub.url('/new/'))
+    assert alger.state == 'ok' and alger.ok
+    assert (delhi.state, delhi.http_status, delhi.error) == ('broken', 404, 'HTTP 404')
+    assert slow.state == 'timeout' and 'in 0.3s' in slow.error
+    assert (loop.state, loop.error) == ('error', 'redirect loop')
+    assert ftp.state == 'error' and 'unsupported URL' in ftp.error
+
+    changes = diff_history(checks)
+    assert [(c.target.id, c.state) for c in changes] == [('paris', 'recorded'), ('lyon', 'new')]
+    report = format_report(checks, changes, 1.0)
+    assert 'in UrlHistory since 2026-10-01, PENDING' in report
+    assert '7 URLs in 1.0s: 3 reachable, 4 unreachable, 2 changed (1 not in UrlHistory)' in report
+    assert normalize_url('HTTPS://Example.gouv.fr:443/rdv/#top') == normalize_url('https://example.gouv.fr/rdv')
+
+
+def test_rate_and_connections_are_per_host():
+    with StubHTTPServer({'/ok': Route()}) as stub:
+        targets = [Target('prefecture', str(i), str(i), stub.url(f'/ok?n={i}', host=host))
+                   for i in range(6) for host in ('127.0.0.1', 'localhost')]
+        checks = check_urls(targets, rate=20, per_host=2, concurrency=8)
+        assert all(c.state == 'ok' for c in checks)
+        for host in ('127.0.0.1', 'localhost'):
+            starts = sorted(r.at for r in stub.requests if r.host.startswith(host))
+            assert len(starts) == 6
+            # 20 requests a second at most on each host.
+            assert starts[-1] - starts[0] >= 0.2
+            assert stub.connections(host) <= 2
+
+        # Idle keep-alive connections count against the global cap: with room
+        # for one socket, switching hosts closes the other host's connection.
+        async def alternate():
+            pool = HostPool(rate=0, concurrency=1)
+            for host in ('127.0.0.1', 'localhost', '127.0.0.1', '127.0.0.1'):
+                await pool.get(stub.url('/ok', host=host))
+                assert pool.open_now == 1
+            pool.close()
+            return pool.opened, pool.open_now
+        assert asyncio.run(alternate()) == (3, 0)
@@ -0,0 +1,110 @@
+import io
+import shutil
+
+import pytest
+
+pytest.importorskip('paramiko')
+if shutil.which('node') is None:
+    pytest.skip('node is not installed', allow_module_level=True)
+
+from rdvops.query import QueryAgent
+from rdvops.users import ProvisionError, format_report, provision, read_users
+
+# Stands in for @prisma/client: an in-memory User table whose writes, like
+# Prisma's, only run when awaited, and whose $transaction rolls back.
+FAKE_PRISMA = '''
+let users = new Map([['old@example.com', { email: 'old@example.com', passwordHash: 'kept', role: 'USER' }]]);
+let transactions = 0;
+const lazy = (run) => ({ then: (resolve, reject) => run().then(resolve, reject) });
+class PrismaClient {
+  constructor() {
+    this.user = {
+      findMany: async ({ where } = {}) =>
+        [...users.values()].filter((u) => !where || where.email.in.includes(u.email)),
+      create: ({ data }) => lazy(async () => {
+        if (data.telegramChatId === 'taken') throw new Error('Invalid `create()` invocation:\\n\\nUnique constraint');
+        users.set(data.email, { ...data });
+      }),
+      update: ({ where, data }) => lazy(async () => users.set(where.email, { ...users.get(where.email), ...data })),
+    };
+  }
+  async $transaction(writes) {
+    transactions += 1;
+    const saved = new Map(users);
+    try {
+      for (const write of writes) await write;
+    } catch (e) {
+      users = saved;
+      throw e;
+    }
+  }
+  transactions() { return transactions; }
+  async $connect() {}
+  async $disconnect() {}
+}
+module.exports = { PrismaClient };
+'''
+
+# Stands in for bcryptjs; the hash records the thread that made it.
+FAKE_BCRYPT = '''
+const { threadId } = require('worker_threads');
+module.exports = { hashSync: (password, rounds) => `$${rounds}$${threadId}$${password.length}` };
+'''
+
+CSV = '''email,password,role,plan,planExpiresAt,telegramChatId,emailVerified
+new1@example.com,Staff-Password-1,ADMIN,,,,yes
+new2@example.com,Staff-Password-2,,URGENCE_7J,2026-12-01,,
+old@example.com,Staff-Password-3,,,,,true
+clash@example.com,Staff-Password-4,,,,taken,
+nopass@example.com,,,,,,
+weak@example.com,short,,,,,
+NEW1@example.com,Staff-Password-5,,,,,
+new3@example.com,Staff-Password-6,,,,,
+'''
+
+
+@pytest.fixture
+def agent(stub_session, tmp_path):
+    (tmp_path / 'bcrypt.js').write_text(FAKE_BCRYPT)
+    session = stub_session(prisma=FAKE_PRISMA, env={'RDVOPS_BCRYPT_MODULE': str(tmp_path / 'bcrypt.js')})
+    with QueryAgent(session) as db:
+        yield db
+
+
+def test_csv_validation():
+    rows, invalid = read_users(io.StringIO(CSV))
+    assert [(r.line, r.email) for r in rows] == [
+        (2, 'new1@example.com'), (3, 'new2@example.com'), (4, 'old@example.com'), (5, 'clash@example.com'),
+        (6, 'nopass@example.com'), (9, 'new3@example.com')]
+    assert rows[0].data == {'role': 'ADMIN', 'emailVerified': True}
+    assert rows[1].data == {'plan': 'URGENCE_7J', 'planExpiresAt': '2026-12-01T00:00:00Z'}
+    assert [(r.line, r.error) for r in invalid] == [
+        (7, 'password needs at least 12 characters, an uppercase letter, a number, a special character'),
+        (8, 'duplicate of line 2')]
+    with pytest.raises(ProvisionError, match='unknown columns: name'):
+        read_users(io.StringIO('email,password,name\n'))
+
+
+def test_chunks_share_one_hash_pool(agent):
+    rows, invalid = read_users(io.StringIO(CSV))
+    dry = provision(agent, rows, dry_run=True)
+    assert [r.status for r in dry] == ['created', 'created', 'exists', 'created', 'failed', 'created']
+    assert agent.script('return (await prisma.user.findMany()).length').result == 1
+
+    results = provision(agent, rows, update=True, chunk_size=2, workers=2)
+    assert [(r.email, r.status) for r in results] == [
+        ('new1@example.com', 'created'), ('new2@example.com', 'created'), ('old@example.com', 'updated'),
+        ('clash@example.com', 'failed'), ('nopass@example.com', 'failed'), ('new3@example.com', 'created')]
+    assert results[3].error == 'Unique constraint' and results[4].error == 'a new account needs a password'
+    users = {u['email']: u for u in agent.script('return prisma.user.findMany()').result}
+    # The failed row's chunk was retried row by row, so old@ still got its update.
+    assert sorted(users) == ['new1@example.com', 'new2@example.com', 'new3@example.com', 'old@example.com']
+    assert users['new1@example.com']['role'] == 'ADMIN' and users['old@example.com']['emailVerified'] is True
+    hashes = [users[e]['passwordHash'].split('$') for e in ('new1@example.com', 'new2@example.com',
+                                                            'old@example.com', 'new3@example.com')]
+    assert {h[1] for h in hashes} == {'12'} and len({h[2] for h in hashes}) == 2
+    assert agent.script('return prisma.transactions()').result == 3
+
+    report = format_report(results + invalid)
+    assert '    5  clash@example.com   failed: Unique constraint' in report
+    assert report.endswith('created 3, failed 2, invalid 2, updated 1')
@@ -0,0 +1,207 @@
+"""Phase timings for deploys, kept as JSON lines and a Prometheus textfile.
+
+A :class:`DeployTrace` collects one :class:`Span` per phase (connect, local
+hashing, manifest fetch, upload, compose config) and per service (build,
+tag, restart).  :meth:`DeployTrace.finish` appends the spans and a summary
+line to ``cache_dir()/deploys/<host>.jsonl`` and rewrites
+``rdvops_deploy_<host>_<kind>.prom`` in the text format ``/api/metrics``
+serves, so a node_exporter textfile collector (``$RDVOPS_TEXTFILE_DIR``) can
+scrape the last backend and frontend deploy side by side.  ``python -m rdvops.trace`` shows phase durations for the last
+N deploys.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from .config import ConfigError, cache_dir, get_host
+
+# Column order for the history table; anything else is appended after these.
+PHASES = ('connect', 'hash', 'manifest', 'upload', 'compose_config', 'build', 'tag', 'restart')
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration: float = 0.0
+    ok: bool = True
+    service: str | None = None
+    attrs: dict = field(default_factory=dict)
+
+
+@contextmanager
+def span(trace: 'DeployTrace | None', name: str, service: str | None = None, **attrs) -> Iterator[Span]:
+    """Time the block as a span of ``trace``; with no trace it is only timed.
+
+    The span is yielded so the block can set ``ok`` or add ``attrs``; an
+    exception marks it failed.
+    """
+    current = Span(name, time.time(), service=service, attrs=attrs)
+    started = time.monotonic()
+    try:
+        yield current
+    except BaseException:
+        current.ok = False
+        raise
+    finally:
+        current.duration = time.monotonic() - started
+        if trace is not None:
+            trace.spans.append(current)
+
+
+def deploys_dir() -> Path:
+    path = cache_dir() / 'deploys'
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def textfile_dir() -> Path:
+    env = os.environ.get('RDVOPS_TEXTFILE_DIR')
+    return Path(env).expanduser() if env else deploys_dir()
+
+
+class DeployTrace:
+    """Spans of one deploy of ``kind`` (e.g. ``backend``, ``frontend``) to ``host``."""
+
+    def __init__(self, kind: str, host: str):
+        self.kind = kind
+        self.host = host
+        self.started = time.time()
+        self.id = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(self.started)) + f'-{os.getpid()}'
+        self.spans: list[Span] = []
+        self._monotonic = time.monotonic()
+
+    def span(self, name: str, service: str | None = None, **attrs):
+        return span(self, name, service, **attrs)
+
+    def summary(self, ok: bool) -> dict:
+        phases: dict[str, float] = {}
+        for s in self.spans:
+            phases[s.name] = round(phases.get(s.name, 0.0) + s.duration, 3)
+        return {'type': 'deploy', 'id': self.id, 'kind': self.kind, 'host': self.host, 'start': self.started,
+                'duration': round(time.monotonic() - self._monotonic, 3), 'ok': ok, 'phases': phases}
+
+    def finish(self, ok: bool) -> dict:
+        """Append the spans and summary to the history and rewrite the textfile."""
+        summary = self.summary(ok)
+        lines = [json.dumps({'type': 'span', 'id': self.id, 'kind': self.kind, **asdict(s),
+                             'duration': round(s.duration, 3)}) for s in self.spans]
+        lines.append(json.dumps(summary))
+        with open(history_path(self.host), 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        path = textfile_dir() / f'rdvops_deploy_{self.host}_{self.kind}.prom'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(prometheus_text(summary, self.spans), encoding='utf-8')
+        os.replace(tmp, path)
+        return summary
+
+
+def history_path(host: str) -> Path:
+    return deploys_dir() / f'{host}.jsonl'
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items() if v is not None) + '}'
+
+
+def prometheus_text(summary: dict, spans: list[Span]) -> str:
+    """The last deploy as Prometheus text-format gauges."""
+    base = {'host': summary['host'], 'kind': summary['kind']}
+    lines = ['# HELP rdvops_deploy_duration_seconds Duration of the last deploy',
+             '# TYPE rdvops_deploy_duration_seconds gauge',
+             f'rdvops_deploy_duration_seconds{_labels(**base)} {summary["duration"]}',
+             '',
+             '# HELP rdvops_deploy_success Whether the last deploy succeeded',
+             '# TYPE rdvops_deploy_success gauge',
+             f'rdvops_deploy_success{_labels(**base)} {int(summary["ok"])}',
+             '',
+             '# HELP rdvops_deploy_timestamp_seconds Start time of the last deploy',
+             '# TYPE rdvops_deploy_timestamp_seconds gauge',
+             f'rdvops_deploy_timestamp_seconds{_labels(**base)} {summary["start"]:.0f}',
+             '',
+             '# HELP rdvops_deploy_phase_duration_seconds Duration of each phase of the last deploy',
+             '# TYPE rdvops_deploy_phase_duration_seconds gauge']
+    for s in spans:
+        lines.append(f'rdvops_deploy_phase_duration_seconds'
+                     f'{_labels(**base, phase=s.name, service=s.service)} {s.duration:.3f}')
+    lines += ['',
+              '# HELP rdvops_deploy_phase_success Whether each phase of the last deploy succeeded',
+              '# TYPE rdvops_deploy_phase_success gauge']
+    for s in spans:
+        lines.append(f'rdvops_deploy_phase_success{_labels(**base, phase=s.name, service=s.service)} {int(s.ok)}')
+    return '\n'.join(lines) + '\n'
+
+
+def load_history(host: str, kind: str | None = None, last: int = 10) -> list[dict]:
+    """The last ``last`` deploys (oldest first), each with its ``spans``."""
+    try:
+        text = history_path(host).read_text(encoding='utf-8')
+    except OSError:
+        return []
+    spans: dict[str, list[dict]] = {}
+    deploys = []
+    for line in text.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # a deploy killed mid-write
+        if kind is not None and entry.get('kind') != kind:
+            continue
+        if entry.get('type') == 'span':
+            spans.setdefault(entry['id'], []).append(entry)
+        elif entry.get('type') == 'deploy':
+            deploys.append({**entry, 'spans': spans.pop(entry['id'], [])})
+    return deploys[-last:] if last else deploys
+
+
+def format_history(deploys: list[dict], detail: bool = False) -> str:
+    if not deploys:
+        return '(no deploys recorded)'
+    seen = {name for d in deploys for name in d['phases']}
+    phases = [p for p in PHASES if p in seen] + sorted(seen - set(PHASES))
+    head = f"{'Started (UTC)':<17}  {'Kind':<9}  {'Result':<6}" + ''.join(f'  {p[:9]:>9}' for p in phases) + f"  {'Total':>8}"
+    lines = [head, '-' * len(head)]
+    for d in deploys:
+        started = time.strftime('%Y-%m-%d %H:%M', time.gmtime(d['start']))
+        cells = ''.join(f"  {d['phases'][p]:>8.1f}s" if p in d['phases'] else f"  {'-':>9}" for p in phases)
+        lines.append(f"{started:<17}  {d['kind']:<9}  {'ok' if d['ok'] else 'FAILED':<6}{cells}  {d['duration']:>7.1f}s")
+        if detail:
+            for s in d['spans']:
+                name = s['name'] + (f" {s['service']}" if s.get('service') else '')
+                lines.append(f"    {name:<28} {s['duration']:>8.2f}s{'' if s['ok'] else '  FAILED'}")
+    if len(deploys) > 1:
+        lines.append('-' * len(head))
+        means = ''.join(f"  {sum(d['phases'].get(p, 0) for d in deploys) / len(deploys):>8.1f}s" for p in phases)
+        total = sum(d['duration'] for d in deploys) / len(deploys)
+        lines.append(f"{'mean':<17}  {'':<9}  {'':<6}{means}  {total:>7.1f}s")
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Show phase durations of recent deploys.')
+    parser.add_argument('-n', '--last', type=int, default=10, help='number of deploys to show (default 10)')
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('--kind', help='only deploys of this kind (backend, frontend)')
+    parser.add_argument('--detail', action='store_true', help='list every span under each deploy')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args(argv)
+    try:
+        host = get_host(args.host).name
+    except ConfigError as e:
+        parser.error(str(e))
+    deploys = load_history(host, args.kind, args.last)
+    print(json.dumps(deploys, indent=2) if args.json else format_history(deploys, args.detail))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Compressed transfer of large remote outputs.
+
+A command whose output may be large is wrapped so its stdout goes through
+``gzip`` on the server (stderr and the exit status are passed through
+untouched), and :class:`rdvops.stream.ChannelReader` inflates it chunk by
+chunk as it arrives.  The gzip level follows the expected payload size:
+small outputs are not worth a compressor at all, mid-sized ones get a good
+ratio cheaply, and for very large ones a fast level keeps the server's CPU
+from becoming the bottleneck.  The query helper applies the same table to
+every answer it sends.  Each transfer reports bytes on the wire against
+bytes decoded, and :class:`TransferLog` remembers the last size per kind of
+transfer so the next one can pick its level before any output exists.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from .config import cache_dir
+
+# (largest payload in bytes, gzip level); level 0 means "send as is".
+LEVELS: tuple[tuple[int | None, int], ...] = (
+    (16 * 1024, 0),
+    (4 * 1024 * 1024, 6),
+    (64 * 1024 * 1024, 4),
+    (None, 1),
+)
+# Level used when nothing is known about the payload yet.
+DEFAULT_LEVEL = 6
+
+
+def choose_level(size: int | None) -> int:
+    """The gzip level for a payload of ``size`` bytes (``None``: unknown)."""
+    if size is None:
+        return DEFAULT_LEVEL
+    for limit, level in LEVELS:
+        if limit is None or size <= limit:
+            return level
+    return DEFAULT_LEVEL
+
+
+def gzip_command(command: str, level: int) -> str:
+    """``command`` with its stdout gzipped at ``level``, keeping its exit status.
+
+    The command runs in a subshell so an ``exit`` in it cannot skip the
+    status report, and without the two helper descriptors so background
+    jobs do not hold them open.
+    """
+    return (f'exec 3>&1; status=$({{ {{ ( {command}\n) 3>&- 4>&-; echo $? >&4; }} '
+            f'| gzip -c -{int(level)} >&3; }} 4>&1); exit "${{status:-1}}"')
+
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.2f}GB'
+
+
+@dataclass
+class Transfer:
+    wire: int
+    decoded: int
+    encoding: str
+    elapsed: float
+
+    @property
+    def ratio(self) -> float:
+        return self.decoded / self.wire if self.wire else 1.0
+
+    def describe(self) -> str:
+        return (f'{format_bytes(self.decoded)} decoded from {format_bytes(self.wire)} on the wire '
+                f'({self.ratio:.1f}x, {self.encoding}) in {self.elapsed:.1f}s')
+
+
+class TransferLog:
+    """The last transfer of each kind (``logs``, ``scraperlogs-export``, ...), kept in the rdvops cache."""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or cache_dir() / 'transfers.json'
+        try:
+            self.entries: dict[str, dict] = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def expected(self, key: str) -> int | None:
+        """Decoded size of the last ``key`` transfer, the best guess for the next."""
+        entry = self.entries.get(key)
+        return entry['decoded'] if entry else None
+
+    def record(self, key: str, transfer: Transfer) -> None:
+        self.entries[key] = {**asdict(transfer), 'at': time.time()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.entries, indent=1), encoding='utf-8')
+        os.replace(tmp, self.path)
@@ -0,0 +1,444 @@
+"""Check every stored booking URL for reachability, concurrently but politely.
+
+Prefecture, category, consulate and VFS URLs are loaded from the database
+through the query helper and fetched from here with a small asyncio HTTP/1.1
+client.  Connections are kept alive and pooled per host, each host gets at
+most ``per_host`` connections and ``rate`` request starts per second (many
+prefectures share ``rdv-prefecture.interieur.gouv.fr``, and the WAFs in front
+of them ban bursts), and a global cap bounds the sockets open at once, idle keep-alive
+connections included.
+Redirects are followed by hand so every hop's status and latency is kept.
+Final URLs that differ from the stored one are compared with the latest
+``UrlHistory`` row of the prefecture, which tells a change the discovery
+service already recorded from one it has not seen.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import ssl
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from .query import QueryAgent, QueryError
+from .session import SessionError, get_session
+
+KINDS = ('prefecture', 'category', 'consulate', 'vfs')
+DEFAULT_RATE = 1.0  # request starts per second per host
+DEFAULT_PER_HOST = 2
+DEFAULT_CONCURRENCY = 32
+DEFAULT_TIMEOUT = 15.0
+MAX_REDIRECTS = 10
+# Bodies are drained so the connection can be reused, not kept; past this
+# size the connection is dropped instead.
+DRAIN_LIMIT = 1024 * 1024
+REDIRECTS = {301, 302, 303, 307, 308}
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'fr-FR,fr;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'identity',
+    'Connection': 'keep-alive',
+}
+
+# UrlHistory is read through to_jsonb: databases migrated from
+# 20260301_add_url_discovery_fields have discoveredAt and no validationStatus,
+# while schema.prisma has createdAt and validationStatus.
+TARGETS_SCRIPT = """
+return prisma.$queryRawUnsafe(`
+  SELECT 'prefecture' AS kind, p.id, p.name, p.status::text AS status, p."bookingUrl" AS url,
+         h.row->>'newUrl' AS "historyUrl", h.row->>'validationStatus' AS "historyStatus",
+         left(h.at, 10) AS "historyAt"
+  FROM "Prefecture" p
+  LEFT JOIN LATERAL (SELECT to_jsonb(u) AS row, coalesce(to_jsonb(u)->>'createdAt', to_jsonb(u)->>'discoveredAt') AS at
+                     FROM "UrlHistory" u WHERE u."prefectureId" = p.id ORDER BY 2 DESC LIMIT 1) h ON true
+  UNION ALL
+  SELECT 'category', c.id, p.name || ' / ' || c.name, c.status::text, c."categoryUrl", NULL, NULL, NULL
+  FROM "PrefectureCategory" c JOIN "Prefecture" p ON p.id = c."prefectureId"
+  UNION ALL
+  SELECT 'consulate', id, name, status::text, "baseUrl", NULL, NULL, NULL FROM "Consulate"
+  UNION ALL
+  SELECT 'vfs', id, name, status::text, "bookingUrl", NULL, NULL, NULL FROM "VfsCenter"
+  ORDER BY 1, 2`);
+"""
+
+
+class HttpError(Exception):
+    pass
+
+
+@dataclass
+class Target:
+    kind: str
+    id: str
+    name: str
+    url: str
+    status: str = ''
+    history_url: str | None = None
+    history_status: str | None = None
+    history_at: str | None = None
+
+
+@dataclass
+class Hop:
+    url: str
+    status: int
+    ms: float
+
+
+@dataclass
+class UrlCheck:
+    target: Target
+    state: str  # ok, redirected, broken, timeout or error
+    final_url: str | None
+    hops: list[Hop] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.state in ('ok', 'redirected')
+
+    @property
+    def redirects(self) -> int:
+        return max(len(self.hops) - 1, 0)
+
+    @property
+    def ms(self) -> float:
+        return sum(hop.ms for hop in self.hops)
+
+    @property
+    def http_status(self) -> int | None:
+        return self.hops[-1].status if self.hops else None
+
+
+@dataclass
+class UrlChange:
+    target: Target
+    final_url: str
+    # new: not in UrlHistory; recorded: the latest UrlHistory row already has it;
+    # untracked: not a prefecture, so there is no UrlHistory to compare with
+    state: str
+    redirects: int
+
+
+def normalize_url(url: str) -> str:
+    """``url`` with the case, default port, trailing slash and fragment that do not matter removed."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    default = {'http': 80, 'https': 443}.get(parts.scheme.lower())
+    netloc = host if parts.port in (None, default) else f'{host}:{parts.port}'
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path.rstrip('/'), parts.query, ''))
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class HostPool:
+    """Keep-alive connections, a connection cap and a request rate per host.
+
+    ``concurrency`` caps the sockets open across all hosts, idle ones
+    included: when a new connection would go over it, the idle connection
+    released longest ago is closed first.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, per_host: int = DEFAULT_PER_HOST,
+                 concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.opened = 0
+        self.open_now = 0
+        self._cap = max(1, concurrency)
+        self._sockets = asyncio.Semaphore(self._cap)
+        self._limits: dict[tuple, asyncio.Semaphore] = {}
+        self._idle: dict[tuple, list[_Connection]] = {}
+        # Every idle connection, oldest release first, for eviction at the cap.
+        self._released: dict[_Connection, tuple] = {}
+        self._next_start: dict[str, float] = {}
+        self._ssl: ssl.SSLContext | None = None
+
+    async def _turn(self, host: str) -> None:
+        # Reserve the next start slot for this host, then wait for it.
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def _open(self, key: tuple) -> _Connection:
+        scheme, host, port = key
+        if scheme == 'https' and self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        # Requests in flight never exceed the cap, so an idle connection is
+        # always there to close when the open ones have reached it.
+        while self.open_now >= self._cap and self._released:
+            oldest, oldest_key = next(iter(self._released.items()))
+            self._idle[oldest_key].remove(oldest)
+            del self._released[oldest]
+            self._close(oldest)
+        self.open_now += 1
+        try:
+            reader, writer = await asyncio.open_connection(host, port, ssl=self._ssl if scheme == 'https' else None,
+                                                           limit=DRAIN_LIMIT)
+        except BaseException:
+            self.open_now -= 1
+            raise
+        self.opened += 1
+        return _Connection(reader, writer)
+
+    def _close(self, connection: _Connection) -> None:
+        connection.close()
+        self.open_now -= 1
+
+    async def get(self, url: str) -> tuple[int, dict[str, str], float]:
+        """GET ``url`` and drain the body; returns the status, lower-cased headers and milliseconds.
+
+        The wait for the host's turn is not part of the milliseconds.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise HttpError(f'unsupported URL: {url}')
+        default = 443 if parts.scheme == 'https' else 80
+        key = (parts.scheme, parts.hostname.lower(), parts.port or default)
+        authority = key[1] if key[2] == default else f'{key[1]}:{key[2]}'
+        target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        request = ''.join([f'GET {target} HTTP/1.1\r\nHost: {authority}\r\n',
+                           *(f'{name}: {value}\r\n' for name, value in HEADERS.items()), '\r\n']).encode()
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.per_host))
+        async with limit:
+            await self._turn(key[1])
+            async with self._sockets:
+                started = time.monotonic()
+                status, headers = await asyncio.wait_for(self._exchange(key, request), self.timeout)
+                return status, headers, (time.monotonic() - started) * 1000
+
+    async def _exchange(self, key: tuple, request: bytes) -> tuple[int, dict[str, str]]:
+        idle = self._idle.setdefault(key, [])
+        while True:
+            reused = bool(idle)
+            if reused:
+                connection = idle.pop()
+                del self._released[connection]
+            else:
+                connection = await self._open(key)
+            try:
+                connection.writer.write(request)
+                await connection.writer.drain()
+                status, headers = await self._read_head(connection.reader)
+            except (ConnectionError, asyncio.IncompleteReadError, HttpError):
+                self._close(connection)
+                if reused:
+                    continue  # the server closed an idle connection; try a fresh one
+                raise
+            except BaseException:
+                self._close(connection)
+                raise
+            try:
+                keep = await self._drain(connection.reader, headers)
+            except BaseException:
+                self._close(connection)
+                raise
+            if keep and headers.get('connection', '').lower() != 'close':
+                idle.append(connection)
+                self._released[connection] = key
+            else:
+                self._close(connection)
+            return status, headers
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> tuple[int, dict[str, str]]:
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(b'', None)
+        try:
+            status = int(line.split()[1])
+        except (IndexError, ValueError):
+            raise HttpError(f'bad status line: {line[:80]!r}') from None
+        headers: dict[str, str] = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    @staticmethod
+    async def _drain(reader: asyncio.StreamReader, headers: dict[str, str]) -> bool:
+        """Skip the body; ``True`` when the connection can carry another request."""
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            total = 0
+            while size := int((await reader.readline()).split(b';')[0], 16):
+                total += size
+                if total > DRAIN_LIMIT:
+                    return False
+                await reader.readexactly(size + 2)
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            return True
+        if 'content-length' in headers:
+            size = int(headers['content-length'])
+            if size > DRAIN_LIMIT:
+                return False
+            await reader.readexactly(size)
+            return True
+        return False
+
+    def close(self) -> None:
+        for connections in self._idle.values():
+            for connection in connections:
+                self._close(connection)
+        self._idle.clear()
+        self._released.clear()
+
+
+class UrlChecker:
+    """Follows each target's redirects through one shared :class:`HostPool`."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, per_host: int = DEFAULT_PER_HOST,
+                 concurrency: int = DEFAULT_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT,
+                 max_redirects: int = MAX_REDIRECTS):
+        self.settings = (rate, per_host, concurrency, timeout)
+        self.max_redirects = max_redirects
+        self.pool: HostPool | None = None
+
+    async def check(self, target: Target) -> UrlCheck:
+        url, hops = target.url, []
+        try:
+            while True:
+                status, headers, ms = await self.pool.get(url)
+                hops.append(Hop(url, status, ms))
+                if status not in REDIRECTS or not headers.get('location'):
+                    break
+                url = urljoin(url, headers['location'])
+                if any(hop.url == url for hop in hops):
+                    return UrlCheck(target, 'error', url, hops, 'redirect loop')
+                if len(hops) > self.max_redirects:
+                    return UrlCheck(target, 'error', url, hops, f'more than {self.max_redirects} redirects')
+        except asyncio.TimeoutError:
+            return UrlCheck(target, 'timeout', None, hops, f'no answer from {urlsplit(url).netloc} '
+                                                            f'in {self.pool.timeout:g}s')
+        except (OSError, HttpError, asyncio.IncompleteReadError, ValueError) as e:
+            return UrlCheck(target, 'error', None, hops, str(e) or type(e).__name__)
+        if 200 <= status < 300:
+            return UrlCheck(target, 'ok' if len(hops) == 1 else 'redirected', url, hops)
+        return UrlCheck(target, 'broken', url, hops, f'HTTP {status}')
+
+    async def run(self, targets: list[Target]) -> list[UrlCheck]:
+        """Check ``targets`` concurrently; results in the same order."""
+        self.pool = HostPool(*self.settings)
+        try:
+            return list(await asyncio.gather(*(self.check(t) for t in targets)))
+        finally:
+            self.pool.close()
+
+
+def check_urls(targets: list[Target], **settings) -> list[UrlCheck]:
+    return asyncio.run(UrlChecker(**settings).run(targets))
+
+
+def diff_history(checks: list[UrlCheck]) -> list[UrlChange]:
+    """Reachable targets whose final URL is not the stored one, against the latest ``UrlHistory`` row."""
+    changes = []
+    for check in checks:
+        if not check.ok or normalize_url(check.final_url) == normalize_url(check.target.url):
+            continue
+        history = check.target.history_url
+        if check.target.kind != 'prefecture':
+            state = 'untracked'
+        elif history and normalize_url(history) == normalize_url(check.final_url):
+            state = 'recorded'
+        else:
+            state = 'new'
+        changes.append(UrlChange(check.target, check.final_url, state, check.redirects))
+    return changes
+
+
+def load_targets(agent: QueryAgent, kinds: tuple[str, ...] = KINDS) -> list[Target]:
+    result = agent.script(TARGETS_SCRIPT)
+    if not result.ok:
+        raise QueryError(f'could not load booking URLs: {result.error}')
+    return [Target(row['kind'], row['id'], row['name'], row['url'], row['status'], row['historyUrl'],
+                   row['historyStatus'], row['historyAt'])
+            for row in result.result if row['kind'] in kinds and row['url']]
+
+
+def _label(target: Target) -> str:
+    return f'{target.kind:<10} ' + (f'{target.name}: ' if target.name else '') + target.url
+
+
+def format_report(checks: list[UrlCheck], changes: list[UrlChange], elapsed: float) -> str:
+    lines = []
+    failed = [c for c in checks if not c.ok]
+    if failed:
+        lines.append('Unreachable:')
+        for c in failed:
+            lines.append(f'  {c.state:<8} {_label(c.target)}  ({c.error})')
+    if changes:
+        lines.append('Changed URLs:')
+        for change in changes:
+            t = change.target
+            note = {'recorded': f'in UrlHistory since {t.history_at}'
+                                + (f', {t.history_status}' if t.history_status else ''),
+                    'new': 'not in UrlHistory', 'untracked': 'no UrlHistory for this kind'}[change.state]
+            lines.append(f'  {_label(t)}\n'
+                         f'    -> {change.final_url} ({change.redirects} redirects; {note})')
+    latencies = sorted(c.ms for c in checks if c.ok)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+    lines.append(f'{len(checks)} URLs in {elapsed:.1f}s: {len(checks) - len(failed)} reachable, '
+                 f'{len(failed)} unreachable, {len(changes)} changed '
+                 f'({sum(c.state == "new" for c in changes)} not in UrlHistory); p95 {p95:.0f}ms')
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Check every stored booking URL and diff against UrlHistory.')
+    parser.add_argument('urls', nargs='*', help='check these URLs instead of the ones in the database')
+    parser.add_argument('--kind', action='append', choices=KINDS, help='only this kind of target (repeatable)')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'request starts per second per host (default {DEFAULT_RATE:g})')
+    parser.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST,
+                        help=f'connections per host (default {DEFAULT_PER_HOST})')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'sockets open overall, idle ones included (default {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'seconds per request (default {DEFAULT_TIMEOUT:g})')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of text')
+    args = parser.parse_args(argv)
+
+    if args.urls:
+        targets = [Target('url', str(i), '', url) for i, url in enumerate(args.urls, 1)]
+    else:
+        try:
+            with QueryAgent(get_session()) as db:
+                targets = load_targets(db, tuple(args.kind or KINDS))
+        except (QueryError, SessionError, OSError) as e:
+            print(f'urlcheck: {e}', file=sys.stderr)
+            return 2
+    started = time.monotonic()
+    checks = check_urls(targets, rate=args.rate, per_host=args.per_host, concurrency=args.concurrency,
+                        timeout=args.timeout)
+    changes = diff_history(checks)
+    if args.json:
+        print(json.dumps({
+            'checks': [{**asdict(c.target), 'state': c.state, 'httpStatus': c.http_status, 'finalUrl': c.final_url,
+                        'redirects': c.redirects, 'ms': round(c.ms, 1), 'error': c.error,
+                        'hops': [asdict(h) for h in c.hops]} for c in checks],
+            'changes': [{'kind': ch.target.kind, 'id': ch.target.id, 'url': ch.target.url,
+                         'finalUrl': ch.final_url, 'state': ch.state} for ch in changes],
+        }, indent=2, ensure_ascii=False))
+    else:
+        print(format_report(checks, changes, time.monotonic() - started))
+    return 1 if any(not c.ok for c in checks) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
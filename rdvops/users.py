@@ -0,0 +1,333 @@
+"""Bulk user provisioning from a CSV file in one remote process.
+
+``create-admin.py`` copies a script into ``rdv_api`` and starts Node for a
+single account.  Here the whole CSV goes through one :class:`QueryAgent`:
+rows are validated locally, then sent in chunks that the helper works on
+concurrently.  Passwords are hashed with ``bcryptjs`` (cost 12, as
+``BCRYPT_ROUNDS`` in the backend) on a pool of worker threads shared by every
+chunk, and each chunk's creates and updates are written in one Prisma
+transaction.  A chunk whose transaction fails is retried row by row, so one
+bad row is reported on its own instead of failing its neighbours::
+
+    python -m rdvops.users staff.csv --dry-run
+    python -m rdvops.users staff.csv --update --json
+
+The CSV needs an ``email`` column; ``password``, ``role``, ``plan``,
+``planExpiresAt``, ``phone``, ``whatsappNumber``, ``telegramChatId`` and
+``emailVerified`` are optional.  Existing accounts are left alone unless
+``--update`` is given, and an empty cell keeps the stored value.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Iterable, TextIO
+
+from .query import QueryAgent, QueryError
+from .session import get_session
+
+BCRYPT_ROUNDS = 12
+DEFAULT_CHUNK = 100
+COLUMNS = ('email', 'password', 'role', 'plan', 'planExpiresAt', 'phone', 'whatsappNumber', 'telegramChatId',
+           'emailVerified')
+ROLES = ('USER', 'ADMIN')
+PLANS = ('NONE', 'URGENCE_24H', 'URGENCE_7J', 'URGENCE_TOTAL')
+BOOLEANS = {'true': True, '1': True, 'yes': True, 'false': False, '0': False, 'no': False}
+# registerSchema in backend/src/validators/auth.validator.ts.
+PASSWORD_RULES = ((r'.{12}', 'at least 12 characters'), (r'[A-Z]', 'an uppercase letter'),
+                  (r'[a-z]', 'a lowercase letter'), (r'[0-9]', 'a number'),
+                  (r'[^A-Za-z0-9]', 'a special character'))
+EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+# Statuses that mean the row was not provisioned.
+PROBLEMS = ('invalid', 'failed')
+
+PROVISION_SCRIPT = r'''
+const os = require('os');
+const { Worker } = require('worker_threads');
+
+const HASHER = `
+const { parentPort, workerData } = require('worker_threads');
+const bcrypt = require(workerData.module);
+parentPort.on('message', ({ id, password, rounds }) => {
+  try {
+    parentPort.postMessage({ id, hash: bcrypt.hashSync(password, rounds) });
+  } catch (e) {
+    parentPort.postMessage({ id, error: String((e && e.message) || e) });
+  }
+});`;
+
+// One pool for the helper's life, so concurrent chunks share the cores.
+function hashPool(size) {
+  const module = require.resolve(process.env.RDVOPS_BCRYPT_MODULE || 'bcryptjs');
+  let next = 0;
+  const workers = Array.from({ length: size }, () => {
+    const worker = new Worker(HASHER, { eval: true, workerData: { module } });
+    worker.tasks = new Map();
+    worker.on('message', ({ id, hash, error }) => {
+      const task = worker.tasks.get(id);
+      worker.tasks.delete(id);
+      if (!worker.tasks.size) worker.unref();
+      error ? task.reject(new Error(error)) : task.resolve(hash);
+    });
+    worker.on('error', (e) => {
+      globalThis.rdvopsHashPool = null;
+      for (const task of worker.tasks.values()) task.reject(e);
+      worker.tasks.clear();
+    });
+    worker.unref();
+    return worker;
+  });
+  return {
+    size,
+    hash(password, rounds) {
+      const worker = workers.reduce((a, b) => (b.tasks.size < a.tasks.size ? b : a));
+      const id = ++next;
+      return new Promise((resolve, reject) => {
+        if (!worker.tasks.size) worker.ref();
+        worker.tasks.set(id, { resolve, reject });
+        worker.postMessage({ id, password, rounds });
+      });
+    },
+  };
+}
+
+const size = Math.max(1, args.workers || os.cpus().length);
+const pool = args.dryRun ? null : globalThis.rdvopsHashPool || (globalThis.rdvopsHashPool = hashPool(size));
+const found = await prisma.user.findMany({
+  where: { email: { in: args.rows.map((row) => row.email) } },
+  select: { email: true },
+});
+const existing = new Set(found.map((user) => user.email));
+
+const results = [];
+const writes = [];
+await Promise.all(args.rows.map(async (row) => {
+  const result = { line: row.line, email: row.email };
+  results.push(result);
+  if (existing.has(row.email) && !args.update) {
+    result.status = 'exists';
+    return;
+  }
+  result.status = existing.has(row.email) ? 'updated' : 'created';
+  if (result.status === 'created' && !row.password) {
+    Object.assign(result, { status: 'failed', error: 'a new account needs a password' });
+    return;
+  }
+  if (args.dryRun) return;
+  const data = { ...row.data };
+  try {
+    if (row.password) data.passwordHash = await pool.hash(row.password, args.rounds);
+  } catch (e) {
+    Object.assign(result, { status: 'failed', error: 'hash: ' + String((e && e.message) || e) });
+    return;
+  }
+  const write = result.status === 'created'
+    ? () => prisma.user.create({ data: { email: row.email, ...data } })
+    : () => prisma.user.update({ where: { email: row.email }, data });
+  writes.push({ result, write });
+}));
+
+try {
+  if (writes.length) await prisma.$transaction(writes.map(({ write }) => write()));
+} catch {
+  for (const { result, write } of writes) {
+    try {
+      await write();
+    } catch (e) {
+      Object.assign(result, { status: 'failed', error: String((e && e.message) || e).trim().split('\n').pop() });
+    }
+  }
+}
+results.sort((a, b) => a.line - b.line);
+return { workers: pool ? pool.size : 0, results };
+'''
+
+
+class ProvisionError(Exception):
+    """Raised when the CSV cannot be used at all (missing or unknown columns)."""
+
+
+@dataclass
+class UserRow:
+    line: int
+    email: str
+    password: str = ''
+    data: dict = field(default_factory=dict)
+
+    def to_request(self) -> dict:
+        return {'line': self.line, 'email': self.email, 'password': self.password, 'data': self.data}
+
+
+@dataclass
+class RowResult:
+    line: int
+    email: str
+    status: str
+    error: str | None = None
+
+    def to_dict(self) -> dict:
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
+def password_problems(password: str) -> list[str]:
+    return [rule for pattern, rule in PASSWORD_RULES if not re.search(pattern, password)]
+
+
+def parse_row(line: int, cells: dict[str, str]) -> UserRow:
+    """One CSV row as a :class:`UserRow`; raises ``ValueError`` with the reason it is unusable."""
+    password = cells.get('password') or ''  # kept as typed, spaces and all
+    cells = {k: (v or '').strip() for k, v in cells.items()}
+    email = cells.get('email', '')
+    if not EMAIL.match(email):
+        raise ValueError(f'bad email {email!r}' if email else 'no email')
+    if password:
+        missing = password_problems(password)
+        if missing:
+            raise ValueError('password needs ' + ', '.join(missing))
+    data: dict = {}
+    for name in ('phone', 'whatsappNumber', 'telegramChatId'):
+        if cells.get(name):
+            data[name] = cells[name]
+    for name, allowed in (('role', ROLES), ('plan', PLANS)):
+        value = cells.get(name, '').upper()
+        if value:
+            if value not in allowed:
+                raise ValueError(f'{name} must be one of {", ".join(allowed)}')
+            data[name] = value
+    if cells.get('planExpiresAt'):
+        try:
+            expires = datetime.fromisoformat(cells['planExpiresAt'])
+        except ValueError:
+            raise ValueError(f'planExpiresAt is not an ISO date: {cells["planExpiresAt"]!r}') from None
+        data['planExpiresAt'] = expires.isoformat() + ('' if expires.tzinfo else 'Z')
+    if cells.get('emailVerified'):
+        verified = BOOLEANS.get(cells['emailVerified'].lower())
+        if verified is None:
+            raise ValueError(f'emailVerified is not a boolean: {cells["emailVerified"]!r}')
+        data['emailVerified'] = verified
+    return UserRow(line, email, password, data)
+
+
+def read_users(stream: TextIO) -> tuple[list[UserRow], list[RowResult]]:
+    """Parse a users CSV; rows that fail validation come back as ``invalid`` results."""
+    reader = csv.DictReader(stream)
+    header = [name.strip() for name in reader.fieldnames or ()]
+    if 'email' not in header:
+        raise ProvisionError('the CSV has no email column')
+    unknown = [name for name in header if name not in COLUMNS]
+    if unknown:
+        raise ProvisionError(f'unknown columns: {", ".join(unknown)} (expected {", ".join(COLUMNS)})')
+    reader.fieldnames = header
+    rows: list[UserRow] = []
+    invalid: list[RowResult] = []
+    seen: dict[str, int] = {}
+    for cells in reader:
+        line = reader.line_num
+        try:
+            row = parse_row(line, cells)
+        except ValueError as e:
+            invalid.append(RowResult(line, (cells.get('email') or '').strip(), 'invalid', str(e)))
+            continue
+        key = row.email.lower()
+        if key in seen:
+            invalid.append(RowResult(line, row.email, 'invalid', f'duplicate of line {seen[key]}'))
+            continue
+        seen[key] = line
+        rows.append(row)
+    return rows, invalid
+
+
+def chunks(rows: list[UserRow], size: int) -> Iterable[list[UserRow]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def provision(agent: QueryAgent, rows: list[UserRow], update: bool = False, dry_run: bool = False,
+              rounds: int = BCRYPT_ROUNDS, chunk_size: int = DEFAULT_CHUNK,
+              workers: int | None = None) -> list[RowResult]:
+    """Create (and with ``update``, update) the accounts; one request per chunk, all sent at once."""
+    requests = [{'script': PROVISION_SCRIPT,
+                 'args': {'rows': [row.to_request() for row in chunk], 'update': update, 'dryRun': dry_run,
+                          'rounds': rounds, 'workers': workers}}
+                for chunk in chunks(rows, chunk_size)]
+    results = []
+    for chunk, answer in zip(chunks(rows, chunk_size), agent.batch(requests)):
+        if not answer.ok:
+            results.extend(RowResult(row.line, row.email, 'failed', answer.error) for row in chunk)
+            continue
+        results.extend(RowResult(r['line'], r['email'], r['status'], r.get('error'))
+                       for r in answer.result['results'])
+    return results
+
+
+def summary(results: list[RowResult]) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    return counts
+
+
+def format_report(results: list[RowResult], dry_run: bool = False) -> str:
+    results = sorted(results, key=lambda r: r.line)
+    width = max([len(r.email) for r in results] + [5])
+    lines = [f'{"line":>5}  {"email":<{width}}  status']
+    for r in results:
+        lines.append(f'{r.line:>5}  {r.email:<{width}}  {r.status}' + (f': {r.error}' if r.error else ''))
+    counts = summary(results)
+    lines.append('')
+    lines.append(', '.join(f'{status} {counts[status]}' for status in sorted(counts)) or 'no rows')
+    if dry_run:
+        lines.append('dry run: nothing was written')
+    return '\n'.join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description='Create or update user accounts from a CSV file.')
+    parser.add_argument('csv', help="users CSV ('-' for stdin)")
+    parser.add_argument('--host', help='host name from the rdvops config')
+    parser.add_argument('--update', action='store_true',
+                        help='update existing accounts instead of skipping them')
+    parser.add_argument('--dry-run', action='store_true', help='validate and look up the rows without writing')
+    parser.add_argument('--rounds', type=int, default=BCRYPT_ROUNDS,
+                        help=f'bcrypt cost (default {BCRYPT_ROUNDS}, as BCRYPT_ROUNDS in the backend)')
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK,
+                        help=f'rows per transaction (default {DEFAULT_CHUNK})')
+    parser.add_argument('--workers', type=int, help='hashing threads (default: one per CPU of the server)')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args(argv)
+    if args.chunk < 1:
+        parser.error('--chunk must be at least 1')
+    try:
+        if args.csv == '-':
+            rows, invalid = read_users(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig'))
+        else:
+            with open(args.csv, encoding='utf-8-sig', newline='') as stream:
+                rows, invalid = read_users(stream)
+    except (OSError, ProvisionError) as exc:
+        print(f'error: {exc}', file=sys.stderr)
+        return 2
+    results = list(invalid)
+    if rows:
+        try:
+            with QueryAgent(get_session(args.host), timeout=600) as db:
+                results += provision(db, rows, args.update, args.dry_run, args.rounds, args.chunk, args.workers)
+        except QueryError as exc:
+            print(f'error: {exc}', file=sys.stderr)
+            return 2
+    results.sort(key=lambda r: r.line)
+    if args.json:
+        print(json.dumps({'dryRun': args.dry_run, 'summary': summary(results),
+                          'rows': [r.to_dict() for r in results]}, indent=2))
+    else:
+        print(format_report(results, args.dry_run))
+    return 1 if any(r.status in PROBLEMS for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())